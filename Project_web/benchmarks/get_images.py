@@ -0,0 +1,148 @@
+"""
+Load benchmark of /api/images/get_images for the legacy synchronous session
+stack against the AsyncSession stack.
+
+Run from the Project_web directory (the usual .env is required):
+
+    python -m benchmarks.get_images --database-url postgresql+asyncpg://... \
+        --posts 200 --requests 2000 --concurrency 50
+
+The legacy handler is reproduced here as it was before the async port: an
+``async def`` route doing a blocking ``db.query(...)`` on the event loop.
+"""
+import argparse
+import asyncio
+
+import httpx
+from fastapi import Depends, FastAPI
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from main import app
+from benchmarks.utils import print_report, run_load
+from src.database.db import get_db, pool_options
+from src.database.models import Base, Post, User
+from src.services.auth import auth_service
+
+
+SYNC_DRIVERS = {
+    "postgresql+asyncpg": "postgresql+psycopg2",
+    "sqlite+aiosqlite": "sqlite",
+}
+
+
+def sync_url(url: str) -> str:
+    """
+    The sync_url function maps an async database url to the matching sync driver.
+
+    :param url: str: Async SQLAlchemy url
+    :return: The url with a blocking driver
+    """
+    parsed = make_url(url)
+    return str(parsed.set(drivername=SYNC_DRIVERS.get(parsed.drivername, parsed.drivername)))
+
+
+def seed(session: Session, posts: int) -> User:
+    """
+    The seed function recreates the schema and inserts one author with `posts` posts.
+
+    :param session: Session: Sync session
+    :param posts: int: Number of posts to create
+    :return: The author
+    """
+    Base.metadata.drop_all(bind=session.get_bind())
+    Base.metadata.create_all(bind=session.get_bind())
+    author = User(username="benchmark", email="benchmark@example.com", password="secret")
+    session.add(author)
+    session.flush()
+    session.add_all(
+        Post(
+            description=f"post {i}",
+            image_url=f"https://example.com/{i}.jpg",
+            qr_code_url=f"https://example.com/qr/{i}.png",
+            author_id=author.id,
+        )
+        for i in range(posts)
+    )
+    session.commit()
+    session.refresh(author)
+    return author
+
+
+def legacy_app(session_factory: sessionmaker, user: User) -> FastAPI:
+    """
+    The legacy_app function builds an app serving get_images the pre-async way.
+
+    :param session_factory: sessionmaker: Sync session factory
+    :param user: User: User the requests are made for
+    :return: A FastAPI application
+    """
+    legacy = FastAPI()
+
+    def get_sync_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    @legacy.get("/api/images/get_images")
+    async def get_images(db: Session = Depends(get_sync_db)):
+        return db.query(Post).filter(Post.author_id == user.id).all()
+
+    return legacy
+
+
+async def bench(client: httpx.AsyncClient, requests: int, concurrency: int) -> dict:
+    async def call():
+        response = await client.get("/api/images/get_images")
+        response.raise_for_status()
+
+    return await run_load(call, requests, concurrency)
+
+
+async def main(args: argparse.Namespace) -> None:
+    # the legacy handler waits for a pool connection on the event loop, while the
+    # sessions of finished requests are closed from the thread pool: with a bounded
+    # pool that wait can never end
+    sync_engine = create_engine(sync_url(args.database_url), pool_size=args.concurrency, max_overflow=-1)
+    sync_factory = sessionmaker(bind=sync_engine, autoflush=False)
+    with sync_factory() as session:
+        user = seed(session, args.posts)
+        session.expunge(user)
+
+    async_engine = create_async_engine(args.database_url, **pool_options(args.database_url))
+    async_factory = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+
+    async def override_get_db():
+        async with async_factory() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[auth_service.get_current_user] = lambda: user
+
+    reports = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=legacy_app(sync_factory, user)),
+                                 base_url="http://bench") as client:
+        reports["sync session"] = await bench(client, args.requests, args.concurrency)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        reports["async session"] = await bench(client, args.requests, args.concurrency)
+
+    app.dependency_overrides.clear()
+    await async_engine.dispose()
+    sync_engine.dispose()
+    print_report(
+        f"GET /api/images/get_images, {args.posts} posts, concurrency {args.concurrency}",
+        reports
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default="sqlite+aiosqlite:///./benchmark.db")
+    parser.add_argument("--posts", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
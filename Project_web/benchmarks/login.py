@@ -0,0 +1,120 @@
+"""
+Load benchmark of /api/auth/login with bcrypt verified inline on the event loop
+(the behaviour before the password executor) against the current route.
+
+While logins are running, a probe sleeping 10 ms in a loop measures by how much
+its wake-ups are late, i.e. how long the event loop is blocked. The bcrypt cost is BCRYPT_ROUNDS from the
+environment. Run from the Project_web directory:
+
+    BCRYPT_ROUNDS=12 python -m benchmarks.login --requests 200 --concurrency 20
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from main import app
+from benchmarks.get_images import seed, sync_url
+from benchmarks.utils import percentile, print_report, run_load
+from src.database.db import get_db, pool_options
+from src.repository import users as repository_users
+from src.services.auth import auth_service
+
+
+PASSWORD = "benchmark"
+
+
+def legacy_app(session_factory: async_sessionmaker) -> FastAPI:
+    """
+    The legacy_app function builds an app verifying passwords the pre-executor way.
+
+    :param session_factory: async_sessionmaker: Async session factory
+    :return: A FastAPI application
+    """
+    legacy = FastAPI()
+
+    async def get_async_db():
+        async with session_factory() as db:
+            yield db
+
+    @legacy.post("/api/auth/login")
+    async def login(body: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+        user = await repository_users.get_user_by_email(body.username, db)
+        if user is None or not auth_service.verify_password(body.password, user.password):
+            raise HTTPException(status_code=401)
+        access_token = await auth_service.create_access_token(data={"sub": user.email})
+        refresh_token = await auth_service.create_refresh_token(data={"sub": user.email})
+        await repository_users.update_token(user, refresh_token, db)
+        return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
+
+    return legacy
+
+
+async def bench(client: httpx.AsyncClient, email: str, requests: int, concurrency: int) -> dict:
+    async def call():
+        response = await client.post("/api/auth/login", data={"username": email, "password": PASSWORD})
+        response.raise_for_status()
+
+    async def probe(done: asyncio.Event, lags: list):
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lags.append(time.perf_counter() - start - 0.01)
+
+    done = asyncio.Event()
+    lags = []
+    prober = asyncio.create_task(probe(done, lags))
+    report = await run_load(call, requests, concurrency)
+    done.set()
+    await prober
+    report["loop_lag_p99_ms"] = round(percentile(lags, 99) * 1000, 3)
+    report["loop_lag_max_ms"] = round(max(lags, default=0) * 1000, 3)
+    return report
+
+
+async def main(args: argparse.Namespace) -> None:
+    sync_engine = create_engine(sync_url(args.database_url))
+    with sessionmaker(bind=sync_engine)() as session:
+        user = seed(session, 0)
+        user.password = auth_service.get_password_hash(PASSWORD)
+        user.confirmed = True
+        session.commit()
+        email = user.email
+    sync_engine.dispose()
+
+    async_engine = create_async_engine(args.database_url, **pool_options(args.database_url))
+    async_factory = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+
+    async def override_get_db():
+        async with async_factory() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = override_get_db
+    reports = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=legacy_app(async_factory)),
+                                 base_url="http://bench") as client:
+        reports["inline bcrypt"] = await bench(client, email, args.requests, args.concurrency)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        reports["password executor"] = await bench(client, email, args.requests, args.concurrency)
+
+    app.dependency_overrides.clear()
+    await async_engine.dispose()
+    print_report(
+        f"POST /api/auth/login, bcrypt rounds {auth_service.pwd_context.to_dict()['bcrypt__default_rounds']}, "
+        f"concurrency {args.concurrency}",
+        reports
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default="sqlite+aiosqlite:///./benchmark.db")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    asyncio.run(main(parser.parse_args()))
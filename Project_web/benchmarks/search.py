@@ -0,0 +1,170 @@
+"""
+Load benchmark of /api/images/search against a naive search scanning the
+descriptions and hashtag names with ILIKE '%term%'.
+
+Run from the Project_web directory (the usual .env is required), on the local
+SQLite FTS5 fallback by default or on Postgres:
+
+    python -m benchmarks.search --database-url postgresql+asyncpg://... \
+        --posts 20000 --requests 1000 --concurrency 20
+"""
+import argparse
+import asyncio
+import random
+from datetime import datetime, timedelta
+from typing import List
+
+import httpx
+from fastapi import Depends, FastAPI
+from sqlalchemy import create_engine, insert, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, selectinload, sessionmaker, with_expression
+
+from main import app
+from benchmarks.get_images import sync_url
+from benchmarks.utils import print_report, run_load
+from src.database.db import get_db, pool_options
+from src.database.models import Base, Hashtag, Post, User, post_hashtags
+from src.repository.images import average_rating
+from src.schemas import FeedImageResponce
+from src.services.auth import auth_service
+
+
+WORDS = [
+    "cat", "dog", "sunset", "mountain", "river", "city", "night", "portrait", "street", "forest",
+    "beach", "winter", "summer", "flower", "coffee", "book", "bridge", "train", "cloud", "garden",
+    "kitten", "puppy", "lake", "snow", "rain", "market", "festival", "concert", "bicycle", "harbor",
+]
+
+
+def seed(session: Session, posts: int, tags: int) -> User:
+    """
+    The seed function recreates the schema and inserts one author with `posts` posts
+    with random descriptions, up to 3 of `tags` hashtags and random dates and ratings.
+
+    :param session: Session: Sync session
+    :param posts: int: Number of posts to create
+    :param tags: int: Number of hashtags to create
+    :return: The author
+    """
+    rng = random.Random(0)
+    Base.metadata.drop_all(bind=session.get_bind())
+    Base.metadata.create_all(bind=session.get_bind())
+    author = User(username="benchmark", email="benchmark@example.com", password="secret")
+    session.add(author)
+    session.flush()
+    session.execute(insert(Hashtag), [{"name": f"{rng.choice(WORDS)}{i}"} for i in range(tags)])
+    now = datetime.now()
+    rows = []
+    for i in range(posts):
+        rating_count = rng.randint(0, 5)
+        rows.append({
+            "description": " ".join(rng.choices(WORDS, k=8)),
+            "image_url": f"https://example.com/{i}.jpg",
+            "author_id": author.id,
+            "created_dt": now - timedelta(days=rng.uniform(0, 365)),
+            "rating_sum": rating_count * rng.uniform(1, 5),
+            "rating_count": rating_count,
+        })
+    session.execute(insert(Post), rows)
+    session.execute(insert(post_hashtags), [
+        {"post_id": post_id, "hashtag_id": hashtag_id}
+        for post_id in range(1, posts + 1)
+        for hashtag_id in rng.sample(range(1, tags + 1), rng.randint(0, 3))
+    ])
+    session.commit()
+    session.refresh(author)
+    return author
+
+
+def naive_app(session_factory: async_sessionmaker) -> FastAPI:
+    """
+    The naive_app function builds an app searching with substring scans, newest first,
+    and returning the same images as the search endpoint.
+
+    :param session_factory: async_sessionmaker: Async session factory
+    :return: A FastAPI application
+    """
+    naive = FastAPI()
+
+    async def get_session():
+        async with session_factory() as db:
+            yield db
+
+    @naive.get("/api/images/search", response_model=List[FeedImageResponce])
+    async def search(q: str, db: AsyncSession = Depends(get_session)):
+        conditions = []
+        for term in q.lower().split():
+            conditions.append(Post.description.ilike(f"%{term}%"))
+            conditions.append(Post.id.in_(
+                select(post_hashtags.c.post_id)
+                .join(Hashtag, Hashtag.id == post_hashtags.c.hashtag_id)
+                .where(Hashtag.name.ilike(f"%{term}%"))
+            ))
+        result = await db.execute(
+            select(Post)
+            .where(or_(*conditions))
+            .options(
+                selectinload(Post.author),
+                selectinload(Post.hashtags),
+                with_expression(Post.average_rating, average_rating)
+            )
+            .order_by(Post.created_dt.desc())
+            .limit(20)
+        )
+        return result.scalars().all()
+
+    return naive
+
+
+async def bench(client: httpx.AsyncClient, requests: int, concurrency: int) -> dict:
+    rng = random.Random(1)
+
+    async def call():
+        q = " ".join(rng.sample(WORDS, rng.randint(1, 2)))
+        response = await client.get("/api/images/search", params={"q": q})
+        response.raise_for_status()
+
+    return await run_load(call, requests, concurrency)
+
+
+async def main(args: argparse.Namespace) -> None:
+    sync_engine = create_engine(sync_url(args.database_url))
+    with sessionmaker(bind=sync_engine)() as session:
+        user = seed(session, args.posts, args.tags)
+        session.expunge(user)
+    sync_engine.dispose()
+
+    async_engine = create_async_engine(args.database_url, **pool_options(args.database_url))
+    async_factory = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+
+    async def override_get_db():
+        async with async_factory() as db:
+            yield db
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[auth_service.get_current_user] = lambda: user
+
+    reports = {}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=naive_app(async_factory)),
+                                 base_url="http://bench") as client:
+        reports["ILIKE scan"] = await bench(client, args.requests, args.concurrency)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        reports["search index"] = await bench(client, args.requests, args.concurrency)
+
+    app.dependency_overrides.clear()
+    await async_engine.dispose()
+    print_report(
+        f"GET /api/images/search, {args.posts} posts, {args.tags} hashtags, concurrency {args.concurrency}",
+        reports
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default="sqlite+aiosqlite:///./benchmark.db")
+    parser.add_argument("--posts", type=int, default=5000)
+    parser.add_argument("--tags", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=10)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,147 @@
+"""
+Benchmark of the registration email delivery: one SMTP connection per message,
+as fastapi-mail sends them, against the outbox worker sending batches over a
+pool of long-lived connections.
+
+A local aiosmtpd server stands in for the mail provider, --handshake-ms delays
+its EHLO reply (the cost of a TLS handshake and login with a remote server) and
+--latency-ms every accepted message. The outbox variant queues the emails first,
+as the signups do, and the report has the rate of both steps.
+
+Requires aiosmtpd (pip install aiosmtpd). Run from the Project_web directory
+(the usual .env is required), on SQLite by default or on Postgres:
+
+    python -m benchmarks.send_email --database-url postgresql+asyncpg://... \\
+        --messages 2000 --concurrency 4 --handshake-ms 50 --latency-ms 5
+"""
+import argparse
+import asyncio
+import socket
+import sys
+import tempfile
+import time
+from email.message import EmailMessage
+
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from benchmarks.get_images import sync_url
+from benchmarks.utils import print_report, run_load
+from src.conf.config import settings
+from src.database.db import pool_options
+from src.database.models import Base, OutboxEmail
+from src.repository.outbox import queue_email
+from src.services.outbox import OutboxWorker, SMTPPool
+
+
+class SlowHandler:
+    def __init__(self, handshake: float, latency: float):
+        self.handshake = handshake
+        self.latency = latency
+        self.received = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        await asyncio.sleep(self.handshake)
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        await asyncio.sleep(self.latency)
+        self.received += 1
+        return "250 Message accepted for delivery"
+
+
+def start_server(handler: SlowHandler):
+    try:
+        from aiosmtpd.controller import Controller
+    except ImportError:
+        sys.exit("the email benchmark needs aiosmtpd: pip install aiosmtpd")
+    # aiosmtpd connects to its port once started, it must be known beforehand
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    controller = Controller(handler, hostname="127.0.0.1", port=port)
+    controller.start()
+    return controller
+
+
+async def main(args: argparse.Namespace) -> None:
+    import aiosmtplib
+
+    handler = SlowHandler(args.handshake_ms / 1000, args.latency_ms / 1000)
+    controller = start_server(handler)
+    host, port = controller.hostname, controller.port
+
+    def message(number: int) -> EmailMessage:
+        email = EmailMessage()
+        email["From"] = settings.mail_from
+        email["To"] = f"user{number}@example.com"
+        email["Subject"] = "Confirm your email "
+        email.set_content("<p>benchmark</p>", subtype="html")
+        return email
+
+    numbers = iter(range(args.messages))
+
+    async def connection_per_message():
+        await aiosmtplib.send(message(next(numbers)), hostname=host, port=port)
+
+    reports = {"connection per message": await run_load(connection_per_message, args.messages, args.concurrency)}
+    reports["connection per message"]["connections"] = args.messages
+
+    sync_engine = create_engine(sync_url(args.database_url))
+    Base.metadata.drop_all(bind=sync_engine, tables=[OutboxEmail.__table__])
+    Base.metadata.create_all(bind=sync_engine, tables=[OutboxEmail.__table__])
+    sync_engine.dispose()
+    engine = create_async_engine(args.database_url, **pool_options(args.database_url))
+    session_factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+
+    numbers = iter(range(args.messages))
+
+    async def queue():
+        async with session_factory() as db:
+            number = next(numbers)
+            await queue_email(db, f"user{number}@example.com", "Confirm your email ", "email_template.html",
+                              {"host": "http://localhost:8000/", "username": f"user{number}", "token": "token"})
+            await db.commit()
+
+    reports["outbox: queue"] = await run_load(queue, args.messages, args.concurrency)
+
+    async def connect():
+        smtp = aiosmtplib.SMTP(hostname=host, port=port)
+        await smtp.connect()
+        return smtp
+
+    settings.email_batch_size = args.batch_size
+    pool = SMTPPool(args.concurrency, settings.email_smtp_idle_timeout, connect)
+    worker = OutboxWorker(session_factory, pool)
+    started = time.perf_counter()
+    sent = await worker.drain()
+    elapsed = time.perf_counter() - started
+    await pool.close()
+    await engine.dispose()
+    controller.stop()
+    reports["outbox: send batches"] = {
+        "requests": sent,
+        "rps": round(sent / elapsed, 1),
+        "batches": worker.stats["batches"],
+        "failed": worker.stats["retried"] + worker.stats["failed"],
+        "connections": pool.connections_opened,
+    }
+
+    print_report(
+        f"{args.messages} emails, {args.concurrency} concurrent connections, "
+        f"handshake {args.handshake_ms} ms, {args.latency_ms} ms per message",
+        reports
+    )
+    print(f"received by the server: {handler.received}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default=f"sqlite+aiosqlite:///{tempfile.gettempdir()}/email_benchmark.db")
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=settings.email_batch_size)
+    parser.add_argument("--handshake-ms", type=float, default=50)
+    parser.add_argument("--latency-ms", type=float, default=5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,162 @@
+"""
+Cold-start benchmark and import profiler of the application.
+
+Every run starts a fresh interpreter importing the application module, as a
+worker does before it accepts connections, and measures its wall time against
+an interpreter doing nothing. Runs with `python -X importtime` give the import
+time of every module: the report sums the self time per top-level package and
+lists the modules with the largest cumulative time.
+
+The exit status is 1 when the median cold start exceeds --budget-ms or when one
+of the dependencies loaded on first use (LAZY_MODULES) is imported at startup.
+Run from the Project_web directory (the usual .env is required):
+
+    python -m benchmarks.startup --runs 10 --budget-ms 1500 --output startup.json
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from benchmarks.utils import percentile, print_report, save_results
+
+
+# heavy dependencies only some routes need, they must not be imported with the application
+LAZY_MODULES = (
+    "cloudinary",
+    "fastapi_mail",
+    "jinja2",
+    "passlib.handlers.bcrypt",
+    "PIL",
+    "qrcode",
+    "uvicorn",
+)
+
+COLD_START_BUDGET_MS = 1500
+
+
+def parse_importtime(output: str) -> List[Tuple[str, int, int]]:
+    """
+    The parse_importtime function parses the stderr of `python -X importtime`, lines like
+    `import time:       279 |        388 |         src.utils.cache`.
+
+    :param output: str: Output of the interpreter
+    :return: A list of (module, self time, cumulative time), times in microseconds
+    """
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        if not self_us.strip().isdigit():
+            # the header line
+            continue
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+
+def run(code: str, importtime: bool = False) -> Tuple[float, str]:
+    """
+    The run function executes code in a new interpreter started from the current directory.
+
+    :param code: str: Code passed to -c
+    :param importtime: bool: Run with -X importtime
+    :return: The wall time in seconds and the stderr of the interpreter
+    """
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    started = time.perf_counter()
+    result = subprocess.run(command, capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if result.returncode:
+        sys.exit(f"{' '.join(command)} failed:\n{result.stderr}")
+    return elapsed, result.stderr
+
+
+def profile(module: str, runs: int) -> Tuple[Dict[str, float], Dict[str, dict], Dict[str, dict], List[str]]:
+    """
+    The profile function measures the cold start of the module and the import time
+    of its dependencies, medians over `runs` runs.
+
+    :param module: str: Module to import, e.g. main
+    :param runs: int: Number of runs of every measure
+    :return: The cold start report, the packages and modules reports and the lazy modules imported at startup
+    """
+    # a first import writes the bytecode caches, it is not a cold start of a deployed worker
+    run(f"import {module}")
+    interpreter = [run("pass")[0] for _ in range(runs)]
+    code = f"import sys, {module}; print(*[m for m in {LAZY_MODULES!r} if m in sys.modules], file=sys.stderr)"
+    cold_starts = []
+    for _ in range(runs):
+        elapsed, stderr = run(code)
+        cold_starts.append(elapsed)
+    imported_lazy = stderr.split()
+
+    packages: Dict[str, List[int]] = defaultdict(list)
+    modules: Dict[str, List[int]] = defaultdict(list)
+    for _ in range(runs):
+        totals: Dict[str, int] = defaultdict(int)
+        for name, self_us, cumulative_us in parse_importtime(run(f"import {module}", importtime=True)[1]):
+            totals[name.split(".")[0]] += self_us
+            modules[name].append(cumulative_us)
+        for name, self_us in totals.items():
+            packages[name].append(self_us)
+
+    def ms(seconds: float) -> float:
+        return round(seconds * 1000, 1)
+
+    cold_start = {
+        "runs": runs,
+        "interpreter_ms": ms(statistics.median(interpreter)),
+        "median_ms": ms(statistics.median(cold_starts)),
+        "p95_ms": ms(percentile(cold_starts, 95)),
+        "import_ms": ms(statistics.median(cold_starts) - statistics.median(interpreter)),
+    }
+    packages_report = {
+        name: {"self_ms": round(statistics.median(times) / 1000, 1)}
+        for name, times in sorted(packages.items(), key=lambda item: -statistics.median(item[1]))
+    }
+    modules_report = {
+        name: {"cumulative_ms": round(statistics.median(times) / 1000, 1)}
+        for name, times in sorted(modules.items(), key=lambda item: -statistics.median(item[1]))
+    }
+    return cold_start, packages_report, modules_report, imported_lazy
+
+
+def main(args: argparse.Namespace) -> int:
+    cold_start, packages, modules, imported_lazy = profile(args.module, args.runs)
+    print_report(f"import time by top-level package (self time), {args.runs} runs",
+                 dict(list(packages.items())[:args.top]), columns=["self_ms"])
+    print()
+    print_report(f"slowest modules (cumulative time), {args.runs} runs",
+                 dict(list(modules.items())[:args.top]), columns=["cumulative_ms"])
+    print()
+    print_report(f"cold start of `import {args.module}`, budget {args.budget_ms} ms",
+                 {args.module: cold_start}, columns=list(cold_start))
+    if args.output:
+        save_results(
+            args.output,
+            {"module": args.module, "runs": args.runs, "budget_ms": args.budget_ms, "python": sys.version.split()[0]},
+            {"cold_start": cold_start, "packages": packages, "modules": modules, "imported_lazy": imported_lazy}
+        )
+
+    failed = False
+    if imported_lazy:
+        print(f"\nimported at startup, should be imported on first use: {', '.join(imported_lazy)}")
+        failed = True
+    if cold_start["median_ms"] > args.budget_ms:
+        print(f"\ncold start {cold_start['median_ms']} ms is over the budget of {args.budget_ms} ms")
+        failed = True
+    return int(failed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=20, help="number of packages and modules listed")
+    parser.add_argument("--budget-ms", type=float, default=COLD_START_BUDGET_MS)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    sys.exit(main(parser.parse_args()))
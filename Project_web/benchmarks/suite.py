@@ -0,0 +1,317 @@
+"""
+Load benchmark of the main Project_web endpoints on a synthetic dataset.
+
+The schema is recreated and seeded with users, posts, hashtags, comments and
+ratings, then every endpoint is driven by concurrent async clients through the
+ASGI app, one endpoint after the other. Uploads go to the local fake storage and
+confirmation emails are not sent. For every endpoint the report has the
+throughput, the p50/p95/p99 latencies and the number of database queries per
+request (background tasks included, httpx.ASGITransport waits for them).
+
+Run from the Project_web directory (the usual .env is required):
+
+    python -m benchmarks.suite --database-url postgresql+asyncpg://... \\
+        --users 200 --posts 5000 --requests 1000 --concurrency 20 --output after.json
+
+Results are stored as JSON with --output. Pass the file of an earlier run, e.g.
+of the previous commit, with --compare to print the changes: the exit status is
+1 when an endpoint lost more than --max-regression of its throughput, its p95
+grew by more than --max-regression or it does more queries than before.
+"""
+import argparse
+import asyncio
+import itertools
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterator, List, Tuple
+
+import httpx
+from sqlalchemy import bindparam, create_engine, event, insert, update
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from main import app
+from benchmarks.get_images import sync_url
+from benchmarks.search import WORDS
+from benchmarks.utils import compare_reports, load_results, print_report, run_load, save_results
+from src.database.db import get_db, pool_options
+from src.database.models import Base, Comments, Hashtag, Post, Rating, User, post_hashtags
+from src.repository import images as repository_images
+from src.repository.ranking import refresh_hot_scores
+from src.repository.tags import rebuild_tag_usage
+from src.routes import auth as routes_auth
+from src.services.auth import auth_service
+from src.services.storage import LocalStorage
+
+
+CHUNK = 10000
+
+
+@dataclass
+class Dataset:
+    user: User
+    posts: int
+    authors: List[int]
+    payload: bytes
+    rng: random.Random = field(default_factory=lambda: random.Random(1))
+    # the benchmark user owns no post and rated none, it rates every post once at most
+    unrated: Iterator[int] = None
+    signups: Iterator[int] = field(default_factory=itertools.count)
+
+    def __post_init__(self):
+        self.unrated = iter(range(1, self.posts + 1))
+
+    def post_id(self) -> int:
+        return self.rng.randint(1, self.posts)
+
+    def author_id(self) -> int:
+        return self.rng.choice(self.authors)
+
+
+def signup(n: int) -> Tuple[str, str, dict]:
+    return "POST", "/api/auth/signup", {
+        "json": {"username": f"signup{n}", "email": f"signup{n}@example.com", "password": "benchmark"}
+    }
+
+
+# endpoint name -> function building the arguments of httpx.AsyncClient.request
+Request = Callable[[Dataset], Tuple[str, str, dict]]
+
+ENDPOINTS: Dict[str, Request] = {
+    "get_image": lambda d: ("GET", "/api/images/get_image", {"params": {"image_id": d.post_id()}}),
+    "get_images": lambda d: ("GET", "/api/images/get_images", {"params": {"user_id": d.author_id()}}),
+    "feed": lambda d: ("GET", "/api/images/feed", {"params": {"user_id": d.author_id()}}),
+    "hot": lambda d: ("GET", "/api/images/hot", {}),
+    "search": lambda d: ("GET", "/api/images/search", {"params": {"q": d.rng.choice(WORDS)}}),
+    "comments_by_image": lambda d: ("GET", f"/api/comments/by-image/{d.post_id()}", {}),
+    "ratings": lambda d: ("GET", f"/api/ratings/{d.post_id()}", {}),
+    "user_profile": lambda d: ("GET", f"/api/users/bench{d.author_id()}", {}),
+    "trending_tags": lambda d: ("GET", "/api/tags/trending", {"params": {"window": "7d"}}),
+    "post_comment": lambda d: ("POST", "/api/comments/", {"json": {"image_id": d.post_id(), "text": "benchmark"}}),
+    "rate_image": lambda d: ("POST", "/api/ratings/", {"json": {"image_id": next(d.unrated), "rating": 4}}),
+    "upload": lambda d: ("POST", "/api/images/upload", {
+        "params": {"description": "benchmark"},
+        "data": {"hashtags": "benchmark"},
+        "files": {"file": ("image.jpg", d.payload, "image/jpeg")},
+    }),
+    "signup": lambda d: signup(next(d.signups)),
+}
+
+
+def seed(session: Session, args: argparse.Namespace) -> Tuple[User, List[int]]:
+    """
+    The seed function recreates the schema and inserts `args.users` users. The first
+    one is the benchmark user the requests are made for, it owns no post and rated
+    none. The others own `args.posts` posts dated over the last `args.days` days with
+    up to 3 of `args.tags` hashtags, and wrote `args.comments` comments and up to
+    `args.ratings` ratings. The rating aggregates of the posts match the ratings.
+
+    :param session: Session: Sync session
+    :param args: argparse.Namespace: Dataset sizes
+    :return: The benchmark user and the ids of the users owning posts
+    """
+    rng = random.Random(0)
+    Base.metadata.drop_all(bind=session.get_bind())
+    Base.metadata.create_all(bind=session.get_bind())
+    session.execute(insert(User), [
+        {"username": f"bench{i}", "email": f"bench{i}@example.com", "password": "secret", "confirmed": True}
+        for i in range(1, args.users + 1)
+    ])
+    session.execute(insert(Hashtag), [{"name": f"{rng.choice(WORDS)}{i}"} for i in range(args.tags)])
+    authors = list(range(2, args.users + 1))
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+
+    post_authors = {}
+    for start in range(1, args.posts + 1, CHUNK):
+        ids = range(start, min(start + CHUNK, args.posts + 1))
+        rows = []
+        for post_id in ids:
+            post_authors[post_id] = rng.choice(authors)
+            rows.append({
+                "id": post_id,
+                "description": " ".join(rng.choices(WORDS, k=8)),
+                "image_url": f"https://example.com/{post_id}.jpg",
+                "qr_code_url": f"https://example.com/qr/{post_id}.png",
+                "author_id": post_authors[post_id],
+                "created_dt": now - timedelta(seconds=rng.uniform(0, args.days * 86400)),
+            })
+        session.execute(insert(Post), rows)
+        links = [
+            {"post_id": post_id, "hashtag_id": hashtag_id}
+            for post_id in ids
+            for hashtag_id in rng.sample(range(1, args.tags + 1), rng.randint(0, min(3, args.tags)))
+        ]
+        if links:
+            session.execute(insert(post_hashtags), links)
+
+    for start in range(0, args.comments, CHUNK):
+        session.execute(insert(Comments), [
+            {
+                "text": " ".join(rng.choices(WORDS, k=6)),
+                "image_id": rng.randint(1, args.posts),
+                "user_id": rng.choice(authors),
+                "created_at": now - timedelta(seconds=rng.uniform(0, args.days * 86400)),
+            }
+            for _ in range(start, min(start + CHUNK, args.comments))
+        ])
+
+    # one rating per user and post at most, never on one's own post
+    pairs = sorted({
+        (user_id, post_id)
+        for user_id, post_id in ((rng.choice(authors), rng.randint(1, args.posts)) for _ in range(args.ratings))
+        if post_authors[post_id] != user_id
+    })
+    ratings = [{"user_id": user_id, "image_id": post_id, "rating": rng.randint(1, 5)} for user_id, post_id in pairs]
+    aggregates: Dict[int, Tuple[float, int]] = {}
+    for rating in ratings:
+        rating_sum, rating_count = aggregates.get(rating["image_id"], (0.0, 0))
+        aggregates[rating["image_id"]] = (rating_sum + rating["rating"], rating_count + 1)
+    for start in range(0, len(ratings), CHUNK):
+        session.execute(insert(Rating), ratings[start:start + CHUNK])
+    if aggregates:
+        table = Post.__table__
+        session.execute(
+            update(table)
+            .where(table.c.id == bindparam("b_id"))
+            .values(rating_sum=bindparam("b_sum"), rating_count=bindparam("b_count")),
+            [
+                {"b_id": post_id, "b_sum": rating_sum, "b_count": rating_count}
+                for post_id, (rating_sum, rating_count) in aggregates.items()
+            ]
+        )
+    session.commit()
+    user = session.get(User, 1)
+    return user, authors
+
+
+def commit_id() -> str | None:
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+async def bench(client: httpx.AsyncClient, dataset: Dataset, request: Request, requests: int, concurrency: int) -> dict:
+    async def call():
+        method, url, options = request(dataset)
+        response = await client.request(method, url, **options)
+        response.raise_for_status()
+
+    return await run_load(call, requests, concurrency)
+
+
+async def main(args: argparse.Namespace) -> int:
+    endpoints = args.endpoints.split(",") if args.endpoints else list(ENDPOINTS)
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        sys.exit(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+
+    sync_engine = create_engine(sync_url(args.database_url))
+    with sessionmaker(bind=sync_engine)() as session:
+        user, authors = seed(session, args)
+        session.expunge(user)
+    sync_engine.dispose()
+
+    engine = create_async_engine(args.database_url, **pool_options(args.database_url))
+    session_factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+    async with session_factory() as db:
+        await rebuild_tag_usage(db)
+        await refresh_hot_scores(db)
+
+    # endpoints run one after the other, so a global counter is enough
+    queries = 0
+
+    def count_query(*_):
+        nonlocal queries
+        queries += 1
+
+    event.listen(engine.sync_engine, "after_cursor_execute", count_query)
+
+    async def override_get_db():
+        async with session_factory() as db:
+            yield db
+
+    async def send_email(*_):
+        pass
+
+    dataset = Dataset(user=user, posts=args.posts, authors=authors, payload=b"\0" * args.size)
+    reports = {}
+    with tempfile.TemporaryDirectory() as root:
+        storage = LocalStorage(root, "/storage")
+        get_storage, repository_images.get_storage = repository_images.get_storage, lambda: storage
+        routes_auth.send_email, original_send_email = send_email, routes_auth.send_email
+        app.dependency_overrides[get_db] = override_get_db
+        app.dependency_overrides[auth_service.get_current_user] = lambda: user
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+                for name in endpoints:
+                    requests = args.requests
+                    if name == "rate_image":
+                        requests = min(requests, args.posts - args.warmup)
+                    if args.warmup:
+                        await bench(client, dataset, ENDPOINTS[name], args.warmup, args.concurrency)
+                    queries = 0
+                    report = await bench(client, dataset, ENDPOINTS[name], requests, args.concurrency)
+                    report["queries"] = round(queries / report["requests"], 2) if report["requests"] else 0.0
+                    reports[name] = report
+        finally:
+            app.dependency_overrides.clear()
+            repository_images.get_storage = get_storage
+            routes_auth.send_email = original_send_email
+            await engine.dispose()
+
+    meta = {
+        "commit": commit_id(),
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "database": engine.dialect.name,
+        "dataset": {name: getattr(args, name) for name in ("users", "posts", "tags", "comments", "ratings", "days")},
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "warmup": args.warmup,
+    }
+    print_report(
+        f"{engine.dialect.name}, {args.users} users, {args.posts} posts, {args.comments} comments, "
+        f"{args.ratings} ratings, concurrency {args.concurrency}",
+        reports
+    )
+    if args.output:
+        save_results(args.output, meta, reports)
+
+    if not args.compare:
+        return 0
+    baseline = load_results(args.compare)
+    changes = compare_reports(baseline["reports"], reports, args.max_regression)
+    print()
+    print_report(
+        f"changes against {args.compare} (commit {baseline['meta'].get('commit')})",
+        {name: {**change, "regression": "yes" if change["regression"] else ""} for name, change in changes.items()},
+        columns=list(next(iter(changes.values()), {}))
+    )
+    return int(any(change["regression"] for change in changes.values()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default="sqlite+aiosqlite:///./benchmark.db")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--posts", type=int, default=2000)
+    parser.add_argument("--tags", type=int, default=200)
+    parser.add_argument("--comments", type=int, default=10000)
+    parser.add_argument("--ratings", type=int, default=10000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--size", type=int, default=64 * 1024, help="size of the uploaded files in bytes")
+    parser.add_argument("--endpoints", help=f"comma-separated subset of: {', '.join(ENDPOINTS)}")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests per endpoint")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of a baseline run")
+    parser.add_argument("--max-regression", type=float, default=0.1)
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,105 @@
+"""
+Benchmark of the local transformation backend: time per megapixel of every
+transformation, decoding and encoding included, and the throughput of the
+process pool on a batch of images.
+
+Run from the Project_web directory (pillow and numpy are required):
+
+    python -m benchmarks.transform --sizes 1 4 12 --repeat 10 --workers 2
+"""
+import argparse
+import asyncio
+import io
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from benchmarks.utils import print_report, summarize
+from src.services.transform import LocalTransformer, apply_transformation
+from src.utils.executor import BoundedExecutor
+
+
+TRANSFORMATIONS = {
+    "crop": {"height": 480, "width": 640, "crop": "crop"},
+    "roundcorners": {"radius": 100},
+    "grayscale": {"effect": "grayscale"},
+    "sepia": {"effect": "sepia"},
+}
+
+
+def make_image(megapixels: float) -> bytes:
+    """
+    The make_image function encodes a random 4:3 jpeg of about `megapixels` megapixels.
+
+    :param megapixels: float: Size of the image
+    :return: The jpeg bytes
+    """
+    height = int((megapixels * 1_000_000 * 3 / 4) ** 0.5)
+    width = int(height * 4 / 3)
+    pixels = np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, "jpeg", quality=90)
+    return buffer.getvalue()
+
+
+def bench_inline(data: bytes, megapixels: float, transform_params: dict, repeat: int) -> dict:
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        apply_transformation(data, transform_params)
+        latencies.append(time.perf_counter() - started)
+    report = summarize(latencies, sum(latencies))
+    report["ms_per_mp"] = round(report["mean_ms"] / megapixels, 3)
+    return report
+
+
+async def bench_pool(source: Path, root: Path, workers: int, requests: int) -> dict:
+    executor = ProcessPoolExecutor(max_workers=workers)
+    transformer = LocalTransformer(root, "/transformed", BoundedExecutor(executor, requests))
+    names = list(TRANSFORMATIONS)
+    latencies = []
+
+    async def call(i: int):
+        started = time.perf_counter()
+        await transformer.transform(str(source), TRANSFORMATIONS[names[i % len(names)]])
+        latencies.append(time.perf_counter() - started)
+
+    # start the worker processes before measuring
+    await transformer.transform(str(source), TRANSFORMATIONS["grayscale"])
+    started = time.perf_counter()
+    await asyncio.gather(*(call(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+    executor.shutdown()
+    return summarize(latencies, elapsed)
+
+
+async def main(args: argparse.Namespace) -> None:
+    reports = {}
+    for megapixels in args.sizes:
+        data = make_image(megapixels)
+        for name, transform_params in TRANSFORMATIONS.items():
+            reports[f"{name} {megapixels}MP"] = bench_inline(data, megapixels, transform_params, args.repeat)
+    print_report(f"inline transformations, {args.repeat} runs each", reports)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = Path(tmp) / "source.jpg"
+        source.write_bytes(make_image(args.sizes[-1]))
+        reports = {
+            f"{workers} worker(s)": await bench_pool(source, Path(tmp) / "store", workers, args.requests)
+            for workers in sorted({1, args.workers})
+        }
+    print()
+    print_report(f"process pool, {args.sizes[-1]}MP source, all transformations", reports)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1, 4, 12])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--requests", type=int, default=40)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,136 @@
+"""
+Benchmark of the trending hashtags query: aggregating post_hashtags joined with
+posts on every call, against the hourly counters of tag_usage, against the
+counters served from memory.
+
+Run from the Project_web directory (the usual .env is required), on SQLite by
+default or on Postgres:
+
+    python -m benchmarks.trending --database-url postgresql+asyncpg://... \
+        --rows 1000000 --tags 5000 --requests 50
+"""
+import argparse
+import asyncio
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, func, insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from benchmarks.get_images import sync_url
+from benchmarks.utils import print_report, run_load
+from src.database.db import pool_options
+from src.database.models import Base, Hashtag, Post, User, post_hashtags
+from src.repository.tags import (
+    TRENDING_WINDOWS,
+    get_trending_tags,
+    rebuild_tag_usage,
+    trending_cache,
+    window_start,
+)
+
+
+TAGS_PER_POST = 4
+CHUNK = 50000
+
+
+def seed(session: Session, rows: int, tags: int, days: int) -> None:
+    """
+    The seed function recreates the schema and inserts rows / 4 posts spread over the
+    last `days` days with 4 hashtags each, picked with a skewed distribution.
+
+    :param session: Session: Sync session
+    :param rows: int: Number of post_hashtags rows
+    :param tags: int: Number of hashtags
+    :param days: int: Age of the oldest post in days
+    :return: None
+    """
+    rng = random.Random(0)
+    Base.metadata.drop_all(bind=session.get_bind())
+    Base.metadata.create_all(bind=session.get_bind())
+    author = User(username="benchmark", email="benchmark@example.com", password="secret")
+    session.add(author)
+    session.flush()
+    session.execute(insert(Hashtag), [{"name": f"tag{i}"} for i in range(tags)])
+    # the database clock, posts are dated with it
+    now = session.execute(select(func.current_timestamp())).scalar()
+    if isinstance(now, str):
+        now = datetime.fromisoformat(now)
+    posts = rows // TAGS_PER_POST
+    weights = [1 / (i + 1) for i in range(tags)]
+    for start in range(0, posts, CHUNK):
+        ids = range(start + 1, min(start + CHUNK, posts) + 1)
+        session.execute(insert(Post), [
+            {
+                "id": post_id,
+                "description": "benchmark",
+                "image_url": f"https://example.com/{post_id}.jpg",
+                "author_id": author.id,
+                "created_dt": now - timedelta(seconds=rng.uniform(0, days * 86400)),
+            }
+            for post_id in ids
+        ])
+        session.execute(insert(post_hashtags), [
+            {"post_id": post_id, "hashtag_id": hashtag_id}
+            for post_id in ids
+            for hashtag_id in set(rng.choices(range(1, tags + 1), weights, k=TAGS_PER_POST))
+        ])
+    session.commit()
+
+
+async def main(args: argparse.Namespace) -> None:
+    sync_engine = create_engine(sync_url(args.database_url))
+    with sessionmaker(bind=sync_engine)() as session:
+        seed(session, args.rows, args.tags, args.days)
+    sync_engine.dispose()
+
+    engine = create_async_engine(args.database_url, **pool_options(args.database_url))
+    session_factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+    async with session_factory() as db:
+        counters = await rebuild_tag_usage(db)
+
+    async def scan():
+        async with session_factory() as db:
+            count = func.count().label("count")
+            await db.execute(
+                select(Hashtag.id, Hashtag.name, count)
+                .join(post_hashtags, post_hashtags.c.hashtag_id == Hashtag.id)
+                .join(Post, Post.id == post_hashtags.c.post_id)
+                .where(Post.created_dt >= window_start(db, TRENDING_WINDOWS[args.window]))
+                .group_by(Hashtag.id, Hashtag.name)
+                .order_by(count.desc())
+                .limit(10)
+            )
+
+    async def counters_query():
+        trending_cache.clear()
+        async with session_factory() as db:
+            await get_trending_tags(db, args.window, 10)
+
+    async def cached():
+        async with session_factory() as db:
+            await get_trending_tags(db, args.window, 10)
+
+    reports = {
+        "scan post_hashtags": await run_load(scan, args.requests, 1),
+        "hourly counters": await run_load(counters_query, args.requests, 1),
+        "counters in memory": await run_load(cached, args.requests, 1),
+    }
+    await engine.dispose()
+    print_report(
+        f"trending hashtags, window {args.window}, {args.rows} post_hashtags rows over {args.days} days, "
+        f"{counters} hourly counters",
+        reports
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default="sqlite+aiosqlite:///./benchmark.db")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--tags", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--window", choices=list(TRENDING_WINDOWS), default="7d")
+    parser.add_argument("--requests", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
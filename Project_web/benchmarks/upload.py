@@ -0,0 +1,127 @@
+"""
+Load benchmark of /api/images/upload with the storage calls made inline on the
+event loop (the behaviour before the storage thread pool and the background
+qr code job) against the current route.
+
+Both variants use the local fake storage, `--latency` emulates the round-trip
+of a remote storage API such as Cloudinary. Run from the Project_web directory:
+
+    python -m benchmarks.upload --latency 0.05 --requests 500 --concurrency 20
+
+httpx.ASGITransport returns once the app call is over, background tasks included,
+so the offloaded latencies also contain the qr code job and are an upper bound.
+"""
+import argparse
+import asyncio
+import tempfile
+import uuid
+from typing import List
+
+import httpx
+from fastapi import Depends, FastAPI, File, UploadFile
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from main import app
+from benchmarks.get_images import seed, sync_url
+from benchmarks.utils import print_report, run_load
+from src.conf.config import settings
+from src.database.db import get_db, pool_options
+from src.database.models import Post, User
+from src.repository import images as repository_images
+from src.services.auth import auth_service
+from src.services.storage import LocalStorage
+from src.utils.qr_code import render_qr_code
+
+
+def legacy_app(session_factory: async_sessionmaker, storage: LocalStorage, user: User) -> FastAPI:
+    """
+    The legacy_app function builds an app uploading the image and its qr code
+    inside the request with blocking calls, the pre-offload way.
+
+    :param session_factory: async_sessionmaker: Async session factory
+    :param storage: LocalStorage: Storage the files are written to
+    :param user: User: User the requests are made for
+    :return: A FastAPI application
+    """
+    legacy = FastAPI()
+
+    async def get_async_db():
+        async with session_factory() as db:
+            yield db
+
+    @legacy.post("/api/images/upload")
+    async def upload_file(description: str, hashtags: List[str],
+                          db: AsyncSession = Depends(get_async_db), file: UploadFile = File(...)):
+        public_id = f'{settings.cloudinary_folder_name}/{uuid.uuid4()}'
+        url = storage.upload_sync(file.file, public_id)
+        qr_url = storage.upload_sync(
+            render_qr_code(url),
+            f'{settings.cloudinary_folder_name}/qrcode/{uuid.uuid4()}'
+        )
+        post = Post(description=description, author_id=user.id, image_url=url, qr_code_url=qr_url)
+        db.add(post)
+        await db.commit()
+        return {"id": post.id}
+
+    return legacy
+
+
+async def bench(client: httpx.AsyncClient, payload: bytes, requests: int, concurrency: int) -> dict:
+    async def call():
+        response = await client.post(
+            "/api/images/upload",
+            params={"description": "benchmark"},
+            data={"hashtags": "benchmark"},
+            files={"file": ("image.jpg", payload, "image/jpeg")}
+        )
+        response.raise_for_status()
+
+    return await run_load(call, requests, concurrency)
+
+
+async def main(args: argparse.Namespace) -> None:
+    sync_engine = create_engine(sync_url(args.database_url))
+    with sessionmaker(bind=sync_engine)() as session:
+        user = seed(session, 0)
+        session.expunge(user)
+    sync_engine.dispose()
+
+    async_engine = create_async_engine(args.database_url, **pool_options(args.database_url))
+    async_factory = async_sessionmaker(bind=async_engine, expire_on_commit=False)
+    payload = b"\0" * args.size
+
+    async def override_get_db():
+        async with async_factory() as db:
+            yield db
+
+    reports = {}
+    with tempfile.TemporaryDirectory() as root:
+        storage = LocalStorage(root, "/storage", latency=args.latency)
+        repository_images.get_storage = lambda: storage
+        app.dependency_overrides[get_db] = override_get_db
+        app.dependency_overrides[auth_service.get_current_user] = lambda: user
+
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=legacy_app(async_factory, storage, user)),
+                                     base_url="http://bench") as client:
+            reports["inline upload"] = await bench(client, payload, args.requests, args.concurrency)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            reports["offloaded upload"] = await bench(client, payload, args.requests, args.concurrency)
+
+    app.dependency_overrides.clear()
+    await async_engine.dispose()
+    print_report(
+        f"POST /api/images/upload, {args.size} bytes, latency {args.latency}s, concurrency {args.concurrency}",
+        reports
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default="sqlite+aiosqlite:///./benchmark.db")
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--size", type=int, default=256 * 1024)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,144 @@
+import asyncio
+import json
+import statistics
+import time
+from pathlib import Path
+from typing import Awaitable, Callable, List
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """
+    The percentile function returns the pct-th percentile of the samples
+    using linear interpolation between the closest ranks.
+
+    :param samples: List[float]: Measured values
+    :param pct: float: Percentile in the 0..100 range
+    :return: The percentile value, 0.0 for an empty list
+    """
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(latencies: List[float], elapsed: float) -> dict:
+    """
+    The summarize function turns a list of request latencies (seconds) into
+    a report with throughput and p50/p95/p99 latencies in milliseconds.
+
+    :param latencies: List[float]: Latency of every request in seconds
+    :param elapsed: float: Wall time of the whole run in seconds
+    :return: A dictionary with the report
+    """
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+async def run_load(
+    call: Callable[[], Awaitable[object]],
+    requests: int,
+    concurrency: int
+) -> dict:
+    """
+    The run_load function fires `requests` calls with at most `concurrency`
+    of them in flight and measures the latency of every call.
+
+    :param call: Callable[[], Awaitable[object]]: Coroutine factory doing one request
+    :param requests: int: Total number of requests
+    :param concurrency: int: Number of concurrent workers
+    :return: The report produced by summarize
+    """
+    latencies: List[float] = []
+    counter = iter(range(requests))
+
+    async def worker():
+        for _ in counter:
+            started = time.perf_counter()
+            await call()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def print_report(title: str, reports: dict, columns: List[str] | None = None) -> None:
+    """
+    The print_report function prints one line per benchmarked variant. Keys a
+    benchmark adds to the summarize report are printed as extra columns.
+
+    :param title: str: Benchmark title
+    :param reports: dict: Mapping of variant name to its summarize report
+    :param columns: List[str]: First columns, the summarize ones by default
+    :return: None
+    """
+    columns = list(columns or ["requests", "rps", "p50_ms", "p95_ms", "p99_ms"])
+    for report in reports.values():
+        columns += [key for key in report if key not in columns and key != "mean_ms"]
+    width = max([20] + [len(name) + 2 for name in reports])
+    print(title)
+    widths = [max(14, len(column) + 2) for column in columns]
+    print(f"{'variant':<{width}}" + "".join(f"{column:>{w}}" for column, w in zip(columns, widths)))
+    for name, report in reports.items():
+        print(f"{name:<{width}}" + "".join(f"{report.get(column, ''):>{w}}" for column, w in zip(columns, widths)))
+
+
+def save_results(path: str, meta: dict, reports: dict) -> None:
+    """
+    The save_results function writes the reports of a run with a description of
+    the run (commit, dataset, load) as JSON, the format read by load_results.
+
+    :param path: str: Output file
+    :param meta: dict: Description of the run
+    :param reports: dict: Mapping of endpoint name to its report
+    :return: None
+    """
+    Path(path).write_text(json.dumps({"meta": meta, "reports": reports}, indent=2) + "\n")
+
+
+def load_results(path: str) -> dict:
+    return json.loads(Path(path).read_text())
+
+
+def compare_reports(baseline: dict, reports: dict, max_regression: float) -> dict:
+    """
+    The compare_reports function compares the reports of a run with the reports of
+    a baseline run. Throughput and latencies are relative changes, query counts are
+    absolute: a request doing one more query is a regression whatever the timings.
+
+    :param baseline: dict: Mapping of endpoint name to its baseline report
+    :param reports: dict: Mapping of endpoint name to its report
+    :param max_regression: float: Tolerated relative loss of rps or growth of p95
+    :return: A mapping of endpoint name to its changes, with a "regression" flag
+    """
+    def change(before: float, after: float) -> float:
+        return round((after - before) / before, 3) if before else 0.0
+
+    result = {}
+    for name, report in reports.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        delta = {
+            "rps_change": change(before["rps"], report["rps"]),
+            "p50_change": change(before["p50_ms"], report["p50_ms"]),
+            "p95_change": change(before["p95_ms"], report["p95_ms"]),
+            "p99_change": change(before["p99_ms"], report["p99_ms"]),
+            "queries_delta": round(report.get("queries", 0) - before.get("queries", 0), 2),
+        }
+        delta["regression"] = (
+            delta["rps_change"] < -max_regression
+            or delta["p95_change"] > max_regression
+            or delta["queries_delta"] > 0
+        )
+        result[name] = delta
+    return result
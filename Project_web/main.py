@@ -1,13 +1,42 @@
-import uvicorn
-from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse
-from fastapi.templating import Jinja2Templates
+from contextlib import asynccontextmanager
+from pathlib import Path
 
-from src.routes import auth, users, admin, images, comments, ratings
+from fastapi import Depends, FastAPI, Request
+from fastapi.responses import HTMLResponse, PlainTextResponse
+from fastapi.staticfiles import StaticFiles
 
+from src.conf.config import settings
+from src.database.db import engine
+from src.database.models import User
+from src.routes import auth, users, admin, images, comments, ratings, tags
+from src.services.auth import is_admin
 
-app = FastAPI()
-templates = Jinja2Templates(directory="src/templates")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    The lifespan function starts the worker sending the queued emails with the
+    application and stops it, closing its SMTP connections, on shutdown.
+
+    :param app: FastAPI: The application
+    :return: An async context manager
+    :doc-author: Trelent
+    """
+    if not settings.email_worker_enabled:
+        yield
+        return
+    from src.services.outbox import outbox_worker
+
+    outbox_worker.start()
+    try:
+        yield
+    finally:
+        await outbox_worker.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+# Jinja2 is imported by the first request to the index page
+templates = None
 
 app.include_router(auth.router, prefix='/api')
 app.include_router(users.router, prefix='/api')
@@ -15,6 +44,43 @@ app.include_router(admin.router, prefix='/api')
 app.include_router(images.router, prefix='/api')
 app.include_router(comments.router, prefix='/api')
 app.include_router(ratings.router, prefix='/api')
+app.include_router(tags.router, prefix='/api')
+
+if settings.metrics_enabled:
+    from src.services.metrics import MetricsMiddleware, instrument_engine, metrics
+
+    instrument_engine(engine)
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+    def get_metrics(current_user: User = Depends(is_admin)):
+        """
+        The get_metrics function exports request latencies, query statistics and the
+        connection pool state in the Prometheus text format. It is restricted to admins.
+        
+        :param current_user: User: The admin scraping the metrics
+        :return: The metrics of this worker process
+        :doc-author: Trelent
+        """
+        return metrics.render()
+
+if settings.storage_backend == "local":
+    Path(settings.local_storage_path).mkdir(parents=True, exist_ok=True)
+    app.mount(
+        settings.local_storage_url,
+        StaticFiles(directory=settings.local_storage_path),
+        name="storage"
+    )
+
+if settings.transform_backend == "local":
+    from src.services.transform import ContentAddressedFiles
+
+    Path(settings.transform_store_path).mkdir(parents=True, exist_ok=True)
+    app.mount(
+        settings.transform_store_url,
+        ContentAddressedFiles(directory=settings.transform_store_path),
+        name="transformed"
+    )
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -26,7 +92,14 @@ def read_root(request: Request):
     :return: A dictionary with a key &quot;message&quot; and
     :doc-author: Trelent
     """
+    global templates
+    if templates is None:
+        from fastapi.templating import Jinja2Templates
+
+        templates = Jinja2Templates(directory="src/templates")
     return templates.TemplateResponse("index.html", {"request": request})
 
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run('main:app', host="localhost", port=8000, reload=True)
\ No newline at end of file
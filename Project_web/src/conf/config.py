@@ -3,6 +3,14 @@ from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     sqlalchemy_database_url: str
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_recycle: int = 1800
+    db_pool_timeout: int = 30
+    http_cache_max_age: int = 10
+    metrics_enabled: bool = True
+    slow_query_ms: float = 100
+    n_plus_one_threshold: int = 10
     secret_key: str
     algorithm: str
     mail_username: str
@@ -10,10 +18,69 @@ class Settings(BaseSettings):
     mail_from: str
     mail_port: int
     mail_server: str
+    mail_from_name: str = "Desired Name"
+    mail_ssl_tls: bool = True
+    mail_starttls: bool = False
+    mail_use_credentials: bool = True
+    email_worker_enabled: bool = True
+    email_batch_size: int = 50
+    email_batch_linger: float = 0.2
+    email_poll_interval: float = 5
+    email_smtp_pool_size: int = 4
+    email_smtp_idle_timeout: float = 60
+    email_smtp_timeout: float = 30
+    email_claim_timeout: float = 300
+    email_max_attempts: int = 6
+    email_retry_base: float = 30
+    email_retry_max: float = 3600
     cloudinary_name: str
     cloudinary_api_key: str
     cloudinary_api_secret: str
     cloudinary_folder_name: str
+    storage_backend: str = "cloudinary"
+    storage_workers: int = 8
+    local_storage_path: str = "storage"
+    local_storage_url: str = "/storage"
+    gc_min_age_hours: float = 24
+    gc_list_page_size: int = 500
+    gc_batch_size: int = 100
+    gc_batch_interval: float = 1.0
+    bulk_upload_max_files: int = 20
+    bulk_upload_concurrency: int = 4
+    bulk_transform_concurrency: int = 4
+    transform_backend: str = "cloudinary"
+    transform_workers: int = 2
+    transform_max_pending: int = 32
+    transform_store_path: str = "transformed"
+    transform_store_url: str = "/transformed"
+    qr_code_format: str = "png"
+    qr_code_cache_size: int = 10000
+    qr_code_cache_ttl: float = 600
+    qr_code_workers: int = 2
+    tag_cache_size: int = 1024
+    trending_cache_ttl: float = 60
+    trending_max_tags: int = 100
+    feed_page_size: int = 20
+    feed_max_page_size: int = 100
+    hot_prior_rating: float = 3.0
+    hot_prior_weight: float = 2.0
+    hot_comment_weight: float = 0.5
+    hot_half_life_hours: float = 24.0
+    search_page_size: int = 20
+    search_max_page_size: int = 100
+    search_max_terms: int = 8
+    search_half_life_days: float = 30
+    comments_page_size: int = 50
+    comments_max_page_size: int = 200
+    comments_cache_size: int = 1024
+    comments_cache_ttl: float = 10
+    redis_url: str | None = None
+    user_cache_size: int = 10000
+    user_cache_ttl: float = 5
+    user_cache_redis_ttl: int = 300
+    bcrypt_rounds: int = 12
+    password_workers: int = 4
+    password_max_pending: int = 64
 
     class Config:
         extra = "ignore"
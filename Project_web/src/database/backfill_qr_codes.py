@@ -0,0 +1,24 @@
+"""
+Create the QR codes missing on posts, e.g. when the background job of an
+upload failed. QR codes are rendered in a process pool and uploaded to the
+configured storage backend; already stored ones are reused.
+
+Run from the Project_web directory:
+
+    python -m src.database.backfill_qr_codes
+"""
+import asyncio
+
+from src.database.db import SessionLocal, engine
+from src.repository.images import backfill_qr_codes
+
+
+async def main() -> None:
+    async with SessionLocal() as db:
+        posts = await backfill_qr_codes(db)
+    await engine.dispose()
+    print(f"QR codes created for {posts} posts")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
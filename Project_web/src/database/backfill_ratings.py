@@ -0,0 +1,23 @@
+"""
+Recompute the denormalized rating aggregates of all posts from the ratings table.
+
+Run from the Project_web directory after adding the rating_sum/rating_count
+columns, or whenever the aggregates are suspected to be out of sync:
+
+    python -m src.database.backfill_ratings
+"""
+import asyncio
+
+from src.database.db import SessionLocal, engine
+from src.repository.ratings import recalculate_rating_aggregates
+
+
+async def main() -> None:
+    async with SessionLocal() as db:
+        posts = await recalculate_rating_aggregates(db)
+    await engine.dispose()
+    print(f"Rating aggregates recalculated, {posts} rated posts")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
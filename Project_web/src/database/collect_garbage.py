@@ -0,0 +1,39 @@
+"""
+Delete the stored images and QR codes no post refers to any more (images of
+deleted posts, QR codes of deleted or transformed images).
+
+Run from the Project_web directory, first with --dry-run to review the orphans:
+
+    python -m src.database.collect_garbage --dry-run
+    python -m src.database.collect_garbage
+
+With STORAGE_BACKEND=local it runs against the files under LOCAL_STORAGE_PATH.
+"""
+import argparse
+import asyncio
+from datetime import timedelta
+
+from src.conf.config import settings
+from src.database.db import SessionLocal, engine
+from src.repository.storage_gc import collect_garbage
+
+
+async def main(args: argparse.Namespace) -> None:
+    async with SessionLocal() as db:
+        report = await collect_garbage(db, dry_run=args.dry_run, min_age=timedelta(hours=args.min_age_hours))
+    await engine.dispose()
+    for public_id in report["orphans"]:
+        print(public_id)
+    action = "would be deleted" if args.dry_run else f"found, {report['deleted']} deleted"
+    print(
+        f"{report['scanned']} objects scanned, {report['referenced']} referenced by posts, "
+        f"{len(report['orphans'])} orphans {action}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="only list the orphans")
+    parser.add_argument("--min-age-hours", type=float, default=settings.gc_min_age_hours,
+                        help="keep objects younger than this")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,29 @@
+"""
+Create the full-text search objects (tsvector column, GIN and trigram indexes
+on Postgres, FTS5 table on SQLite) on a database created before they existed.
+New databases get them with the tables.
+
+Run from the Project_web directory:
+
+    python -m src.database.create_search_index
+"""
+import asyncio
+
+from sqlalchemy import text
+
+from src.database.db import engine
+from src.database.models import create_search_objects
+
+
+async def main() -> None:
+    async with engine.begin() as connection:
+        await connection.run_sync(create_search_objects, "posts")
+        await connection.run_sync(create_search_objects, "hashtags")
+        if connection.dialect.name == "sqlite":
+            await connection.execute(text("INSERT INTO posts_fts (posts_fts) VALUES ('rebuild')"))
+    await engine.dispose()
+    print("Search index created")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,17 +1,48 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 
 from src.conf.config import settings
 
 
 SQLALCHEMY_DATABASE_URL = settings.sqlalchemy_database_url
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-def get_db():
-    db = SessionLocal()
-    try:
+def pool_options(url: str) -> dict:
+    """
+    The pool_options function returns the connection pool arguments from settings.
+    SQLite drivers don't use a queue pool, so no pool sizing is passed for them.
+
+    :param url: str: Database url the engine is created for
+    :return: Keyword arguments for create_async_engine
+    :doc-author: Trelent
+    """
+    if url.startswith("sqlite"):
+        return {}
+    return {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_pre_ping": True,
+    }
+
+
+engine = create_async_engine(SQLALCHEMY_DATABASE_URL, **pool_options(SQLALCHEMY_DATABASE_URL))
+
+SessionLocal = async_sessionmaker(
+    bind=engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
+
+async def get_db():
+    """
+    The get_db function is a dependency that yields an AsyncSession bound to the
+    application's async engine and closes it once the request is finished.
+
+    :return: An async database session
+    :doc-author: Trelent
+    """
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
@@ -10,20 +10,44 @@ from sqlalchemy import (
     func,
     Enum as SQLAEnum,
     Boolean,
-    Float)
-from sqlalchemy.orm import relationship
+    Float,
+    Index,
+    event,
+    literal_column,
+    text)
+from sqlalchemy.orm import query_expression, relationship
 from sqlalchemy.ext.declarative import declarative_base
 from enum import Enum
 
 Base = declarative_base()
 
 
+def row_version():
+    """
+    The row_version function is the onupdate value of the version columns: every UPDATE
+    of the row, ORM flush or bulk statement alike, increments it in the same statement,
+    unless the statement sets the version itself (see repository.ranking.refresh_hot_scores).
+    Read endpoints derive their ETags from it.
+    
+    :return: An SQL expression
+    :doc-author: Trelent
+    """
+    return literal_column("version") + 1
+
+
 class UserRole(str, Enum):
     admin = "admin"
     user = "user"
     moderator = "moderator"
 
 
+class EmailStatus(str, Enum):
+    pending = "pending"
+    sending = "sending"
+    sent = "sent"
+    failed = "failed"
+
+
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True)
@@ -39,6 +63,8 @@ class User(Base):
     is_active = Column(Boolean, default=True)
     ratings = relationship("Rating", back_populates="user")
     comments = relationship("Comments", back_populates="user")
+    # incremented by every update of the row, see row_version
+    version = Column(Integer, nullable=False, default=1, server_default="1", onupdate=row_version())
 
 
 post_hashtags = Table(
@@ -47,6 +73,9 @@ post_hashtags = Table(
     Column("post_id", Integer, ForeignKey("posts.id", ondelete='CASCADE')),
     Column("hashtag_id", Integer, ForeignKey("hashtags.id")),
 )
+# hashtags of a post (selectinload) and posts of a hashtag (search)
+Index("ix_post_hashtags_post_id", post_hashtags.c.post_id, post_hashtags.c.hashtag_id)
+Index("ix_post_hashtags_hashtag_id", post_hashtags.c.hashtag_id)
 
 
 class Post(Base):
@@ -62,19 +91,110 @@ class Post(Base):
     hashtags = relationship("Hashtag", secondary=post_hashtags, back_populates="posts")
     qr_code_url = Column(String)
     created_dt = Column(DateTime, default=func.now())
+    # lineage of transformed images: source post and canonical transformation, see utils.image_utils
+    parent_id = Column(Integer, ForeignKey('posts.id', ondelete='SET NULL'), nullable=True)
+    transformation = Column(String, nullable=True)
+    # denormalized rating aggregates, maintained by repository.ratings
+    rating_sum = Column(Float, nullable=False, default=0, server_default="0")
+    rating_count = Column(Integer, nullable=False, default=0, server_default="0")
+    average_rating = query_expression()
+    # popularity rank of the post, refreshed periodically by repository.ranking
+    hot_score = Column(Float, nullable=False, default=0, server_default="0")
+    version = Column(Integer, nullable=False, default=1, server_default="1", onupdate=row_version())
     ratings = relationship("Rating", back_populates="image")
     comments = relationship("Comments", back_populates="image")
 
 
+# keyset pagination of a user's feed, see repository.images.get_feed
+Index("ix_posts_author_id_created_dt", Post.author_id, Post.created_dt.desc(), Post.id.desc())
+# keyset pagination of the ranked feed, see repository.ranking.get_hot_feed
+Index("ix_posts_hot_score", Post.hot_score.desc(), Post.id.desc())
+# one derived post per source image and transformation
+Index("ix_posts_parent_id_transformation", Post.parent_id, Post.transformation, unique=True)
+
+
 class Hashtag(Base):
     __tablename__ = "hashtags"
 
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, index=True)
+    name = Column(String, unique=True, index=True)
 
     posts = relationship("Post", secondary=post_hashtags, back_populates="hashtags")
 
 
+# full-text search, see repository.search. The tsvector column and the GIN/trigram
+# indexes have no portable ORM form, so they are created with the tables; SQLite
+# (tests, local benchmarks) gets an FTS5 table kept in sync by triggers instead.
+SEARCH_DDL = {
+    "postgresql": {
+        "posts": [
+            "ALTER TABLE posts ADD COLUMN IF NOT EXISTS search_vector tsvector "
+            "GENERATED ALWAYS AS (to_tsvector('simple', coalesce(description, ''))) STORED",
+            "CREATE INDEX IF NOT EXISTS ix_posts_search_vector ON posts USING gin (search_vector)",
+        ],
+        "hashtags": [
+            "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+            "CREATE INDEX IF NOT EXISTS ix_hashtags_name_trgm ON hashtags USING gin (name gin_trgm_ops)",
+        ],
+    },
+    "sqlite": {
+        "posts": [
+            "CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts "
+            "USING fts5(description, content='posts', content_rowid='id')",
+            "CREATE TRIGGER IF NOT EXISTS posts_fts_insert AFTER INSERT ON posts BEGIN "
+            "INSERT INTO posts_fts (rowid, description) VALUES (new.id, new.description); END",
+            "CREATE TRIGGER IF NOT EXISTS posts_fts_delete AFTER DELETE ON posts BEGIN "
+            "INSERT INTO posts_fts (posts_fts, rowid, description) VALUES ('delete', old.id, old.description); END",
+            "CREATE TRIGGER IF NOT EXISTS posts_fts_update AFTER UPDATE OF description ON posts BEGIN "
+            "INSERT INTO posts_fts (posts_fts, rowid, description) VALUES ('delete', old.id, old.description); "
+            "INSERT INTO posts_fts (rowid, description) VALUES (new.id, new.description); END",
+        ],
+    },
+}
+
+
+def create_search_objects(connection, table: str) -> None:
+    """
+    The create_search_objects function creates the search column, indexes or tables
+    of the table for the dialect of the connection. Statements are idempotent.
+
+    :param connection: Connection: Sync connection
+    :param table: str: posts or hashtags
+    :return: None
+    :doc-author: Trelent
+    """
+    for statement in SEARCH_DDL.get(connection.dialect.name, {}).get(table, []):
+        connection.execute(text(statement))
+
+
+@event.listens_for(Post.__table__, "after_create")
+def create_posts_search(target, connection, **kw):
+    create_search_objects(connection, "posts")
+
+
+@event.listens_for(Hashtag.__table__, "after_create")
+def create_hashtags_search(target, connection, **kw):
+    create_search_objects(connection, "hashtags")
+
+
+@event.listens_for(Post.__table__, "before_drop")
+def drop_posts_search(target, connection, **kw):
+    if connection.dialect.name == "sqlite":
+        connection.execute(text("DROP TABLE IF EXISTS posts_fts"))
+
+
+# number of posts uploaded with a hashtag per hour, maintained by repository.tags
+# to compute trending hashtags without scanning post_hashtags
+class TagUsage(Base):
+    __tablename__ = "tag_usage"
+    hashtag_id = Column(Integer, ForeignKey("hashtags.id", ondelete='CASCADE'), primary_key=True)
+    bucket = Column(DateTime, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+
+Index("ix_tag_usage_bucket", TagUsage.bucket)
+
+
 class Comments(Base):
     __tablename__ = "comments"
     id = Column(Integer, primary_key=True)
@@ -83,10 +203,16 @@ class Comments(Base):
     updated_at = Column(DateTime, default=None, nullable=True)
     image_id = Column(ForeignKey("posts.id", ondelete='CASCADE'), nullable=False)
     user_id = Column(ForeignKey("users.id", ondelete='CASCADE'), nullable=False)
+    version = Column(Integer, nullable=False, default=1, server_default="1", onupdate=row_version())
     user = relationship("User", back_populates="comments")
     image = relationship("Post", back_populates="comments")
 
 
+# keyset pagination of the comments of an image and of a user, see repository.comments
+Index("ix_comments_image_id_created_at", Comments.image_id, Comments.created_at, Comments.id)
+Index("ix_comments_user_id_created_at", Comments.user_id, Comments.created_at, Comments.id)
+
+
 class Rating(Base):
     __tablename__ = "ratings"
     id = Column(Integer, primary_key=True, index=True)
@@ -96,3 +222,25 @@ class Rating(Base):
 
     user = relationship("User", back_populates="ratings")
     image = relationship("Post", back_populates="ratings")
+
+
+# emails waiting to be sent, see services.outbox: requests only insert a row, a worker
+# sends them in batches over pooled SMTP connections and retries the failures
+class OutboxEmail(Base):
+    __tablename__ = "email_outbox"
+    id = Column(Integer, primary_key=True)
+    recipient = Column(String(250), nullable=False)
+    subject = Column(String(255), nullable=False)
+    template = Column(String(100), nullable=False)
+    # JSON of the template variables
+    body = Column(String, nullable=False)
+    status = Column(SQLAEnum(EmailStatus), nullable=False, default=EmailStatus.pending)
+    attempts = Column(Integer, nullable=False, default=0, server_default="0")
+    # when a pending email is due, or when the claim of a sending one expires
+    next_attempt_at = Column(DateTime, nullable=False)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=func.now(), nullable=False)
+    sent_at = Column(DateTime, nullable=True)
+
+
+Index("ix_email_outbox_due", OutboxEmail.status, OutboxEmail.next_attempt_at)
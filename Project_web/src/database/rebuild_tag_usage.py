@@ -0,0 +1,24 @@
+"""
+Recompute the hourly hashtag usage counters behind /api/tags/trending from the
+posts of the last week and drop the older counters.
+
+Run from the Project_web directory after adding the tag_usage table, and
+periodically (e.g. daily) to prune the counters:
+
+    python -m src.database.rebuild_tag_usage
+"""
+import asyncio
+
+from src.database.db import SessionLocal, engine
+from src.repository.tags import rebuild_tag_usage
+
+
+async def main() -> None:
+    async with SessionLocal() as db:
+        counters = await rebuild_tag_usage(db)
+    await engine.dispose()
+    print(f"Hashtag usage rebuilt, {counters} hourly counters")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
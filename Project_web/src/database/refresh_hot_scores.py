@@ -0,0 +1,24 @@
+"""
+Recompute the popularity scores behind /api/images/hot.
+
+Run from the Project_web directory after adding the posts.hot_score column, and
+periodically (e.g. every 10 minutes from cron) so new posts, ratings and comments
+are ranked and older posts decay:
+
+    python -m src.database.refresh_hot_scores
+"""
+import asyncio
+
+from src.database.db import SessionLocal, engine
+from src.repository.ranking import refresh_hot_scores
+
+
+async def main() -> None:
+    async with SessionLocal() as db:
+        posts = await refresh_hot_scores(db)
+    await engine.dispose()
+    print(f"Hot scores refreshed, {posts} posts")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
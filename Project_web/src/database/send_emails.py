@@ -0,0 +1,38 @@
+"""
+Send the emails queued in the outbox (registration confirmations).
+
+The API process sends them itself unless EMAIL_WORKER_ENABLED=false; this script
+runs the same worker as a separate process. Several of them may run at once on
+Postgres, every worker claims different emails. Run from the Project_web directory:
+
+    python -m src.database.send_emails --once
+    python -m src.database.send_emails
+"""
+import argparse
+import asyncio
+
+from src.conf.config import settings
+from src.database.db import engine
+from src.services.outbox import outbox_worker
+
+
+async def main(args: argparse.Namespace) -> None:
+    try:
+        if args.once:
+            await outbox_worker.drain()
+        else:
+            await outbox_worker.run()
+    finally:
+        await outbox_worker.stop()
+        await engine.dispose()
+    stats = outbox_worker.stats
+    print(
+        f"{stats['sent']} emails sent, {stats['retried']} to retry, {stats['failed']} failed "
+        f"in {stats['batches']} batches of up to {settings.email_batch_size}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--once", action="store_true", help="send the due emails and exit")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,206 @@
+from typing import List, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import Select, and_, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf.config import settings
+from src.database.models import Comments, Post, User
+from src.schemas import GetCommentResponce
+from src.utils.cache import LRUCache
+from src.utils.cursor import decode_cursor, encode_cursor
+from src.utils.etag import make_etag
+
+
+# image_id -> {limit: (first page, next cursor, ETag)}, dropped by invalidate_image_comments on every change
+comments_cache = LRUCache(settings.comments_cache_size, ttl=settings.comments_cache_ttl)
+
+
+def invalidate_image_comments(image_id: int) -> None:
+    """
+    The invalidate_image_comments function drops the cached first page of the comments of an image.
+    It must be called after a comment of the image is created, changed or deleted.
+    
+    :param image_id: int: Id of the image
+    :return: None
+    :doc-author: Trelent
+    """
+    comments_cache.pop(image_id)
+
+
+def comments_page_query(owner, foreign_key, owner_id: int, limit: int, cursor: str | None, *columns) -> Select:
+    """
+    The comments_page_query function builds the query of a page of comments of an image or
+    of a user, oldest first: the owner row is outer joined to its comments, so a missing
+    owner gives no rows and an owner without comments gives one empty row. One row more
+    than the page is selected to find out whether there is a next page.
+    
+    :param owner: Post or User model the comments belong to
+    :param foreign_key: Comments column referencing the owner
+    :param owner_id: int: Id of the owner
+    :param limit: int: Number of comments on a page
+    :param cursor: str: Cursor returned with the previous page, None for the first one
+    :param columns: Comments entity or columns selected after the id of the owner
+    :return: The select statement
+    :doc-author: Trelent
+    """
+    join_on = foreign_key == owner.id
+    if cursor:
+        join_on = and_(join_on, tuple_(Comments.created_at, Comments.id) > tuple_(*decode_cursor(cursor)))
+    return (
+        select(owner.id, *columns)
+        .outerjoin(Comments, join_on)
+        .filter(owner.id == owner_id)
+        .order_by(Comments.created_at, Comments.id)
+        .limit(limit + 1)
+    )
+
+
+async def get_comments_page(
+    db: AsyncSession,
+    owner,
+    foreign_key,
+    owner_id: int,
+    limit: int,
+    cursor: str | None
+) -> Tuple[List[GetCommentResponce], str | None] | None:
+    """
+    The get_comments_page function loads a page of comments of an image or of a user,
+    oldest first, with a single query (see comments_page_query).
+    
+    :param db: AsyncSession: Get the database session
+    :param owner: Post or User model the comments belong to
+    :param foreign_key: Comments column referencing the owner
+    :param owner_id: int: Id of the owner
+    :param limit: int: Number of comments on a page
+    :param cursor: str: Cursor returned with the previous page, None for the first one
+    :return: A tuple of the comments and the cursor of the next page, None if the owner doesn't exist
+    :doc-author: Trelent
+    """
+    result = await db.execute(comments_page_query(owner, foreign_key, owner_id, limit, cursor, Comments))
+    rows = result.all()
+    if not rows:
+        return None
+    comments = [GetCommentResponce.model_validate(comment) for _, comment in rows if comment is not None]
+    if len(comments) <= limit:
+        return comments, None
+    comments = comments[:limit]
+    return comments, encode_cursor(comments[-1].created_at, comments[-1].id)
+
+
+def comments_etag(image_id: int, limit: int, cursor: str | None, next_cursor: str | None, versions) -> str:
+    """
+    The comments_etag function builds the ETag of a page of comments of an image from the
+    ids and versions of its comments.
+    
+    :param image_id: int: Id of the image
+    :param limit: int: Number of comments on a page
+    :param cursor: str: Cursor of the page, None for the first one
+    :param next_cursor: str: Cursor of the next page, None on the last page
+    :param versions: (id, version) pairs of the comments of the page
+    :return: The ETag header value
+    :doc-author: Trelent
+    """
+    return make_etag("comments", image_id, cursor, limit, next_cursor, list(versions))
+
+
+async def get_comments_etag_by_image(
+    db: AsyncSession,
+    image_id: int,
+    limit: int,
+    cursor: str | None = None
+) -> Tuple[str, str | None] | None:
+    """
+    The get_comments_etag_by_image function returns the ETag of a page of comments of an image
+    without loading the comments: a cached first page keeps its ETag, other pages are
+    validated with the ids and versions of their comments only.
+    
+    :param db: AsyncSession: Get the database session
+    :param image_id: int: Get the image id from the url
+    :param limit: int: Number of comments on a page
+    :param cursor: str: Cursor returned with the previous page, None for the first one
+    :return: A tuple of the ETag and the cursor of the next page, None if the image doesn't exist
+    :doc-author: Trelent
+    """
+    if cursor is None:
+        pages = comments_cache.get(image_id) or {}
+        if limit in pages:
+            _, next_cursor, etag = pages[limit]
+            return etag, next_cursor
+    result = await db.execute(comments_page_query(
+        Post, Comments.image_id, image_id, limit, cursor, Comments.id, Comments.created_at, Comments.version
+    ))
+    rows = result.all()
+    if not rows:
+        return None
+    keys = [(comment_id, created_at, version) for _, comment_id, created_at, version in rows if comment_id is not None]
+    next_cursor = None
+    if len(keys) > limit:
+        keys = keys[:limit]
+        last_id, last_created_at, _ = keys[-1]
+        next_cursor = encode_cursor(last_created_at, last_id)
+    versions = [(comment_id, version) for comment_id, _, version in keys]
+    return comments_etag(image_id, limit, cursor, next_cursor, versions), next_cursor
+
+
+async def get_comments_by_image(
+    db: AsyncSession,
+    image_id: int,
+    limit: int,
+    cursor: str | None = None
+) -> Tuple[List[GetCommentResponce], str | None, str]:
+    """
+    The get_comments_by_image function returns a page of comments for the image with the given id
+    and its ETag. The first page is cached with its ETag for a few seconds (COMMENTS_CACHE_TTL).
+    
+    :param db: AsyncSession: Get the database session
+    :param image_id: int: Get the image id from the url
+    :param limit: int: Number of comments on a page
+    :param cursor: str: Cursor returned with the previous page, None for the first one
+    :return: A tuple of the comments, the cursor of the next page and the ETag of the page
+    :doc-author: Trelent
+    """
+    if cursor is None:
+        pages = comments_cache.get(image_id) or {}
+        if limit in pages:
+            return pages[limit]
+    page = await get_comments_page(db, Post, Comments.image_id, image_id, limit, cursor)
+    if page is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Image not found"
+        )
+    comments, next_cursor = page
+    page = comments, next_cursor, comments_etag(
+        image_id, limit, cursor, next_cursor, ((comment.id, comment.version) for comment in comments)
+    )
+    if cursor is None:
+        pages = comments_cache.get(image_id) or {}
+        pages[limit] = page
+        comments_cache.put(image_id, pages)
+    return page
+
+
+async def get_comments_by_user(
+    db: AsyncSession,
+    user_id: int,
+    limit: int,
+    cursor: str | None = None
+) -> Tuple[List[GetCommentResponce], str | None]:
+    """
+    The get_comments_by_user function returns a page of comments made by the user with the given ID.
+    
+    :param db: AsyncSession: Get the database session
+    :param user_id: int: Specify the user_id of the user we want to get comments for
+    :param limit: int: Number of comments on a page
+    :param cursor: str: Cursor returned with the previous page, None for the first one
+    :return: A tuple of the comments and the cursor of the next page
+    :doc-author: Trelent
+    """
+    page = await get_comments_page(db, User, Comments.user_id, user_id, limit, cursor)
+    if page is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    return page
@@ -1,26 +1,37 @@
-from typing import List
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple
 import uuid
-import cloudinary
-import cloudinary.uploader
 from fastapi import HTTPException, UploadFile, status
-from sqlalchemy import and_
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, case, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import selectinload, with_expression
 
-from src.database.models import Post, User
-from src.utils.qr_code import get_qr_code_by_url
-from src.repository.tags import get_or_create_tag
+from src.database.models import Post, User, post_hashtags
+from src.utils.qr_code import upload_qr_code, upload_qr_codes
+from src.repository.comments import invalidate_image_comments
+from src.repository.tags import decrement_tag_usage, get_or_create_tags, increment_tag_usage
 from src.conf.config import settings
 from src.services.auth import check_is_admin_or_moderator
+from src.services.storage import Storage, get_storage
+from src.utils.cursor import decode_cursor, encode_cursor
 
 
-cloudinary.config(
-        cloud_name=settings.cloudinary_name,
-        api_key=settings.cloudinary_api_key,
-        api_secret=settings.cloudinary_api_secret,
-        secure=True
-    )
+# average rating of a post computed from its denormalized rating aggregates
+average_rating = case(
+    (Post.rating_count > 0, Post.rating_sum / Post.rating_count),
+    else_=0.0
+)
+
 
-async def create_images_post(description: str, hashtags: List[str], user: User, db: Session, file: UploadFile)-> Post:
+async def create_images_post(
+    description: str,
+    hashtags: List[str],
+    user: User,
+    db: AsyncSession,
+    file: UploadFile,
+    storage: Storage | None = None
+) -> Post:
     """
     The create_images_post function creates a new post with the given description, hashtags, user and db.
         Args:
@@ -32,28 +43,169 @@ async def create_images_post(description: str, hashtags: List[str], user: User,
     :param description: str: Pass in the description of the post
     :param hashtags: List[str]: Get the hashtags from the request body
     :param user: User: Get the user id of the author
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :param file: UploadFile: Upload the image to cloudinary
-    :return: An object of the post class
+    :param storage: Storage: Storage backend, the configured one by default
+    :return: An object of the post class, its qr code is attached later by attach_qr_code
     :doc-author: Trelent
     """
-    dbtags = []
-    for tag in hashtags:
-        dbtag = await get_or_create_tag(db, tag)
-        dbtags.append(dbtag)
+    storage = storage or get_storage()
+    dbtags = await get_or_create_tags(db, hashtags)
 
     public_id = f'{settings.cloudinary_folder_name}/{uuid.uuid4()}'
-    result = cloudinary.uploader.upload(file.file, public_id=public_id)
-    url = result['secure_url']
-    qr_url = await get_qr_code_by_url(url)    
-    images = Post(description=description, author_id=user.id, image_url=url, qr_code_url=qr_url, hashtags=dbtags)
+    url = await storage.upload(file.file, public_id)
+    images = Post(description=description, author_id=user.id, image_url=url, qr_code_url=None, hashtags=dbtags)
     db.add(images)
-    db.commit()
-    db.refresh(images)
+    if dbtags:
+        await db.flush()
+        await db.refresh(images, ["created_dt"])
+        await increment_tag_usage(db, [tag.id for tag in dbtags], images.created_dt)
+    await db.commit()
+    await db.refresh(images)
     return images
+
+
+async def create_images_posts(
+    description: str,
+    hashtags: List[str],
+    user: User,
+    db: AsyncSession,
+    files: List[UploadFile],
+    storage: Storage | None = None
+) -> List[Tuple[UploadFile, Post | None, str | None]]:
+    """
+    The create_images_posts function creates one post per uploaded file, all with the same
+    description and hashtags. Tags are resolved once, files are uploaded concurrently (at most
+    settings.bulk_upload_concurrency at a time) and the posts of the uploaded files are
+    inserted in one transaction. A failed upload only fails its own file.
+    
+    :param description: str: Pass in the description of the posts
+    :param hashtags: List[str]: Names of the hashtags of the posts
+    :param user: User: Get the user id of the author
+    :param db: AsyncSession: Pass the database session to the function
+    :param files: List[UploadFile]: Files spooled by the multipart parser
+    :param storage: Storage: Storage backend, the configured one by default
+    :return: A list of (file, post, error) in the order of files, post is None when the upload failed
+    :doc-author: Trelent
+    """
+    storage = storage or get_storage()
+    dbtags = await get_or_create_tags(db, hashtags)
+    semaphore = asyncio.Semaphore(settings.bulk_upload_concurrency)
+
+    public_ids = [f'{settings.cloudinary_folder_name}/{uuid.uuid4()}' for _ in files]
+
+    async def upload(file: UploadFile, public_id: str) -> str:
+        async with semaphore:
+            return await storage.upload(file.file, public_id)
+
+    urls = await asyncio.gather(*map(upload, files, public_ids), return_exceptions=True)
+    posts = [
+        None if isinstance(url, Exception)
+        else Post(description=description, author_id=user.id, image_url=url, qr_code_url=None, hashtags=dbtags)
+        for url in urls
+    ]
+    created = [post for post in posts if post is not None]
+    if created:
+        db.add_all(created)
+        try:
+            if dbtags:
+                await db.flush()
+                await db.refresh(created[0], ["created_dt"])
+                await increment_tag_usage(db, [tag.id for tag in dbtags], created[0].created_dt, len(created))
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            # the posts are not stored, don't leave their images behind
+            await asyncio.gather(
+                *(storage.delete(public_id) for public_id, post in zip(public_ids, posts) if post is not None),
+                return_exceptions=True
+            )
+            raise
+        for post in created:
+            await db.refresh(post)
+    return [
+        (file, post, None if post is not None else f"Upload failed: {url}")
+        for file, post, url in zip(files, posts, urls)
+    ]
+
+
+async def attach_qr_codes(posts: Dict[int, str], bind: AsyncEngine, storage: Storage | None = None) -> Dict[int, str]:
+    """
+    The attach_qr_codes function is the batch version of attach_qr_code: the QR codes are
+    rendered in the default thread pool, like single uploads, and the posts are updated
+    with one bulk update.
+    
+    :param posts: Dict[int, str]: Post id -> url encoded in its qr code
+    :param bind: AsyncEngine: Engine of the request session
+    :param storage: Storage: Storage backend, the configured one by default
+    :return: Post id -> url of its qr code image
+    :doc-author: Trelent
+    """
+    storage = storage or get_storage()
+    qr_urls = await upload_qr_codes(list(posts.values()), storage)
+    result = {post_id: qr_urls[url] for post_id, url in posts.items()}
+    async with AsyncSession(bind=bind, expire_on_commit=False) as db:
+        await db.execute(update(Post), [{"id": post_id, "qr_code_url": qr_url} for post_id, qr_url in result.items()])
+        await db.commit()
+    return result
+
+
+async def attach_qr_code(post_id: int, url: str, bind: AsyncEngine, storage: Storage | None = None) -> str:
+    """
+    The attach_qr_code function renders and uploads the QR code of an uploaded image
+    and stores its url on the post. It runs as a background job after the post is inserted,
+    so it opens its own session on the same engine as the request.
     
+    :param post_id: int: Id of the post the qr code belongs to
+    :param url: str: Url encoded in the qr code
+    :param bind: AsyncEngine: Engine of the request session
+    :param storage: Storage: Storage backend, the configured one by default
+    :return: The url of the qr code image
+    :doc-author: Trelent
+    """
+    storage = storage or get_storage()
+    qr_url = await upload_qr_code(url, storage)
+    async with AsyncSession(bind=bind, expire_on_commit=False) as db:
+        await db.execute(update(Post).where(Post.id == post_id).values(qr_code_url=qr_url))
+        await db.commit()
+    return qr_url
+
 
-async def get_images(user_id: int, db: Session):
+async def backfill_qr_codes(db: AsyncSession, storage: Storage | None = None, batch_size: int = 500) -> int:
+    """
+    The backfill_qr_codes function creates the missing QR codes of all posts, e.g. after
+    failed background jobs. Posts are processed in batches ordered by id, the QR codes of
+    a batch are rendered in a pool of settings.qr_code_workers processes, kept for the
+    whole backfill, and the posts are updated with one bulk update.
+    
+    :param db: AsyncSession: Pass the database session to the function
+    :param storage: Storage: Storage backend, the configured one by default
+    :param batch_size: int: Number of posts per batch
+    :return: The number of updated posts
+    :doc-author: Trelent
+    """
+    storage = storage or get_storage()
+    last_id = 0
+    updated = 0
+    with ProcessPoolExecutor(max_workers=settings.qr_code_workers) as pool:
+        while True:
+            result = await db.execute(
+                select(Post.id, Post.image_url)
+                .where(Post.qr_code_url.is_(None), Post.id > last_id)
+                .order_by(Post.id)
+                .limit(batch_size)
+            )
+            rows = result.all()
+            if not rows:
+                return updated
+            qr_urls = await upload_qr_codes([url for _, url in rows], storage, executor=pool)
+            await db.execute(update(Post), [{"id": post_id, "qr_code_url": qr_urls[url]} for post_id, url in rows])
+            await db.commit()
+            updated += len(rows)
+            last_id = rows[-1][0]
+
+
+async def get_images(user_id: int, db: AsyncSession):
     """
     The get_images function returns all images that the current user has uploaded.
             
@@ -61,13 +213,49 @@ async def get_images(user_id: int, db: Session):
         
     
     :param user_id: int: Get the current user's id
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :return: All images that the current user has uploaded
     :doc-author: Trelent
     """
-    return db.query(Post).filter(Post.author_id == str(user_id)).all()
+    result = await db.execute(select(Post).filter(Post.author_id == user_id))
+    return result.scalars().all()
 
-async def get_image(image_id : int, user_id: User, db: Session):
+async def get_feed(user_id: int, db: AsyncSession, limit: int, cursor: str | None = None) -> Tuple[List[Post], str | None]:
+    """
+    The get_feed function returns one page of the images of a user, newest first.
+    Pages are keyset-paginated on (created_dt, id), so fetching a page costs the same
+    however deep it is. Author and hashtags are loaded with one extra query each for
+    the whole page, the average rating is computed from the post's rating aggregates.
+    
+    :param user_id: int: Get the images of this user
+    :param db: AsyncSession: Access the database
+    :param limit: int: Number of images on a page
+    :param cursor: str: Cursor returned with the previous page, None for the first one
+    :return: A tuple of the images of the page and the cursor of the next page (None on the last page)
+    :doc-author: Trelent
+    """
+    stmt = (
+        select(Post)
+        .filter(Post.author_id == user_id)
+        .options(
+            selectinload(Post.author),
+            selectinload(Post.hashtags),
+            with_expression(Post.average_rating, average_rating)
+        )
+        .order_by(Post.created_dt.desc(), Post.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor:
+        stmt = stmt.filter(tuple_(Post.created_dt, Post.id) < tuple_(*decode_cursor(cursor)))
+    result = await db.execute(stmt)
+    images = result.scalars().all()
+    if len(images) <= limit:
+        return images, None
+    images = images[:limit]
+    return images, encode_cursor(images[-1].created_dt, images[-1].id)
+
+
+async def get_image(image_id : int, user_id: User, db: AsyncSession):
     """
     The get_image function returns the image with the given id.
             
@@ -76,40 +264,51 @@ async def get_image(image_id : int, user_id: User, db: Session):
     
     :param image_id : int: Get the image id from the url
     :param user_id: User: Get the current user from the database
-    :param db: Session: Pass in the database session
+    :param db: AsyncSession: Pass in the database session
     :return: The image with the given id
     :doc-author: Trelent
     """
-    return db.query(Post).filter(and_(Post.author_id == str(user_id), Post.id == image_id)).first()
+    result = await db.execute(
+        select(Post).filter(and_(Post.author_id == user_id, Post.id == image_id))
+    )
+    return result.scalars().first()
 
 
-async def del_image(image_id:int, db: Session, current_user: User ):
+async def del_image(image_id:int, db: AsyncSession, current_user: User ):
     """
     The del_image function deletes an image from the database.
             Args:
                 image_id (int): The id of the post to be deleted.
-                db (Session): A connection to a PostgreSQL database.
+                db (AsyncSession): A connection to a PostgreSQL database.
                 current_user (User): The user who is making this request, as determined by FastAPI's authentication system.
     
     :param image_id:int: Specify the image to be deleted
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :param current_user: User: Check if the user is authorized to delete the image
     :return: A dictionary with the key 'msg' and value 'post deleted'
     :doc-author: Trelent
     """
     try:
-        image = db.query(Post).filter(Post.id == image_id).first()
+        result = await db.execute(select(Post).filter(Post.id == image_id))
+        image = result.scalars().first()
         if (not await check_is_admin_or_moderator(current_user) and
             image.author_id != current_user.id):
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Permission denied")
     except:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Permission denied")
-    db.delete(image)
-    db.commit()
+    # derived posts aren't counted, their parent_id is cleared when their source is deleted
+    if image.transformation is None:
+        result = await db.execute(
+            select(post_hashtags.c.hashtag_id).where(post_hashtags.c.post_id == image_id)
+        )
+        await decrement_tag_usage(db, result.scalars().all(), image.created_dt)
+    await db.delete(image)
+    await db.commit()
+    invalidate_image_comments(image_id)
     return {'msg': 'Post deleted'}
 
 
-async def put_image(image_id:int, new_description:str, current_user: User, db: Session):
+async def put_image(image_id:int, new_description:str, current_user: User, db: AsyncSession):
     """
     The put_image function allows the user to update an image's description.
             The function takes in three parameters:
@@ -121,15 +320,16 @@ async def put_image(image_id:int, new_description:str, current_user: User, db: S
     :param image_id:int: Identify the image that is to be deleted
     :param new_description:str: Change the description of the image
     :param current_user: User: Check if the user is authorized to make changes to the image
-    :param db: Session: Connect to the database
+    :param db: AsyncSession: Connect to the database
     :return: The new_images object
     :doc-author: Trelent
     """
-    image = db.query(Post).filter(Post.id == image_id).first()
+    result = await db.execute(select(Post).filter(Post.id == image_id))
+    image = result.scalars().first()
     if (not await check_is_admin_or_moderator(current_user) and
             image.author_id != current_user.id):      
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Permission denied")
     image.description = new_description
-    db.commit()
-    db.refresh(image)
+    await db.commit()
+    await db.refresh(image)
     return image
@@ -0,0 +1,236 @@
+from collections import Counter
+from typing import Dict, List, Tuple
+
+from sqlalchemy import Integer, any_, bindparam, delete, literal, or_, select, update
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import Comments, Post, Rating, User, post_hashtags
+from src.repository.comments import invalidate_image_comments
+from src.repository.tags import decrement_tag_usages
+from src.services.storage import Storage, get_storage
+from src.utils.qr_code import qr_code_cache
+
+
+def id_in(column, ids: List[int], dialect: str):
+    """
+    The id_in function matches a column against a list of ids. PostgreSQL gets
+    `column = ANY(:ids)` with one array parameter, so the statement is the same for any
+    number of ids; other databases get an IN list.
+
+    :param column: Column: Integer column
+    :param ids: List[int]: Ids to match
+    :param dialect: str: Name of the database dialect
+    :return: An SQL condition
+    :doc-author: Trelent
+    """
+    if dialect == "postgresql":
+        return column == any_(literal(list(ids), postgresql.ARRAY(Integer)))
+    return column.in_(ids)
+
+
+async def with_derived_posts(db: AsyncSession, post_ids: List[int], dialect: str) -> List[int]:
+    """
+    The with_derived_posts function adds the transformed copies of the posts (and their
+    own copies) to the list: they show the same image and can't outlive it.
+
+    :param db: AsyncSession: Access the database
+    :param post_ids: List[int]: Ids of the posts
+    :param dialect: str: Name of the database dialect
+    :return: The ids of the posts and of all posts derived from them
+    :doc-author: Trelent
+    """
+    found = set(post_ids)
+    parents = list(found)
+    while parents:
+        result = await db.execute(select(Post.id).where(id_in(Post.parent_id, parents, dialect)))
+        parents = [post_id for post_id in result.scalars().all() if post_id not in found]
+        found.update(parents)
+    return sorted(found)
+
+
+async def delete_ratings(db: AsyncSession, condition) -> int:
+    """
+    The delete_ratings function deletes the ratings matching the condition with one
+    DELETE ... RETURNING and shifts the rating aggregates of the rated posts with one
+    executemany UPDATE. The caller commits.
+
+    :param db: AsyncSession: Access the database
+    :param condition: SQL condition on ratings
+    :return: The number of deleted ratings
+    :doc-author: Trelent
+    """
+    result = await db.execute(delete(Rating).where(condition).returning(Rating.image_id, Rating.rating))
+    rows = result.all()
+    deltas: Dict[int, Tuple[float, int]] = {}
+    for image_id, rating in rows:
+        rating_sum, rating_count = deltas.get(image_id, (0.0, 0))
+        deltas[image_id] = (rating_sum + rating, rating_count + 1)
+    if deltas:
+        table = Post.__table__
+        await db.execute(
+            update(table)
+            .where(table.c.id == bindparam("b_id"))
+            .values(
+                rating_sum=table.c.rating_sum - bindparam("b_sum"),
+                rating_count=table.c.rating_count - bindparam("b_count")
+            ),
+            [
+                {"b_id": image_id, "b_sum": rating_sum, "b_count": rating_count}
+                for image_id, (rating_sum, rating_count) in deltas.items()
+            ]
+        )
+    return len(rows)
+
+
+async def delete_comments(db: AsyncSession, condition) -> int:
+    """
+    The delete_comments function deletes the comments matching the condition with one
+    DELETE ... RETURNING and drops the cached comments of their images. The caller commits.
+
+    :param db: AsyncSession: Access the database
+    :param condition: SQL condition on comments
+    :return: The number of deleted comments
+    :doc-author: Trelent
+    """
+    result = await db.execute(delete(Comments).where(condition).returning(Comments.image_id))
+    image_ids = result.scalars().all()
+    for image_id in set(image_ids):
+        invalidate_image_comments(image_id)
+    return len(image_ids)
+
+
+async def delete_posts(db: AsyncSession, post_ids: List[int], dialect: str) -> Tuple[int, List[str]]:
+    """
+    The delete_posts function deletes posts with their derived posts, comments, ratings
+    and hashtag links, one set-based DELETE per table, and removes them from the hashtag
+    usage counters. The caller commits.
+
+    :param db: AsyncSession: Access the database
+    :param post_ids: List[int]: Ids of the posts
+    :param dialect: str: Name of the database dialect
+    :return: The number of deleted posts and the urls of their stored images and qr codes
+    :doc-author: Trelent
+    """
+    post_ids = await with_derived_posts(db, post_ids, dialect)
+    if not post_ids:
+        return 0, []
+    result = await db.execute(
+        select(post_hashtags.c.hashtag_id, Post.created_dt)
+        .join(Post, Post.id == post_hashtags.c.post_id)
+        .where(id_in(Post.id, post_ids, dialect), Post.transformation.is_(None))
+    )
+    await decrement_tag_usages(db, Counter(tuple(row) for row in result.all()))
+
+    await delete_comments(db, id_in(Comments.image_id, post_ids, dialect))
+    await db.execute(delete(Rating).where(id_in(Rating.image_id, post_ids, dialect)))
+    await db.execute(delete(post_hashtags).where(id_in(post_hashtags.c.post_id, post_ids, dialect)))
+    result = await db.execute(
+        delete(Post)
+        .where(id_in(Post.id, post_ids, dialect))
+        .returning(Post.image_url, Post.qr_code_url, Post.transformation)
+        .execution_options(synchronize_session=False)
+    )
+    rows = result.all()
+    # images of derived posts are transformations of their source, not stored objects
+    urls = [url for image_url, qr_code_url, transformation in rows
+            for url in ((image_url if transformation is None else None), qr_code_url) if url]
+    if urls:
+        # qr codes are shared by the posts encoding the same url
+        result = await db.execute(
+            select(Post.image_url, Post.qr_code_url)
+            .where(or_(Post.image_url.in_(urls), Post.qr_code_url.in_(urls)))
+        )
+        kept = {url for row in result.all() for url in row}
+        urls = [url for url in urls if url not in kept]
+    return len(rows), urls
+
+
+async def delete_content(
+    db: AsyncSession,
+    post_ids: List[int],
+    comment_ids: List[int],
+    rating_ids: List[int]
+) -> Tuple[Dict[str, int], List[str]]:
+    """
+    The delete_content function deletes posts, comments and ratings by id in one transaction.
+
+    :param db: AsyncSession: Access the database
+    :param post_ids: List[int]: Ids of the posts
+    :param comment_ids: List[int]: Ids of the comments
+    :param rating_ids: List[int]: Ids of the ratings
+    :return: The number of deleted rows per kind and the urls of the stored objects to delete
+    :doc-author: Trelent
+    """
+    dialect = db.get_bind().dialect.name
+    counts = {"comments": 0, "ratings": 0}
+    if comment_ids:
+        counts["comments"] = await delete_comments(db, id_in(Comments.id, comment_ids, dialect))
+    if rating_ids:
+        counts["ratings"] = await delete_ratings(db, id_in(Rating.id, rating_ids, dialect))
+    counts["posts"], urls = await delete_posts(db, post_ids, dialect)
+    await db.commit()
+    return counts, urls
+
+
+async def delete_user_content(db: AsyncSession, user_id: int) -> Tuple[Dict[str, int], List[str]]:
+    """
+    The delete_user_content function deletes all posts, comments and ratings of a user
+    in one transaction, the user account is kept.
+
+    :param db: AsyncSession: Access the database
+    :param user_id: int: Id of the user
+    :return: The number of deleted rows per kind and the urls of the stored objects to delete
+    :doc-author: Trelent
+    """
+    dialect = db.get_bind().dialect.name
+    counts = {
+        "comments": await delete_comments(db, Comments.user_id == user_id),
+        "ratings": await delete_ratings(db, Rating.user_id == user_id),
+    }
+    result = await db.execute(select(Post.id).where(Post.author_id == user_id))
+    counts["posts"], urls = await delete_posts(db, result.scalars().all(), dialect)
+    await db.commit()
+    return counts, urls
+
+
+async def deactivate_users(db: AsyncSession, user_ids: List[int]) -> List[str]:
+    """
+    The deactivate_users function bans many users with one UPDATE.
+
+    :param db: AsyncSession: Access the database
+    :param user_ids: List[int]: Ids of the users
+    :return: The emails of the deactivated users, for the invalidation of the user cache
+    :doc-author: Trelent
+    """
+    dialect = db.get_bind().dialect.name
+    result = await db.execute(
+        update(User)
+        .where(id_in(User.id, user_ids, dialect))
+        .values(is_active=False)
+        .returning(User.email)
+        .execution_options(synchronize_session=False)
+    )
+    emails = result.scalars().all()
+    await db.commit()
+    return emails
+
+
+async def delete_stored_images(urls: List[str], storage: Storage | None = None) -> int:
+    """
+    The delete_stored_images function removes the images and qr codes of deleted posts
+    from the storage with its bulk delete. It runs as a background job after the
+    moderation transaction is committed.
+
+    :param urls: List[str]: Urls of the stored objects
+    :param storage: Storage: Storage backend, the configured one by default
+    :return: The number of deleted objects
+    :doc-author: Trelent
+    """
+    storage = storage or get_storage()
+    public_ids = [public_id for public_id in map(storage.public_id, urls) if public_id]
+    for public_id in public_ids:
+        qr_code_cache.pop(public_id)
+    if not public_ids:
+        return 0
+    return await storage.delete_many(public_ids)
@@ -0,0 +1,141 @@
+import json
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Tuple
+
+from sqlalchemy import Row, bindparam, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf.config import settings
+from src.database.models import EmailStatus, OutboxEmail
+
+
+def utcnow() -> datetime:
+    # naive UTC, the outbox timestamps are compared with the application clock only
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def retry_delay(attempts: int) -> float:
+    """
+    The retry_delay function returns the exponential backoff before the next attempt,
+    with a random jitter so emails failing together are not retried together.
+
+    :param attempts: int: Number of failed attempts
+    :return: The delay in seconds
+    :doc-author: Trelent
+    """
+    delay = min(settings.email_retry_max, settings.email_retry_base * 2 ** (attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+async def queue_email(db: AsyncSession, recipient: str, subject: str, template: str, body: dict) -> OutboxEmail:
+    """
+    The queue_email function adds an email to the outbox, the worker sends it. The caller
+    commits: the email is stored in the same transaction as the change it is about, or not at all.
+
+    :param db: AsyncSession: Access the database
+    :param recipient: str: Email address
+    :param subject: str: Subject of the email
+    :param template: str: Name of the template in services/templates
+    :param body: dict: Template variables, JSON serializable
+    :return: The outbox row
+    :doc-author: Trelent
+    """
+    email = OutboxEmail(
+        recipient=recipient,
+        subject=subject,
+        template=template,
+        body=json.dumps(body),
+        status=EmailStatus.pending,
+        next_attempt_at=utcnow(),
+    )
+    db.add(email)
+    return email
+
+
+async def claim_emails(db: AsyncSession, limit: int) -> List[Row]:
+    """
+    The claim_emails function marks up to `limit` due emails as being sent, with one
+    UPDATE ... RETURNING. The claim expires after settings.email_claim_timeout seconds,
+    so the emails of a worker that died while sending them are sent again. On Postgres
+    the due rows are locked with SKIP LOCKED: concurrent workers claim different emails.
+
+    :param db: AsyncSession: Access the database
+    :param limit: int: Maximum number of emails
+    :return: The claimed emails: id, recipient, subject, template, body and attempts
+    :doc-author: Trelent
+    """
+    now = utcnow()
+    due = (
+        select(OutboxEmail.id)
+        .where(
+            OutboxEmail.status.in_([EmailStatus.pending, EmailStatus.sending]),
+            OutboxEmail.next_attempt_at <= now
+        )
+        .order_by(OutboxEmail.next_attempt_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    result = await db.execute(
+        update(OutboxEmail)
+        .where(OutboxEmail.id.in_(due.scalar_subquery()))
+        .values(status=EmailStatus.sending, next_attempt_at=now + timedelta(seconds=settings.email_claim_timeout))
+        .returning(
+            OutboxEmail.id, OutboxEmail.recipient, OutboxEmail.subject,
+            OutboxEmail.template, OutboxEmail.body, OutboxEmail.attempts
+        )
+        .execution_options(synchronize_session=False)
+    )
+    emails = result.all()
+    await db.commit()
+    return emails
+
+
+async def record_deliveries(db: AsyncSession, emails: List[Row], errors: List[Tuple[str, bool] | None]) -> Dict[str, int]:
+    """
+    The record_deliveries function stores the outcome of a batch with one executemany
+    UPDATE: sent emails are done, failed ones are retried with an exponential backoff
+    until settings.email_max_attempts attempts or a permanent error.
+
+    :param db: AsyncSession: Access the database
+    :param emails: List[Row]: Emails returned by claim_emails
+    :param errors: List[Tuple[str, bool] | None]: None when sent, else the error and whether it is permanent
+    :return: The number of sent, retried and failed emails
+    :doc-author: Trelent
+    """
+    now = utcnow()
+    counts = {"sent": 0, "retried": 0, "failed": 0}
+    params = []
+    for email, error in zip(emails, errors):
+        if error is None:
+            counts["sent"] += 1
+            params.append({
+                "b_id": email.id, "b_status": EmailStatus.sent, "b_attempts": email.attempts + 1,
+                "b_next": now, "b_error": None, "b_sent": now,
+            })
+            continue
+        message, permanent = error
+        attempts = email.attempts + 1
+        failed = permanent or attempts >= settings.email_max_attempts
+        counts["failed" if failed else "retried"] += 1
+        params.append({
+            "b_id": email.id, "b_status": EmailStatus.failed if failed else EmailStatus.pending,
+            "b_attempts": attempts, "b_next": now + timedelta(seconds=retry_delay(attempts)),
+            "b_error": message[:1000], "b_sent": None,
+        })
+    if params:
+        table = OutboxEmail.__table__
+        await db.execute(
+            update(table)
+            .where(table.c.id == bindparam("b_id"))
+            .values(
+                status=bindparam("b_status"),
+                attempts=bindparam("b_attempts"),
+                next_attempt_at=bindparam("b_next"),
+                last_error=bindparam("b_error"),
+                sent_at=bindparam("b_sent"),
+            ),
+            params
+        )
+        await db.commit()
+    return counts
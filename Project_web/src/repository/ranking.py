@@ -0,0 +1,97 @@
+import math
+from typing import List, Tuple
+
+from sqlalchemy import func, select, tuple_, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload, with_expression
+
+from src.conf.config import settings
+from src.database.models import Comments, Post
+from src.repository.images import average_rating
+from src.repository.search import age_in_days
+from src.utils.cursor import decode_score_cursor, encode_score_cursor
+
+
+def hot_score(dialect: str):
+    """
+    The hot_score function builds the popularity score of a post:
+
+        quality * engagement / (1 + k * age_hours / half_life) ** 2
+
+    quality is the average rating pulled towards settings.hot_prior_rating by
+    settings.hot_prior_weight virtual ratings and scaled to 0..1, so a single 5 doesn't
+    beat many 4s. engagement is 1 + ratings + settings.hot_comment_weight * comments.
+    k = sqrt(2) - 1 makes the decay halve the score of a post settings.hot_half_life_hours
+    old, older posts keep falling quadratically. Only arithmetic is used, so the score is computed by the database on
+    PostgreSQL and on SQLite alike.
+
+    :param dialect: str: Name of the database dialect
+    :return: An SQL expression over posts
+    :doc-author: Trelent
+    """
+    comment_count = (
+        select(func.count(Comments.id))
+        .where(Comments.image_id == Post.id)
+        .scalar_subquery()
+    )
+    quality = (
+        (Post.rating_sum + settings.hot_prior_rating * settings.hot_prior_weight)
+        / (Post.rating_count + settings.hot_prior_weight) / 5
+    )
+    engagement = 1 + Post.rating_count + settings.hot_comment_weight * comment_count
+    decay = 1 + (math.sqrt(2) - 1) * 24 * age_in_days(dialect) / settings.hot_half_life_hours
+    return quality * engagement / (decay * decay)
+
+
+async def refresh_hot_scores(db: AsyncSession) -> int:
+    """
+    The refresh_hot_scores function recomputes the hot score of every post with a single
+    UPDATE statement, comment counts come from a correlated aggregate. It is meant to run
+    periodically, see src/database/refresh_hot_scores.py: the ranked feed reads the
+    stored scores, so it never touches ratings or comments. The score isn't part of any
+    representation, so the version of the posts is kept and their ETags stay valid.
+
+    :param db: AsyncSession: Pass the database session to the function
+    :return: The number of updated posts
+    :doc-author: Trelent
+    """
+    result = await db.execute(
+        update(Post)
+        .values(hot_score=hot_score(db.get_bind().dialect.name), version=Post.version)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount
+
+
+async def get_hot_feed(db: AsyncSession, limit: int, cursor: str | None = None) -> Tuple[List[Post], str | None]:
+    """
+    The get_hot_feed function returns one page of all images, most popular first.
+    Pages are keyset-paginated on (hot_score, id) with the ix_posts_hot_score index,
+    so fetching a page costs the same however deep it is. A refresh of the scores
+    between two pages may move posts across the cursor.
+
+    :param db: AsyncSession: Access the database
+    :param limit: int: Number of images on a page
+    :param cursor: str: Cursor returned with the previous page, None for the first one
+    :return: A tuple of the images of the page and the cursor of the next page (None on the last page)
+    :doc-author: Trelent
+    """
+    stmt = (
+        select(Post)
+        .options(
+            selectinload(Post.author),
+            selectinload(Post.hashtags),
+            with_expression(Post.average_rating, average_rating)
+        )
+        .order_by(Post.hot_score.desc(), Post.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor:
+        stmt = stmt.filter(tuple_(Post.hot_score, Post.id) < tuple_(*decode_score_cursor(cursor)))
+    result = await db.execute(stmt)
+    images = result.scalars().all()
+    if len(images) <= limit:
+        return images, None
+    images = images[:limit]
+    return images, encode_score_cursor(images[-1].hot_score, images[-1].id)
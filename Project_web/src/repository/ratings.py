@@ -1,21 +1,25 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException, status
 
 from src.database.models import Rating, User, Post, UserRole
 
 
-async def create_rating(db: Session, user: User, image: Post, rating_value: int) -> Rating:
+async def create_rating(db: AsyncSession, user: User, image: Post, rating_value: int) -> Rating:
     """
     The create_rating function creates a new rating for an image by a user.
     
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :param user: User: Get the user that is creating the rating
     :param image: Post: Pass in the image being rated
     :param rating_value: int: Pass in the value of the rating
     :return: A rating object
     :doc-author: Trelent
     """
-    existing_rating = db.query(Rating).filter(Rating.user_id == user.id, Rating.image_id == image.id).first()
+    result = await db.execute(
+        select(Rating).filter(Rating.user_id == user.id, Rating.image_id == image.id)
+    )
+    existing_rating = result.scalars().first()
     if existing_rating:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="You have already rated this image")
 
@@ -24,59 +28,115 @@ async def create_rating(db: Session, user: User, image: Post, rating_value: int)
 
     new_rating = Rating(user_id=user.id, image_id=image.id, rating=rating_value)
     db.add(new_rating)
-    db.commit()
-    db.refresh(new_rating)
+    await update_rating_aggregates(db, image.id, rating_value, 1)
+    await db.commit()
+    await db.refresh(new_rating)
     return new_rating
 
 
-async def get_ratings(db: Session, image_id: int):
+async def get_ratings(db: AsyncSession, image_id: int):
     """
     The get_ratings function returns a list of ratings for a specific image.
     
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :param image_id: int: Filter the database query
     :return: A list of rating objects
     :doc-author: Trelent
     """
-    return db.query(Rating).filter(Rating.image_id == image_id).all()
+    result = await db.execute(select(Rating).filter(Rating.image_id == image_id))
+    return result.scalars().all()
 
 
-async def delete_rating(db: Session, rating_id: int, current_user: User):
+async def delete_rating(db: AsyncSession, rating_id: int, current_user: User):
     """
     The delete_rating function deletes a rating by ID.
     
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :param rating_id: int: Get the rating that is to be updated
     :param current_user: User: Ensure that only the user who created the rating can delete it
     :return: A dictionary with a message key and the value &quot;rating deleted successfully&quot;
     :doc-author: Trelent
     """
-    rating = db.query(Rating).filter(Rating.id == rating_id).first()
+    result = await db.execute(select(Rating).filter(Rating.id == rating_id))
+    rating = result.scalars().first()
     if not rating:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Rating not found")
 
     if current_user.role not in [UserRole.admin, UserRole.moderator] and rating.user_id != current_user.id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Permission denied")
 
-    db.delete(rating)
-    db.commit()
+    await db.delete(rating)
+    await update_rating_aggregates(db, rating.image_id, -rating.rating, -1)
+    await db.commit()
     return {"message": "Rating deleted successfully"}
 
 
-def calculate_average_rating(db: Session, image_id: int) -> float:
+async def update_rating_aggregates(db: AsyncSession, image_id: int, delta_sum: float, delta_count: int) -> None:
     """
-    The calculate_average_rating function calculates the average rating for a specific image.
+    The update_rating_aggregates function shifts the rating_sum/rating_count of a post.
+    The increment is done by the database in the caller's transaction, so concurrent
+    ratings of the same image don't overwrite each other.
     
-    :param db: Session: Pass in the database session
+    :param db: AsyncSession: Pass the database session to the function
     :param image_id: int: Specify the image id
-    :return: The average rating for a specific image
+    :param delta_sum: float: Value added to rating_sum
+    :param delta_count: int: Value added to rating_count
+    :return: None
     :doc-author: Trelent
     """
-    ratings = db.query(Rating).filter(Rating.image_id == image_id).all()
+    await db.execute(
+        update(Post)
+        .where(Post.id == image_id)
+        .values(
+            rating_sum=Post.rating_sum + delta_sum,
+            rating_count=Post.rating_count + delta_count
+        )
+    )
+
 
-    if not ratings:
+async def calculate_average_rating(db: AsyncSession, image_id: int) -> float:
+    """
+    The calculate_average_rating function calculates the average rating for a specific image
+    from the aggregates stored on the post.
+    
+    :param db: AsyncSession: Pass in the database session
+    :param image_id: int: Specify the image id
+    :return: The average rating for a specific image
+    :doc-author: Trelent
+    """
+    result = await db.execute(
+        select(Post.rating_sum, Post.rating_count).filter(Post.id == image_id)
+    )
+    row = result.first()
+    if not row or not row.rating_count:
         return 0.0
+    return row.rating_sum / row.rating_count
+
 
-    total_score = sum(rating.rating for rating in ratings)
-    average_rating = total_score / len(ratings)
-    return average_rating
+async def recalculate_rating_aggregates(db: AsyncSession) -> int:
+    """
+    The recalculate_rating_aggregates function recomputes rating_sum/rating_count of every post
+    from the ratings table with a single GROUP BY query and a bulk update.
+    
+    :param db: AsyncSession: Pass the database session to the function
+    :return: The number of posts that have ratings
+    :doc-author: Trelent
+    """
+    result = await db.execute(
+        select(Rating.image_id, func.sum(Rating.rating), func.count(Rating.id))
+        .group_by(Rating.image_id)
+    )
+    aggregates = [
+        {"id": image_id, "rating_sum": rating_sum, "rating_count": rating_count}
+        for image_id, rating_sum, rating_count in result.all()
+    ]
+    await db.execute(
+        update(Post)
+        .where(Post.rating_count != 0)
+        .values(rating_sum=0, rating_count=0)
+        .execution_options(synchronize_session=False)
+    )
+    if aggregates:
+        await db.execute(update(Post), aggregates)
+    await db.commit()
+    return len(aggregates)
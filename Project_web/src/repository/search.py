@@ -0,0 +1,133 @@
+import re
+from typing import List
+
+from sqlalchemy import Float, cast, column, func, literal_column, or_, select, table, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload, with_expression
+from sqlalchemy.sql import Select
+
+from src.conf.config import settings
+from src.database.models import Hashtag, Post, post_hashtags
+from src.repository.images import average_rating
+
+
+posts_fts = table("posts_fts", column("rowid"), column("rank"))
+
+
+def search_terms(q: str) -> List[str]:
+    """
+    The search_terms function splits the query into lowercase words. Words only contain
+    letters, digits and underscores, so they are safe to use in tsquery and FTS5 syntax.
+    
+    :param q: str: Search query
+    :return: At most settings.search_max_terms words
+    :doc-author: Trelent
+    """
+    return re.findall(r"\w+", q.lower())[:settings.search_max_terms]
+
+
+def escape_like(term: str) -> str:
+    return term.replace("/", "//").replace("%", "/%").replace("_", "/_")
+
+
+def text_matches(dialect: str, terms: List[str]) -> Select:
+    """
+    The text_matches function selects the posts whose description contains every term
+    as a word prefix, with a relevance in the 0..1 range. Postgres matches the tsvector
+    column, SQLite the FTS5 table.
+    
+    :param dialect: str: Name of the database dialect
+    :param terms: List[str]: Words returned by search_terms
+    :return: A select of (post_id, relevance)
+    :doc-author: Trelent
+    """
+    if dialect == "postgresql":
+        query = func.to_tsquery("simple", " & ".join(f"{term}:*" for term in terms))
+        vector = literal_column("posts.search_vector")
+        # normalization 32 scales the rank to rank / (rank + 1)
+        return (
+            select(Post.id.label("post_id"), cast(func.ts_rank_cd(vector, query, 32), Float).label("relevance"))
+            .where(vector.op("@@")(query))
+        )
+    # FTS5 rank is the negated bm25 score
+    match = " ".join(f'"{term}"*' for term in terms)
+    return (
+        select(posts_fts.c.rowid.label("post_id"), (-posts_fts.c.rank / (1 - posts_fts.c.rank)).label("relevance"))
+        .where(literal_column("posts_fts").op("MATCH")(match))
+    )
+
+
+def tag_matches(dialect: str, term: str) -> Select:
+    """
+    The tag_matches function selects the posts having a hashtag that starts with the term
+    or, on Postgres, is similar to it according to pg_trgm. The relevance is the trigram
+    similarity on Postgres and the matched share of the name on SQLite.
+    
+    :param dialect: str: Name of the database dialect
+    :param term: str: Word returned by search_terms
+    :return: A select of (post_id, relevance)
+    :doc-author: Trelent
+    """
+    prefix = Hashtag.name.ilike(f"{escape_like(term)}%", escape="/")
+    if dialect == "postgresql":
+        relevance = func.greatest(func.similarity(Hashtag.name, term), float(len(term)) / func.length(Hashtag.name))
+        condition = or_(prefix, Hashtag.name.op("%")(term))
+    else:
+        relevance = float(len(term)) / func.length(Hashtag.name)
+        condition = prefix
+    return (
+        select(post_hashtags.c.post_id, cast(relevance, Float).label("relevance"))
+        .join(Hashtag, Hashtag.id == post_hashtags.c.hashtag_id)
+        .where(condition)
+    )
+
+
+def age_in_days(dialect: str):
+    if dialect == "postgresql":
+        return func.extract("epoch", func.now() - Post.created_dt) / 86400
+    return func.julianday("now") - func.julianday(Post.created_dt)
+
+
+async def search_posts(q: str, db: AsyncSession, limit: int, offset: int = 0) -> List[Post]:
+    """
+    The search_posts function searches posts by the words of their description and by
+    their hashtags. Posts are ordered by relevance x rating x recency, where the rating
+    factor grows from 1 to 2 with the average rating and the recency factor falls from 1
+    for a new post to 1/2 for a post settings.search_half_life_days days old.
+    
+    :param q: str: Search query
+    :param db: AsyncSession: Access the database
+    :param limit: int: Number of posts on a page
+    :param offset: int: Number of posts to skip
+    :return: The posts with their author, hashtags and average rating
+    :doc-author: Trelent
+    """
+    terms = search_terms(q)
+    if not terms:
+        return []
+    dialect = db.get_bind().dialect.name
+    matches = union_all(text_matches(dialect, terms), *(tag_matches(dialect, term) for term in terms)).subquery()
+    relevance = (
+        select(matches.c.post_id, func.sum(matches.c.relevance).label("relevance"))
+        .group_by(matches.c.post_id)
+        .subquery()
+    )
+    score = (
+        relevance.c.relevance
+        * (1 + average_rating / 5)
+        / (1 + age_in_days(dialect) / settings.search_half_life_days)
+    )
+    stmt = (
+        select(Post)
+        .join(relevance, relevance.c.post_id == Post.id)
+        .options(
+            selectinload(Post.author),
+            selectinload(Post.hashtags),
+            with_expression(Post.average_rating, average_rating)
+        )
+        .order_by(score.desc(), Post.id.desc())
+        .limit(limit)
+        .offset(offset)
+    )
+    result = await db.execute(stmt)
+    return result.scalars().all()
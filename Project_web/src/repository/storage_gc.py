@@ -0,0 +1,99 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import List, Set
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf.config import settings
+from src.database.models import Post
+from src.services.storage import Storage, get_storage
+from src.utils.qr_code import qr_code_cache
+
+
+async def referenced_public_ids(db: AsyncSession, storage: Storage) -> Set[str]:
+    """
+    The referenced_public_ids function collects the public ids of all images and qr codes
+    used by posts. A derived post rendered by Cloudinary refers to the stored image it is a
+    transformation of, which must be kept even when its parent post is deleted. Rows are streamed from a server-side cursor, so only the set of ids is
+    held in memory, not the posts.
+
+    :param db: AsyncSession: Access the database
+    :param storage: Storage: Backend the urls point to
+    :return: The set of referenced public ids
+    :doc-author: Trelent
+    """
+    referenced = set()
+    result = await db.stream(
+        select(Post.image_url, Post.qr_code_url).execution_options(yield_per=settings.gc_list_page_size)
+    )
+    async for row in result:
+        for url in row:
+            public_id = storage.source_public_id(url) if url else None
+            if public_id:
+                referenced.add(public_id)
+    return referenced
+
+
+async def collect_garbage(
+    db: AsyncSession,
+    storage: Storage | None = None,
+    dry_run: bool = False,
+    min_age: timedelta | None = None
+) -> dict:
+    """
+    The collect_garbage function deletes the stored objects of the project folder no post
+    refers to: images of deleted posts and their qr codes. The storage is listed page by page
+    and diffed against the urls of the posts, orphans are deleted in batches of
+    settings.gc_batch_size with settings.gc_batch_interval seconds between the batches.
+    Objects younger than min_age are kept, an upload is stored before its post is committed.
+    The deleted qr codes are dropped from the qr code cache of this process, the other
+    processes look them up again once their entries expire (settings.qr_code_cache_ttl).
+
+    :param db: AsyncSession: Access the database
+    :param storage: Storage: Storage backend, the configured one by default
+    :param dry_run: bool: Only report the orphans
+    :param min_age: timedelta: Minimum age of deleted objects, settings.gc_min_age_hours by default
+    :return: A report with the numbers of scanned, referenced, orphaned and deleted objects and the orphans
+    :doc-author: Trelent
+    """
+    storage = storage or get_storage()
+    if min_age is None:
+        min_age = timedelta(hours=settings.gc_min_age_hours)
+    # objects listed after this point may belong to posts the set below doesn't know yet
+    created_before = datetime.now(timezone.utc) - min_age
+    referenced = await referenced_public_ids(db, storage)
+
+    report = {"scanned": 0, "referenced": len(referenced), "orphans": [], "deleted": 0, "dry_run": dry_run}
+    batch: List[str] = []
+    batches = 0
+
+    async def flush():
+        nonlocal batches
+        if batches:
+            await asyncio.sleep(settings.gc_batch_interval)
+        batches += 1
+        for public_id in batch:
+            qr_code_cache.pop(public_id)
+        report["deleted"] += await storage.delete_many(batch)
+        batch.clear()
+
+    cursor = None
+    while True:
+        objects, cursor = await storage.list(
+            f"{settings.cloudinary_folder_name}/", cursor, settings.gc_list_page_size
+        )
+        report["scanned"] += len(objects)
+        for public_id, created in objects:
+            if public_id in referenced or created > created_before:
+                continue
+            report["orphans"].append(public_id)
+            if not dry_run:
+                batch.append(public_id)
+                if len(batch) >= settings.gc_batch_size:
+                    await flush()
+        if cursor is None:
+            break
+    if batch:
+        await flush()
+    return report
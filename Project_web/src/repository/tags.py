@@ -1,21 +1,286 @@
-from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
 
-from src.database.models import Hashtag
+from sqlalchemy import bindparam, case, delete, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
 
+from src.conf.config import settings
+from src.database.models import Hashtag, Post, TagUsage, post_hashtags
+from src.utils.cache import LRUCache
 
-async def get_or_create_tag(db: Session, name: str):
+
+# name -> id of hot tags, tags are never renamed or deleted so entries don't go stale
+tag_cache = LRUCache(settings.tag_cache_size)
+
+TRENDING_WINDOWS = {
+    "1h": timedelta(hours=1),
+    "24h": timedelta(hours=24),
+    "7d": timedelta(days=7),
+}
+
+# (window, limit) -> trending tags, shared by all users and refreshed every trending_cache_ttl seconds
+trending_cache = LRUCache(64, ttl=settings.trending_cache_ttl)
+
+
+def insert_ignore_duplicates(db: AsyncSession, names: List[str]):
+    """
+    The insert_ignore_duplicates function builds a single INSERT of the given tag names
+    that skips names inserted meanwhile by a concurrent request (ON CONFLICT DO NOTHING)
+    and returns the ids of the rows it created.
+
+    :param db: AsyncSession: Session the statement is built for, selects the dialect
+    :param names: List[str]: Names of the tags to insert
+    :return: An insert statement
+    :doc-author: Trelent
+    """
+    values = [{"name": name} for name in names]
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        stmt = postgresql.insert(Hashtag).values(values).on_conflict_do_nothing(index_elements=[Hashtag.name])
+    elif dialect == "sqlite":
+        stmt = sqlite.insert(Hashtag).values(values).on_conflict_do_nothing(index_elements=[Hashtag.name])
+    else:
+        stmt = insert(Hashtag).values(values)
+    return stmt.returning(Hashtag.id, Hashtag.name)
+
+
+async def select_tag_ids(db: AsyncSession, names: List[str]) -> Dict[str, int]:
+    """
+    The select_tag_ids function looks up the ids of the given tag names with a single query.
+
+    :param db: AsyncSession: Pass the database session to the function
+    :param names: List[str]: Names of the tags
+    :return: A dictionary name -> id of the tags that exist
+    :doc-author: Trelent
+    """
+    result = await db.execute(select(Hashtag.id, Hashtag.name).where(Hashtag.name.in_(names)))
+    return {name: tag_id for tag_id, name in result.all()}
+
+
+async def get_or_create_tags(db: AsyncSession, names: List[str]) -> List[Hashtag]:
+    """
+    The get_or_create_tags function resolves a list of tag names to tags, creating the missing ones.
+    Known names are served from the in-process cache, the rest is resolved with one
+    WHERE name IN (...) query and one INSERT ... ON CONFLICT DO NOTHING for the new names,
+    committed once. Duplicated names are returned once.
+    
+    :param db: AsyncSession: Pass the database session to the function
+    :param names: List[str]: Names of the tags
+    :return: A list of tags attached to the session, in the order of names
+    :doc-author: Trelent
+    """
+    names = list(dict.fromkeys(names))
+    ids = {name: tag_cache.get(name) for name in names}
+    missing = [name for name, tag_id in ids.items() if tag_id is None]
+    if missing:
+        ids.update(await select_tag_ids(db, missing))
+        missing = [name for name in missing if ids[name] is None]
+    if missing:
+        result = await db.execute(insert_ignore_duplicates(db, missing))
+        ids.update({name: tag_id for tag_id, name in result.all()})
+        await db.commit()
+        missing = [name for name in missing if ids[name] is None]
+        if missing:
+            # inserted by a concurrent request between our select and insert
+            ids.update(await select_tag_ids(db, missing))
+
+    tags = []
+    for name in names:
+        tag_cache.put(name, ids[name])
+        tag = Hashtag(id=ids[name], name=name)
+        make_transient_to_detached(tag)
+        tags.append(await db.merge(tag, load=False))
+    return tags
+
+
+async def get_or_create_tag(db: AsyncSession, name: str):
     """
     The get_or_create_tag function retrieves a tag from the database with the given name, or creates a new tag if it doesn't exist.
     
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :param name: str: Specify the name of the tag
     :return: A tag
     :doc-author: Trelent
     """
-    tag = db.query(Hashtag).filter(Hashtag.name == name).first()
-    if not tag:
-        tag = Hashtag(name=name)
-        db.add(tag)
-        db.commit()
-        db.refresh(tag)
-    return tag
\ No newline at end of file
+    tags = await get_or_create_tags(db, [name])
+    return tags[0]
+
+
+
+def tag_usage_bucket(created: datetime) -> datetime:
+    return created.replace(minute=0, second=0, microsecond=0)
+
+
+async def increment_tag_usage(db: AsyncSession, hashtag_ids: List[int], created: datetime, posts: int = 1) -> None:
+    """
+    The increment_tag_usage function counts a post created at `created` in the hourly
+    usage counters of its hashtags, creating the counters with a single upsert.
+    The caller commits.
+
+    :param db: AsyncSession: Pass the database session to the function
+    :param hashtag_ids: List[int]: Ids of the hashtags of the post
+    :param created: datetime: Creation time of the post
+    :param posts: int: Number of posts created with these hashtags at that time
+    :return: None
+    :doc-author: Trelent
+    """
+    hashtag_ids = list(dict.fromkeys(hashtag_ids))
+    if not hashtag_ids or created is None:
+        return
+    values = [
+        {"hashtag_id": hashtag_id, "bucket": tag_usage_bucket(created), "count": posts}
+        for hashtag_id in hashtag_ids
+    ]
+    if db.get_bind().dialect.name == "postgresql":
+        stmt = postgresql.insert(TagUsage).values(values)
+    else:
+        stmt = sqlite.insert(TagUsage).values(values)
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[TagUsage.hashtag_id, TagUsage.bucket],
+        set_={"count": TagUsage.count + stmt.excluded.count}
+    ))
+
+
+async def decrement_tag_usage(db: AsyncSession, hashtag_ids: List[int], created: datetime) -> None:
+    """
+    The decrement_tag_usage function removes a deleted post from the hourly usage counters
+    of its hashtags. Counters never go below zero, so deleting a post older than the
+    counters is harmless. The caller commits.
+
+    :param db: AsyncSession: Pass the database session to the function
+    :param hashtag_ids: List[int]: Ids of the hashtags of the post
+    :param created: datetime: Creation time of the post
+    :return: None
+    :doc-author: Trelent
+    """
+    if not hashtag_ids or created is None:
+        return
+    await db.execute(
+        update(TagUsage)
+        .where(
+            TagUsage.hashtag_id.in_(hashtag_ids),
+            TagUsage.bucket == tag_usage_bucket(created),
+            TagUsage.count > 0
+        )
+        .values(count=TagUsage.count - 1)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def decrement_tag_usages(db: AsyncSession, usages: Dict[Tuple[int, datetime], int]) -> None:
+    """
+    The decrement_tag_usages function is the bulk version of decrement_tag_usage: it removes
+    many deleted posts from the usage counters with one executemany UPDATE. The caller commits.
+
+    :param db: AsyncSession: Pass the database session to the function
+    :param usages: Dict[Tuple[int, datetime], int]: (hashtag id, post creation time) -> number of deleted posts
+    :return: None
+    :doc-author: Trelent
+    """
+    counts: Dict[Tuple[int, datetime], int] = {}
+    for (hashtag_id, created), posts in usages.items():
+        if created is not None:
+            key = (hashtag_id, tag_usage_bucket(created))
+            counts[key] = counts.get(key, 0) + posts
+    if not counts:
+        return
+    table = TagUsage.__table__
+    await db.execute(
+        update(table)
+        .where(table.c.hashtag_id == bindparam("b_hashtag_id"), table.c.bucket == bindparam("b_bucket"))
+        .values(count=case(
+            (table.c.count > bindparam("b_posts"), table.c.count - bindparam("b_posts")),
+            else_=0
+        )),
+        [
+            {"b_hashtag_id": hashtag_id, "b_bucket": bucket, "b_posts": posts}
+            for (hashtag_id, bucket), posts in counts.items()
+        ]
+    )
+
+
+def window_start(db: AsyncSession, window: timedelta):
+    """
+    The window_start function returns the start of a window ending now, computed by the
+    database: created_dt of posts comes from the database clock.
+
+    :param db: AsyncSession: Session the expression is built for, selects the dialect
+    :param window: timedelta: Length of the window
+    :return: An SQL expression
+    :doc-author: Trelent
+    """
+    if db.get_bind().dialect.name == "sqlite":
+        return func.datetime("now", f"-{int(window.total_seconds())} seconds")
+    return func.localtimestamp() - window
+
+
+async def get_trending_tags(db: AsyncSession, window: str, limit: int) -> List[dict]:
+    """
+    The get_trending_tags function returns the hashtags of the largest number of posts
+    uploaded during the window, summing the hourly counters of the window (one hour
+    resolution). Results are served from memory for settings.trending_cache_ttl seconds.
+
+    :param db: AsyncSession: Pass the database session to the function
+    :param window: str: 1h, 24h or 7d
+    :param limit: int: Number of hashtags
+    :return: A list of dictionaries with id, name and count, the most used first
+    :doc-author: Trelent
+    """
+    key = (window, limit)
+    tags = trending_cache.get(key)
+    if tags is not None:
+        return tags
+    count = func.sum(TagUsage.count).label("count")
+    # rank the counters alone, only the top hashtags are joined for their names
+    top = (
+        select(TagUsage.hashtag_id, count)
+        .where(TagUsage.bucket >= window_start(db, TRENDING_WINDOWS[window]))
+        .group_by(TagUsage.hashtag_id)
+        .having(count > 0)
+        .order_by(count.desc(), TagUsage.hashtag_id)
+        .limit(limit)
+        .subquery()
+    )
+    result = await db.execute(
+        select(Hashtag.id, Hashtag.name, top.c.count)
+        .join(top, top.c.hashtag_id == Hashtag.id)
+        .order_by(top.c.count.desc(), Hashtag.id)
+    )
+    tags = [{"id": tag_id, "name": name, "count": total} for tag_id, name, total in result.all()]
+    trending_cache.put(key, tags)
+    return tags
+
+
+async def rebuild_tag_usage(db: AsyncSession) -> int:
+    """
+    The rebuild_tag_usage function recomputes the usage counters of the longest window
+    from post_hashtags and drops the older ones. It is used to fill the counters of an
+    existing database and to prune them periodically.
+
+    :param db: AsyncSession: Pass the database session to the function
+    :return: The number of counters
+    :doc-author: Trelent
+    """
+    if db.get_bind().dialect.name == "sqlite":
+        # the text format SQLAlchemy stores datetimes in
+        bucket = func.strftime("%Y-%m-%d %H:00:00.000000", Post.created_dt)
+    else:
+        bucket = func.date_trunc("hour", Post.created_dt)
+    counters = (
+        select(post_hashtags.c.hashtag_id, bucket.label("bucket"), func.count().label("count"))
+        .join(Post, Post.id == post_hashtags.c.post_id)
+        .where(
+            Post.transformation.is_(None),
+            Post.created_dt >= window_start(db, max(TRENDING_WINDOWS.values()))
+        )
+        .group_by(post_hashtags.c.hashtag_id, bucket)
+    )
+    await db.execute(delete(TagUsage))
+    result = await db.execute(
+        insert(TagUsage).from_select(["hashtag_id", "bucket", "count"], counters)
+    )
+    await db.commit()
+    trending_cache.clear()
+    return result.rowcount
@@ -1,10 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from typing import List
+
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.db import get_db
 from src.database.models import User
-from src.services.auth import is_admin
-from src.schemas import UserOut, RoleChangeRequest
+from src.repository import moderation as repository_moderation
+from src.services.auth import is_admin, is_admin_or_moderator
+from src.services.jobs import job_queue
+from src.services.user_cache import user_cache
+from src.schemas import (
+    UserOut,
+    RoleChangeRequest,
+    ModerationDeleteRequest,
+    ModerationUsersRequest,
+    ModerationResponce
+)
 
 
 router = APIRouter(prefix="/admin", tags=["admin"])
@@ -13,14 +25,14 @@ router = APIRouter(prefix="/admin", tags=["admin"])
 @router.put("/change-role", response_model=UserOut)
 async def change_user_role(
     request: RoleChangeRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(is_admin)
 ):
     """
     The change_user_role function changes the role of a user.
     
     :param request: RoleChangeRequest: Pass the user_id and new_role parameters
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :param current_user: User: Get the current user
     :return: The user object, which is the same as the one in get_user
     :doc-author: Trelent
@@ -28,27 +40,29 @@ async def change_user_role(
     if request.user_id == 1 or request.user_id == current_user.id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
     
-    user_to_update = db.query(User).filter(User.id == request.user_id).first()
+    result = await db.execute(select(User).filter(User.id == request.user_id))
+    user_to_update = result.scalars().first()
     if not user_to_update:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
     user_to_update.role = request.new_role
-    db.commit()
-    db.refresh(user_to_update)
+    await db.commit()
+    await db.refresh(user_to_update)
+    await user_cache.invalidate(user_to_update.email)
     return user_to_update
 
 
 @router.put("/ban/{user_id}", response_model=UserOut)
 async def ban_user(
     user_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(is_admin)
 ):
     """
     The ban_user function is used to ban a user.
     
     :param user_id: int: Specify the user id of the user to be banned
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :param current_user: User: Get the current user
     :return: The banned user
     :doc-author: Trelent
@@ -56,38 +70,144 @@ async def ban_user(
     if user_id == 1 or user_id == current_user.id:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
     
-    user_to_ban = db.query(User).filter(User.id == user_id).first()
+    result = await db.execute(select(User).filter(User.id == user_id))
+    user_to_ban = result.scalars().first()
     if not user_to_ban:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
     user_to_ban.is_active = False
-    db.commit()
-    db.refresh(user_to_ban)
+    await db.commit()
+    await db.refresh(user_to_ban)
+    await user_cache.invalidate(user_to_ban.email)
     return user_to_ban
 
 
 @router.put("/unban/{user_id}", response_model=UserOut)
 async def unban_user(
         user_id: int,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_db),
         current_user: User = Depends(is_admin)
 ):
     """
-    The unban_user function takes a user_id and an optional db Session object.
+    The unban_user function takes a user_id and an optional db AsyncSession object.
     It returns the User object of the unbanned user.
     
     
     :param user_id: int: Specify the user id of the user to be banned
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :param current_user: User: Ensure that the user is an admin
     :return: A user object
     :doc-author: Trelent
     """
-    user_to_unban = db.query(User).filter(User.id == user_id).first()
+    result = await db.execute(select(User).filter(User.id == user_id))
+    user_to_unban = result.scalars().first()
     if not user_to_unban:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
     user_to_unban.is_active = True
-    db.commit()
-    db.refresh(user_to_unban)
+    await db.commit()
+    await db.refresh(user_to_unban)
+    await user_cache.invalidate(user_to_unban.email)
     return user_to_unban
+
+
+def schedule_storage_cleanup(urls: List[str], current_user: User, background_tasks: BackgroundTasks) -> str | None:
+    """
+    The schedule_storage_cleanup function registers the background job deleting
+    the stored images and qr codes of deleted posts.
+    
+    :param urls: List[str]: Urls of the stored objects
+    :param current_user: User: Moderator deleting the content, the owner of the job
+    :param background_tasks: BackgroundTasks: Run the job after the response
+    :return: The id of the job, None if there is nothing to delete
+    :doc-author: Trelent
+    """
+    if not urls:
+        return None
+    job = job_queue.create("storage_cleanup", current_user.id)
+    background_tasks.add_task(job_queue.run, job.id, repository_moderation.delete_stored_images, urls)
+    return job.id
+
+
+@router.post("/moderation/delete", response_model=ModerationResponce)
+async def delete_content(
+    body: ModerationDeleteRequest,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(is_admin_or_moderator)
+):
+    """
+    The delete_content function deletes posts, comments and ratings by id in one transaction.
+    Deleted posts take their transformed copies, comments and ratings with them, their
+    stored images are deleted by a background job.
+    
+    :param body: ModerationDeleteRequest: Ids of the posts, comments and ratings
+    :param background_tasks: BackgroundTasks: Run the storage cleanup after the response
+    :param db: AsyncSession: Access the database
+    :param current_user: User: Ensure that the user is an admin or a moderator
+    :return: The number of deleted rows per kind and the id of the cleanup job
+    :doc-author: Trelent
+    """
+    counts, urls = await repository_moderation.delete_content(db, body.post_ids, body.comment_ids, body.rating_ids)
+    return ModerationResponce(**counts, cleanup_job_id=schedule_storage_cleanup(urls, current_user, background_tasks))
+
+
+@router.delete("/moderation/users/{user_id}/content", response_model=ModerationResponce)
+async def delete_user_content(
+    user_id: int,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(is_admin_or_moderator)
+):
+    """
+    The delete_user_content function deletes all posts, comments and ratings of a user
+    in one transaction, e.g. to remove spam. The account itself is kept.
+    
+    :param user_id: int: Id of the user
+    :param background_tasks: BackgroundTasks: Run the storage cleanup after the response
+    :param db: AsyncSession: Access the database
+    :param current_user: User: Ensure that the user is an admin or a moderator
+    :return: The number of deleted rows per kind and the id of the cleanup job
+    :doc-author: Trelent
+    """
+    result = await db.execute(select(User.id).filter(User.id == user_id))
+    if result.scalar() is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    counts, urls = await repository_moderation.delete_user_content(db, user_id)
+    return ModerationResponce(**counts, cleanup_job_id=schedule_storage_cleanup(urls, current_user, background_tasks))
+
+
+@router.put("/moderation/ban", response_model=ModerationResponce)
+async def ban_users(
+    body: ModerationUsersRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(is_admin)
+):
+    """
+    The ban_users function bans many users with one update.
+    
+    :param body: ModerationUsersRequest: Ids of the users
+    :param db: AsyncSession: Access the database
+    :param current_user: User: Ensure that the user is an admin
+    :return: The number of banned users
+    :doc-author: Trelent
+    """
+    if 1 in body.user_ids or current_user.id in body.user_ids:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
+    emails = await repository_moderation.deactivate_users(db, body.user_ids)
+    for email in emails:
+        await user_cache.invalidate(email)
+    return ModerationResponce(users=len(emails))
+
+
+@router.get("/user-cache")
+async def get_user_cache_stats(current_user: User = Depends(is_admin)):
+    """
+    The get_user_cache_stats function returns the hit/miss counters of the cache
+    of the users resolved from access tokens, for the worker serving the request.
+    
+    :param current_user: User: Ensure that the user is an admin
+    :return: A dictionary of counters
+    :doc-author: Trelent
+    """
+    return user_cache.get_stats()
@@ -1,11 +1,13 @@
-from fastapi import APIRouter, HTTPException, Depends, status, Security, BackgroundTasks, Request
+from fastapi import APIRouter, HTTPException, Depends, status, Security, Request
 from fastapi.security import OAuth2PasswordRequestForm, HTTPAuthorizationCredentials, HTTPBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.db import get_db
 from src.schemas import UserModel, UserResponse, TokenModel, RequestEmail, FirstAdminModel
 from src.repository import users as repository_users
+from src.database.models import User
 from src.services.auth import auth_service
+from src.services.user_cache import user_cache
 from src.services.email import send_email
 
 router = APIRouter(prefix='/auth', tags=["auth"])
@@ -13,16 +15,16 @@ security = HTTPBearer()
 
 
 @router.post("/signup", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def signup(body: UserModel, background_tasks: BackgroundTasks, request: Request, db: Session = Depends(get_db)):
+async def signup(body: UserModel, request: Request, db: AsyncSession = Depends(get_db)):
     """
     The signup function creates a new user in the database.
         It takes a UserModel object as input, and returns an HTTP response with the newly created user's information.
         If there are no users in the database, it will create an admin account instead of a regular user account.
+        The confirmation email is queued in the transaction creating the user.
     
     :param body: UserModel: Get the user's email and password
-    :param background_tasks: BackgroundTasks: Add a task to the background tasks queue
     :param request: Request: Get the base url of the application
-    :param db: Session: Get a database session
+    :param db: AsyncSession: Get a database session
     :return: A dictionary with two keys: user and detail
     :doc-author: Trelent
     """
@@ -30,27 +32,28 @@ async def signup(body: UserModel, background_tasks: BackgroundTasks, request: Re
         admin_body = FirstAdminModel(
             username=body.username,
             email=body.email,
-            password=auth_service.get_password_hash(body.password))
+            password=await auth_service.hash_password(body.password))
+        await send_email(db, body.email, body.username, request.base_url)
         new_user = await repository_users.create_user(admin_body, db)
     else:
         exist_user = await repository_users.get_user_by_email(body.email, db)
         if exist_user:
             raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Account already exists")
-        body.password = auth_service.get_password_hash(body.password)
+        body.password = await auth_service.hash_password(body.password)
+        await send_email(db, body.email, body.username, request.base_url)
         new_user = await repository_users.create_user(body, db)
-    background_tasks.add_task(send_email, new_user.email, new_user.username, request.base_url)
     return {"user": new_user, "detail": "User successfully created. Check your email for confirmation."}
 
 
 @router.post("/login", response_model=TokenModel)
-async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(body: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     """
     The login function is used to authenticate a user.
     It takes an email and password as input, and returns an access token if the credentials are valid.
     
     
     :param body: OAuth2PasswordRequestForm: Validate the request body
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :return: A tuple of access_token and refresh_token
     :doc-author: Trelent
     """
@@ -59,8 +62,11 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depen
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid email")
     if not user.confirmed:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Email not confirmed")
-    if not auth_service.verify_password(body.password, user.password):
+    valid, new_hash = await auth_service.verify_and_update_password(body.password, user.password)
+    if not valid:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
+    if new_hash:
+        await repository_users.update_password(user, new_hash, db)
     # Generate JWT
     access_token = await auth_service.create_access_token(data={"sub": user.email})
     refresh_token = await auth_service.create_refresh_token(data={"sub": user.email})
@@ -69,14 +75,14 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depen
 
 
 @router.get('/refresh_token', response_model=TokenModel)
-async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(security), db: Session = Depends(get_db)):
+async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(security), db: AsyncSession = Depends(get_db)):
     """
     The refresh_token function is used to refresh the access token.
         The function takes in a refresh token and returns an access token.
         If the user's refresh_token does not match, then it will return an error.
     
     :param credentials: HTTPAuthorizationCredentials: Get the token from the request header
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :return: A dictionary with the new access token, refresh token and bearer type
     :doc-author: Trelent
     """
@@ -92,8 +98,24 @@ async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(sec
     await repository_users.update_token(user, refresh_token, db)
     return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
 
+@router.post('/logout')
+async def logout(current_user: User = Depends(auth_service.get_current_user), db: AsyncSession = Depends(get_db)):
+    """
+    The logout function revokes the refresh token of the current user and drops the user
+    from the user cache. Access tokens already issued stay valid until they expire.
+    
+    :param current_user: User: Get the current user
+    :param db: AsyncSession: Get the database session
+    :return: A message to the user
+    :doc-author: Trelent
+    """
+    user = await repository_users.get_user_by_email(current_user.email, db)
+    await repository_users.update_token(user, None, db)
+    await user_cache.invalidate(current_user.email)
+    return {"message": "Logged out"}
+
 @router.get('/confirmed_email/{token}')
-async def confirmed_email(token: str, db: Session = Depends(get_db)):
+async def confirmed_email(token: str, db: AsyncSession = Depends(get_db)):
     """
     The confirmed_email function takes a token and db as parameters.
     It then gets the email from the token, and gets the user by that email.
@@ -102,7 +124,7 @@ async def confirmed_email(token: str, db: Session = Depends(get_db)):
     it confirms their account by calling repository_users' confirmed_email function on their email address using db as
     
     :param token: str: Get the token from the url
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :return: A message that the email is already confirmed or a message that the email has been confirmed
     :doc-author: Trelent
     """
@@ -116,17 +138,15 @@ async def confirmed_email(token: str, db: Session = Depends(get_db)):
     return {"message": "Email confirmed"}
 
 @router.post('/request_email')
-async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, request: Request,
-                        db: Session = Depends(get_db)):
+async def request_email(body: RequestEmail, request: Request, db: AsyncSession = Depends(get_db)):
     """
     The request_email function is used to send an email to the user with a link that they can click on
         to confirm their email address. The function takes in a RequestEmail object, which contains the user's
         email address. It then checks if there is already a confirmed account associated with that email address, and if so, returns an error message saying as much. If not, it sends an email containing a confirmation link.
     
     :param body: RequestEmail: Get the email from the request body
-    :param background_tasks: BackgroundTasks: Add a task to the background tasks queue
     :param request: Request: Get the base_url of the application
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :return: A message to the user
     :doc-author: Trelent
     """
@@ -135,5 +155,6 @@ async def request_email(body: RequestEmail, background_tasks: BackgroundTasks, r
     if user.confirmed:
         return {"message": "Your email is already confirmed"}
     if user:
-        background_tasks.add_task(send_email, user.email, user.username, request.base_url)
+        await send_email(db, user.email, user.username, request.base_url)
+        await db.commit()
     return {"message": "Check your email for confirmation."}
\ No newline at end of file
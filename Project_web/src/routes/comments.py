@@ -1,8 +1,11 @@
 from datetime import datetime
 from typing import List
-from fastapi import APIRouter, HTTPException, Depends, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.conf.config import settings
 from src.database.db import get_db
+from src.repository import comments as repository_comments
 from src.schemas import (
     PostCommentReques,
     GetCommentResponce,
@@ -10,6 +13,7 @@ from src.schemas import (
 )
 from src.database.models import User, Post, Comments, UserRole
 from src.services.auth import auth_service
+from src.utils.etag import conditional_response
 
 
 router = APIRouter(prefix='/comments', tags=["comments"])
@@ -22,7 +26,7 @@ router = APIRouter(prefix='/comments', tags=["comments"])
 )
 async def post_comment(
     body: PostCommentReques,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(auth_service.get_current_user)
 ):
     """
@@ -30,14 +34,17 @@ async def post_comment(
     The user who created this comment is determined by the JWT token in the request header.
     
     :param body: PostCommentReques: Get the data from the request body
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :param current_user: User: Get the user that is currently logged in
     :return: A comment
     :doc-author: Trelent
     """
-    image = db.query(Post).filter(
-        Post.id == body.image_id
-    ).first()
+    result = await db.execute(
+        select(Post).filter(
+            Post.id == body.image_id
+        )
+    )
+    image = result.scalars().first()
     if image is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -49,7 +56,9 @@ async def post_comment(
         user_id=current_user.id
     )
     db.add(comment)
-    db.commit()
+    await db.commit()
+    await db.refresh(comment)
+    repository_comments.invalidate_image_comments(comment.image_id)
     return comment
 
 
@@ -59,20 +68,23 @@ async def post_comment(
 )
 async def get_comment(
     comment_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     The get_comment function returns a comment with the given id.
     If no such comment exists, it raises an HTTP 404 error.
     
     :param comment_id: int: Specify the comment id
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :return: A comment with the given id
     :doc-author: Trelent
     """
-    comment = db.query(Comments).filter(
-        Comments.id == comment_id
-    ).first()
+    result = await db.execute(
+        select(Comments).filter(
+            Comments.id == comment_id
+        )
+    )
+    comment = result.scalars().first()
     if comment is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -87,28 +99,47 @@ async def get_comment(
 )
 async def get_comments_by_image(
     image_id: int,
-    db: Session = Depends(get_db)
+    request: Request,
+    response: Response,
+    cursor: str = None,
+    limit: int = Query(settings.comments_page_size, ge=1, le=settings.comments_max_page_size),
+    db: AsyncSession = Depends(get_db)
 ):
     """
-    The get_comments_by_image function returns a list of comments for the image with the given id.
+    The get_comments_by_image function returns a page of comments for the image with the given id, oldest first.
+    The cursor of the next page is returned in the X-Next-Cursor header, it is absent on the last page.
     If no image is found, it raises an HTTPException with status code 404 and detail 'Image not found';.
+    The ETag is derived from the ids and versions of the comments of the page. A conditional
+    request is answered from the cached first page, or from the ids and versions of the
+    comments, without loading the page. The page may be kept by shared caches for a few
+    seconds (HTTP_CACHE_MAX_AGE).
     
     :param image_id: int: Get the image id from the url
-    :param db: Session: Get the database session
+    :param request: Request: Read the If-None-Match header
+    :param response: Response: Set the X-Next-Cursor, ETag and Cache-Control headers
+    :param cursor: str: X-Next-Cursor of the previous page
+    :param limit: int: Number of comments on a page
+    :param db: AsyncSession: Get the database session
     :return: A list of comments for the image with the given id
     :doc-author: Trelent
     """
-    image = db.query(Post).filter(
-        Post.id == image_id
-    ).first()
-    if image is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Image not found"
-        )
-    comments = db.query(Comments).filter(
-        Comments.image_id == image.id
-    ).all()
+    if request.headers.get("if-none-match"):
+        validator = await repository_comments.get_comments_etag_by_image(db, image_id, limit, cursor)
+        if validator is not None:
+            etag, next_cursor = validator
+            not_modified = conditional_response(request, response, etag, public=True)
+            if not_modified is not None:
+                if next_cursor:
+                    not_modified.headers["X-Next-Cursor"] = next_cursor
+                return not_modified
+    comments, next_cursor, etag = await repository_comments.get_comments_by_image(db, image_id, limit, cursor)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    not_modified = conditional_response(request, response, etag, public=True)
+    if not_modified is not None:
+        if next_cursor:
+            not_modified.headers["X-Next-Cursor"] = next_cursor
+        return not_modified
     return comments
 
 
@@ -118,28 +149,27 @@ async def get_comments_by_image(
 )
 async def get_comments_by_user(
     user_id: int,
-    db: Session = Depends(get_db)
+    response: Response,
+    cursor: str = None,
+    limit: int = Query(settings.comments_page_size, ge=1, le=settings.comments_max_page_size),
+    db: AsyncSession = Depends(get_db)
 ):
     """
-    The get_comments_by_user function returns a list of comments made by the user with the given ID.
+    The get_comments_by_user function returns a page of comments made by the user with the given ID, oldest first.
+    The cursor of the next page is returned in the X-Next-Cursor header, it is absent on the last page.
     If no such user exists, it raises an HTTP 404 error.
     
     :param user_id: int: Specify the user_id of the user we want to get comments for
-    :param db: Session: Get the database session
+    :param response: Response: Set the X-Next-Cursor header
+    :param cursor: str: X-Next-Cursor of the previous page
+    :param limit: int: Number of comments on a page
+    :param db: AsyncSession: Get the database session
     :return: A list of comments made by the user with the given id
     :doc-author: Trelent
     """
-    user = db.query(User).filter(
-        User.id == user_id
-    ).first()
-    if user is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-    comments = db.query(Comments).filter(
-        Comments.user_id == user.id
-    ).all()
+    comments, next_cursor = await repository_comments.get_comments_by_user(db, user_id, limit, cursor)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return comments
 
 
@@ -149,7 +179,7 @@ async def get_comments_by_user(
 )
 async def change_comment(
     body: PutCommentReques,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(auth_service.get_current_user)
 ):
     """
@@ -158,14 +188,17 @@ async def change_comment(
         
     
     :param body: PutCommentReques: Get the new text for the comment
-    :param db: Session: Get a database session
+    :param db: AsyncSession: Get a database session
     :param current_user: User: Get the user who is currently logged in
     :return: The comment that was updated
     :doc-author: Trelent
     """
-    comment = db.query(Comments).filter(
-        Comments.id == body.comment_id
-    ).first()
+    result = await db.execute(
+        select(Comments).filter(
+            Comments.id == body.comment_id
+        )
+    )
+    comment = result.scalars().first()
 
     if comment is None:
         raise HTTPException(
@@ -181,7 +214,10 @@ async def change_comment(
 
     comment.text = body.new_text
     comment.updated_at = datetime.now()
-    db.commit()
+    await db.commit()
+    # the version is bumped by the database
+    await db.refresh(comment)
+    repository_comments.invalidate_image_comments(comment.image_id)
     return comment
 
 
@@ -191,7 +227,7 @@ async def change_comment(
 )
 async def delete_comment(
     comment_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(auth_service.get_current_user)
 ):
     """
@@ -200,7 +236,7 @@ async def delete_comment(
         
     
     :param comment_id: int: Specify the id of the comment to be edited
-    :param db: Session: Get a database session
+    :param db: AsyncSession: Get a database session
     :param current_user: User: Get the current user from the database
     :return: The deleted comment
     :doc-author: Trelent
@@ -210,14 +246,18 @@ async def delete_comment(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Access denied"
         )
-    comment = db.query(Comments).filter(
-        Comments.id == comment_id
-    ).first()
+    result = await db.execute(
+        select(Comments).filter(
+            Comments.id == comment_id
+        )
+    )
+    comment = result.scalars().first()
     if comment is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Comment not found"
         )
-    db.delete(comment)
-    db.commit()
+    await db.delete(comment)
+    await db.commit()
+    repository_comments.invalidate_image_comments(comment.image_id)
     return comment
@@ -1,69 +1,178 @@
-from fastapi import Depends, File, HTTPException, UploadFile, APIRouter, status
-from sqlalchemy.orm import Session
+from fastapi import BackgroundTasks, Depends, File, HTTPException, Query, Request, Response, UploadFile, APIRouter, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 
 from src.schemas import (
+    FeedImageResponce,
+    FeedResponce,
     ImageResponce,
+    ImageUploadResponce,
+    BulkUploadItemResponce,
+    BulkUploadResponce,
+    JobResponce,
     CropImageRequest,
     RoundCornersImageRequest,
-    EffectImageRequest
+    EffectImageRequest,
+    BulkTransformImageRequest,
+    TransformationType
 )
+from src.conf.config import settings
 from src.database.models import User
 from src.database.db import get_db
 from src.repository import images as repository_images
+from src.repository import ranking as repository_ranking
+from src.repository import search as repository_search
 from src.services.auth import auth_service, check_is_admin_or_moderator
-from src.utils.image_utils import transform_image
+from src.services.jobs import job_queue
+from src.utils.etag import conditional_response, make_etag
+from src.utils.image_utils import transform_image, transform_images
 
 
 router = APIRouter(prefix='/images', tags=["images"])
 
-@router.post("/upload")
-async def upload_file(description: str, hashtags: List[str], db: Session = Depends(get_db), current_user: User = Depends(auth_service.get_current_user),   file: UploadFile = File(...)):
+@router.post("/upload", response_model=ImageUploadResponce)
+async def upload_file(description: str, hashtags: List[str], background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db), current_user: User = Depends(auth_service.get_current_user),   file: UploadFile = File(...)):
     """
     The upload_file function is used to upload a file to the server.
             The function takes in a description, hashtags, and an image file.
             It then creates an entry in the database for that image with all of its information.
+            The qr code of the image is generated by a background job, its status
+            can be polled with the returned qr_code_job_id.
     
     :param description: str: Get the description of the image
     :param hashtags: List[str]: Get the hashtags from the request body
-    :param db: Session: Access the database
+    :param background_tasks: BackgroundTasks: Run the qr code job after the response
+    :param db: AsyncSession: Access the database
     :param current_user: User: Get the user who is currently logged in
     :param file: UploadFile: Upload the file to the server
-    :return: A tuple of the info
+    :return: The created image and the id of its qr code job
     :doc-author: Trelent
     """
     for i in hashtags:
         tags_list = i.split(',')
     if len(tags_list) > 5:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Limit of 5 tags")
-    return await repository_images.create_images_post(description, tags_list, current_user, db,  file)
+    image = await repository_images.create_images_post(description, tags_list, current_user, db,  file)
+    job = job_queue.create("qr_code", current_user.id)
+    background_tasks.add_task(
+        job_queue.run,
+        job.id,
+        repository_images.attach_qr_code,
+        image.id,
+        image.image_url,
+        db.bind
+    )
+    return ImageUploadResponce(
+        **ImageResponce.model_validate(image).model_dump(),
+        qr_code_job_id=job.id
+    )
+
+
+@router.post("/upload/bulk", response_model=BulkUploadResponce)
+async def upload_files(description: str, hashtags: List[str], background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db), current_user: User = Depends(auth_service.get_current_user), files: List[UploadFile] = File(...)):
+    """
+    The upload_files function uploads several images with the same description and hashtags
+    in one request. The multipart body is parsed as a stream and every file is spooled to a
+    temporary file, so large batches are never held in memory. The files are uploaded
+    concurrently and the posts are inserted in one transaction, the result of every file
+    is reported separately. The qr codes of all images are generated by one background job.
+    
+    :param description: str: Get the description of the images
+    :param hashtags: List[str]: Get the hashtags from the request body
+    :param background_tasks: BackgroundTasks: Run the qr code job after the response
+    :param db: AsyncSession: Access the database
+    :param current_user: User: Get the user who is currently logged in
+    :param files: List[UploadFile]: The uploaded files
+    :return: The created image or the error of every file and the id of the qr code job
+    :doc-author: Trelent
+    """
+    for i in hashtags:
+        tags_list = i.split(',')
+    if len(tags_list) > 5:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Limit of 5 tags")
+    if len(files) > settings.bulk_upload_max_files:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Limit of {settings.bulk_upload_max_files} files"
+        )
+    results = await repository_images.create_images_posts(description, tags_list, current_user, db, files)
+    posts = {image.id: image.image_url for _, image, _ in results if image is not None}
+    job = None
+    if posts:
+        job = job_queue.create("qr_code", current_user.id)
+        background_tasks.add_task(
+            job_queue.run,
+            job.id,
+            repository_images.attach_qr_codes,
+            posts,
+            db.bind
+        )
+    return BulkUploadResponce(
+        items=[
+            BulkUploadItemResponce(
+                filename=file.filename,
+                image=ImageResponce.model_validate(image) if image is not None else None,
+                error=error
+            )
+            for file, image, error in results
+        ],
+        qr_code_job_id=job.id if job is not None else None
+    )
+
+
+@router.get("/jobs/{job_id}", response_model=JobResponce)
+async def get_job(
+    job_id: str,
+    current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The get_job function returns the status of a background job started by an upload.
+    The jobs of other users are reported as not found.
+    
+    :param job_id: str: Id of the job
+    :param current_user: User: Get the current user, only the user who started the job may poll it
+    :return: The job status, its result when done or its error when failed
+    :doc-author: Trelent
+    """
+    job = job_queue.get(job_id)
+    if job is None or job.user_id != current_user.id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job
 
 @router.get("/get_image")
 async def get_image(
     image_id : int,
+    request: Request,
+    response: Response,
     user_id: int = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(auth_service.get_current_user)):
     """
     The get_image function returns a single image from the database.
         The function takes an integer as its only argument, which is the id of the image to be returned.
         The function returns a JSON object containing all information about that particular image.
+        The ETag is derived from the version of the post, a request with a current
+        If-None-Match gets 304 without a body.
     
     :param image_id : int: Get the image with that id from the database
+    :param request: Request: Read the If-None-Match header
+    :param response: Response: Set the ETag and Cache-Control headers
     :param user_id: int: Get the image of another user
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :param current_user: User: Get the current user
     :return: A single image from the database
     :doc-author: Trelent
     """
-    if not user_id:
-        return await repository_images.get_image(image_id, current_user.id, db)
-    return await repository_images.get_image(image_id, user_id, db)
+    image = await repository_images.get_image(image_id, user_id or current_user.id, db)
+    if image is not None:
+        not_modified = conditional_response(request, response, make_etag("post", image.id, image.version))
+        if not_modified is not None:
+            return not_modified
+    return image
 
 @router.get("/get_images")
 async def get_images(
     user_id: int = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(auth_service.get_current_user)):
     """
     The get_images function returns a list of images that the current user has uploaded.
@@ -73,7 +182,7 @@ async def get_images(
         
     
     :param user_id: int: Get the images for a specific user
-    :param db: Session: Pass the database connection to the repository layer
+    :param db: AsyncSession: Pass the database connection to the repository layer
     :param current_user: User: Get the current user from the database
     :return: A list of images that the current user has uploaded
     :doc-author: Trelent
@@ -82,10 +191,79 @@ async def get_images(
         return await repository_images.get_images(user_id=current_user.id, db=db)
     return await repository_images.get_images(user_id=user_id, db=db)
 
+@router.get("/feed", response_model=FeedResponce)
+async def get_feed(
+    user_id: int = None,
+    cursor: str = None,
+    limit: int = Query(settings.feed_page_size, ge=1, le=settings.feed_max_page_size),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The get_feed function returns a page of images of a user, newest first,
+    with their author, hashtags and average rating.
+    
+    :param user_id: int: Get the images for a specific user, the current user by default
+    :param cursor: str: next_cursor of the previous page
+    :param limit: int: Number of images on a page
+    :param db: AsyncSession: Pass the database connection to the repository layer
+    :param current_user: User: Get the current user from the database
+    :return: The images of the page and the cursor of the next one
+    :doc-author: Trelent
+    """
+    images, next_cursor = await repository_images.get_feed(
+        user_id=user_id or current_user.id,
+        db=db,
+        limit=limit,
+        cursor=cursor
+    )
+    return {"items": images, "next_cursor": next_cursor}
+
+@router.get("/hot", response_model=FeedResponce)
+async def get_hot_feed(
+    cursor: str = None,
+    limit: int = Query(settings.feed_page_size, ge=1, le=settings.feed_max_page_size),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The get_hot_feed function returns a page of the images of all users ranked by popularity
+    (rating, number of ratings and comments, age), with their author, hashtags and average rating.
+    
+    :param cursor: str: next_cursor of the previous page
+    :param limit: int: Number of images on a page
+    :param db: AsyncSession: Pass the database connection to the repository layer
+    :param current_user: User: Get the current user from the database
+    :return: The images of the page and the cursor of the next one
+    :doc-author: Trelent
+    """
+    images, next_cursor = await repository_ranking.get_hot_feed(db=db, limit=limit, cursor=cursor)
+    return {"items": images, "next_cursor": next_cursor}
+
+@router.get("/search", response_model=List[FeedImageResponce])
+async def search_images(
+    q: str = Query(min_length=1, max_length=200),
+    limit: int = Query(settings.search_page_size, ge=1, le=settings.search_max_page_size),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(auth_service.get_current_user)):
+    """
+    The search_images function searches images by the words of their description and by hashtags,
+    the best matching, best rated and newest first.
+    
+    :param q: str: Search query
+    :param limit: int: Number of images on a page
+    :param offset: int: Number of images to skip
+    :param db: AsyncSession: Pass the database connection to the repository layer
+    :param current_user: User: Get the current user from the database
+    :return: The matching images with their author, hashtags and average rating
+    :doc-author: Trelent
+    """
+    return await repository_search.search_posts(q=q, db=db, limit=limit, offset=offset)
+
+
 @router.delete("/delete_image")
 async def delete_image(
     image_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(auth_service.get_current_user)):
     """
     The delete_image function deletes an image from the database.
@@ -94,7 +272,7 @@ async def delete_image(
         
     
     :param image_id: int: Identify the image to be deleted
-    :param db: Session: Pass the database session to the repository layer
+    :param db: AsyncSession: Pass the database session to the repository layer
     :param current_user: User: Get the current user from the auth_service
     :return: A dictionary with the following keys:
     :doc-author: Trelent
@@ -104,7 +282,7 @@ async def delete_image(
 
 @router.put("/edit_description")
 async def put_image(image_id: int , new_description: str, 
-                       db: Session = Depends(get_db), 
+                       db: AsyncSession = Depends(get_db), 
                        current_user: User = Depends(auth_service.get_current_user)):
     """
     The put_image function updates the description of an image.
@@ -112,7 +290,7 @@ async def put_image(image_id: int , new_description: str,
     
     :param image_id: int: Identify which image is being deleted
     :param new_description: str: Update the description of an image
-    :param db: Session: Pass the database session to the repository function
+    :param db: AsyncSession: Pass the database session to the repository function
     :param current_user: User: Get the current user
     :return: A new image
     :doc-author: Trelent
@@ -126,14 +304,14 @@ async def put_image(image_id: int , new_description: str,
 )
 async def crop_image_view(
     body: CropImageRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(auth_service.get_current_user)
 ):
     """
     The crop_image_view function that allows users to crop an image.
     
     :param body: CropImageRequest: Parse the request body
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :param current_user: User: Get the user who is currently logged in
     :return: A cropped image
     :doc-author: Trelent
@@ -158,7 +336,7 @@ async def crop_image_view(
 )
 async def round_corners(
     body: RoundCornersImageRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(auth_service.get_current_user)
 ):
     """
@@ -167,7 +345,7 @@ async def round_corners(
     
     
     :param body: RoundCornersImageRequest: Parse the request body
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :param current_user: User: Get the user who is logged in
     :return: A response object that contains the transformed image
     :doc-author: Trelent
@@ -188,14 +366,14 @@ async def round_corners(
 )
 async def grayscale(
     body: EffectImageRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(auth_service.get_current_user)
 ):
     """
     The grayscale function 
     
     :param body: EffectImageRequest: Get the image_id and description from the request body
-    :param db: Session: Get a database session
+    :param db: AsyncSession: Get a database session
     :param current_user: User: Get the user who is logged in
     :return: A response object that contains the transformed image
     :doc-author: Trelent
@@ -216,7 +394,7 @@ async def grayscale(
 )
 async def sepia(
     body: EffectImageRequest,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: User = Depends(auth_service.get_current_user)
 ):
     """
@@ -225,7 +403,7 @@ async def sepia(
     
     
     :param body: EffectImageRequest: Get the image_id and description from the request body
-    :param db: Session: Get a database session
+    :param db: AsyncSession: Get a database session
     :param current_user: User: Get the user who is logged in
     :return: A response object that contains the transformed image
     :doc-author: Trelent
@@ -238,3 +416,51 @@ async def sepia(
         db=db,
         current_user=current_user
     )
+
+
+@router.post(
+    "/transformation/bulk",
+    response_model=List[ImageResponce]
+)
+async def bulk_transformation(
+    body: BulkTransformImageRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(auth_service.get_current_user)
+):
+    """
+    The bulk_transformation function applies one transformation to many images of the current user.
+    crop requires width and height, roundcorners requires radius.
+    
+    :param body: BulkTransformImageRequest: Get the image ids, the transformation and its parameters
+    :param db: AsyncSession: Get a database session
+    :param current_user: User: Get the user who is logged in
+    :return: The transformed images, in the order of image_ids
+    :doc-author: Trelent
+    """
+    if body.transformation == TransformationType.crop:
+        if body.width is None or body.height is None:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="width and height are required to crop"
+            )
+        transform_params = {
+            "height": body.height,
+            "width": body.width,
+            "crop": "crop"
+        }
+    elif body.transformation == TransformationType.roundcorners:
+        if body.radius is None:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="radius is required to round corners"
+            )
+        transform_params = {"radius": body.radius}
+    else:
+        transform_params = {"effect": body.transformation.value}
+    return await transform_images(
+        image_ids=body.image_ids,
+        transform_params=transform_params,
+        description=body.description,
+        db=db,
+        current_user=current_user
+    )
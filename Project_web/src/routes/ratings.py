@@ -1,11 +1,13 @@
 from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from src.database.db import get_db
 from src.database.models import User, Post
 from src.services.auth import auth_service
 from src.schemas import RatingCreate, RatingResponse
 from src.repository.ratings import create_rating, get_ratings, delete_rating, calculate_average_rating
+from src.utils.etag import conditional_response, make_etag
 
 
 router = APIRouter(prefix="/ratings", tags=["ratings"])
@@ -14,19 +16,20 @@ router = APIRouter(prefix="/ratings", tags=["ratings"])
 @router.post("/", response_model=RatingResponse, summary="Create a new rating")
 async def rate_image(
         rating: RatingCreate,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_db),
         current_user: User = Depends(auth_service.get_current_user)
 ):
     """
     The rate_image function creates a new rating for an image by a user.
     
     :param rating: RatingCreate: Create a new rating
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :param current_user: User: Get the current user
     :return: A ratingresponse object
     :doc-author: Trelent
     """
-    image = db.query(Post).filter(Post.id == rating.image_id).first()
+    result = await db.execute(select(Post).filter(Post.id == rating.image_id))
+    image = result.scalars().first()
     if not image:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
 
@@ -37,18 +40,30 @@ async def rate_image(
 @router.get("/{image_id}", response_model=List[RatingResponse], summary="Get all ratings for an image")
 async def get_image_ratings(
         image_id: int,
-        db: Session = Depends(get_db),
+        request: Request,
+        response: Response,
+        db: AsyncSession = Depends(get_db),
         current_user: User = Depends(auth_service.get_current_user)
 ):
     """
     The get_image_ratings function returns a list of ratings for a specific image.
+    Every rating change updates the rating aggregates of the image, so the ETag is derived
+    from the version of the image and a current If-None-Match gets 304 without loading the ratings.
     
     :param image_id: int: Specify the id of the image
-    :param db: Session: Pass in the database session
+    :param request: Request: Read the If-None-Match header
+    :param response: Response: Set the ETag and Cache-Control headers
+    :param db: AsyncSession: Pass in the database session
     :param current_user: User: Get the current user
     :return: A list of ratingresponse objects
     :doc-author: Trelent
     """
+    result = await db.execute(select(Post.version).filter(Post.id == image_id))
+    version = result.scalar()
+    if version is not None:
+        not_modified = conditional_response(request, response, make_etag("ratings", image_id, version))
+        if not_modified is not None:
+            return not_modified
     ratings = await get_ratings(db, image_id)
     return ratings
 
@@ -56,14 +71,14 @@ async def get_image_ratings(
 @router.delete("/{rating_id}", response_model=dict, summary="Delete a rating by ID")
 async def delete_image_rating(
         rating_id: int,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_db),
         current_user: User = Depends(auth_service.get_current_user)
 ):
     """
     The delete_image_rating function deletes a rating by ID.
     
     :param rating_id: int: Identify the rating to be deleted
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :param current_user: User: Ensure that the user performing the action is logged in
     :return: A dict
     :doc-author: Trelent
@@ -75,17 +90,17 @@ async def delete_image_rating(
 @router.get("/{image_id}/average", response_model=float)
 async def get_average_rating(
         image_id: int,
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_db),
         current_user: User = Depends(auth_service.get_current_user)
 ):
     """
     The get_average_rating function returns the average rating for an image.
     
     :param image_id: int: Specify the id of the image
-    :param db: Session: Get the database session
+    :param db: AsyncSession: Get the database session
     :param current_user: User: Get the current user making the request
     :return: The average rating for an image
     :doc-author: Trelent
     """
-    average_rating = calculate_average_rating(db, image_id)
+    average_rating = await calculate_average_rating(db, image_id)
     return average_rating
@@ -0,0 +1,33 @@
+from typing import List
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from src.conf.config import settings
+from src.database.db import get_db
+from src.database.models import User
+from src.services.auth import auth_service
+from src.schemas import TrendingTagResponce, TrendingWindow
+from src.repository.tags import get_trending_tags
+
+
+router = APIRouter(prefix="/tags", tags=["tags"])
+
+
+@router.get("/trending", response_model=List[TrendingTagResponce])
+async def trending_tags(
+        window: TrendingWindow = TrendingWindow.day,
+        limit: int = Query(10, ge=1, le=settings.trending_max_tags),
+        db: AsyncSession = Depends(get_db),
+        current_user: User = Depends(auth_service.get_current_user)
+):
+    """
+    The trending_tags function returns the hashtags of the largest number of images
+    uploaded during the last hour, day or week.
+    
+    :param window: TrendingWindow: 1h, 24h or 7d
+    :param limit: int: Number of hashtags
+    :param db: AsyncSession: Pass the database session to the function
+    :param current_user: User: Get the current user
+    :return: A list of hashtags with the number of images, the most used first
+    :doc-author: Trelent
+    """
+    return await get_trending_tags(db, window.value, limit)
@@ -1,7 +1,5 @@
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
-from sqlalchemy.orm import Session
-import cloudinary
-import cloudinary.uploader
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.db import get_db
 from src.database.models import User
@@ -9,6 +7,8 @@ from src.repository import users as repository_users
 from src.services.auth import auth_service
 from src.conf.config import settings
 from src.schemas import UserDb, UserUpdate
+from src.services.storage import cloudinary_service
+from src.utils.etag import conditional_response, make_etag
 
 
 router = APIRouter(prefix="/users", tags=["users"])
@@ -30,7 +30,7 @@ async def read_users_me(current_user: User = Depends(auth_service.get_current_us
 
 @router.patch('/avatar', response_model=UserDb)
 async def update_avatar_user(file: UploadFile = File(), current_user: User = Depends(auth_service.get_current_user),
-                             db: Session = Depends(get_db)):
+                             db: AsyncSession = Depends(get_db)):
     """
     The update_avatar_user function takes in a file, current_user and db as parameters.
     The function then uploads the file to cloudinary using the username of the user as its public id.
@@ -39,10 +39,11 @@ async def update_avatar_user(file: UploadFile = File(), current_user: User = Dep
     
     :param file: UploadFile: Get the file from the request body
     :param current_user: User: Get the current user's email address
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :return: The updated user object
     :doc-author: Trelent
     """
+    cloudinary = cloudinary_service()
     cloudinary.config(
         cloud_name=settings.cloudinary_name,
         api_key=settings.cloudinary_api_key,
@@ -58,30 +59,37 @@ async def update_avatar_user(file: UploadFile = File(), current_user: User = Dep
 
 
 @router.get("/{username}", response_model=UserDb)
-async def get_user_by_username(username: str, db: Session = Depends(get_db)):
+async def get_user_by_username(username: str, request: Request, response: Response, db: AsyncSession = Depends(get_db)):
     """
     The get_user_by_username function is used to get a user profile by unique username.
+    The ETag is derived from the version of the user, the profile may be kept by shared
+    caches for a few seconds (HTTP_CACHE_MAX_AGE).
         
     
     :param username: str: Specify the username of the user to be retrieved
-    :param db: Session: Pass the database session to the function
+    :param request: Request: Read the If-None-Match header
+    :param response: Response: Set the ETag and Cache-Control headers
+    :param db: AsyncSession: Pass the database session to the function
     :return: A userdb object
     :doc-author: Trelent
     """
     user = await repository_users.get_user_by_username(username, db)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    not_modified = conditional_response(request, response, make_etag("user", user.id, user.version), public=True)
+    if not_modified is not None:
+        return not_modified
     return user
 
 
 @router.put("/me", response_model=UserDb)
-async def update_my_profile(user_update: UserUpdate, db: Session = Depends(get_db),
+async def update_my_profile(user_update: UserUpdate, db: AsyncSession = Depends(get_db),
                             current_user: User = Depends(auth_service.get_current_user)):
     """
     The update_my_profile function allows the current user to update their own profile information.
     
     :param user_update: UserUpdate: Get the new user data
-    :param db: Session: Pass the database session to the function
+    :param db: AsyncSession: Pass the database session to the function
     :param current_user: User: Get the current logged in user
     :return: The updated user object
     :doc-author: Trelent
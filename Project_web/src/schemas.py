@@ -1,4 +1,5 @@
 from datetime import datetime
+from typing import Any, List
 from pydantic import BaseModel, Field, EmailStr
 from enum import Enum
 
@@ -73,6 +74,11 @@ class GetCommentResponce(BaseModel):
     updated_at: datetime | None
     image_id: int
     user_id: int
+    # only used for the ETag of the comments pages
+    version: int = Field(default=1, exclude=True)
+
+    class Config:
+        from_attributes = True
 
 
 class PutCommentReques(BaseModel):
@@ -100,8 +106,78 @@ class ImageResponce(BaseModel):
     description: str
     image_url: str
     author_id: int
-    qr_code_url: str
+    qr_code_url: str | None
     created_dt: datetime
+    parent_id: int | None = None
+
+    class Config:
+        from_attributes = True
+
+
+class ImageAuthorResponce(BaseModel):
+    id: int
+    username: str
+
+    class Config:
+        from_attributes = True
+
+
+class TagResponce(BaseModel):
+    id: int
+    name: str
+
+    class Config:
+        from_attributes = True
+
+
+class FeedImageResponce(ImageResponce):
+    author: ImageAuthorResponce
+    hashtags: List[TagResponce]
+    average_rating: float
+    rating_count: int
+
+
+class FeedResponce(BaseModel):
+    items: List[FeedImageResponce]
+    next_cursor: str | None
+
+
+class ImageUploadResponce(ImageResponce):
+    qr_code_job_id: str
+
+
+class BulkUploadItemResponce(BaseModel):
+    filename: str | None
+    image: ImageResponce | None = None
+    error: str | None = None
+
+
+class BulkUploadResponce(BaseModel):
+    items: List[BulkUploadItemResponce]
+    qr_code_job_id: str | None = None
+
+
+class JobResponce(BaseModel):
+    id: str
+    name: str
+    status: str
+    result: Any = None
+    error: str | None = None
+
+    class Config:
+        from_attributes = True
+
+
+class TrendingWindow(str, Enum):
+    hour = "1h"
+    day = "24h"
+    week = "7d"
+
+
+class TrendingTagResponce(BaseModel):
+    id: int
+    name: str
+    count: int
 
 
 class CropImageRequest(BaseModel):
@@ -121,7 +197,42 @@ class EffectImageRequest(BaseModel):
     image_id: int
     description: str
 
+
+class TransformationType(str, Enum):
+    crop = "crop"
+    roundcorners = "roundcorners"
+    grayscale = "grayscale"
+    sepia = "sepia"
+
+
+class BulkTransformImageRequest(BaseModel):
+    image_ids: List[int] = Field(min_length=1, max_length=100)
+    transformation: TransformationType
+    width: int | None = None
+    height: int | None = None
+    radius: int | None = None
+    description: str
+
+
 class FirstAdminModel(UserModel):
     id: int = 1
     role: UserRole = UserRole.admin
     password: str
+
+
+class ModerationDeleteRequest(BaseModel):
+    post_ids: List[int] = Field(default=[], max_length=1000)
+    comment_ids: List[int] = Field(default=[], max_length=1000)
+    rating_ids: List[int] = Field(default=[], max_length=1000)
+
+
+class ModerationUsersRequest(BaseModel):
+    user_ids: List[int] = Field(min_length=1, max_length=1000)
+
+
+class ModerationResponce(BaseModel):
+    posts: int = 0
+    comments: int = 0
+    ratings: int = 0
+    users: int = 0
+    cleanup_job_id: str | None = None
@@ -1,23 +1,46 @@
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+from typing import Optional, Tuple
 
 from jose import JWTError, jwt
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.db import get_db
 from src.database.models import User, UserRole
 from src.repository import users as repository_users
 from src.conf.config import settings
+from src.services.user_cache import user_cache, user_from_snapshot
+from src.utils.executor import BoundedExecutor
+
+# bcrypt takes hundreds of milliseconds, hashing never runs on the event loop
+password_executor = BoundedExecutor(
+    ThreadPoolExecutor(max_workers=settings.password_workers, thread_name_prefix="password"),
+    max_pending=settings.password_max_pending
+)
+
 
 class Auth:
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
     SECRET_KEY = settings.secret_key
     ALGORITHM = settings.algorithm
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
+    @cached_property
+    def pwd_context(self):
+        # created by the first password check, loading the bcrypt handler slows every worker start;
+        # min = max = default rounds: a hash made with another cost is rehashed on login
+        from passlib.context import CryptContext
+
+        return CryptContext(
+            schemes=["bcrypt"],
+            deprecated="auto",
+            bcrypt__default_rounds=settings.bcrypt_rounds,
+            bcrypt__min_rounds=settings.bcrypt_rounds,
+            bcrypt__max_rounds=settings.bcrypt_rounds
+        )
+
     def verify_password(self, plain_password, hashed_password):
         """
         The verify_password function takes a plain-text password and hashed
@@ -45,6 +68,33 @@ class Auth:
         """
         return self.pwd_context.hash(password)
 
+    async def hash_password(self, password: str) -> str:
+        """
+        The hash_password function hashes a password on the password executor.
+        It raises 503 when too many hashes are already waiting.
+        
+        :param self: Represent the instance of the class
+        :param password: str: Specify the password that will be hashed
+        :return: A hash of the password
+        :doc-author: Trelent
+        """
+        return await password_executor.run(self.get_password_hash, password)
+
+    async def verify_and_update_password(self, plain_password: str, hashed_password: str) -> Tuple[bool, str | None]:
+        """
+        The verify_and_update_password function checks a password on the password executor.
+        When the hash was made with other settings (e.g. another BCRYPT_ROUNDS) a new hash
+        is returned as well, so that the caller can store it.
+        It raises 503 when too many checks are already waiting.
+        
+        :param self: Represent the instance of the class
+        :param plain_password: str: Password entered by the user
+        :param hashed_password: str: Hash stored in the database
+        :return: A tuple of the check result and the new hash or None
+        :doc-author: Trelent
+        """
+        return await password_executor.run(self.pwd_context.verify_and_update, plain_password, hashed_password)
+
     # define a function to generate a new access token
     async def create_access_token(self, data: dict, expires_delta: Optional[float] = None):
         """
@@ -111,15 +161,17 @@ class Auth:
         except JWTError:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate credentials')
 
-    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
         """
         The get_current_user function is a dependency that will be called by FastAPI to
             retrieve the current user for each request. It uses the OAuth2PasswordBearer
             to validate and decode the JWT token in the Authorization header of each request.
+            Users are served from user_cache when possible, such users are not attached
+            to the session and must not be modified.
         
         :param self: Refer to the class itself
         :param token: str: Get the token from the request header
-        :param db: Session: Get the database session
+        :param db: AsyncSession: Get the database session
         :return: The user object corresponding to the email in the jwt payload
         :doc-author: Trelent
         """
@@ -141,9 +193,13 @@ class Auth:
         except JWTError as e:
             raise credentials_exception
         
+        snapshot = await user_cache.get(email)
+        if snapshot is not None:
+            return user_from_snapshot(snapshot)
         user = await repository_users.get_user_by_email(email, db)
         if user is None:
             raise credentials_exception
+        await user_cache.set(user)
         return user
     
     def create_email_token(self, data: dict):
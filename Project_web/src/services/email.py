@@ -1,51 +1,36 @@
-from pathlib import Path
-
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi_mail.errors import ConnectionErrors
 from pydantic import EmailStr
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.repository.outbox import queue_email
 from src.services.auth import auth_service
-from src.conf.config import settings
-
-conf = ConnectionConfig(
-    MAIL_USERNAME=settings.mail_username,
-    MAIL_PASSWORD=settings.mail_password,
-    MAIL_FROM=settings.mail_from,
-    MAIL_PORT=settings.mail_port,
-    MAIL_SERVER=settings.mail_server,
-    MAIL_FROM_NAME="Desired Name",
-    MAIL_STARTTLS=False,
-    MAIL_SSL_TLS=True,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
-)
+from src.services.outbox import outbox_worker
 
 
-async def send_email(email: EmailStr, username: str, host: str):
+async def send_email(db: AsyncSession, email: EmailStr, username: str, host: str):
     """
     The send_email function sends an email to the user with a link to confirm their email address.
-            The function takes in three parameters:
-                1) An EmailStr object that contains the user's email address.
-                2) A string containing the username of the user who is registering for an account.  This will be used in a template message sent to them via FastMail API.
-                3) A string containing the hostname of this server, which will be used as part of a URL that is sent to them via FastMail API.
+            The function takes in four parameters:
+                1) The database session of the request.
+                2) An EmailStr object that contains the user's email address.
+                3) A string containing the username of the user who is registering for an account.  This will be used in the email template.
+                4) A string containing the hostname of this server, which will be used as part of the confirmation URL.
+            The email is queued in the outbox with the session of the request and sent by the outbox worker,
+            which is woken up once the caller commits.
     
+    :param db: AsyncSession: Session of the request, committed by the caller
     :param email: EmailStr: Specify the email address of the recipient
     :param username: str: Pass the username to the email template
     :param host: str: Pass the hostname of this server to the email template
-    :return: A coroutine object
+    :return: None
     :doc-author: Trelent
     """
-    try:
-        token_verification = auth_service.create_email_token({"sub": email})
-        message = MessageSchema(
-            subject="Confirm your email ",
-            recipients=[email],
-            template_body={"host": host, "username": username, "token": token_verification},
-            subtype=MessageType.html
-        )
-
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="email_template.html")
-    except ConnectionErrors as err:
-        print(err)
+    token_verification = auth_service.create_email_token({"sub": email})
+    await queue_email(
+        db,
+        email,
+        "Confirm your email ",
+        "email_template.html",
+        {"host": str(host), "username": username, "token": token_verification}
+    )
+    event.listen(db.sync_session, "after_commit", lambda session: outbox_worker.notify(), once=True)
@@ -0,0 +1,89 @@
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Awaitable, Callable
+
+
+class JobStatus(str, Enum):
+    pending = "pending"
+    running = "running"
+    done = "done"
+    failed = "failed"
+
+
+@dataclass
+class Job:
+    id: str
+    name: str
+    user_id: int
+    status: JobStatus = JobStatus.pending
+    result: Any = None
+    error: str | None = None
+
+
+class JobQueue:
+    """
+    In-process registry of background jobs. A job is created while handling the
+    request, executed by FastAPI BackgroundTasks once the response is sent, and
+    its status can be polled by id by the user who started it. Only the latest `max_jobs` jobs are kept.
+    """
+
+    def __init__(self, max_jobs: int = 10000):
+        self.max_jobs = max_jobs
+        self.jobs: OrderedDict[str, Job] = OrderedDict()
+
+    def create(self, name: str, user_id: int) -> Job:
+        """
+        The create function registers a new pending job.
+
+        :param name: str: Kind of the job, e.g. "qr_code"
+        :param user_id: int: Id of the user who started the job, the only one allowed to poll it
+        :return: The created job
+        :doc-author: Trelent
+        """
+        job = Job(id=uuid.uuid4().hex, name=name, user_id=user_id)
+        self.jobs[job.id] = job
+        while len(self.jobs) > self.max_jobs:
+            self.jobs.popitem(last=False)
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        """
+        The get function returns the job with the given id.
+
+        :param job_id: str: Job id
+        :return: The job or None if it is unknown or already evicted
+        :doc-author: Trelent
+        """
+        return self.jobs.get(job_id)
+
+    async def run(
+        self,
+        job_id: str,
+        func: Callable[..., Awaitable[Any]],
+        *args,
+        **kwargs
+    ) -> None:
+        """
+        The run function executes the coroutine function of a job and records
+        its result or error. It never raises, failures are kept in the job.
+
+        :param job_id: str: Id of a job returned by create
+        :param func: Callable[..., Awaitable[Any]]: Coroutine function doing the work
+        :return: None
+        :doc-author: Trelent
+        """
+        job = self.jobs.get(job_id)
+        if job is None:
+            return
+        job.status = JobStatus.running
+        try:
+            job.result = await func(*args, **kwargs)
+            job.status = JobStatus.done
+        except Exception as err:
+            job.error = str(err)
+            job.status = JobStatus.failed
+
+
+job_queue = JobQueue()
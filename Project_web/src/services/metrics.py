@@ -0,0 +1,269 @@
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from src.conf.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+HISTOGRAMS = {
+    "http_request_duration_seconds": ("Time until the response is sent, by route", LATENCY_BUCKETS),
+    "http_request_queries": ("Database queries per request, by route", COUNT_BUCKETS),
+    "http_request_query_duration_seconds": ("Time spent in database queries per request, by route", LATENCY_BUCKETS),
+    "db_pool_checkout_wait_seconds": ("Time spent waiting for a pool connection", LATENCY_BUCKETS),
+}
+
+COUNTERS = {
+    "db_slow_queries_total": "Queries slower than settings.slow_query_ms",
+    "db_n_plus_one_total": "Requests repeating one statement settings.n_plus_one_threshold times or more, by route",
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram, buckets are upper bounds as in the Prometheus
+    text format (the +Inf bucket is implicit).
+    """
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        result = []
+        total = 0
+        for bound, count in zip(list(self.buckets) + ["+Inf"], self.counts):
+            total += count
+            result.append((str(bound), total))
+        return result
+
+
+class Metrics:
+    """
+    In-process registry of the metrics declared in HISTOGRAMS and COUNTERS.
+    Every worker process keeps its own values, scrape each worker or run
+    a single one behind the /metrics endpoint.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {name: {} for name in HISTOGRAMS}
+        self.counters: Dict[str, Dict[Labels, float]] = {name: {} for name in COUNTERS}
+        self.engines: List[Engine] = []
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """
+        The observe function records a value in the histogram with the given labels.
+
+        :param name: str: Name of a histogram from HISTOGRAMS
+        :param value: float: Observed value
+        :param labels: str: Label values
+        :return: None
+        :doc-author: Trelent
+        """
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            histogram = self.histograms[name].get(key)
+            if histogram is None:
+                histogram = self.histograms[name][key] = Histogram(HISTOGRAMS[name][1])
+            histogram.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        """
+        The inc function increments the counter with the given labels.
+
+        :param name: str: Name of a counter from COUNTERS
+        :param value: float: Increment
+        :param labels: str: Label values
+        :return: None
+        :doc-author: Trelent
+        """
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.counters[name][key] = self.counters[name].get(key, 0) + value
+
+    def clear(self) -> None:
+        with self.lock:
+            for values in (*self.histograms.values(), *self.counters.values()):
+                values.clear()
+
+    def render(self) -> str:
+        """
+        The render function exports all metrics and the state of the connection
+        pools of the instrumented engines in the Prometheus text format.
+
+        :return: The text of the /metrics response
+        :doc-author: Trelent
+        """
+        lines = []
+        with self.lock:
+            for name, (description, _) in HISTOGRAMS.items():
+                lines += [f"# HELP {name} {description}", f"# TYPE {name} histogram"]
+                for key, histogram in sorted(self.histograms[name].items()):
+                    for bound, count in histogram.cumulative():
+                        lines.append(f"{name}_bucket{format_labels(key + (('le', bound),))} {count}")
+                    lines.append(f"{name}_sum{format_labels(key)} {histogram.sum}")
+                    lines.append(f"{name}_count{format_labels(key)} {histogram.count}")
+            for name, description in COUNTERS.items():
+                lines += [f"# HELP {name} {description}", f"# TYPE {name} counter"]
+                for key, value in sorted(self.counters[name].items()):
+                    lines.append(f"{name}{format_labels(key)} {value}")
+        for name, description, method in (
+            ("db_pool_size", "Connections kept by the pool", "size"),
+            ("db_pool_checked_out", "Connections currently used", "checkedout"),
+            ("db_pool_overflow", "Connections opened above the pool size", "overflow"),
+        ):
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} gauge"]
+            for index, engine in enumerate(self.engines):
+                # only queue pools report their state; engines are numbered, their urls name hosts and databases
+                value = getattr(engine.pool, method, None)
+                if callable(value):
+                    lines.append(f'{name}{format_labels((("engine", str(index)),))} {value()}')
+        return "\n".join(lines) + "\n"
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label(str(value))}"' for key, value in labels) + "}"
+
+
+metrics = Metrics()
+
+
+@dataclass
+class RequestStats:
+    queries: int = 0
+    query_duration: float = 0.0
+    statements: Counter = field(default_factory=Counter)
+
+
+# statistics of the request being handled, None outside of requests
+current_request: ContextVar[RequestStats | None] = ContextVar("current_request", default=None)
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context.metrics_start = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context.metrics_start
+    stats = current_request.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.query_duration += elapsed
+        stats.statements[statement] += 1
+    if elapsed * 1000 >= settings.slow_query_ms:
+        metrics.inc("db_slow_queries_total")
+        logger.warning("slow query: %.1f ms: %s", elapsed * 1000, statement)
+
+
+def instrument_engine(engine) -> None:
+    """
+    The instrument_engine function hooks the cursor events of an engine to time every
+    query and count the queries of the current request, and times the checkouts of
+    pool connections. Instrumenting the same engine twice does nothing.
+
+    :param engine: Engine | AsyncEngine: Engine to instrument
+    :return: None
+    :doc-author: Trelent
+    """
+    engine = getattr(engine, "sync_engine", engine)
+    if engine in metrics.engines:
+        return
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    raw_connection = engine.raw_connection
+
+    # every Connection gets its DBAPI connection from the pool through raw_connection,
+    # wrapping it on the engine keeps working when dispose() replaces the pool
+    def timed_raw_connection():
+        start = time.perf_counter()
+        try:
+            return raw_connection()
+        finally:
+            metrics.observe("db_pool_checkout_wait_seconds", time.perf_counter() - start)
+
+    engine.raw_connection = timed_raw_connection
+    metrics.engines.append(engine)
+
+
+def route_label(scope) -> str:
+    route = scope.get("route")
+    # raw paths are unbounded, requests not matched by a route share one label
+    return getattr(route, "path", None) or "unmatched"
+
+
+def record_request(scope, status_code: int, elapsed: float, stats: RequestStats) -> None:
+    route = route_label(scope)
+    metrics.observe("http_request_duration_seconds", elapsed,
+                    method=scope["method"], route=route, status=str(status_code))
+    metrics.observe("http_request_queries", stats.queries, route=route)
+    metrics.observe("http_request_query_duration_seconds", stats.query_duration, route=route)
+    if stats.statements:
+        statement, count = stats.statements.most_common(1)[0]
+        if count >= settings.n_plus_one_threshold:
+            metrics.inc("db_n_plus_one_total", route=route)
+            logger.warning("possible N+1 in %s %s: %d executions of %s", scope["method"], route, count, statement)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware measuring every HTTP request: latency until the last byte of
+    the response is sent (background tasks excluded), number and duration of its
+    database queries, and repeated statements hinting at N+1 queries.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats()
+        token = current_request.set(stats)
+        start = time.perf_counter()
+        status_code = 500
+        recorded = False
+
+        async def send_wrapper(message):
+            nonlocal status_code, recorded
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False) and not recorded:
+                recorded = True
+                record_request(scope, status_code, time.perf_counter() - start, stats)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_request.reset(token)
+            if not recorded:
+                record_request(scope, status_code, time.perf_counter() - start, stats)
@@ -0,0 +1,299 @@
+import asyncio
+import re
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from functools import partial
+from pathlib import Path
+from typing import BinaryIO, List, Tuple
+
+from src.conf.config import settings
+
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.storage_workers,
+    thread_name_prefix="storage"
+)
+
+
+def cloudinary_service():
+    """
+    The cloudinary_service function imports the cloudinary SDK with the modules the
+    application uses. It is imported on first use rather than with the application,
+    the local backends and most routes never need it.
+
+    :return: The cloudinary package
+    :doc-author: Trelent
+    """
+    import cloudinary
+    import cloudinary.api
+    import cloudinary.exceptions
+    import cloudinary.uploader
+
+    return cloudinary
+
+
+class Storage:
+    """
+    Base class of the image storage backends. Subclasses implement the blocking
+    upload_sync/delete_sync calls, the async wrappers run them in a dedicated
+    thread pool so the event loop is never blocked by a remote upload.
+    """
+
+    def upload_sync(self, file: BinaryIO | bytes, public_id: str) -> str:
+        raise NotImplementedError
+
+    def delete_sync(self, public_id: str) -> bool:
+        raise NotImplementedError
+
+    def find_sync(self, public_id: str) -> str | None:
+        raise NotImplementedError
+
+    def public_id(self, url: str) -> str | None:
+        raise NotImplementedError
+
+    def source_public_id(self, url: str) -> str | None:
+        # url of a stored object or of a transformation of a stored object
+        return self.public_id(url)
+
+    def delete_many_sync(self, public_ids: List[str]) -> int:
+        return sum(self.delete_sync(public_id) for public_id in public_ids)
+
+    def list_sync(self, prefix: str, cursor: str | None, limit: int) -> Tuple[List[Tuple[str, datetime]], str | None]:
+        raise NotImplementedError
+
+    async def upload(self, file: BinaryIO | bytes, public_id: str) -> str:
+        """
+        The upload function stores a file or raw bytes under the given public id
+        from a worker thread and returns the public url of the stored object.
+
+        :param file: BinaryIO | bytes: File object (read in chunks) or content
+        :param public_id: str: Object name, folder included
+        :return: The url of the stored object
+        :doc-author: Trelent
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            executor, partial(self.upload_sync, file, public_id)
+        )
+
+    async def delete(self, public_id: str) -> bool:
+        """
+        The delete function removes the object with the given public id
+        from a worker thread.
+
+        :param public_id: str: Object name, folder included
+        :return: True if the object existed
+        :doc-author: Trelent
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            executor, partial(self.delete_sync, public_id)
+        )
+
+    async def delete_many(self, public_ids: List[str]) -> int:
+        """
+        The delete_many function removes the objects with the given public ids
+        from a worker thread, with as few storage API calls as the backend allows.
+
+        :param public_ids: List[str]: Object names, folder included
+        :return: The number of objects that existed
+        :doc-author: Trelent
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            executor, partial(self.delete_many_sync, public_ids)
+        )
+
+    async def list(
+        self,
+        prefix: str,
+        cursor: str | None = None,
+        limit: int = 500
+    ) -> Tuple[List[Tuple[str, datetime]], str | None]:
+        """
+        The list function returns one page of the stored objects whose public id
+        starts with prefix, from a worker thread.
+
+        :param prefix: str: Beginning of the public ids, e.g. a folder name with a slash
+        :param cursor: str: Cursor returned with the previous page, None for the first one
+        :param limit: int: Maximum number of objects on the page
+        :return: A list of (public id, creation time in UTC) and the cursor of the next page (None on the last page)
+        :doc-author: Trelent
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            executor, partial(self.list_sync, prefix, cursor, limit)
+        )
+
+    async def find(self, public_id: str) -> str | None:
+        """
+        The find function looks up an already stored object from a worker thread.
+
+        :param public_id: str: Object name, folder included
+        :return: The url of the object or None if it isn't stored
+        :doc-author: Trelent
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            executor, partial(self.find_sync, public_id)
+        )
+
+
+class CloudinaryStorage(Storage):
+    # maximum number of public ids of one delete_resources call
+    delete_batch_size = 100
+    url_pattern = re.compile(r"/image/upload/(?:v\d+/)?([^?#]+?)(?:\.[a-z0-9]+)?$")
+
+    def __init__(self, service=None):
+        self.service = service or cloudinary_service()
+        self.service.config(
+            cloud_name=settings.cloudinary_name,
+            api_key=settings.cloudinary_api_key,
+            api_secret=settings.cloudinary_api_secret,
+            secure=True
+        )
+
+    def upload_sync(self, file: BinaryIO | bytes, public_id: str) -> str:
+        result = self.service.uploader.upload(
+            file,
+            public_id=public_id,
+            overwrite=True
+        )
+        return self.service.CloudinaryImage(public_id).build_url(
+            version=result.get("version")
+        )
+
+    def delete_sync(self, public_id: str) -> bool:
+        result = self.service.uploader.destroy(public_id=public_id)
+        return result.get("result") == "ok"
+
+    def find_sync(self, public_id: str) -> str | None:
+        from cloudinary.exceptions import NotFound
+
+        try:
+            result = self.service.api.resource(public_id)
+        except NotFound:
+            return None
+        return self.service.CloudinaryImage(public_id).build_url(
+            version=result.get("version")
+        )
+
+    def public_id(self, url: str) -> str | None:
+        # urls built by upload_sync: .../image/upload/v<version>/<public_id>,
+        # transformation urls of derived images are not stored objects, see source_public_id
+        match = self.url_pattern.search(url)
+        if match is None or not match.group(1).startswith(f"{settings.cloudinary_folder_name}/"):
+            return None
+        return match.group(1)
+
+    def source_public_id(self, url: str) -> str | None:
+        # transformation urls of derived images: .../image/upload/<transformations>/v<version>/<public_id>,
+        # the transformations are rendered by Cloudinary from the stored source image
+        folder = re.escape(settings.cloudinary_folder_name)
+        match = re.search(rf"/image/upload/(?:[^/?#]+/)*?(?:v\d+/)?({folder}/[^?#]+?)(?:\.[a-z0-9]+)?$", url)
+        return match.group(1) if match else None
+
+    def delete_many_sync(self, public_ids: List[str]) -> int:
+        deleted = 0
+        for start in range(0, len(public_ids), self.delete_batch_size):
+            result = self.service.api.delete_resources(public_ids[start:start + self.delete_batch_size])
+            deleted += sum(status == "deleted" for status in result.get("deleted", {}).values())
+        return deleted
+
+    def list_sync(self, prefix: str, cursor: str | None, limit: int) -> Tuple[List[Tuple[str, datetime]], str | None]:
+        options = {"next_cursor": cursor} if cursor else {}
+        result = self.service.api.resources(type="upload", prefix=prefix, max_results=limit, **options)
+        objects = [
+            (resource["public_id"], datetime.fromisoformat(resource["created_at"].replace("Z", "+00:00")))
+            for resource in result.get("resources", [])
+        ]
+        return objects, result.get("next_cursor")
+
+
+class LocalStorage(Storage):
+    """
+    Fake storage keeping objects on the local disk. It is used to run and
+    benchmark the upload pipeline offline, `latency` emulates the round-trip
+    of a remote storage API in seconds.
+    """
+    chunk_size = 1024 * 1024
+
+    def __init__(self, root: str | Path, base_url: str, latency: float = 0.0):
+        self.root = Path(root)
+        self.base_url = base_url.rstrip("/")
+        self.latency = latency
+
+    def path(self, public_id: str) -> Path:
+        return self.root / public_id
+
+    def upload_sync(self, file: BinaryIO | bytes, public_id: str) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        path = self.path(public_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as dest:
+            if isinstance(file, (bytes, bytearray)):
+                dest.write(file)
+            else:
+                shutil.copyfileobj(file, dest, self.chunk_size)
+        return f"{self.base_url}/{public_id}"
+
+    def delete_sync(self, public_id: str) -> bool:
+        if self.latency:
+            time.sleep(self.latency)
+        path = self.path(public_id)
+        if not path.exists():
+            return False
+        path.unlink()
+        return True
+
+    def find_sync(self, public_id: str) -> str | None:
+        if not self.path(public_id).exists():
+            return None
+        return f"{self.base_url}/{public_id}"
+
+    def list_sync(self, prefix: str, cursor: str | None, limit: int) -> Tuple[List[Tuple[str, datetime]], str | None]:
+        # public ids are listed in lexicographic order, the cursor is the last listed one
+        public_ids = sorted(
+            public_id for public_id in (
+                path.relative_to(self.root).as_posix() for path in self.root.rglob("*") if path.is_file()
+            )
+            if public_id.startswith(prefix) and (cursor is None or public_id > cursor)
+        )
+        page = public_ids[:limit]
+        objects = [
+            (public_id, datetime.fromtimestamp(self.path(public_id).stat().st_mtime, timezone.utc))
+            for public_id in page
+        ]
+        return objects, page[-1] if len(public_ids) > limit else None
+
+    def public_id(self, url: str) -> str | None:
+        prefix = f"{self.base_url}/"
+        if not url.startswith(prefix):
+            return None
+        return url[len(prefix):]
+
+
+_storage: Storage | None = None
+
+
+def get_storage() -> Storage:
+    """
+    The get_storage function returns the storage backend selected by
+    settings.storage_backend ("cloudinary" or "local"), created once per process.
+
+    :return: The storage backend
+    :doc-author: Trelent
+    """
+    global _storage
+    if _storage is None:
+        if settings.storage_backend == "local":
+            _storage = LocalStorage(
+                settings.local_storage_path,
+                settings.local_storage_url
+            )
+        else:
+            _storage = CloudinaryStorage()
+    return _storage
@@ -0,0 +1,164 @@
+import json
+import logging
+from datetime import datetime
+
+from src.conf.config import settings
+from src.database.models import User, UserRole
+from src.utils.cache import LRUCache
+
+
+logger = logging.getLogger(__name__)
+
+# columns kept in a snapshot; password and refresh token never leave the database
+SNAPSHOT_FIELDS = ("id", "username", "email", "role", "avatar", "confirmed", "is_active", "created_at")
+
+
+def user_to_snapshot(user: User) -> dict:
+    """
+    The user_to_snapshot function turns a user into a small JSON-serializable dictionary.
+
+    :param user: User: User loaded from the database
+    :return: A dictionary with the SNAPSHOT_FIELDS of the user
+    :doc-author: Trelent
+    """
+    snapshot = {field: getattr(user, field) for field in SNAPSHOT_FIELDS}
+    snapshot["role"] = snapshot["role"].value if snapshot["role"] else None
+    snapshot["created_at"] = snapshot["created_at"].isoformat() if snapshot["created_at"] else None
+    return snapshot
+
+
+def user_from_snapshot(snapshot: dict) -> User:
+    """
+    The user_from_snapshot function builds a User from a snapshot. The user is not
+    attached to any session, it is only meant to be read by the request handlers.
+
+    :param snapshot: dict: Snapshot made by user_to_snapshot
+    :return: A transient user object
+    :doc-author: Trelent
+    """
+    data = dict(snapshot)
+    data["role"] = UserRole(data["role"]) if data["role"] else None
+    data["created_at"] = datetime.fromisoformat(data["created_at"]) if data["created_at"] else None
+    return User(**data)
+
+
+class UserCache:
+    """
+    Cache of the users resolved from access tokens, keyed by email (the token subject).
+    The first tier is an in-process TTL LRU, the optional second tier is Redis shared by
+    all the workers. The in-process tier of the other workers is only dropped by its TTL,
+    so it is kept short.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, redis=None, redis_ttl: int = 300):
+        self.local = LRUCache(maxsize, ttl=ttl)
+        self.redis = redis
+        self.redis_ttl = redis_ttl
+        self.stats = {"local_hits": 0, "redis_hits": 0, "misses": 0, "invalidations": 0, "redis_errors": 0}
+
+    @staticmethod
+    def key(email: str) -> str:
+        return f"user:{email}"
+
+    async def get(self, email: str) -> dict | None:
+        """
+        The get function returns the cached snapshot of a user.
+
+        :param email: str: Email of the user
+        :return: The snapshot or None on a miss
+        :doc-author: Trelent
+        """
+        snapshot = self.local.get(email)
+        if snapshot is not None:
+            self.stats["local_hits"] += 1
+            return snapshot
+        if self.redis is not None:
+            try:
+                raw = await self.redis.get(self.key(email))
+            except Exception as err:
+                self.stats["redis_errors"] += 1
+                logger.warning("user cache: redis get failed: %s", err)
+                raw = None
+            if raw:
+                snapshot = json.loads(raw)
+                self.local.put(email, snapshot)
+                self.stats["redis_hits"] += 1
+                return snapshot
+        self.stats["misses"] += 1
+        return None
+
+    async def set(self, user: User) -> None:
+        """
+        The set function stores the snapshot of a user in both tiers.
+
+        :param user: User: User loaded from the database
+        :return: None
+        :doc-author: Trelent
+        """
+        snapshot = user_to_snapshot(user)
+        self.local.put(user.email, snapshot)
+        if self.redis is not None:
+            try:
+                await self.redis.set(self.key(user.email), json.dumps(snapshot), ex=self.redis_ttl)
+            except Exception as err:
+                self.stats["redis_errors"] += 1
+                logger.warning("user cache: redis set failed: %s", err)
+
+    async def invalidate(self, email: str) -> None:
+        """
+        The invalidate function drops a user from both tiers. It must be called
+        whenever a column of the snapshot changes.
+
+        :param email: str: Email of the user
+        :return: None
+        :doc-author: Trelent
+        """
+        self.local.pop(email)
+        self.stats["invalidations"] += 1
+        if self.redis is not None:
+            try:
+                await self.redis.delete(self.key(email))
+            except Exception as err:
+                self.stats["redis_errors"] += 1
+                logger.warning("user cache: redis delete failed: %s", err)
+
+    def clear(self) -> None:
+        """
+        The clear function empties the in-process tier.
+
+        :return: None
+        :doc-author: Trelent
+        """
+        self.local.clear()
+
+    def get_stats(self) -> dict:
+        """
+        The get_stats function returns the hit/miss counters and the in-process tier size.
+
+        :return: A dictionary of counters
+        :doc-author: Trelent
+        """
+        return {**self.stats, "size": len(self.local), "redis": self.redis is not None}
+
+
+def create_user_cache() -> UserCache:
+    """
+    The create_user_cache function builds the cache from settings, with the Redis tier
+    when REDIS_URL is set (the redis package is then required).
+
+    :return: The user cache
+    :doc-author: Trelent
+    """
+    client = None
+    if settings.redis_url:
+        import redis.asyncio as aioredis
+        client = aioredis.from_url(settings.redis_url)
+    return UserCache(
+        settings.user_cache_size,
+        settings.user_cache_ttl,
+        redis=client,
+        redis_ttl=settings.user_cache_redis_ttl
+    )
+
+
+user_cache = create_user_cache()
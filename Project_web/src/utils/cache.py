@@ -0,0 +1,74 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+class LRUCache:
+    """
+    Small in-process least recently used cache. It is not shared between
+    worker processes, so it must only hold values that never go stale
+    or that are invalidated explicitly by the code changing them. With `ttl`
+    (seconds) entries also expire, which bounds the staleness seen by the
+    other processes.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data: OrderedDict[Hashable, Any] = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        The get function returns the cached value and marks it as recently used.
+
+        :param key: Hashable: Cache key
+        :param default: Any: Value returned on a miss
+        :return: The cached value or default
+        :doc-author: Trelent
+        """
+        if key not in self.data:
+            return default
+        expires, value = self.data[key]
+        if expires is not None and expires <= time.monotonic():
+            del self.data[key]
+            return default
+        self.data.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """
+        The put function stores a value and evicts the least recently used
+        entries above maxsize.
+
+        :param key: Hashable: Cache key
+        :param value: Any: Value to store
+        :return: None
+        :doc-author: Trelent
+        """
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        self.data[key] = (expires, value)
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        """
+        The pop function drops a key from the cache if it is there.
+
+        :param key: Hashable: Cache key
+        :return: None
+        :doc-author: Trelent
+        """
+        self.data.pop(key, None)
+
+    def clear(self) -> None:
+        """
+        The clear function drops every cached entry.
+
+        :return: None
+        :doc-author: Trelent
+        """
+        self.data.clear()
+
+    def __len__(self) -> int:
+        return len(self.data)
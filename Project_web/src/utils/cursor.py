@@ -0,0 +1,66 @@
+import base64
+import binascii
+from datetime import datetime
+from typing import Tuple
+
+from fastapi import HTTPException, status
+
+
+def encode_cursor(created: datetime, item_id: int) -> str:
+    """
+    The encode_cursor function packs the sort key of the last item of a page
+    into an opaque url-safe token.
+
+    :param created: datetime: Creation time of the last item
+    :param item_id: int: Id of the last item, breaks ties of equal times
+    :return: The cursor of the next page
+    :doc-author: Trelent
+    """
+    raw = f"{created.isoformat()}|{item_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    The decode_cursor function unpacks a token made by encode_cursor.
+
+    :param cursor: str: Cursor received from the client
+    :return: A tuple of the creation time and the id of the last seen item
+    :doc-author: Trelent
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created, item_id = raw.split("|")
+        return datetime.fromisoformat(created), int(item_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def encode_score_cursor(score: float, item_id: int) -> str:
+    """
+    The encode_score_cursor function packs the sort key of the last item of a page
+    ranked by score into an opaque url-safe token.
+
+    :param score: float: Score of the last item
+    :param item_id: int: Id of the last item, breaks ties of equal scores
+    :return: The cursor of the next page
+    :doc-author: Trelent
+    """
+    raw = f"{score!r}|{item_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_score_cursor(cursor: str) -> Tuple[float, int]:
+    """
+    The decode_score_cursor function unpacks a token made by encode_score_cursor.
+
+    :param cursor: str: Cursor received from the client
+    :return: A tuple of the score and the id of the last seen item
+    :doc-author: Trelent
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        score, item_id = raw.split("|")
+        return float(score), int(item_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
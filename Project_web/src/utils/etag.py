@@ -0,0 +1,74 @@
+import hashlib
+
+from fastapi import Request, Response, status
+
+from src.conf.config import settings
+
+
+def make_etag(*parts) -> str:
+    """
+    The make_etag function builds a weak ETag from the values identifying a version of
+    a representation, e.g. the id and version of a row. Weak, because the same version
+    may be serialized differently (JSON whitespace, compression).
+
+    :param parts: Values identifying the representation
+    :return: The ETag header value
+    :doc-author: Trelent
+    """
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """
+    The etag_matches function checks the If-None-Match header of a request with the
+    weak comparison of RFC 9110.
+
+    :param request: Request: Incoming request
+    :param etag: str: Current ETag of the representation
+    :return: True if the client already holds the current version
+    :doc-author: Trelent
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in header.split(","))
+
+
+def cache_control(public: bool) -> str:
+    """
+    The cache_control function returns the Cache-Control of read endpoints. Responses
+    that don't depend on the user may be kept by shared caches (CDN) for
+    settings.http_cache_max_age seconds, the others only by the client; both are
+    revalidated with their ETag afterwards.
+
+    :param public: bool: The response is the same for every user
+    :return: The Cache-Control header value
+    :doc-author: Trelent
+    """
+    if public:
+        return f"public, max-age={settings.http_cache_max_age}, must-revalidate"
+    return "private, no-cache"
+
+
+def conditional_response(request: Request, response: Response, etag: str, public: bool = False) -> Response | None:
+    """
+    The conditional_response function sets the validators of a read endpoint and answers
+    conditional requests. The route returns the 304 response when there is one, before
+    loading or serializing the body.
+
+    :param request: Request: Incoming request
+    :param response: Response: Response of the route, gets the ETag and Cache-Control headers
+    :param etag: str: Current ETag of the representation
+    :param public: bool: The response is the same for every user
+    :return: A 304 response if the client holds the current version, otherwise None
+    :doc-author: Trelent
+    """
+    headers = {"ETag": etag, "Cache-Control": cache_control(public)}
+    if etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return None
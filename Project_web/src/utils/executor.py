@@ -0,0 +1,42 @@
+import asyncio
+from concurrent.futures import Executor
+from functools import partial
+from typing import Any, Callable
+
+from fastapi import HTTPException, status
+
+
+class BoundedExecutor:
+    """
+    Runs blocking calls on an executor from async code and limits the number of
+    calls waiting for it. When `max_pending` calls are already queued or running
+    the next one is rejected with 503 instead of piling up behind them.
+    """
+
+    def __init__(self, executor: Executor, max_pending: int):
+        self.executor = executor
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        The run function executes func(*args, **kwargs) on the executor.
+
+        :param func: Callable[..., Any]: Blocking function
+        :return: The result of func
+        :doc-author: Trelent
+        """
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy, try again later",
+                headers={"Retry-After": "1"}
+            )
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, partial(func, *args, **kwargs))
+        finally:
+            self.pending -= 1
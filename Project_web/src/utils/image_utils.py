@@ -1,39 +1,240 @@
-import cloudinary
+import asyncio
+import json
+from typing import Dict, List
+
 from fastapi import HTTPException, status
-from sqlalchemy.orm import Session
-from src.utils.qr_code import get_qr_code_by_url
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from src.services.storage import cloudinary_service, get_storage
+from src.utils.qr_code import upload_qr_code
 from src.database.models import Post, User
 from src.conf.config import settings
 
 
+def canonical_transformation(transform_params: dict) -> str:
+    """
+    The canonical_transformation function serializes transformation parameters
+    so that equal transformations always give the same string, whatever the order
+    of the keys.
+    
+    :param transform_params: dict: Cloudinary transformation parameters
+    :return: The key of the transformation
+    :doc-author: Trelent
+    """
+    return json.dumps(transform_params, sort_keys=True, separators=(",", ":"))
+
+
+def transform_service(service=None):
+    """
+    The transform_service function returns the configured Cloudinary library building the
+    transformation urls. With the local transformation backend it returns None: images are
+    rendered by the application and Cloudinary is neither imported nor configured.
+    
+    :param service: cloudinary: Pass in the cloudinary library, imported on first use by default
+    :return: The cloudinary library or None
+    :doc-author: Trelent
+    """
+    if settings.transform_backend == "local":
+        return None
+    service = service or cloudinary_service()
+    service.config(
+        cloud_name=settings.cloudinary_name,
+        api_key=settings.cloudinary_api_key,
+        api_secret=settings.cloudinary_api_secret,
+        secure=True
+    )
+    return service
+
+
+async def get_source_images(image_ids: List[int], db: AsyncSession, current_user: User) -> Dict[int, Post]:
+    """
+    The get_source_images function loads the images to be transformed with their hashtags.
+    It raises 404 if one of them doesn't exist and 403 if one of them belongs to another user.
+    
+    :param image_ids: List[int]: Ids of the images
+    :param db: AsyncSession: Access the database
+    :param current_user: User: Get the user's id
+    :return: A dictionary id -> image
+    :doc-author: Trelent
+    """
+    result = await db.execute(
+        select(Post).options(
+            selectinload(Post.hashtags)
+        ).filter(
+            Post.id.in_(image_ids)
+        )
+    )
+    images = {image.id: image for image in result.scalars().all()}
+    if len(images) < len(set(image_ids)):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Image not found"
+        )
+    if any(image.author_id != current_user.id for image in images.values()):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied"
+        )
+    return images
+
+
+async def get_derived_images(parent_ids: List[int], transformation: str, db: AsyncSession) -> Dict[int, Post]:
+    """
+    The get_derived_images function looks up the images already derived from the given
+    images with the given transformation.
+    
+    :param parent_ids: List[int]: Ids of the source images
+    :param transformation: str: Key made by canonical_transformation
+    :param db: AsyncSession: Access the database
+    :return: A dictionary source id -> derived image
+    :doc-author: Trelent
+    """
+    result = await db.execute(
+        select(Post).filter(
+            Post.parent_id.in_(parent_ids),
+            Post.transformation == transformation
+        )
+    )
+    return {image.parent_id: image for image in result.scalars().all()}
+
+
+async def build_derived_image(
+    image: Post,
+    transform_params: dict,
+    transformation: str,
+    description: str,
+    current_user: User,
+    service
+) -> Post:
+    """
+    The build_derived_image function builds the url of a transformed image and its qr code,
+    and returns the new post, not yet added to the session. With the local transformation
+    backend the image is rendered by the application instead of Cloudinary. The qr code is
+    stored with the configured storage backend.
+    
+    :param image: Post: Source image
+    :param transform_params: dict: Cloudinary transformation parameters
+    :param transformation: str: Key made by canonical_transformation
+    :param description: str: Set the description of the new image
+    :param current_user: User: Get the user's id
+    :param service: cloudinary: Configured cloudinary library, None with the local backend
+    :return: The derived post
+    :doc-author: Trelent
+    """
+    if settings.transform_backend == "local":
+        from src.services.transform import get_transformer
+
+        url = await get_transformer().transform(image.image_url, transform_params)
+    else:
+        filename = image.image_url.split("/")[-1].split(".")[0]
+        public_id = f'{settings.cloudinary_folder_name}/{filename}'
+
+        url = service.CloudinaryImage(public_id=public_id).build_url(
+            **transform_params
+        )
+
+    qr_code_url = await upload_qr_code(url, get_storage())
+
+    return Post(
+        description=description,
+        author_id=current_user.id,
+        image_url=url,
+        qr_code_url=qr_code_url,
+        hashtags=image.hashtags,
+        parent_id=image.id,
+        transformation=transformation
+    )
+
+
+async def transform_images(
+    image_ids: List[int],
+    transform_params: dict,
+    description: str,
+    db: AsyncSession,
+    current_user: User,
+    service=None
+) -> List[Post]:
+    """
+    The transform_images function applies one transformation to many images of the current user.
+    A transformation already applied to an image is not generated again, the post derived
+    the first time is returned instead. The missing ones are built concurrently, at most
+    settings.bulk_transform_concurrency at a time. New posts keep the source image id as parent_id.
+    
+    :param image_ids: List[int]: Specify the images that are to be transformed
+    :param transform_params: dict: Pass in the transformation parameters
+    :param description: str: Set the description of the new images
+    :param db: AsyncSession: Access the database
+    :param current_user: User: Get the user's id
+    :param service: cloudinary: Pass in the cloudinary library, imported on first use by default
+    :return: The transformed images, in the order of image_ids
+    :doc-author: Trelent
+    """
+    images = await get_source_images(image_ids, db, current_user)
+    transformation = canonical_transformation(transform_params)
+    derived = await get_derived_images(list(images), transformation, db)
+    missing = [image_id for image_id in dict.fromkeys(image_ids) if image_id not in derived]
+    if missing:
+        service = transform_service(service)
+        semaphore = asyncio.Semaphore(settings.bulk_transform_concurrency)
+
+        async def build(image_id: int) -> Post:
+            async with semaphore:
+                return await build_derived_image(images[image_id], transform_params, transformation,
+                                                 description, current_user, service)
+
+        new_images = await asyncio.gather(*map(build, missing))
+        db.add_all(new_images)
+        try:
+            await db.commit()
+        except IntegrityError:
+            # another request derived some of them meanwhile, keep its posts
+            await db.rollback()
+            derived = await get_derived_images(list(images), transformation, db)
+            new_images = [image for image in new_images if image.parent_id not in derived]
+            db.add_all(new_images)
+            await db.commit()
+        for new_image in new_images:
+            await db.refresh(new_image)
+            derived[new_image.parent_id] = new_image
+    return [derived[image_id] for image_id in image_ids]
+
+
 async def transform_image(
     image_id: int,
     transform_params: dict,
     description: str,
-    db: Session,
+    db: AsyncSession,
     current_user: User,
-    service: cloudinary = cloudinary
+    service=None
 ) -> Post:
     """
     The transform_image function takes an image_id, transform_params, description and db as arguments.
     It then queries the database for a Post with the given id. If no such post exists it raises a 404 error.
     If the user is not authorized to access this post (i.e., if they are not its author) it raises a 403 error instead.
-    The function then configures cloudinary using settings from settings module and builds an url for transformed image using 
+    If the image was already transformed with the same params, the post derived then is returned.
+    Otherwise the function configures cloudinary using settings from settings module and builds an url for transformed image using 
     the public id of original image and transform params provided by user in request body (see docs/transformations). 
     Then it gets qr code url for new
     
     :param image_id: int: Specify the image that is to be transformed
     :param transform_params: dict: Pass in the transformation parameters
     :param description: str: Set the description of the new image
-    :param db: Session: Access the database
+    :param db: AsyncSession: Access the database
     :param current_user: User: Get the user's id
-    :param service: cloudinary: Pass in the cloudinary library
+    :param service: cloudinary: Pass in the cloudinary library, imported on first use by default
     :return: A new image with the transformation applied
     :doc-author: Trelent
     """
-    image: Post = db.query(Post).filter(
-        Post.id == image_id
-    ).first()
+    result = await db.execute(
+        select(Post).options(
+            selectinload(Post.hashtags)
+        ).filter(
+            Post.id == image_id
+        )
+    )
+    image: Post = result.scalars().first()
     if image is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -45,31 +246,22 @@ async def transform_image(
             detail="Access denied"
         )
 
-    service.config(
-        cloud_name=settings.cloudinary_name,
-        api_key=settings.cloudinary_api_key,
-        api_secret=settings.cloudinary_api_secret,
-        secure=True
-    )
-
-    filename = image.image_url.split("/")[-1].split(".")[0]
-    public_id = f'{settings.cloudinary_folder_name}/{filename}'
-
-    url = service.CloudinaryImage(public_id=public_id).build_url(
-        **transform_params
-    )
-
-    qr_code_url = await get_qr_code_by_url(url=url, service=service)
+    transformation = canonical_transformation(transform_params)
+    derived = await get_derived_images([image.id], transformation, db)
+    if image.id in derived:
+        return derived[image.id]
 
-    new_image = Post(
-        description=description,
-        author_id=current_user.id,
-        image_url=url,
-        qr_code_url=qr_code_url,
-        hashtags=image.hashtags
-    )
+    service = transform_service(service)
+    new_image = await build_derived_image(image, transform_params, transformation,
+                                          description, current_user, service)
 
     db.add(new_image)
-    db.commit()
-    db.refresh(new_image)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # the same transformation was stored by a concurrent request
+        await db.rollback()
+        derived = await get_derived_images([image.id], transformation, db)
+        return derived[image.id]
+    await db.refresh(new_image)
     return new_image
@@ -1,71 +1,175 @@
 import io
-import uuid
-import qrcode
-import cloudinary
-import cloudinary.uploader
+import asyncio
+import hashlib
+from concurrent.futures import Executor
+from typing import Dict, List
 
 from src.conf.config import settings
+from src.services.storage import CloudinaryStorage, Storage, cloudinary_service
+from src.utils.cache import LRUCache
 
 
-async def get_qr_code_by_url(url: str, service: cloudinary=cloudinary) -> str:
+QR_CODE_OPTIONS = {
+    "version": 1,
+    # qrcode.constants.ERROR_CORRECT_L, qrcode is imported when a code is rendered
+    "error_correction": 1,
+    "box_size": 10,
+    "border": 4,
+}
+
+# public id -> url of the qr codes known to be stored. The storage GC deletes orphaned
+# qr codes from another process, the entries expire so a deleted one is looked up again
+qr_code_cache = LRUCache(settings.qr_code_cache_size, settings.qr_code_cache_ttl)
+
+
+def qr_code_public_id(url: str, format: str = "png") -> str:
     """
-    The get_qr_code_by_url function takes a url as an argument and returns the URL of a QR code image.
+    The qr_code_public_id function derives the public id of a QR code from the
+    url and the render options, so the same QR code is always stored under the same name.
     
     :param url: str: Specify the url that will be encoded in the qr code
-    :param service: cloudinary: Specify the cloudinary service that will be used to upload the image
-    :return: The url of a qr code image
+    :param format: str: png or svg
+    :return: The public id of the qr code
     :doc-author: Trelent
     """
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
+    options = "|".join(f"{key}={value}" for key, value in sorted(QR_CODE_OPTIONS.items()))
+    digest = hashlib.sha256(f"{options}|{format}|{url}".encode()).hexdigest()
+    return f'{settings.cloudinary_folder_name}/qrcode/{digest}'
+
+
+def render_qr_code(url: str, format: str = "png") -> bytes:
+    """
+    The render_qr_code function renders a QR code for the url as PNG or SVG bytes.
+    SVG is built by qrcode itself and doesn't need Pillow.
+    
+    :param url: str: Specify the url that will be encoded in the qr code
+    :param format: str: png or svg
+    :return: The image of the qr code
+    :doc-author: Trelent
+    """
+    if format not in ("png", "svg"):
+        raise ValueError(f"Unsupported qr code format: {format}")
+    import qrcode
+    import qrcode.image.svg
+
+    qr = qrcode.QRCode(**QR_CODE_OPTIONS)
     qr.add_data(url)
     qr.make(fit=True)
 
-    img = qr.make_image(fill_color="black", back_color="white")
-
     b = io.BytesIO()
-    img.save(b, 'png')
-    img_bytes = b.getvalue()
+    if format == "svg":
+        qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).save(b)
+    else:
+        qr.make_image(fill_color="black", back_color="white").save(b, 'png')
+    return b.getvalue()
 
-    service.config(
-        cloud_name=settings.cloudinary_name,
-        api_key=settings.cloudinary_api_key,
-        api_secret=settings.cloudinary_api_secret,
-        secure=True
-    )
 
-    public_id = f'{settings.cloudinary_folder_name}/qrcode/{uuid.uuid4()}'
+async def get_qr_code_by_url(url: str, service=None) -> str:
+    """
+    The get_qr_code_by_url function takes a url as an argument and returns the URL of a QR code image
+    stored on Cloudinary, see upload_qr_code.
+    
+    :param url: str: Specify the url that will be encoded in the qr code
+    :param service: cloudinary: Specify the cloudinary service that will be used to upload the image, imported on first use by default
+    :return: The url of a qr code image
+    :doc-author: Trelent
+    """
+    return await upload_qr_code(url, CloudinaryStorage(service))
+
 
-    service.uploader.upload(
-        img_bytes,
-        public_id=public_id,
-        overwrite=True
-    )
+async def upload_qr_code(url: str, storage: Storage, format: str | None = None) -> str:
+    """
+    The upload_qr_code function returns the url of the QR code of the url. The QR code is
+    content-addressed: when it is already stored it is neither rendered nor uploaded again.
+    Otherwise it is rendered in a worker thread and stored with the given storage backend,
+    so the event loop is not blocked.
+    
+    :param url: str: Specify the url that will be encoded in the qr code
+    :param storage: Storage: Backend the image is uploaded to
+    :param format: str: png or svg, settings.qr_code_format by default
+    :return: The url of a qr code image
+    :doc-author: Trelent
+    """
+    format = format or settings.qr_code_format
+    public_id = qr_code_public_id(url, format)
+    qr_url = qr_code_cache.get(public_id)
+    if qr_url is not None:
+        return qr_url
+    qr_url = await storage.find(public_id)
+    if qr_url is None:
+        loop = asyncio.get_running_loop()
+        img_bytes = await loop.run_in_executor(None, render_qr_code, url, format)
+        qr_url = await storage.upload(img_bytes, public_id)
+    qr_code_cache.put(public_id, qr_url)
+    return qr_url
+
+
+async def upload_qr_codes(
+    urls: List[str],
+    storage: Storage,
+    format: str | None = None,
+    executor: Executor | None = None
+) -> Dict[str, str]:
+    """
+    The upload_qr_codes function is the batch version of upload_qr_code for bulk uploads and backfills.
+    The QR codes that aren't stored yet are rendered in the executor and uploaded concurrently.
+    
+    :param urls: List[str]: Urls that will be encoded in the qr codes
+    :param storage: Storage: Backend the images are uploaded to
+    :param format: str: png or svg, settings.qr_code_format by default
+    :param executor: Executor: Executor rendering the qr codes, the default thread pool of the loop by default
+    :return: A dictionary url -> url of its qr code
+    :doc-author: Trelent
+    """
+    format = format or settings.qr_code_format
+    public_ids = {url: qr_code_public_id(url, format) for url in urls}
+    result = {}
+    for url, public_id in public_ids.items():
+        qr_url = qr_code_cache.get(public_id)
+        if qr_url is not None:
+            result[url] = qr_url
+    unknown = [url for url in public_ids if url not in result]
+    found = await asyncio.gather(*(storage.find(public_ids[url]) for url in unknown))
+    missing = []
+    for url, qr_url in zip(unknown, found):
+        if qr_url is None:
+            missing.append(url)
+        else:
+            result[url] = qr_url
 
-    src_url = service.CloudinaryImage(public_id).build_url()
+    if missing:
+        loop = asyncio.get_running_loop()
+        images = await asyncio.gather(
+            *(loop.run_in_executor(executor, render_qr_code, url, format) for url in missing)
+        )
+        uploaded = await asyncio.gather(
+            *(storage.upload(img_bytes, public_ids[url]) for url, img_bytes in zip(missing, images))
+        )
+        result.update(zip(missing, uploaded))
 
-    return src_url
+    for url, qr_url in result.items():
+        qr_code_cache.put(public_ids[url], qr_url)
+    return result
 
 
-async def delete_qr_code_by_url(url: str, service: cloudinary=cloudinary) -> None:
+async def delete_qr_code_by_url(url: str, service=None) -> None:
     """
     The delete_qr_code_by_url function deletes a QR code from Cloudinary.
     If file not founr raises FileNotFoundError error.
+    QR codes are shared by all posts encoding the same url, so it must only be used
+    for a QR code no other post refers to.
         
     
     
     :param url: str: Specify the url of the qr code to be deleted
-    :param service: cloudinary: Specify the cloudinary service to use
+    :param service: cloudinary: Specify the cloudinary service to use, imported on first use by default
     :return: None
     :doc-author: Trelent
     """
     filename = url.split("/")[-1]
     public_id = f'{settings.cloudinary_folder_name}/qrcode/{filename}'
 
+    service = service or cloudinary_service()
     service.config(
         cloud_name=settings.cloudinary_name,
         api_key=settings.cloudinary_api_key,
@@ -74,6 +178,7 @@ async def delete_qr_code_by_url(url: str, service: cloudinary=cloudinary) -> Non
     )
 
     res = service.uploader.destroy(public_id=public_id)
+    qr_code_cache.pop(public_id)
     print(res)
     if res["result"] != "ok":
         raise FileNotFoundError(
@@ -3,15 +3,22 @@ import pytest_asyncio
 from unittest.mock import AsyncMock, Mock
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 
 from main import app
 from src.database.models import Base, User, UserRole
 from src.database.db import get_db
+from src.repository.comments import comments_cache
+from src.repository.tags import tag_cache, trending_cache
 from src.services.auth import auth_service
+from src.services.user_cache import user_cache
+from src.utils.qr_code import qr_code_cache
 
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
+ASYNC_SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///./test.db"
 
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
@@ -22,6 +29,17 @@ TestingSessionLocal = sessionmaker(
     bind=engine
 )
 
+# the application works with AsyncSession, the sync session above is
+# only used by the tests to seed and inspect the same database file
+async_engine = create_async_engine(
+    ASYNC_SQLALCHEMY_DATABASE_URL, poolclass=NullPool
+)
+TestingAsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    autoflush=False,
+    expire_on_commit=False
+)
+
 
 test_user = {
     "username": "deadpool",
@@ -37,6 +55,12 @@ second_test_user = {
 }
 
 
+@pytest.fixture(autouse=True)
+def clear_user_cache():
+    # tests change users through the sync session, behind the cache's back
+    user_cache.clear()
+
+
 @pytest.fixture(scope="module")
 def user():
     return test_user
@@ -61,6 +85,10 @@ def session():
 
     Base.metadata.drop_all(bind=engine)
     Base.metadata.create_all(bind=engine)
+    tag_cache.clear()
+    trending_cache.clear()
+    comments_cache.clear()
+    qr_code_cache.clear()
 
     db = TestingSessionLocal()
 
@@ -86,9 +114,10 @@ def session():
 def client(session):
     # Dependency override
 
-    def override_get_db():
+    async def override_get_db():
         try:
-            yield session
+            async with TestingAsyncSessionLocal() as db:
+                yield db
         finally:
             session.close()
 
@@ -97,6 +126,12 @@ def client(session):
     yield TestClient(app)
 
 
+@pytest_asyncio.fixture
+async def async_session(session):
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
+
 @pytest.fixture(scope="module")
 def comment():
     return {
@@ -106,24 +141,24 @@ def comment():
 
 
 @pytest.fixture()
-def mock_get_qr_code_by_url(mocker):
+def mock_upload_qr_code(mocker):
     async_mock = AsyncMock(return_value="qr_code_url_responce")
     mocker.patch(
-        'src.utils.image_utils.get_qr_code_by_url',
+        'src.utils.image_utils.upload_qr_code',
         side_effect=async_mock
     )
 
 
 @pytest.fixture()
 def mock_cloudinary_uploader(mocker):
-    mocker.patch("src.routes.users.cloudinary.uploader")
+    mocker.patch("cloudinary.uploader.upload")
 
 
 @pytest.fixture()
 def mock_cloudinary_build_url(mocker):
     mock = Mock(return_value="avatar_url")
     mocker.patch(
-        "src.routes.users.cloudinary.CloudinaryImage.build_url",
+        "cloudinary.CloudinaryImage.build_url",
         side_effect=mock
     )
 
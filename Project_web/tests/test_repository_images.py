@@ -1,6 +1,7 @@
 from unittest.mock import AsyncMock, MagicMock, patch
 import unittest
 from fastapi import File, HTTPException, UploadFile, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 import os
 import sys
@@ -12,9 +13,11 @@ from src.repository.images import (
     get_images,
     del_image,
     put_image,
+    backfill_qr_codes,
 )
+import pytest
+from src.services.storage import LocalStorage
 # from src.utils.qr_code import get_qr_code_by_url
-from src.repository.tags import get_or_create_tag
 # import cloudinary
 
 # class TestImages(unittest.IsolatedAsyncioTestCase):
@@ -97,35 +100,63 @@ from src.repository.tags import get_or_create_tag
 #     def setUp(self):
 #         self.service = MagicMock(spec=cloudinary)
 
-#     async def test_post_images(mock_get_or_create_tag,mock_get_qr_code_by_url):
+#     async def test_post_images(mock_get_or_create_tag,mock_upload_qr_code):
         
 class TestCreateImagesPost(unittest.IsolatedAsyncioTestCase):
 
     def setUp(self):
-        self.session = MagicMock(spec=Session)
+        self.session = MagicMock(spec=AsyncSession)
+        self.session.execute.return_value = MagicMock()
         self.user = User(id=1)
         self.hashtags = ['test1', 'test2']
         self.file = UploadFile(file='logo.png', filename='image.jpg')
+        self.storage = MagicMock()
+        self.storage.upload = AsyncMock(return_value='https://example.com/image.jpg')
         
     def tearDown(self):
         self.session.close()
 
-    async def test_create_images_post(self):
+    @patch('src.repository.images.get_or_create_tags')
+    async def test_create_images_post(self, mock_get_or_create_tags):
         # Arrange
-        for hashtag in self.hashtags:
-            await get_or_create_tag(self.session, hashtag)
+        mock_get_or_create_tags.return_value = [Hashtag(name=name) for name in self.hashtags]
 
         # Act
-        post = await create_images_post('Test Description', self.hashtags, self.user, self.session, self.file)
+        post = await create_images_post('Test Description', self.hashtags, self.user, self.session, self.file, self.storage)
 
         # Assert
         self.assertIsNotNone(post)
         self.assertEqual(post.description, 'Test Description')
         self.assertEqual(post.author_id, 1)
-        self.assertIsNotNone(post.image_url)
-        self.assertIsNotNone(post.qr_code_url)
+        self.assertEqual(post.image_url, 'https://example.com/image.jpg')
+        self.assertIsNone(post.qr_code_url)
         self.assertEqual(len(post.hashtags), 2)
 
+
+@pytest.mark.asyncio
+async def test_backfill_qr_codes(session: Session, async_session: AsyncSession, tmp_path):
+    author = User(username="qr_author", email="qr_author@example.com", password="secret")
+    session.add(author)
+    session.commit()
+    posts = [
+        Post(description=f"qr {i}", image_url=f"http://example.com/{i}.jpg", author_id=author.id,
+             qr_code_url="http://example.com/qr.png" if i == 0 else None)
+        for i in range(5)
+    ]
+    session.add_all(posts)
+    session.commit()
+    ids = [post.id for post in posts]
+    storage = LocalStorage(tmp_path, "/storage")
+
+    assert await backfill_qr_codes(async_session, storage, batch_size=2) == 4
+    assert await backfill_qr_codes(async_session, storage, batch_size=2) == 0
+
+    session.expire_all()
+    qr_urls = [session.get(Post, post_id).qr_code_url for post_id in ids]
+    assert qr_urls[0] == "http://example.com/qr.png"
+    assert all(url.startswith("/storage/") for url in qr_urls[1:])
+    assert len(set(qr_urls)) == 5
+
 if __name__ == '__main__':
     unittest.main()
 
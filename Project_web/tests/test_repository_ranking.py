@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from src.database.models import Comments, Post, User
+from src.repository.ranking import get_hot_feed, refresh_hot_scores
+
+
+@pytest.mark.asyncio
+async def test_refresh_hot_scores(session: Session, async_session: AsyncSession):
+    author = User(username="hot_author", email="hot_author@example.com", password="secret")
+    session.add(author)
+    session.commit()
+    now = datetime.utcnow()
+    posts = {
+        "unrated": Post(description="unrated", author_id=author.id, created_dt=now),
+        "rated": Post(description="rated", author_id=author.id, created_dt=now, rating_sum=18, rating_count=4),
+        "single five": Post(description="single five", author_id=author.id, created_dt=now, rating_sum=5, rating_count=1),
+        "commented": Post(description="commented", author_id=author.id, created_dt=now),
+        "old rated": Post(description="old rated", author_id=author.id, created_dt=now - timedelta(days=7),
+                          rating_sum=18, rating_count=4),
+    }
+    session.add_all(posts.values())
+    session.commit()
+    session.add_all(
+        Comments(text=f"comment {i}", image_id=posts["commented"].id, user_id=author.id) for i in range(4)
+    )
+    session.commit()
+    ids = {name: post.id for name, post in posts.items()}
+    versions = {name: post.version for name, post in posts.items()}
+
+    assert await refresh_hot_scores(async_session) >= len(posts)
+    session.expire_all()
+    scores = {name: session.get(Post, post_id).hot_score for name, post_id in ids.items()}
+    assert {name: session.get(Post, post_id).version for name, post_id in ids.items()} == versions
+    assert scores["unrated"] > 0
+    assert scores["rated"] > scores["single five"] > scores["unrated"]
+    assert scores["commented"] > scores["unrated"]
+    assert scores["rated"] > 10 * scores["old rated"]
+
+
+@pytest.mark.asyncio
+async def test_get_hot_feed(session: Session, async_session: AsyncSession):
+    author = User(username="hot_feeder", email="hot_feeder@example.com", password="secret")
+    session.add(author)
+    session.commit()
+    scores = [1000.5, 1000.25, 1000.25, 1000.0, 999.75]
+    posts = [
+        Post(description=f"hot {i}", author_id=author.id, hot_score=score)
+        for i, score in enumerate(scores)
+    ]
+    session.add_all(posts)
+    session.commit()
+    expected = [p.id for p in sorted(posts, key=lambda p: (p.hot_score, p.id), reverse=True)]
+
+    ids = []
+    cursor = None
+    for _ in range(3):
+        images, cursor = await get_hot_feed(async_session, 2, cursor)
+        ids.extend(image.id for image in images)
+        assert all(image.author.username == "hot_feeder" for image in images if image.id in expected)
+        if len(ids) >= len(expected):
+            break
+    assert ids[:len(expected)] == expected
+
+    with pytest.raises(HTTPException) as exc:
+        await get_hot_feed(async_session, 2, "not a cursor")
+    assert exc.value.status_code == 400
@@ -1,6 +1,13 @@
 import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from src.repository.ratings import create_rating, get_ratings, delete_rating, calculate_average_rating
+from src.repository.ratings import (
+    create_rating,
+    get_ratings,
+    delete_rating,
+    calculate_average_rating,
+    recalculate_rating_aggregates
+)
 from src.database.models import User, Post, Rating, UserRole
 from fastapi import HTTPException
 
@@ -30,65 +37,115 @@ def setup_data(session: Session):
 
 
 @pytest.mark.asyncio
-async def test_create_rating(session: Session, setup_data):
+async def test_create_rating(async_session: AsyncSession, setup_data):
     user, post, _ = setup_data
     rating_value = 5
 
-    new_rating = await create_rating(session, user, post, rating_value)
+    new_rating = await create_rating(async_session, user, post, rating_value)
     assert new_rating.rating == rating_value
     assert new_rating.user_id == user.id
     assert new_rating.image_id == post.id
 
 
 @pytest.mark.asyncio
-async def test_create_rating_existing(session: Session, setup_data):
+async def test_create_rating_existing(async_session: AsyncSession, setup_data):
     user, post, _ = setup_data
     rating_value = 5
 
-    await create_rating(session, user, post, rating_value)
+    await create_rating(async_session, user, post, rating_value)
 
     with pytest.raises(HTTPException):
-        await create_rating(session, user, post, rating_value)
+        await create_rating(async_session, user, post, rating_value)
 
 
 @pytest.mark.asyncio
-async def test_create_rating_own_image(session: Session, setup_data):
+async def test_create_rating_own_image(async_session: AsyncSession, setup_data):
     user, post, author = setup_data
     rating_value = 5
 
     with pytest.raises(HTTPException):
-        await create_rating(session, author, post, rating_value)
+        await create_rating(async_session, author, post, rating_value)
 
 
 @pytest.mark.asyncio
-async def test_get_ratings(session: Session, setup_data):
+async def test_get_ratings(async_session: AsyncSession, setup_data):
     user, post, _ = setup_data
     rating_value = 5
 
-    await create_rating(session, user, post, rating_value)
+    await create_rating(async_session, user, post, rating_value)
 
-    ratings = await get_ratings(session, post.id)
+    ratings = await get_ratings(async_session, post.id)
     assert len(ratings) == 1
     assert ratings[0].rating == rating_value
 
 
 @pytest.mark.asyncio
-async def test_delete_rating(session: Session, setup_data):
+async def test_delete_rating(async_session: AsyncSession, setup_data):
     user, post, _ = setup_data
     rating_value = 5
 
-    new_rating = await create_rating(session, user, post, rating_value)
+    new_rating = await create_rating(async_session, user, post, rating_value)
 
-    response = await delete_rating(session, new_rating.id, user)
+    response = await delete_rating(async_session, new_rating.id, user)
     assert response == {"message": "Rating deleted successfully"}
 
 
 @pytest.mark.asyncio
-async def test_calculate_average_rating(session: Session, setup_data):
+async def test_calculate_average_rating(async_session: AsyncSession, setup_data):
     user, post, _ = setup_data
     rating_value = 5
 
-    await create_rating(session, user, post, rating_value)
+    await create_rating(async_session, user, post, rating_value)
 
-    average_rating = calculate_average_rating(session, post.id)
-    assert average_rating == rating_value
\ No newline at end of file
+    average_rating = await calculate_average_rating(async_session, post.id)
+    assert average_rating == rating_value
+
+
+@pytest.mark.asyncio
+async def test_rating_aggregates(session: Session, async_session: AsyncSession, setup_data):
+    user, post, author = setup_data
+    other = User(username="other", email="other@example.com", password="hashedpassword")
+    session.add(other)
+    session.commit()
+
+    await create_rating(async_session, user, post, 5)
+    other_rating = await create_rating(async_session, other, post, 2)
+    assert await calculate_average_rating(async_session, post.id) == 3.5
+
+    session.refresh(post)
+    assert post.rating_sum == 7
+    assert post.rating_count == 2
+
+    await delete_rating(async_session, other_rating.id, other)
+    session.refresh(post)
+    assert post.rating_sum == 5
+    assert post.rating_count == 1
+    assert await calculate_average_rating(async_session, post.id) == 5
+
+
+@pytest.mark.asyncio
+async def test_calculate_average_rating_no_ratings(async_session: AsyncSession, setup_data):
+    _, post, _ = setup_data
+    assert await calculate_average_rating(async_session, post.id) == 0.0
+    assert await calculate_average_rating(async_session, 0) == 0.0
+
+
+@pytest.mark.asyncio
+async def test_recalculate_rating_aggregates(session: Session, async_session: AsyncSession, setup_data):
+    user, post, author = setup_data
+    unrated = Post(description="Unrated", image_url="http://example.com/unrated.jpg",
+                   author_id=author.id, rating_sum=10, rating_count=3)
+    session.add(unrated)
+    session.add_all([
+        Rating(user_id=user.id, image_id=post.id, rating=4),
+        Rating(user_id=author.id, image_id=post.id, rating=1),
+    ])
+    session.commit()
+
+    assert await recalculate_rating_aggregates(async_session) == 1
+
+    session.refresh(post)
+    session.refresh(unrated)
+    assert (post.rating_sum, post.rating_count) == (5, 2)
+    assert (unrated.rating_sum, unrated.rating_count) == (0, 0)
+    assert await calculate_average_rating(async_session, post.id) == 2.5
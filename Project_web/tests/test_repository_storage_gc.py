@@ -0,0 +1,94 @@
+import os
+import time
+from datetime import timedelta
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from src.conf.config import settings
+from src.database.models import Post, User
+from src.repository.storage_gc import collect_garbage
+from src.services.storage import LocalStorage
+
+
+@pytest.mark.asyncio
+async def test_collect_garbage(session: Session, async_session: AsyncSession, tmp_path):
+    storage = LocalStorage(tmp_path, "/storage")
+    folder = settings.cloudinary_folder_name
+    day_ago = time.time() - 2 * 24 * 3600
+    names = ["image", "qrcode/qr", "orphan1", "orphan2", "qrcode/orphan3", "fresh"]
+    for name in names:
+        path = tmp_path / folder / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"image")
+        if name != "fresh":
+            os.utime(path, (day_ago, day_ago))
+    (tmp_path / "other").mkdir()
+    (tmp_path / "other" / "file").write_bytes(b"not ours")
+    author = User(username="gc_author", email="gc_author@example.com", password="secret")
+    session.add(author)
+    session.commit()
+    session.add(Post(description="gc", author_id=author.id, image_url=f"/storage/{folder}/image",
+                     qr_code_url=f"/storage/{folder}/qrcode/qr"))
+    session.commit()
+    orphans = [f"{folder}/orphan1", f"{folder}/orphan2", f"{folder}/qrcode/orphan3"]
+
+    with patch.multiple(settings, gc_list_page_size=2, gc_batch_size=2, gc_batch_interval=0):
+        report = await collect_garbage(async_session, storage, dry_run=True)
+        assert report["scanned"] == 6
+        assert sorted(report["orphans"]) == orphans
+        assert report["deleted"] == 0
+        assert all((tmp_path / public_id).exists() for public_id in orphans)
+
+        report = await collect_garbage(async_session, storage, min_age=timedelta(hours=1))
+        assert sorted(report["orphans"]) == orphans
+        assert report["deleted"] == 3
+
+    assert not any((tmp_path / public_id).exists() for public_id in orphans)
+    for name in ("image", "qrcode/qr", "fresh"):
+        assert (tmp_path / folder / name).exists()
+    assert (tmp_path / "other" / "file").exists()
+
+
+@pytest.mark.asyncio
+async def test_collect_garbage_keeps_sources_of_derived_posts(session: Session, async_session: AsyncSession):
+    import cloudinary.api
+    from unittest.mock import MagicMock
+
+    from src.repository.images import del_image
+    from src.services.storage import CloudinaryStorage
+
+    service = MagicMock(spec=cloudinary)
+    storage = CloudinaryStorage(service=service)
+    folder = settings.cloudinary_folder_name
+    base = "https://res.cloudinary.com/abc/image/upload"
+    author = User(username="gc_derived", email="gc_derived@example.com", password="secret")
+    session.add(author)
+    session.commit()
+    parent = Post(description="source", author_id=author.id, image_url=f"{base}/v1/{folder}/source")
+    session.add(parent)
+    session.commit()
+    derived = Post(description="derived", author_id=author.id, parent_id=parent.id, transformation="crop",
+                   image_url=f"{base}/c_crop,h_100,w_100/e_grayscale/v1/{folder}/source")
+    session.add(derived)
+    session.commit()
+    parent_id, derived_id = parent.id, derived.id
+
+    await del_image(parent_id, async_session, author)
+    session.expire_all()
+    assert session.get(Post, parent_id) is None
+    assert session.get(Post, derived_id) is not None
+
+    service.api.resources.return_value = {
+        "resources": [
+            {"public_id": f"{folder}/source", "created_at": "2020-01-01T00:00:00Z"},
+            {"public_id": f"{folder}/orphan", "created_at": "2020-01-01T00:00:00Z"},
+        ]
+    }
+    service.api.delete_resources.side_effect = lambda ids: {"deleted": {public_id: "deleted" for public_id in ids}}
+    with patch.multiple(settings, gc_batch_interval=0):
+        report = await collect_garbage(async_session, storage)
+    assert report["orphans"] == [f"{folder}/orphan"]
+    service.api.delete_resources.assert_called_once_with([f"{folder}/orphan"])
@@ -1,19 +1,34 @@
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, patch
+
 import pytest
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from src.database.models import Hashtag
-from src.repository.tags import get_or_create_tag
+from src.database.models import Hashtag, Post, TagUsage, User
+from src.repository.images import del_image
+from src.repository.tags import (
+    decrement_tag_usage,
+    get_or_create_tag,
+    get_or_create_tags,
+    get_trending_tags,
+    increment_tag_usage,
+    rebuild_tag_usage,
+    tag_cache,
+    trending_cache,
+)
 
 
 @pytest.mark.asyncio
-async def test_get_or_create_tag(session: Session):
+async def test_get_or_create_tag(session: Session, async_session: AsyncSession):
 
     tag_name = "test_tag"
 
     tag = session.query(Hashtag).filter(Hashtag.name == tag_name).first()
     assert tag is None
 
-    tag = await get_or_create_tag(session, tag_name)
+    tag = await get_or_create_tag(async_session, tag_name)
     assert tag is not None
     assert tag.name == tag_name
 
@@ -21,7 +36,131 @@ async def test_get_or_create_tag(session: Session):
     assert tag_from_db is not None
     assert tag_from_db.name == tag_name
 
-    existing_tag = await get_or_create_tag(session, tag_name)
+    existing_tag = await get_or_create_tag(async_session, tag_name)
     assert existing_tag is not None
     assert existing_tag.id == tag.id
     assert existing_tag.name == tag.name
+
+
+@pytest.mark.asyncio
+async def test_get_or_create_tags(session: Session, async_session: AsyncSession):
+    tag_cache.clear()
+    existing = await get_or_create_tag(async_session, "existing_tag")
+
+    tags = await get_or_create_tags(async_session, ["new_tag", "existing_tag", "new_tag", "other_tag"])
+    assert [tag.name for tag in tags] == ["new_tag", "existing_tag", "other_tag"]
+    assert tags[1].id == existing.id
+    assert len({tag.id for tag in tags}) == 3
+
+    names = {tag.name for tag in session.query(Hashtag).all()}
+    assert {"new_tag", "existing_tag", "other_tag"} <= names
+
+    # served from the cache without touching the database
+    async_session.execute = AsyncMock(side_effect=AssertionError("cache miss"))
+    cached = await get_or_create_tags(async_session, ["other_tag", "new_tag"])
+    assert [tag.id for tag in cached] == [tags[2].id, tags[0].id]
+
+
+@pytest.mark.asyncio
+async def test_get_or_create_tags_concurrent_insert(session: Session, async_session: AsyncSession):
+    tag_cache.clear()
+    # the tag is created by another request after our select but before our insert
+    session.add(Hashtag(name="race_tag"))
+    session.commit()
+    race_id = session.query(Hashtag.id).filter(Hashtag.name == "race_tag").scalar()
+
+    with patch("src.repository.tags.select_tag_ids", side_effect=[{}, {"race_tag": race_id}]):
+        tags = await get_or_create_tags(async_session, ["race_tag"])
+
+    assert tags[0].id == race_id
+    assert session.query(Hashtag).filter(Hashtag.name == "race_tag").count() == 1
+
+
+@pytest.mark.asyncio
+async def test_trending_tags(session: Session, async_session: AsyncSession):
+    tags = await get_or_create_tags(async_session, ["hot", "warm"])
+    hot, warm = (tag.id for tag in tags)
+    now = datetime.utcnow()
+    await increment_tag_usage(async_session, [hot, warm], now)
+    await increment_tag_usage(async_session, [hot, hot], now)
+    await increment_tag_usage(async_session, [warm], now - timedelta(hours=3))
+    await decrement_tag_usage(async_session, [hot], now - timedelta(days=30))
+    await async_session.commit()
+
+    assert await get_trending_tags(async_session, "1h", 10) == [
+        {"id": hot, "name": "hot", "count": 2},
+        {"id": warm, "name": "warm", "count": 1},
+    ]
+    assert [tag["count"] for tag in await get_trending_tags(async_session, "24h", 10)] == [2, 2]
+    assert len(await get_trending_tags(async_session, "24h", 1)) == 1
+
+    await decrement_tag_usage(async_session, [warm], now)
+    await decrement_tag_usage(async_session, [warm], now)
+    await async_session.commit()
+    # served from memory until the cache expires
+    assert len(await get_trending_tags(async_session, "1h", 10)) == 2
+    trending_cache.clear()
+    assert await get_trending_tags(async_session, "1h", 10) == [{"id": hot, "name": "hot", "count": 2}]
+
+
+@pytest.mark.asyncio
+async def test_rebuild_tag_usage(session: Session, async_session: AsyncSession):
+    author = User(username="trend_author", email="trend_author@example.com", password="secret")
+    tag = Hashtag(name="rebuilt")
+    session.add_all([author, tag])
+    session.commit()
+    now = datetime.utcnow()
+    source = Post(description="new", author_id=author.id, created_dt=now, hashtags=[tag])
+    session.add_all([
+        source,
+        Post(description="new", author_id=author.id, created_dt=now, hashtags=[tag]),
+        Post(description="old", author_id=author.id, created_dt=now - timedelta(days=10), hashtags=[tag]),
+    ])
+    session.commit()
+    session.add(Post(description="derived", author_id=author.id, created_dt=now, hashtags=[tag], parent_id=source.id,
+                     transformation="{}"))
+    session.commit()
+    tag_id = tag.id
+
+    assert await rebuild_tag_usage(async_session) >= 1
+    trending = await get_trending_tags(async_session, "7d", 100)
+    assert {"id": tag_id, "name": "rebuilt", "count": 2} in trending
+
+
+@pytest.mark.asyncio
+async def test_tag_usage_of_orphaned_derived_post(session: Session, async_session: AsyncSession):
+    author = User(username="orphan_author", email="orphan_author@example.com", password="secret")
+    tag = Hashtag(name="orphaned")
+    session.add_all([author, tag])
+    session.commit()
+    now = datetime.utcnow()
+    source = Post(description="source", author_id=author.id, created_dt=now, hashtags=[tag])
+    other = Post(description="other", author_id=author.id, created_dt=now, hashtags=[tag])
+    session.add_all([source, other])
+    session.commit()
+    derived = Post(description="derived", author_id=author.id, created_dt=now, hashtags=[tag],
+                   parent_id=source.id, transformation="{}")
+    session.add(derived)
+    session.commit()
+    tag_id, source_id, derived_id = tag.id, source.id, derived.id
+    await rebuild_tag_usage(async_session)
+    current_user = await async_session.get(User, author.id)
+
+    async def usage():
+        result = await async_session.execute(
+            select(func.coalesce(func.sum(TagUsage.count), 0)).where(TagUsage.hashtag_id == tag_id)
+        )
+        return result.scalar()
+
+    assert await usage() == 2
+    await del_image(source_id, async_session, current_user)
+    assert await usage() == 1
+    # ON DELETE SET NULL, which SQLite doesn't enforce here
+    await async_session.execute(update(Post).where(Post.id == derived_id).values(parent_id=None))
+    await async_session.commit()
+
+    # the derived post was never counted, neither by the rebuild nor by its deletion
+    await rebuild_tag_usage(async_session)
+    assert await usage() == 1
+    await del_image(derived_id, async_session, current_user)
+    assert await usage() == 1
@@ -1,4 +1,9 @@
-from src.database.models import User, UserRole
+import asyncio
+
+from src.database.models import Comments, Hashtag, Post, Rating, User, UserRole
+from src.services.auth import auth_service
+from src.services.storage import LocalStorage
+from src.services.user_cache import user_cache
 
 
 def test_change_user_role_forbidden(client, session, user, get_token):
@@ -141,3 +146,137 @@ def test_unban_user(client, session, second_user, get_token):
         User.id == banned_user_id
     ).first()
     assert banned_user.is_active == True
+
+
+def test_change_user_role_invalidates_user_cache(client, session, second_user, get_token):
+    second_test_user = session.query(User).filter(
+        User.email == second_user["email"]
+    ).first()
+    second_user_id = second_test_user.id
+    second_token = asyncio.run(
+        auth_service.create_access_token(data={"sub": second_user["email"]})
+    )
+    response = client.get(
+        "/api/users/me",
+        headers={"Authorization": f"Bearer {second_token}"}
+    )
+    assert response.status_code == 200, response.text
+    assert user_cache.local.get(second_user["email"]) is not None
+
+    headers = {"Authorization": f"Bearer {get_token}"}
+    response = client.put(
+        "/api/admin/change-role",
+        json={"user_id": second_user_id, "new_role": UserRole.user},
+        headers=headers
+    )
+    assert response.status_code == 200, response.text
+    assert user_cache.local.get(second_user["email"]) is None
+
+    response = client.get("/api/admin/user-cache", headers=headers)
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["local_hits"] >= 1
+    assert data["invalidations"] >= 1
+
+
+def test_moderation_delete_user_content(client, session, get_token, mocker, tmp_path):
+    storage = LocalStorage(tmp_path, "/storage")
+    mocker.patch("src.repository.moderation.get_storage", return_value=storage)
+    for name in ("spam.jpg", "qr/spam.png", "kept.jpg"):
+        (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / name).write_bytes(b"image")
+    spammer = User(username="spammer", email="spammer@example.com", password="secret")
+    author = User(username="honest", email="honest@example.com", password="secret")
+    tag = Hashtag(name="spam_tag")
+    session.add_all([spammer, author, tag])
+    session.commit()
+    spam = Post(description="spam", author_id=spammer.id, image_url="/storage/spam.jpg",
+                qr_code_url="/storage/qr/spam.png", hashtags=[tag])
+    kept = Post(description="kept", author_id=author.id, image_url="/storage/kept.jpg",
+                rating_sum=6, rating_count=2)
+    session.add_all([spam, kept])
+    session.commit()
+    derived = Post(description="derived", author_id=author.id, image_url="/storage/spam.jpg?crop",
+                   parent_id=spam.id, transformation="{}")
+    session.add_all([
+        derived,
+        Rating(rating=5, user_id=spammer.id, image_id=kept.id),
+        Rating(rating=1, user_id=author.id, image_id=kept.id),
+        Comments(text="spam comment", image_id=kept.id, user_id=spammer.id),
+        Comments(text="comment", image_id=spam.id, user_id=author.id),
+    ])
+    session.commit()
+    spammer_id, spam_id, kept_id, derived_id = spammer.id, spam.id, kept.id, derived.id
+    headers = {"Authorization": f"Bearer {get_token}"}
+
+    response = client.delete(f"/api/admin/moderation/users/{spammer_id}/content", headers=headers)
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert (data["posts"], data["comments"], data["ratings"]) == (2, 1, 1)
+
+    session.expire_all()
+    assert session.get(Post, spam_id) is None
+    assert session.get(Post, derived_id) is None
+    kept = session.get(Post, kept_id)
+    assert (kept.rating_sum, kept.rating_count) == (1, 1)
+    assert session.query(Comments).filter(Comments.image_id == kept_id).count() == 0
+    assert session.get(User, spammer_id).is_active
+
+    job = client.get(f"/api/images/jobs/{data['cleanup_job_id']}", headers=headers).json()
+    assert job["status"] == "done", job
+    assert job["result"] == 2
+    assert not (tmp_path / "spam.jpg").exists()
+    assert not (tmp_path / "qr/spam.png").exists()
+    assert (tmp_path / "kept.jpg").exists()
+
+    response = client.delete("/api/admin/moderation/users/999/content", headers=headers)
+    assert response.status_code == 404
+
+
+def test_moderation_delete(client, session, get_token):
+    author = User(username="bulk_author", email="bulk_author@example.com", password="secret")
+    session.add(author)
+    session.commit()
+    posts = [Post(description=f"bulk {i}", author_id=author.id) for i in range(3)]
+    session.add_all(posts)
+    session.commit()
+    comments = [Comments(text=f"bulk {i}", image_id=posts[2].id, user_id=author.id) for i in range(3)]
+    rating = Rating(rating=4, user_id=author.id, image_id=posts[2].id)
+    posts[2].rating_sum, posts[2].rating_count = 4, 1
+    session.add_all([*comments, rating])
+    session.commit()
+    post_ids = [posts[0].id, posts[1].id]
+    comment_ids = [comments[0].id, comments[1].id]
+    kept_id, rating_id = posts[2].id, rating.id
+    headers = {"Authorization": f"Bearer {get_token}"}
+
+    response = client.post(
+        "/api/admin/moderation/delete",
+        json={"post_ids": post_ids, "comment_ids": comment_ids, "rating_ids": [rating_id]},
+        headers=headers
+    )
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert (data["posts"], data["comments"], data["ratings"]) == (2, 2, 1)
+    assert data["cleanup_job_id"] is None
+    session.expire_all()
+    assert session.query(Post).filter(Post.id.in_(post_ids)).count() == 0
+    assert session.query(Comments).filter(Comments.image_id == kept_id).count() == 1
+    assert session.get(Post, kept_id).rating_count == 0
+
+
+def test_moderation_ban(client, session, get_token):
+    users = [User(username=f"banned{i}", email=f"banned{i}@example.com", password="secret") for i in range(3)]
+    session.add_all(users)
+    session.commit()
+    user_ids = [u.id for u in users]
+    headers = {"Authorization": f"Bearer {get_token}"}
+
+    response = client.put("/api/admin/moderation/ban", json={"user_ids": user_ids}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["users"] == 3
+    session.expire_all()
+    assert all(not session.get(User, user_id).is_active for user_id in user_ids)
+
+    response = client.put("/api/admin/moderation/ban", json={"user_ids": [1]}, headers=headers)
+    assert response.status_code == 403
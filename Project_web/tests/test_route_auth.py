@@ -1,17 +1,19 @@
-from unittest.mock import MagicMock
-from src.database.models import User
+import asyncio
+
+from passlib.context import CryptContext
+from src.database.models import OutboxEmail, User
 from src.services.auth import auth_service
+from src.services.user_cache import user_cache
 
 
-def test_create_user(client, user, session, monkeypatch):
+def test_create_user(client, user, session):
     existed_user = session.query(User).filter(
         User.email == user["email"]
     ).first()
     session.delete(existed_user)
+    session.query(OutboxEmail).delete()
     session.commit()
 
-    mock_send_email = MagicMock()
-    monkeypatch.setattr("src.routes.auth.send_email", mock_send_email)
     response = client.post(
         "/api/auth/signup",
         json=user,
@@ -20,6 +22,8 @@ def test_create_user(client, user, session, monkeypatch):
     data = response.json()
     assert data["user"]["email"] == user.get("email")
     assert "id" in data["user"]
+    # the confirmation email is committed with the user
+    assert [email.recipient for email in session.query(OutboxEmail)] == [user["email"]]
 
 
 def test_repeat_create_user(client, user):
@@ -63,6 +67,28 @@ def test_login_user(client, session, user):
     assert data["token_type"] == "bearer"
 
 
+def test_login_rehash_password(client, session, user):
+    current_user: User = session.query(User).filter(
+        User.email == user['email']
+    ).first()
+    old_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash(user['password'])
+    current_user.password = old_hash
+    session.commit()
+    response = client.post(
+        "/api/auth/login",
+        data={
+            "username": user['email'],
+            "password": user['password']
+        },
+    )
+    assert response.status_code == 200, response.text
+    current_user = session.query(User).filter(
+        User.email == user['email']
+    ).first()
+    assert current_user.password != old_hash
+    assert not auth_service.pwd_context.needs_update(current_user.password)
+
+
 def test_login_wrong_password(client, user):
     response = client.post(
         "/api/auth/login",
@@ -175,9 +201,9 @@ def test_already_confirmed_email_request(client, user):
     assert data["message"] == "Your email is already confirmed"
 
 
-def test_email_request(client, user, monkeypatch, session):
-    mock_send_email = MagicMock()
-    monkeypatch.setattr("src.routes.auth.send_email", mock_send_email)
+def test_email_request(client, user, session):
+    session.query(OutboxEmail).delete()
+    session.commit()
     current_user: User = session.query(User).filter(
         User.email == user['email']
     ).first()
@@ -190,3 +216,22 @@ def test_email_request(client, user, monkeypatch, session):
     assert response.status_code == 200, response.text
     data = response.json()
     assert data["message"] == "Check your email for confirmation."
+    assert [email.recipient for email in session.query(OutboxEmail)] == [user["email"]]
+
+
+def test_logout(client, session, user):
+    access_token = asyncio.run(
+        auth_service.create_access_token(data={"sub": user["email"]})
+    )
+    response = client.post(
+        "/api/auth/logout",
+        headers={"Authorization": f"Bearer {access_token}"}
+    )
+    assert response.status_code == 200, response.text
+    assert response.json() == {"message": "Logged out"}
+    assert user_cache.local.get(user["email"]) is None
+    current_user: User = session.query(User).filter(
+        User.email == user['email']
+    ).first()
+    session.refresh(current_user)
+    assert current_user.refresh_token is None
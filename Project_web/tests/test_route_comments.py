@@ -1,5 +1,8 @@
 import asyncio
+from datetime import datetime, timedelta
+from unittest.mock import patch
 from src.database.models import Post, User, UserRole, Comments
+from src.repository.comments import comments_cache
 from src.services.auth import auth_service
 
 
@@ -172,6 +175,142 @@ def test_get_comments_by_user_not_found(client):
     assert data["detail"] == "User not found"
 
 
+def test_get_comments_by_image_paginated(client, session, user):
+    current_user = session.query(User).filter(
+        User.email == user["email"]
+    ).first()
+    image = Post(
+        description="paginated",
+        image_url="http://test_url.com/paginated",
+        author_id=current_user.id
+    )
+    session.add(image)
+    session.commit()
+    # explicit timestamps: SQLite stores func.now() defaults as text without
+    # microseconds, which doesn't compare with the datetimes bound from a cursor
+    created_at = datetime(2024, 1, 1)
+    session.add_all(
+        Comments(text=f"comment {i}", image_id=image.id, user_id=current_user.id,
+                 created_at=created_at + timedelta(minutes=i // 2))
+        for i in range(5)
+    )
+    session.commit()
+    image_id = image.id
+    expected = [
+        c.id for c in session.query(Comments).filter(
+            Comments.image_id == image_id
+        ).order_by(Comments.created_at, Comments.id)
+    ]
+
+    ids = []
+    cursor = None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get(f"/api/comments/by-image/{image_id}", params=params)
+        assert response.status_code == 200, response.text
+        assert len(response.json()) <= 2
+        ids.extend(c["id"] for c in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert ids == expected
+
+
+def test_get_comments_by_image_empty(client, session, user):
+    current_user = session.query(User).filter(
+        User.email == user["email"]
+    ).first()
+    image = Post(
+        description="no comments",
+        image_url="http://test_url.com/empty",
+        author_id=current_user.id
+    )
+    session.add(image)
+    session.commit()
+    response = client.get(f"/api/comments/by-image/{image.id}")
+    assert response.status_code == 200, response.text
+    assert response.json() == []
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_get_comments_by_image_cache_invalidated(client, get_token):
+    image_id = 1
+    before = client.get(f"/api/comments/by-image/{image_id}").json()
+    headers = {"Authorization": f"Bearer {get_token}"}
+    response = client.post(
+        "/api/comments",
+        headers=headers,
+        json={"image_id": image_id, "text": "fresh comment"},
+    )
+    assert response.status_code == 201, response.text
+    after = client.get(f"/api/comments/by-image/{image_id}").json()
+    assert len(after) == len(before) + 1
+    assert after[-1]["text"] == "fresh comment"
+
+
+def test_get_comments_by_image_etag(client, get_token):
+    image_id = 1
+    response = client.get(f"/api/comments/by-image/{image_id}")
+    etag = response.headers["etag"]
+    assert etag.startswith('W/"')
+    assert response.headers["cache-control"].startswith("public")
+
+    response = client.get(f"/api/comments/by-image/{image_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    response = client.get(f"/api/comments/by-image/{image_id}", params={"limit": 1})
+    page_etag, next_cursor = response.headers["etag"], response.headers["X-Next-Cursor"]
+    # the cached first page keeps its ETag, it is revalidated without a query
+    with patch("src.repository.comments.comments_page_query") as query:
+        response = client.get(
+            f"/api/comments/by-image/{image_id}", params={"limit": 1}, headers={"If-None-Match": page_etag}
+        )
+    assert response.status_code == 304
+    assert response.headers["X-Next-Cursor"] == next_cursor
+    query.assert_not_called()
+
+    # otherwise from the ids and versions of the comments, the page isn't loaded
+    comments_cache.clear()
+    with patch("src.repository.comments.get_comments_page") as get_page:
+        response = client.get(
+            f"/api/comments/by-image/{image_id}", params={"limit": 1}, headers={"If-None-Match": page_etag}
+        )
+    assert response.status_code == 304
+    assert response.headers["X-Next-Cursor"] == next_cursor
+    get_page.assert_not_called()
+    response = client.get(f"/api/comments/by-image/{image_id}", params={"limit": 1, "cursor": next_cursor})
+    with patch("src.repository.comments.get_comments_page") as get_page:
+        response = client.get(
+            f"/api/comments/by-image/{image_id}", params={"limit": 1, "cursor": next_cursor},
+            headers={"If-None-Match": response.headers["etag"]}
+        )
+    assert response.status_code == 304
+    get_page.assert_not_called()
+
+    # unconditional requests load the page only
+    comments_cache.clear()
+    with patch("src.routes.comments.repository_comments.get_comments_etag_by_image") as get_etag:
+        response = client.get(f"/api/comments/by-image/{image_id}", params={"limit": 1})
+    assert response.status_code == 200
+    assert response.headers["etag"] == page_etag
+    get_etag.assert_not_called()
+
+    comment_id = client.get(f"/api/comments/by-image/{image_id}").json()[-1]["id"]
+    headers = {"Authorization": f"Bearer {get_token}"}
+    response = client.put(
+        "/api/comments",
+        headers=headers,
+        json={"comment_id": comment_id, "new_text": "edited for etag"},
+    )
+    assert response.status_code == 200, response.text
+    response = client.get(f"/api/comments/by-image/{image_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+
 def test_delete_comment_access_denied(client, get_token):
     comment_id = 1
     token = get_token
@@ -187,16 +326,16 @@ def test_delete_comment_access_denied(client, get_token):
 
 def test_delete_comment(client, get_token, session, user):
     comment_id = 1
-    current_comment: Comments = session.query(Comments).filter(
-        Comments.id == comment_id
-    ).first()
-
     current_user = session.query(User).filter(
         User.email == user["email"]
     ).first()
     current_user.role = UserRole.moderator
     session.commit()
 
+    current_comment: Comments = session.query(Comments).filter(
+        Comments.id == comment_id
+    ).first()
+
     token = get_token
     headers = {"Authorization": f"Bearer {token}"}
     response = client.delete(
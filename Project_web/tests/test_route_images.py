@@ -1,7 +1,12 @@
-from src.database.models import Post
+import asyncio
+from datetime import datetime
 
+from src.database.models import Hashtag, Post, User
+from src.services.auth import auth_service
+from src.services.storage import LocalStorage
 
-def test_crop_image_view(client, session, get_token, mock_get_qr_code_by_url):
+
+def test_crop_image_view(client, session, get_token, mock_upload_qr_code):
     test_image = Post(
         description="test_description",
         image_url="https://res.cloudinary.com/abcdefghi/image/upload/v1234567890/project_name/a96e4ceb-54de-4e37-9520-0d0d3a3a31a6",
@@ -34,7 +39,7 @@ def test_crop_image_view(client, session, get_token, mock_get_qr_code_by_url):
     assert "created_dt" in data
 
 
-def test_round_corners(client, get_token, mock_get_qr_code_by_url):
+def test_round_corners(client, get_token, mock_upload_qr_code):
     token = get_token
     headers = {"Authorization": f"Bearer {token}"}
     transformation = {
@@ -58,7 +63,7 @@ def test_round_corners(client, get_token, mock_get_qr_code_by_url):
     assert "created_dt" in data
 
 
-def test_grayscale(client, get_token, mock_get_qr_code_by_url):
+def test_grayscale(client, get_token, mock_upload_qr_code):
     token = get_token
     headers = {"Authorization": f"Bearer {token}"}
     transformation = {
@@ -81,7 +86,7 @@ def test_grayscale(client, get_token, mock_get_qr_code_by_url):
     assert "created_dt" in data
 
 
-def test_sepia(client, get_token, mock_get_qr_code_by_url):
+def test_sepia(client, get_token, mock_upload_qr_code):
     token = get_token
     headers = {"Authorization": f"Bearer {token}"}
     transformation = {
@@ -102,3 +107,326 @@ def test_sepia(client, get_token, mock_get_qr_code_by_url):
     assert "author_id" in data
     assert "qr_code_url" in data
     assert "created_dt" in data
+
+
+def test_transformation_reused(client, get_token, mock_upload_qr_code):
+    headers = {"Authorization": f"Bearer {get_token}"}
+    transformation = {
+        "image_id": 1,
+        "radius": 50,
+        "description": "description"
+    }
+
+    first = client.post("/api/images/transformation/roundcorners", headers=headers, json=transformation)
+    assert first.status_code == 200
+    transformation["description"] = "another description"
+    second = client.post("/api/images/transformation/roundcorners", headers=headers, json=transformation)
+    assert second.status_code == 200
+    assert second.json() == first.json()
+    assert first.json()["parent_id"] == 1
+
+
+def test_bulk_transformation(client, session, get_token, mock_upload_qr_code):
+    test_image = Post(
+        description="bulk_description",
+        image_url="https://res.cloudinary.com/abcdefghi/image/upload/v1234567890/project_name/bulk",
+        author_id=1
+    )
+    session.add(test_image)
+    session.commit()
+    image_id = test_image.id
+    headers = {"Authorization": f"Bearer {get_token}"}
+    sepia = client.post(
+        "/api/images/transformation/sepia",
+        headers=headers,
+        json={"image_id": 1, "description": "description"}
+    ).json()
+
+    response = client.post(
+        "/api/images/transformation/bulk",
+        headers=headers,
+        json={"image_ids": [1, image_id], "transformation": "sepia", "description": "bulk"}
+    )
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert [image["parent_id"] for image in data] == [1, image_id]
+    assert data[0] == sepia
+    assert data[1]["description"] == "bulk"
+    assert "e_sepia" in data[1]["image_url"]
+
+    response = client.post(
+        "/api/images/transformation/bulk",
+        headers=headers,
+        json={"image_ids": [1, image_id], "transformation": "crop", "description": "bulk"}
+    )
+    assert response.status_code == 422
+
+    response = client.post(
+        "/api/images/transformation/bulk",
+        headers=headers,
+        json={"image_ids": [1, 999], "transformation": "sepia", "description": "bulk"}
+    )
+    assert response.status_code == 404
+
+
+def test_upload_file(client, session, get_token, mocker, tmp_path):
+    storage = LocalStorage(tmp_path, "/storage")
+    mocker.patch("src.repository.images.get_storage", return_value=storage)
+    headers = {"Authorization": f"Bearer {get_token}"}
+
+    response = client.post(
+        "/api/images/upload",
+        headers=headers,
+        params={"description": "upload"},
+        data={"hashtags": "cat,dog"},
+        files={"file": ("image.jpg", b"image", "image/jpeg")}
+    )
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["description"] == "upload"
+    assert data["image_url"].startswith("/storage/")
+    assert data["qr_code_url"] is None
+
+    # TestClient runs the background tasks before returning the response
+    response = client.get(
+        f"/api/images/jobs/{data['qr_code_job_id']}",
+        headers=headers
+    )
+    assert response.status_code == 200
+    job = response.json()
+    assert job["status"] == "done"
+    assert job["result"].startswith("/storage/")
+    post = session.get(Post, data["id"])
+    session.refresh(post)
+    assert post.qr_code_url == job["result"]
+
+    # the job is only visible to the user who started it
+    session.add(User(username="job_peeker", email="job_peeker@example.com", password="secret"))
+    session.commit()
+    peeker_token = asyncio.run(auth_service.create_access_token(data={"sub": "job_peeker@example.com"}))
+    response = client.get(
+        f"/api/images/jobs/{data['qr_code_job_id']}",
+        headers={"Authorization": f"Bearer {peeker_token}"}
+    )
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Job not found"
+
+
+def test_upload_files(client, session, get_token, mocker, tmp_path):
+    storage = LocalStorage(tmp_path, "/storage")
+    upload_sync = storage.upload_sync
+
+    def failing_upload(file, public_id):
+        if not isinstance(file, bytes):
+            if file.read(6) == b"broken":
+                raise OSError("storage is unavailable")
+            file.seek(0)
+        return upload_sync(file, public_id)
+
+    mocker.patch.object(storage, "upload_sync", side_effect=failing_upload)
+    mocker.patch("src.repository.images.get_storage", return_value=storage)
+    headers = {"Authorization": f"Bearer {get_token}"}
+
+    response = client.post(
+        "/api/images/upload/bulk",
+        headers=headers,
+        params={"description": "bulk upload"},
+        data={"hashtags": "bulk_a,bulk_b"},
+        files=[
+            ("files", ("first.jpg", b"first", "image/jpeg")),
+            ("files", ("broken.jpg", b"broken", "image/jpeg")),
+            ("files", ("second.jpg", b"second", "image/jpeg")),
+        ]
+    )
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert [item["filename"] for item in data["items"]] == ["first.jpg", "broken.jpg", "second.jpg"]
+    first, broken, second = data["items"]
+    assert broken["image"] is None
+    assert "storage is unavailable" in broken["error"]
+    for item, content in ((first, b"first"), (second, b"second")):
+        assert item["error"] is None
+        assert item["image"]["description"] == "bulk upload"
+        public_id = item["image"]["image_url"].removeprefix("/storage/")
+        assert (tmp_path / public_id).read_bytes() == content
+
+    response = client.get(f"/api/images/jobs/{data['qr_code_job_id']}", headers=headers)
+    job = response.json()
+    assert job["status"] == "done", job
+    for item in (first, second):
+        post = session.get(Post, item["image"]["id"])
+        session.refresh(post)
+        assert post.qr_code_url == job["result"][str(post.id)]
+        assert sorted(tag.name for tag in post.hashtags) == ["bulk_a", "bulk_b"]
+
+    response = client.post(
+        "/api/images/upload/bulk",
+        headers=headers,
+        params={"description": "too many"},
+        data={"hashtags": "bulk_a"},
+        files=[("files", (f"{i}.jpg", b"image", "image/jpeg")) for i in range(21)]
+    )
+    assert response.status_code == 413
+
+
+def test_get_job_not_found(client, get_token):
+    headers = {"Authorization": f"Bearer {get_token}"}
+    response = client.get("/api/images/jobs/unknown", headers=headers)
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Job not found"
+
+
+def test_get_feed(client, session, get_token):
+    author = User(username="feeder", email="feeder@example.com", password="secret")
+    tag = Hashtag(name="feed_tag")
+    session.add_all([author, tag])
+    session.commit()
+    created = [datetime(2024, 1, 1), datetime(2024, 1, 2), datetime(2024, 1, 2), datetime(2024, 1, 3), datetime(2024, 1, 4)]
+    posts = [
+        Post(description=f"feed {i}", image_url=f"https://example.com/{i}.jpg", author_id=author.id,
+             created_dt=dt, hashtags=[tag], rating_sum=9 if i == 0 else 0, rating_count=2 if i == 0 else 0)
+        for i, dt in enumerate(created)
+    ]
+    session.add_all(posts)
+    session.commit()
+    expected = [p.id for p in sorted(posts, key=lambda p: (p.created_dt, p.id), reverse=True)]
+    author_id, tag_id = author.id, tag.id
+    headers = {"Authorization": f"Bearer {get_token}"}
+
+    ids = []
+    cursor = None
+    for _ in range(3):
+        params = {"user_id": author_id, "limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/api/images/feed", headers=headers, params=params)
+        assert response.status_code == 200, response.text
+        data = response.json()
+        assert len(data["items"]) <= 2
+        ids.extend(item["id"] for item in data["items"])
+        cursor = data["next_cursor"]
+        if cursor is None:
+            break
+
+    assert cursor is None
+    assert ids == expected
+    oldest = data["items"][-1]
+    assert oldest["author"] == {"id": author_id, "username": "feeder"}
+    assert oldest["hashtags"] == [{"id": tag_id, "name": "feed_tag"}]
+    assert oldest["average_rating"] == 4.5
+    assert oldest["rating_count"] == 2
+
+
+def test_get_feed_invalid_cursor(client, get_token):
+    headers = {"Authorization": f"Bearer {get_token}"}
+    response = client.get("/api/images/feed", headers=headers, params={"cursor": "not a cursor"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+    response = client.get("/api/images/feed", headers=headers, params={"limit": 0})
+    assert response.status_code == 422
+
+
+def test_search_images(client, session, get_token):
+    author = User(username="searcher", email="searcher@example.com", password="secret")
+    cats, dogs = Hashtag(name="kittycats"), Hashtag(name="puppydogs")
+    session.add_all([author, cats, dogs])
+    session.commit()
+    posts = [
+        Post(description="Sleepy kitten on a sofa", image_url="https://example.com/s0.jpg", author_id=author.id,
+             created_dt=datetime.now(), hashtags=[cats]),
+        Post(description="Old kitten photo", image_url="https://example.com/s1.jpg", author_id=author.id,
+             created_dt=datetime(2020, 1, 1)),
+        Post(description="Kitten rated five", image_url="https://example.com/s2.jpg", author_id=author.id,
+             created_dt=datetime.now(), rating_sum=5, rating_count=1),
+        Post(description="A puppy", image_url="https://example.com/s3.jpg", author_id=author.id,
+             created_dt=datetime.now(), hashtags=[dogs]),
+    ]
+    session.add_all(posts)
+    session.commit()
+    ids = [post.id for post in posts]
+    headers = {"Authorization": f"Bearer {get_token}"}
+
+    response = client.get("/api/images/search", headers=headers, params={"q": "kitt"})
+    assert response.status_code == 200, response.text
+    assert [image["id"] for image in response.json()] == [ids[2], ids[0], ids[1]]
+
+    response = client.get("/api/images/search", headers=headers, params={"q": "KittyCat"})
+    data = response.json()
+    assert [image["id"] for image in data] == [ids[0]]
+    assert data[0]["hashtags"][0]["name"] == "kittycats"
+    assert data[0]["author"]["username"] == "searcher"
+
+    response = client.get("/api/images/search", headers=headers, params={"q": "puppydog"})
+    assert [image["id"] for image in response.json()] == [ids[3]]
+
+    response = client.get("/api/images/search", headers=headers, params={"q": "kitten", "limit": 1, "offset": 1})
+    assert len(response.json()) == 1
+
+    response = client.get("/api/images/search", headers=headers, params={"q": "!!!"})
+    assert response.json() == []
+
+    session.query(Post).filter(Post.id == ids[3]).update({"description": "A kitten after all"})
+    session.commit()
+    response = client.get("/api/images/search", headers=headers, params={"q": "after all"})
+    assert [image["id"] for image in response.json()] == [ids[3]]
+    response = client.get("/api/images/search", headers=headers, params={"q": "sleepy sofa"})
+    assert [image["id"] for image in response.json()] == [ids[0]]
+
+
+def test_get_hot_feed(client, session, get_token):
+    author = User(username="hot_route", email="hot_route@example.com", password="secret")
+    session.add(author)
+    session.commit()
+    posts = [Post(description=f"hot {i}", image_url=f"https://example.com/hot/{i}.jpg", author_id=author.id,
+                  hot_score=2000 + i) for i in range(3)]
+    session.add_all(posts)
+    session.commit()
+    expected = [p.id for p in reversed(posts)]
+    headers = {"Authorization": f"Bearer {get_token}"}
+
+    response = client.get("/api/images/hot", headers=headers, params={"limit": 2})
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert [item["id"] for item in data["items"]] == expected[:2]
+    assert data["items"][0]["author"]["username"] == "hot_route"
+
+    response = client.get("/api/images/hot", headers=headers, params={"limit": 2, "cursor": data["next_cursor"]})
+    assert response.status_code == 200
+    assert response.json()["items"][0]["id"] == expected[2]
+
+
+def test_get_image_etag(client, session, get_token):
+    current_user = session.query(User).filter(User.email == "deadpool@example.com").first()
+    rater = User(username="etag_rater", email="etag_rater@example.com", password="secret")
+    post = Post(description="etag", image_url="https://example.com/etag.jpg", author_id=current_user.id)
+    session.add_all([rater, post])
+    session.commit()
+    post_id, rater_id = post.id, rater.id
+    headers = {"Authorization": f"Bearer {get_token}"}
+
+    response = client.get("/api/images/get_image", headers=headers, params={"image_id": post_id})
+    assert response.status_code == 200, response.text
+    etag = response.headers["etag"]
+    assert response.headers["cache-control"] == "private, no-cache"
+    response = client.get("/api/images/get_image", headers={**headers, "If-None-Match": etag},
+                          params={"image_id": post_id})
+    assert response.status_code == 304
+
+    response = client.get(f"/api/ratings/{post_id}", headers=headers)
+    ratings_etag = response.headers["etag"]
+    response = client.get(f"/api/ratings/{post_id}", headers={**headers, "If-None-Match": ratings_etag})
+    assert response.status_code == 304
+
+    rater_token = asyncio.run(auth_service.create_access_token(data={"sub": "etag_rater@example.com"}))
+    response = client.post("/api/ratings/", headers={"Authorization": f"Bearer {rater_token}"},
+                           json={"image_id": post_id, "rating": 4})
+    assert response.status_code == 200, response.text
+
+    response = client.get(f"/api/ratings/{post_id}", headers={**headers, "If-None-Match": ratings_etag})
+    assert response.status_code == 200
+    assert [rating["user_id"] for rating in response.json()] == [rater_id]
+    response = client.get("/api/images/get_image", headers={**headers, "If-None-Match": etag},
+                          params={"image_id": post_id})
+    assert response.status_code == 200
+    assert response.json()["rating_count"] == 1
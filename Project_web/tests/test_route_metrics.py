@@ -0,0 +1,24 @@
+from src.database.models import User, UserRole
+from src.services.user_cache import user_cache
+
+
+def test_metrics(client, session, user, get_token):
+    headers = {"Authorization": f"Bearer {get_token}"}
+    response = client.get("/api/images/hot", headers=headers)
+    assert response.status_code == 200
+
+    response = client.get("/metrics")
+    assert response.status_code == 401, response.text
+    response = client.get("/metrics", headers=headers)
+    assert response.status_code == 403, response.text
+
+    current_user = session.query(User).filter(User.email == user["email"]).first()
+    current_user.role = UserRole.admin
+    session.commit()
+    user_cache.clear()
+    response = client.get("/metrics", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE http_request_duration_seconds histogram" in response.text
+    assert 'http_request_duration_seconds_count{method="GET",route="/api/images/hot",status="200"}' in response.text
+    assert "db_pool_checked_out" in response.text
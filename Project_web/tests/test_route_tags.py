@@ -0,0 +1,32 @@
+from src.repository.tags import trending_cache
+from src.services.storage import LocalStorage
+
+
+def test_trending_tags(client, session, get_token, mocker, tmp_path):
+    mocker.patch("src.repository.images.get_storage", return_value=LocalStorage(tmp_path, "/storage"))
+    headers = {"Authorization": f"Bearer {get_token}"}
+
+    ids = []
+    for hashtags in ("trend_a,trend_b", "trend_a"):
+        response = client.post(
+            "/api/images/upload",
+            headers=headers,
+            params={"description": "trending"},
+            data={"hashtags": hashtags},
+            files={"file": ("image.jpg", b"image", "image/jpeg")}
+        )
+        assert response.status_code == 200, response.text
+        ids.append(response.json()["id"])
+
+    response = client.get("/api/tags/trending", headers=headers, params={"window": "1h"})
+    assert response.status_code == 200, response.text
+    assert [(tag["name"], tag["count"]) for tag in response.json()] == [("trend_a", 2), ("trend_b", 1)]
+
+    response = client.delete("/api/images/delete_image", headers=headers, params={"image_id": ids[0]})
+    assert response.status_code == 200, response.text
+    trending_cache.clear()
+    response = client.get("/api/tags/trending", headers=headers, params={"window": "7d", "limit": 5})
+    assert [(tag["name"], tag["count"]) for tag in response.json()] == [("trend_a", 1)]
+
+    response = client.get("/api/tags/trending", headers=headers, params={"window": "1y"})
+    assert response.status_code == 422
@@ -60,6 +60,21 @@ def test_get_user_by_username(client, user):
     assert "avatar" in data
 
 
+def test_get_user_by_username_etag(client, session, user):
+    response = client.get(f"/api/users/{user['username']}")
+    etag = response.headers["etag"]
+    response = client.get(f"/api/users/{user['username']}", headers={"If-None-Match": f'"x", {etag}'})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+
+    current_user = session.query(User).filter(User.email == user["email"]).first()
+    current_user.avatar = "new_avatar_url"
+    session.commit()
+    response = client.get(f"/api/users/{user['username']}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["avatar"] == "new_avatar_url"
+
+
 def test_get_user_by_username_not_found(client):
     username = "wrong_user_name"
     response = client.get(
@@ -1,6 +1,6 @@
 import unittest
 from unittest.mock import MagicMock, patch
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from src.database.models import User
 from src.schemas import UserModel, UserUpdate
 from src.repository.users import (
@@ -19,11 +19,13 @@ from src.repository.users import (
 class TestUsers(unittest.IsolatedAsyncioTestCase):
 
     def setUp(self):
-        self.session = MagicMock(spec=Session)
+        self.session = MagicMock(spec=AsyncSession)
+        self.result = MagicMock()
+        self.session.execute.return_value = self.result
 
     async def test_get_user_by_email(self):
         user = User()
-        self.session.query().filter().first.return_value = user
+        self.result.scalars().first.return_value = user
         result = await get_user_by_email(
             email="example@mail.com",
             db=self.session
@@ -77,7 +79,7 @@ class TestUsers(unittest.IsolatedAsyncioTestCase):
     async def test_confirmed_email(self):
         user = User()
         email = "example@mail.com"
-        self.session.query().filter().first.return_value = user
+        self.result.scalars().first.return_value = user
         await confirmed_email(email=email, db=self.session)
         self.session.commit.assert_called_once()
 
@@ -85,7 +87,7 @@ class TestUsers(unittest.IsolatedAsyncioTestCase):
         user = User()
         email = "example@mail.com"
         url = "avatar_url"
-        self.session.query().filter().first.return_value = user
+        self.result.scalars().first.return_value = user
         result = await update_avatar(
             email=email,
             url=url,
@@ -97,7 +99,7 @@ class TestUsers(unittest.IsolatedAsyncioTestCase):
     async def test_get_user_by_username(self):
         user = User()
         username = "username"
-        self.session.query().filter().first.return_value = user
+        self.result.scalars().first.return_value = user
         result = await get_user_by_username(username=username, db=self.session)
         self.assertEqual(result, user)
 
@@ -108,7 +110,7 @@ class TestUsers(unittest.IsolatedAsyncioTestCase):
             email="example@mail.com",
             avatar="avtar.url"
         )
-        self.session.query().filter().first.return_value = user
+        self.result.scalars().first.return_value = user
         result = await update_user(
             user_id=1,
             user_update=user_update,
@@ -125,7 +127,7 @@ class TestUsers(unittest.IsolatedAsyncioTestCase):
             email="example@mail.com",
             avatar="avtar.url"
         )
-        self.session.query().filter().first.return_value = None
+        self.result.scalars().first.return_value = None
         result = await update_user(
             user_id=1,
             user_update=user_update,
@@ -135,7 +137,7 @@ class TestUsers(unittest.IsolatedAsyncioTestCase):
 
     async def test_get_user_by_id(self):
         user = User()
-        self.session.query().filter().first.return_value = user
+        self.result.scalars().first.return_value = user
         result = await get_user_by_id(user_id=1, db=self.session)
         self.assertEqual(result, user)
 
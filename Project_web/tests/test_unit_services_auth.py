@@ -1,7 +1,7 @@
 import datetime
 import unittest
 from unittest.mock import MagicMock
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from passlib.context import CryptContext
 from jose import jwt
@@ -24,7 +24,9 @@ class TestAuth(unittest.IsolatedAsyncioTestCase):
         self.pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
         auth_service.SECRET_KEY = self.SECRET_KEY
         auth_service.ALGORITHM = self.ALGORITHM
-        self.session = MagicMock(spec=Session)
+        self.session = MagicMock(spec=AsyncSession)
+        self.result = MagicMock()
+        self.session.execute.return_value = self.result
 
     def test_get_password_hash(self):
         password = "password"
@@ -48,6 +50,30 @@ class TestAuth(unittest.IsolatedAsyncioTestCase):
         )
         self.assertTrue(result)
 
+    async def test_hash_password(self):
+        password = "password"
+        result = await auth_service.hash_password(password)
+        self.assertTrue(self.pwd_context.verify(password, result))
+
+    async def test_verify_and_update_password(self):
+        password = "password"
+        hashed_password = auth_service.get_password_hash(password)
+        valid, new_hash = await auth_service.verify_and_update_password(password, hashed_password)
+        self.assertTrue(valid)
+        self.assertIsNone(new_hash)
+
+        valid, new_hash = await auth_service.verify_and_update_password("wrong_password", hashed_password)
+        self.assertFalse(valid)
+        self.assertIsNone(new_hash)
+
+    async def test_verify_and_update_password_rehash(self):
+        password = "password"
+        old_cost = CryptContext(schemes=["bcrypt"], bcrypt__rounds=4).hash(password)
+        valid, new_hash = await auth_service.verify_and_update_password(password, old_cost)
+        self.assertTrue(valid)
+        self.assertIsNotNone(new_hash)
+        self.assertTrue(auth_service.verify_password(password, new_hash))
+
     def test_verify_password_wrong_password(self):
         password = "password"
         hashed_password = self.pwd_context.hash(password)
@@ -194,14 +220,25 @@ class TestAuth(unittest.IsolatedAsyncioTestCase):
             algorithm=self.ALGORITHM
         )
 
-        user = User
-        self.session.query().filter().first.return_value = user
+        user = User(id=1, username="example", email=email, role=UserRole.user)
+        self.result.scalars().first.return_value = user
         result = await auth_service.get_current_user(
             token=token,
             db=self.session
         )
         self.assertEqual(result, user)
 
+        # the second request is served from the user cache
+        self.session.execute.reset_mock()
+        result = await auth_service.get_current_user(
+            token=token,
+            db=self.session
+        )
+        self.session.execute.assert_not_called()
+        self.assertEqual(result.id, user.id)
+        self.assertEqual(result.email, email)
+        self.assertEqual(result.role, UserRole.user)
+
     async def test_get_current_user_not_found(self):
         email = "example@mail.com"
         expire = datetime.datetime.now(datetime.UTC) + datetime.timedelta(minutes=15)
@@ -216,7 +253,7 @@ class TestAuth(unittest.IsolatedAsyncioTestCase):
             key=self.SECRET_KEY,
             algorithm=self.ALGORITHM
         )
-        self.session.query().filter().first.return_value = None
+        self.result.scalars().first.return_value = None
         try:
             result = await auth_service.get_current_user(
                 token=token,
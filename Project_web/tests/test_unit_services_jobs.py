@@ -0,0 +1,35 @@
+import unittest
+
+from src.services.jobs import JobQueue, JobStatus
+
+
+class TestJobQueue(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.queue = JobQueue(max_jobs=2)
+
+    async def test_run_done(self):
+        async def work(value):
+            return value * 2
+
+        job = self.queue.create("test", 1)
+        self.assertEqual(job.status, JobStatus.pending)
+        await self.queue.run(job.id, work, 21)
+        self.assertEqual(self.queue.get(job.id).status, JobStatus.done)
+        self.assertEqual(self.queue.get(job.id).result, 42)
+
+    async def test_run_failed(self):
+        async def work():
+            raise FileNotFoundError("not found")
+
+        job = self.queue.create("test", 1)
+        await self.queue.run(job.id, work)
+        self.assertEqual(job.status, JobStatus.failed)
+        self.assertEqual(job.error, "not found")
+        self.assertIsNone(job.result)
+
+    def test_eviction(self):
+        first = self.queue.create("test", 1)
+        self.queue.create("test", 1)
+        self.queue.create("test", 1)
+        self.assertIsNone(self.queue.get(first.id))
+        self.assertEqual(len(self.queue.jobs), 2)
@@ -0,0 +1,76 @@
+import unittest
+from unittest.mock import patch
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import QueuePool
+
+from src.services.metrics import (
+    Histogram,
+    RequestStats,
+    current_request,
+    instrument_engine,
+    metrics,
+    record_request,
+)
+
+
+class TestHistogram(unittest.TestCase):
+    def test_cumulative(self):
+        histogram = Histogram((1, 5))
+        for value in (0.5, 1, 3, 7):
+            histogram.observe(value)
+        self.assertEqual(histogram.cumulative(), [("1", 2), ("5", 3), ("+Inf", 4)])
+        self.assertEqual(histogram.sum, 11.5)
+        self.assertEqual(histogram.count, 4)
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        metrics.clear()
+        self.engine = create_engine("sqlite:///:memory:", poolclass=QueuePool)
+        instrument_engine(self.engine)
+
+    def tearDown(self):
+        metrics.engines.remove(self.engine)
+        self.engine.dispose()
+
+    def test_request_queries(self):
+        stats = RequestStats()
+        token = current_request.set(stats)
+        try:
+            with self.engine.connect() as conn:
+                for i in range(12):
+                    conn.execute(text("SELECT :i"), {"i": i})
+        finally:
+            current_request.reset(token)
+        self.assertEqual(stats.queries, 12)
+        self.assertGreater(stats.query_duration, 0)
+
+        scope = {"method": "GET", "route": None}
+        with patch("src.services.metrics.settings.n_plus_one_threshold", 10):
+            record_request(scope, 200, 0.01, stats)
+        output = metrics.render()
+        self.assertIn('db_n_plus_one_total{route="unmatched"} 1', output)
+        self.assertIn('http_request_queries_bucket{route="unmatched",le="20"} 1', output)
+        self.assertIn('http_request_duration_seconds_count{method="GET",route="unmatched",status="200"} 1', output)
+        self.assertIn("db_pool_checkout_wait_seconds_count 1", output)
+        self.assertIn(f'db_pool_checked_out{{engine="{metrics.engines.index(self.engine)}"}} 0', output)
+        self.assertNotIn("sqlite:///", output)
+
+    def test_queries_outside_of_requests(self):
+        with self.engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        self.assertIsNone(current_request.get())
+
+    def test_slow_query(self):
+        with patch("src.services.metrics.settings.slow_query_ms", 0):
+            with self.assertLogs("src.services.metrics", "WARNING"):
+                with self.engine.connect() as conn:
+                    conn.execute(text("SELECT 1"))
+        self.assertIn("db_slow_queries_total 1", metrics.render())
+
+    def test_instrument_twice(self):
+        instrument_engine(self.engine)
+        with self.engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        self.assertIn("db_pool_checkout_wait_seconds_count 1", metrics.render())
@@ -0,0 +1,143 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+import pytest
+from aiosmtplib import SMTPResponseException
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from src.conf.config import settings
+from src.database.models import EmailStatus, OutboxEmail
+from src.repository.outbox import queue_email, retry_delay, utcnow
+from src.services.outbox import OutboxWorker, SMTPPool
+from tests.conftest import TestingAsyncSessionLocal
+
+
+class FakeSMTP:
+    def __init__(self, server):
+        self.server = server
+        self.is_connected = True
+
+    async def send_message(self, message):
+        code = self.server.refuse.get(message["To"])
+        if code:
+            raise SMTPResponseException(code, "refused")
+        self.server.messages.append(message)
+
+    async def quit(self):
+        self.is_connected = False
+
+    def close(self):
+        self.is_connected = False
+
+
+class FakeServer:
+    def __init__(self):
+        self.messages = []
+        self.refuse = {}
+
+    async def connect(self):
+        return FakeSMTP(self)
+
+
+@pytest.fixture
+def server(session: Session):
+    session.execute(delete(OutboxEmail))
+    session.commit()
+    return FakeServer()
+
+
+async def queue(db: AsyncSession, recipient: str):
+    email = await queue_email(db, recipient, "Confirm your email ", "email_template.html",
+                              {"host": "http://testserver/", "username": recipient.split("@")[0], "token": "token"})
+    await db.commit()
+    return email
+
+
+@pytest.mark.asyncio
+async def test_send_batch(server, async_session: AsyncSession):
+    for number in range(5):
+        await queue(async_session, f"user{number}@example.com")
+    pool = SMTPPool(2, 60, server.connect)
+    worker = OutboxWorker(TestingAsyncSessionLocal, pool)
+
+    assert await worker.send_batch(async_session) == 5
+    assert await worker.send_batch(async_session) == 0
+    assert sorted(message["To"] for message in server.messages) == [f"user{n}@example.com" for n in range(5)]
+    assert "http://testserver/api/auth/confirmed_email/token" in server.messages[0].get_content()
+    assert pool.connections_opened <= 2
+    statuses = (await async_session.execute(select(OutboxEmail.status, OutboxEmail.sent_at))).all()
+    assert all(status == EmailStatus.sent and sent_at for status, sent_at in statuses)
+    assert worker.stats == {"batches": 1, "sent": 5, "retried": 0, "failed": 0}
+
+    await queue(async_session, "late@example.com")
+    assert await worker.drain() == 1
+    assert pool.connections_opened <= 2
+
+
+@pytest.mark.asyncio
+async def test_send_batch_failures(server, async_session: AsyncSession):
+    busy = await queue(async_session, "busy@example.com")
+    unknown = await queue(async_session, "unknown@example.com")
+    server.refuse = {"busy@example.com": 451, "unknown@example.com": 550}
+    worker = OutboxWorker(TestingAsyncSessionLocal, SMTPPool(2, 60, server.connect))
+
+    with patch.multiple(settings, email_retry_base=30, email_max_attempts=2):
+        assert await worker.send_batch(async_session) == 2
+        await async_session.refresh(busy)
+        await async_session.refresh(unknown)
+        assert busy.status == EmailStatus.pending and busy.attempts == 1
+        assert busy.next_attempt_at > utcnow() + timedelta(seconds=20)
+        assert "451" in busy.last_error
+        assert unknown.status == EmailStatus.failed and unknown.attempts == 1
+        # not due yet
+        assert await worker.send_batch(async_session) == 0
+
+        busy.next_attempt_at = utcnow()
+        await async_session.commit()
+        assert await worker.send_batch(async_session) == 1
+        await async_session.refresh(busy)
+        assert busy.status == EmailStatus.failed and busy.attempts == 2
+    assert worker.stats == {"batches": 2, "sent": 0, "retried": 1, "failed": 2}
+
+
+@pytest.mark.asyncio
+async def test_send_batch_reclaims_expired(server, async_session: AsyncSession):
+    email = await queue(async_session, "lost@example.com")
+    # claimed by a worker which died before recording the delivery
+    email.status = EmailStatus.sending
+    email.next_attempt_at = utcnow() - timedelta(seconds=1)
+    await async_session.commit()
+    worker = OutboxWorker(TestingAsyncSessionLocal, SMTPPool(1, 60, server.connect))
+
+    assert await worker.send_batch(async_session) == 1
+    assert [message["To"] for message in server.messages] == ["lost@example.com"]
+
+
+@pytest.mark.asyncio
+async def test_send_email_queues(server, async_session: AsyncSession):
+    from src.services.email import send_email
+    from src.services.outbox import outbox_worker
+
+    outbox_worker.wakeup.clear()
+    await send_email(async_session, "rolledback@example.com", "rolledback", "http://testserver/")
+    await async_session.rollback()
+    assert not outbox_worker.wakeup.is_set()
+
+    await send_email(async_session, "queued@example.com", "queued", "http://testserver/")
+    # queued in the transaction of the caller, the worker is woken up by its commit
+    assert not outbox_worker.wakeup.is_set()
+    await async_session.commit()
+    assert outbox_worker.wakeup.is_set()
+
+    email = (await async_session.execute(select(OutboxEmail))).scalar_one()
+    assert email.recipient == "queued@example.com"
+    assert email.status == EmailStatus.pending
+
+
+def test_retry_delay():
+    with patch.multiple(settings, email_retry_base=30, email_retry_max=3600):
+        assert 24 <= retry_delay(1) <= 36
+        assert 96 <= retry_delay(3) <= 144
+        assert retry_delay(20) <= 3600 * 1.2
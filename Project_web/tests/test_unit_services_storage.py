@@ -0,0 +1,139 @@
+import io
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+import cloudinary
+import cloudinary.exceptions
+
+from src.services.storage import CloudinaryStorage, LocalStorage
+
+
+class TestLocalStorage(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.storage = LocalStorage(self.tmp.name, "/storage/")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    async def test_upload_file(self):
+        url = await self.storage.upload(io.BytesIO(b"image"), "folder/image")
+        self.assertEqual(url, "/storage/folder/image")
+        self.assertEqual(self.storage.path("folder/image").read_bytes(), b"image")
+
+    async def test_upload_bytes(self):
+        url = await self.storage.upload(b"qr", "folder/qrcode/qr")
+        self.assertEqual(url, "/storage/folder/qrcode/qr")
+        self.assertEqual(self.storage.path("folder/qrcode/qr").read_bytes(), b"qr")
+
+    async def test_delete(self):
+        await self.storage.upload(b"image", "folder/image")
+        self.assertTrue(await self.storage.delete("folder/image"))
+        self.assertFalse(self.storage.path("folder/image").exists())
+        self.assertFalse(await self.storage.delete("folder/image"))
+
+    async def test_delete_many(self):
+        await self.storage.upload(b"image", "folder/image")
+        self.assertEqual(await self.storage.delete_many(["folder/image", "folder/missing"]), 1)
+        self.assertFalse(self.storage.path("folder/image").exists())
+
+    async def test_list(self):
+        for name in ("folder/b", "folder/a", "folder/sub/c", "other/d"):
+            await self.storage.upload(b"image", name)
+        objects, cursor = await self.storage.list("folder/", limit=2)
+        self.assertEqual([public_id for public_id, _ in objects], ["folder/a", "folder/b"])
+        objects, cursor = await self.storage.list("folder/", cursor, limit=2)
+        self.assertEqual([public_id for public_id, _ in objects], ["folder/sub/c"])
+        self.assertIsNone(cursor)
+
+    def test_public_id(self):
+        self.assertEqual(self.storage.public_id("/storage/folder/image"), "folder/image")
+        self.assertIsNone(self.storage.public_id("https://example.com/folder/image"))
+
+    async def test_find(self):
+        self.assertIsNone(await self.storage.find("folder/image"))
+        await self.storage.upload(b"image", "folder/image")
+        self.assertEqual(await self.storage.find("folder/image"), "/storage/folder/image")
+
+
+class TestCloudinaryStorage(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.service = MagicMock(spec=cloudinary)
+        self.storage = CloudinaryStorage(service=self.service)
+
+    async def test_upload(self):
+        responce_url = "https://res.cloudinary.com/abcdefghi/image/upload/v1234567890/project_name/a96e4ceb-54de-4e37-9520-0d0d3a3a31a6"
+        self.service.uploader.upload.return_value = {"version": 1234567890}
+        self.service.CloudinaryImage().build_url.return_value = responce_url
+        result = await self.storage.upload(b"image", "project_name/a96e4ceb-54de-4e37-9520-0d0d3a3a31a6")
+        self.assertEqual(result, responce_url)
+        self.service.CloudinaryImage().build_url.assert_called_with(version=1234567890)
+
+    async def test_delete(self):
+        self.service.uploader.destroy.return_value = {"result": "ok"}
+        self.assertTrue(await self.storage.delete("project_name/image"))
+        self.service.uploader.destroy.return_value = {"result": "not found"}
+        self.assertFalse(await self.storage.delete("project_name/image"))
+
+    async def test_find(self):
+        self.service.api.resource.return_value = {"version": 1234567890}
+        self.service.CloudinaryImage().build_url.return_value = "https://res.cloudinary.com/qrcode"
+        self.assertEqual(await self.storage.find("project_name/qrcode"), "https://res.cloudinary.com/qrcode")
+        self.service.CloudinaryImage().build_url.assert_called_with(version=1234567890)
+        self.service.api.resource.side_effect = cloudinary.exceptions.NotFound("not found")
+        self.assertIsNone(await self.storage.find("project_name/qrcode"))
+
+    async def test_delete_many(self):
+        self.service.api.delete_resources.side_effect = lambda ids: {
+            "deleted": {public_id: "deleted" for public_id in ids[1:]} | {ids[0]: "not_found"}
+        }
+        public_ids = [f"project_name/image{i}" for i in range(150)]
+        self.assertEqual(await self.storage.delete_many(public_ids), 148)
+        self.assertEqual(self.service.api.delete_resources.call_count, 2)
+        self.service.api.delete_resources.assert_called_with(public_ids[100:])
+
+    async def test_list(self):
+        self.service.api.resources.return_value = {
+            "resources": [{"public_id": "project_name/image", "created_at": "2024-01-02T03:04:05Z"}],
+            "next_cursor": "next"
+        }
+        objects, cursor = await self.storage.list("project_name/", "previous", 500)
+        self.assertEqual(objects[0][0], "project_name/image")
+        self.assertEqual(objects[0][1].isoformat(), "2024-01-02T03:04:05+00:00")
+        self.assertEqual(cursor, "next")
+        self.service.api.resources.assert_called_with(
+            type="upload", prefix="project_name/", max_results=500, next_cursor="previous"
+        )
+
+    def test_public_id(self):
+        with patch("src.services.storage.settings.cloudinary_folder_name", "project_name"):
+            self.assertEqual(
+                self.storage.public_id("https://res.cloudinary.com/abc/image/upload/v1234567890/project_name/image"),
+                "project_name/image"
+            )
+            self.assertEqual(
+                self.storage.public_id("https://res.cloudinary.com/abc/image/upload/v1/project_name/qrcode/qr.svg"),
+                "project_name/qrcode/qr"
+            )
+            self.assertIsNone(
+                self.storage.public_id("https://res.cloudinary.com/abc/image/upload/c_crop,w_10/v1/project_name/image")
+            )
+
+    def test_source_public_id(self):
+        with patch("src.services.storage.settings.cloudinary_folder_name", "project_name"):
+            self.assertEqual(
+                self.storage.source_public_id("https://res.cloudinary.com/abc/image/upload/v1/project_name/image"),
+                "project_name/image"
+            )
+            self.assertEqual(
+                self.storage.source_public_id(
+                    "https://res.cloudinary.com/abc/image/upload/c_crop,h_100,w_100/e_grayscale/v1/project_name/image"
+                ),
+                "project_name/image"
+            )
+            self.assertEqual(
+                self.storage.source_public_id("https://res.cloudinary.com/abc/image/upload/a_90/project_name/image.jpg"),
+                "project_name/image"
+            )
+            self.assertIsNone(self.storage.source_public_id("https://res.cloudinary.com/abc/image/upload/v1/other/image"))
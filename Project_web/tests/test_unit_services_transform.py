@@ -0,0 +1,132 @@
+import io
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from src.services.transform import (
+    ContentAddressedFiles,
+    LocalTransformer,
+    apply_transformation,
+    crop,
+    grayscale,
+    render,
+    round_corners,
+    sepia,
+)
+from src.utils.executor import BoundedExecutor
+
+
+def encode(pixels: np.ndarray, format: str = "png") -> bytes:
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format)
+    return buffer.getvalue()
+
+
+class TestOperations(unittest.TestCase):
+    def setUp(self):
+        self.pixels = np.arange(6 * 8 * 3, dtype=np.uint8).reshape(6, 8, 3)
+
+    def test_crop_centre(self):
+        result = crop(self.pixels, 4, 2)
+        self.assertEqual(result.shape, (2, 4, 3))
+        np.testing.assert_array_equal(result, self.pixels[2:4, 2:6])
+
+    def test_crop_larger_than_image(self):
+        self.assertEqual(crop(self.pixels, 100, 100).shape, (6, 8, 3))
+
+    def test_round_corners(self):
+        pixels = np.zeros((20, 20, 3), dtype=np.uint8)
+        result = round_corners(pixels, 5)
+        self.assertEqual(result.shape, (20, 20, 4))
+        for y, x in ((0, 0), (0, 19), (19, 0), (19, 19)):
+            self.assertEqual(result[y, x, 3], 0)
+        self.assertEqual(result[10, 10, 3], 255)
+        self.assertEqual(result[0, 10, 3], 255)
+        self.assertEqual(result[10, 0, 3], 255)
+
+    def test_grayscale(self):
+        pixels = np.array([[[255, 0, 0], [0, 255, 0], [255, 255, 255]]], dtype=np.uint8)
+        result = grayscale(pixels)
+        self.assertEqual(result.shape, (1, 3, 3))
+        np.testing.assert_array_equal(result[0, :, 0], [76, 149, 255])
+        np.testing.assert_array_equal(result[..., 0], result[..., 2])
+
+    def test_sepia_keeps_alpha(self):
+        pixels = np.array([[[100, 100, 100, 7]]], dtype=np.uint8)
+        result = sepia(pixels)
+        np.testing.assert_array_equal(result[0, 0], [135, 120, 93, 7])
+
+    def test_apply_transformation(self):
+        data = encode(np.zeros((10, 12, 3), dtype=np.uint8))
+        result, extension = apply_transformation(data, {"height": 4, "width": 6, "crop": "crop"})
+        self.assertEqual(extension, "jpg")
+        self.assertEqual(Image.open(io.BytesIO(result)).size, (6, 4))
+        result, extension = apply_transformation(data, {"radius": 3})
+        self.assertEqual(extension, "png")
+        self.assertEqual(Image.open(io.BytesIO(result)).mode, "RGBA")
+
+    def test_apply_transformation_unsupported(self):
+        data = encode(np.zeros((2, 2, 3), dtype=np.uint8))
+        with self.assertRaises(ValueError):
+            apply_transformation(data, {"effect": "blur"})
+        with self.assertRaises(ValueError):
+            apply_transformation(data, {"angle": 90})
+
+
+class TestLocalTransformer(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.source = self.root / "source.png"
+        self.source.write_bytes(encode(np.full((8, 8, 3), 200, dtype=np.uint8)))
+        self.executor = ThreadPoolExecutor(1)
+        self.transformer = LocalTransformer(
+            self.root / "store", "/transformed/", BoundedExecutor(self.executor, 4)
+        )
+
+    def tearDown(self):
+        self.executor.shutdown()
+        self.tmp.cleanup()
+
+    def test_render_content_addressed(self):
+        first = render(str(self.source), {"effect": "sepia"}, str(self.root / "store"))
+        second = render(str(self.source), {"effect": "sepia"}, str(self.root / "store"))
+        self.assertEqual(first, second)
+        digest = first.split("/")[-1].split(".")[0]
+        self.assertTrue(first.startswith(digest[:2] + "/"))
+        self.assertEqual(len(list((self.root / "store").rglob("*"))), 2)
+
+    async def test_transform(self):
+        url = await self.transformer.transform(str(self.source), {"effect": "grayscale"})
+        self.assertTrue(url.startswith("/transformed/"))
+        self.assertTrue((self.root / "store" / url[len("/transformed/"):]).exists())
+
+    async def test_transform_chained(self):
+        url = await self.transformer.transform(str(self.source), {"radius": 2})
+        self.assertEqual(self.transformer.source(url), str(self.root / "store" / url[len("/transformed/"):]))
+        chained = await self.transformer.transform(url, {"effect": "sepia"})
+        self.assertTrue(chained.endswith(".png"))
+
+
+class TestContentAddressedFiles(unittest.TestCase):
+    def test_etag_and_cache_control(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            (Path(tmp) / "ab").mkdir()
+            (Path(tmp) / "ab" / "abcdef.jpg").write_bytes(b"image")
+            app = FastAPI()
+            app.mount("/transformed", ContentAddressedFiles(directory=tmp))
+            client = TestClient(app)
+
+            response = client.get("/transformed/ab/abcdef.jpg")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.headers["etag"], '"abcdef"')
+            self.assertIn("immutable", response.headers["cache-control"])
+
+            response = client.get("/transformed/ab/abcdef.jpg", headers={"If-None-Match": '"abcdef"'})
+            self.assertEqual(response.status_code, 304)
@@ -0,0 +1,71 @@
+import datetime
+import json
+import unittest
+from unittest.mock import AsyncMock
+
+from src.database.models import User, UserRole
+from src.services.user_cache import UserCache, user_from_snapshot, user_to_snapshot
+
+
+class TestUserCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.user = User(
+            id=1,
+            username="deadpool",
+            email="deadpool@example.com",
+            password="secret",
+            refresh_token="token",
+            role=UserRole.moderator,
+            avatar=None,
+            confirmed=True,
+            is_active=True,
+            created_at=datetime.datetime(2024, 1, 1, 12, 0)
+        )
+
+    def test_snapshot(self):
+        snapshot = user_to_snapshot(self.user)
+        self.assertNotIn("password", snapshot)
+        self.assertNotIn("refresh_token", snapshot)
+        user = user_from_snapshot(json.loads(json.dumps(snapshot)))
+        self.assertEqual(user.id, 1)
+        self.assertEqual(user.role, UserRole.moderator)
+        self.assertEqual(user.created_at, self.user.created_at)
+
+    async def test_local(self):
+        cache = UserCache(maxsize=10, ttl=60)
+        self.assertIsNone(await cache.get(self.user.email))
+        await cache.set(self.user)
+        self.assertEqual((await cache.get(self.user.email))["id"], 1)
+        await cache.invalidate(self.user.email)
+        self.assertIsNone(await cache.get(self.user.email))
+        stats = cache.get_stats()
+        self.assertEqual(stats["local_hits"], 1)
+        self.assertEqual(stats["misses"], 2)
+        self.assertEqual(stats["invalidations"], 1)
+
+    async def test_redis(self):
+        redis = AsyncMock()
+        cache = UserCache(maxsize=10, ttl=60, redis=redis, redis_ttl=300)
+        await cache.set(self.user)
+        key, raw = redis.set.call_args.args
+        self.assertEqual(key, "user:deadpool@example.com")
+        self.assertEqual(redis.set.call_args.kwargs, {"ex": 300})
+
+        # another worker: empty local tier, snapshot found in redis
+        other = UserCache(maxsize=10, ttl=60, redis=redis)
+        redis.get.return_value = raw
+        self.assertEqual((await other.get(self.user.email))["email"], self.user.email)
+        self.assertEqual((await other.get(self.user.email))["email"], self.user.email)
+        redis.get.assert_awaited_once()
+        self.assertEqual(other.get_stats()["redis_hits"], 1)
+        self.assertEqual(other.get_stats()["local_hits"], 1)
+
+        await other.invalidate(self.user.email)
+        redis.delete.assert_awaited_once_with(key)
+
+    async def test_redis_errors(self):
+        redis = AsyncMock()
+        redis.get.side_effect = ConnectionError("down")
+        cache = UserCache(maxsize=10, ttl=60, redis=redis)
+        self.assertIsNone(await cache.get(self.user.email))
+        self.assertEqual(cache.get_stats()["redis_errors"], 1)
@@ -0,0 +1,26 @@
+import subprocess
+import sys
+import unittest
+
+from benchmarks.startup import LAZY_MODULES, parse_importtime
+
+
+class TestStartup(unittest.TestCase):
+    def test_heavy_dependencies_not_imported(self):
+        result = subprocess.run(
+            [sys.executable, "-c", f"import sys, main; print(*[m for m in {LAZY_MODULES!r} if m in sys.modules])"],
+            capture_output=True, text=True
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.split(), [])
+
+    def test_parse_importtime(self):
+        output = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       279 |        388 |         src.utils.cache\n"
+            "import time:     1024 |      64959 |     src.services.auth\n"
+        )
+        self.assertEqual(
+            parse_importtime(output),
+            [("src.utils.cache", 279, 388), ("src.services.auth", 1024, 64959)]
+        )
@@ -0,0 +1,44 @@
+import unittest
+from unittest.mock import patch
+
+from src.utils.cache import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = LRUCache(maxsize=2)
+
+    def test_get_put(self):
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.get("a", 0), 0)
+        self.cache.put("a", 1)
+        self.assertEqual(self.cache.get("a"), 1)
+
+    def test_eviction(self):
+        self.cache.put("a", 1)
+        self.cache.put("b", 2)
+        self.cache.get("a")
+        self.cache.put("c", 3)
+        self.assertEqual(self.cache.get("a"), 1)
+        self.assertIsNone(self.cache.get("b"))
+        self.assertEqual(len(self.cache), 2)
+
+    def test_pop_clear(self):
+        self.cache.put("a", 1)
+        self.cache.put("b", 2)
+        self.cache.pop("a")
+        self.cache.pop("missing")
+        self.assertIsNone(self.cache.get("a"))
+        self.cache.clear()
+        self.assertEqual(len(self.cache), 0)
+
+    @patch("src.utils.cache.time.monotonic")
+    def test_ttl(self, mock_monotonic):
+        cache = LRUCache(maxsize=2, ttl=10)
+        mock_monotonic.return_value = 100
+        cache.put("a", 1)
+        mock_monotonic.return_value = 109
+        self.assertEqual(cache.get("a"), 1)
+        mock_monotonic.return_value = 110
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
@@ -0,0 +1,35 @@
+import asyncio
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException, status
+
+from src.utils.executor import BoundedExecutor
+
+
+class TestBoundedExecutor(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.pool = ThreadPoolExecutor(max_workers=1)
+        self.executor = BoundedExecutor(self.pool, max_pending=2)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    async def test_run(self):
+        result = await self.executor.run(pow, 2, 10)
+        self.assertEqual(result, 1024)
+        self.assertEqual(self.executor.pending, 0)
+
+    async def test_saturated(self):
+        release = threading.Event()
+        first = asyncio.create_task(self.executor.run(release.wait))
+        second = asyncio.create_task(self.executor.run(release.wait))
+        await asyncio.sleep(0)
+        with self.assertRaises(HTTPException) as err:
+            await self.executor.run(release.wait)
+        self.assertEqual(err.exception.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(self.executor.rejected, 1)
+        release.set()
+        await asyncio.gather(first, second)
+        self.assertEqual(self.executor.pending, 0)
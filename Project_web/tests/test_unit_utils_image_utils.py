@@ -1,16 +1,22 @@
+import asyncio
 import unittest
-from unittest.mock import MagicMock
-from sqlalchemy.orm import Session
+from unittest.mock import AsyncMock, MagicMock, patch
+from sqlalchemy.ext.asyncio import AsyncSession
 import cloudinary
 from fastapi import HTTPException, status
-from src.utils.image_utils import transform_image
+from src.utils.image_utils import canonical_transformation, transform_image, transform_images
 from src.database.models import User, Post
 
 
 class TestImageUtils(unittest.IsolatedAsyncioTestCase):
     def setUp(self):
         self.service = MagicMock(spec=cloudinary)
-        self.session = MagicMock(spec=Session)
+        self.session = MagicMock(spec=AsyncSession)
+        self.result = MagicMock()
+        self.session.execute.return_value = self.result
+        patcher = patch("src.utils.image_utils.upload_qr_code", AsyncMock(return_value="/storage/qrcode"))
+        self.upload_qr_code = patcher.start()
+        self.addCleanup(patcher.stop)
 
     async def test_transform_image_access_denied(self):
         user = User()
@@ -36,7 +42,7 @@ class TestImageUtils(unittest.IsolatedAsyncioTestCase):
         user = User()
         image = Post()
         description = "description"
-        self.session.query().filter().first.return_value = None
+        self.result.scalars().first.return_value = None
         try:
             result = await transform_image(
                 image_id=image.id,
@@ -62,7 +68,7 @@ class TestImageUtils(unittest.IsolatedAsyncioTestCase):
             image_url = test_url
         )
         description = "description"
-        self.session.query().filter().first.return_value = image
+        self.result.scalars().first.return_value = image
         self.service.CloudinaryImage().build_url.return_value = responce_url
         result = await transform_image(
             image_id=image.id,
@@ -75,3 +81,73 @@ class TestImageUtils(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(result.description, description)
         self.assertEqual(result.author, user.id)
         self.assertEqual(result.image_url, responce_url)
+
+
+    async def test_transform_image_existing(self):
+        user = User(id=1)
+        image = Post(id=1, author_id=user.id)
+        derived = Post(id=2, parent_id=image.id, transformation='{"radius":10}')
+        self.result.scalars().first.return_value = image
+        self.result.scalars().all.return_value = [derived]
+        result = await transform_image(
+            image_id=image.id,
+            transform_params={"radius": 10},
+            description="description",
+            db=self.session,
+            current_user=user,
+            service=self.service
+        )
+        self.assertIs(result, derived)
+        self.service.CloudinaryImage.assert_not_called()
+        self.session.add.assert_not_called()
+
+    async def test_transform_image_local_backend(self):
+        user = User(id=1)
+        image = Post(id=1, author_id=user.id, image_url="/storage/project_name/image")
+        self.result.scalars().first.return_value = image
+        transformer = MagicMock()
+        transformer.transform = AsyncMock(return_value="/transformed/ab/abcdef.jpg")
+        with patch("src.utils.image_utils.settings.transform_backend", "local"), \
+                patch("src.services.transform.get_transformer", return_value=transformer):
+            result = await transform_image(
+                image_id=image.id,
+                transform_params={"effect": "sepia"},
+                description="description",
+                db=self.session,
+                current_user=user,
+                service=self.service
+            )
+        self.assertEqual(result.image_url, "/transformed/ab/abcdef.jpg")
+        self.assertEqual(result.qr_code_url, "/storage/qrcode")
+        transformer.transform.assert_awaited_once_with(image.image_url, {"effect": "sepia"})
+        # rendered and stored offline, without cloudinary
+        self.service.config.assert_not_called()
+        self.service.CloudinaryImage.assert_not_called()
+
+    async def test_transform_images_concurrent(self):
+        user = User(id=1)
+        images = {image_id: Post(id=image_id, author_id=user.id) for image_id in range(1, 7)}
+        running, peak = 0, 0
+
+        async def build(image, *args):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return Post(parent_id=image.id)
+
+        with patch("src.utils.image_utils.get_source_images", AsyncMock(return_value=images)), \
+                patch("src.utils.image_utils.get_derived_images", AsyncMock(return_value={})), \
+                patch("src.utils.image_utils.build_derived_image", side_effect=build), \
+                patch("src.utils.image_utils.settings.bulk_transform_concurrency", 3):
+            result = await transform_images(list(images), {"effect": "sepia"}, "description",
+                                            self.session, user, self.service)
+        self.assertEqual([image.parent_id for image in result], list(images))
+        self.assertEqual(peak, 3)
+
+    def test_canonical_transformation(self):
+        self.assertEqual(
+            canonical_transformation({"width": 640, "height": 480, "crop": "crop"}),
+            canonical_transformation({"crop": "crop", "height": 480, "width": 640})
+        )
@@ -1,12 +1,24 @@
+import tempfile
 import unittest
-from unittest.mock import MagicMock
+from concurrent.futures import ProcessPoolExecutor
+from unittest.mock import MagicMock, patch
 import cloudinary
-from src.utils.qr_code import get_qr_code_by_url, delete_qr_code_by_url
+from src.services.storage import LocalStorage
+from src.utils.qr_code import (
+    get_qr_code_by_url,
+    delete_qr_code_by_url,
+    qr_code_cache,
+    qr_code_public_id,
+    render_qr_code,
+    upload_qr_code,
+    upload_qr_codes,
+)
 
 
 class TestQrCode(unittest.IsolatedAsyncioTestCase):
     def setUp(self):
         self.service = MagicMock(spec=cloudinary)
+        qr_code_cache.clear()
 
     async def test_get_qr_code_by_url(self):
         test_url = "http://www.google.com"
@@ -33,3 +45,75 @@ class TestQrCode(unittest.IsolatedAsyncioTestCase):
             assert False
         except FileNotFoundError:
             assert True
+
+
+class TestContentAddressedQrCode(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        qr_code_cache.clear()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.storage = LocalStorage(self.tmp.name, "/storage")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_public_id(self):
+        public_id = qr_code_public_id("http://example.com/1.jpg")
+        self.assertEqual(public_id, qr_code_public_id("http://example.com/1.jpg"))
+        self.assertNotEqual(public_id, qr_code_public_id("http://example.com/2.jpg"))
+        self.assertNotEqual(public_id, qr_code_public_id("http://example.com/1.jpg", "svg"))
+
+    def test_render_svg(self):
+        image = render_qr_code("http://example.com/1.jpg", "svg")
+        self.assertIn(b"<svg", image)
+        with self.assertRaises(ValueError):
+            render_qr_code("http://example.com/1.jpg", "gif")
+
+    async def test_upload_qr_code_reused(self):
+        url = "http://example.com/1.jpg"
+        qr_url = await upload_qr_code(url, self.storage, "svg")
+        public_id = qr_code_public_id(url, "svg")
+        self.assertEqual(qr_url, f"/storage/{public_id}")
+        self.assertTrue(self.storage.path(public_id).exists())
+
+        qr_code_cache.clear()
+        with patch("src.utils.qr_code.render_qr_code") as render:
+            self.assertEqual(await upload_qr_code(url, self.storage, "svg"), qr_url)
+            render.assert_not_called()
+
+        with patch.object(self.storage, "find") as find:
+            self.assertEqual(await upload_qr_code(url, self.storage, "svg"), qr_url)
+            find.assert_not_called()
+
+    async def test_upload_qr_codes(self):
+        stored = await upload_qr_code("http://example.com/0.jpg", self.storage, "png")
+        qr_code_cache.clear()
+        urls = [f"http://example.com/{i}.jpg" for i in (0, 1, 2, 1)]
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            result = await upload_qr_codes(urls, self.storage, "png", executor=pool)
+        self.assertEqual(set(result), set(urls))
+        self.assertEqual(result["http://example.com/0.jpg"], stored)
+        for url in urls:
+            public_id = qr_code_public_id(url, "png")
+            self.assertEqual(result[url], f"/storage/{public_id}")
+            self.assertTrue(self.storage.path(public_id).read_bytes().startswith(b"\x89PNG"))
+
+    async def test_upload_qr_codes_thread_pool(self):
+        # bulk uploads render in the default thread pool of the loop, not in new processes
+        urls = ["http://example.com/3.jpg", "http://example.com/4.jpg"]
+        with patch("src.utils.qr_code.render_qr_code", wraps=render_qr_code) as render:
+            result = await upload_qr_codes(urls, self.storage, "svg")
+        self.assertEqual(render.call_count, 2)
+        for url in urls:
+            self.assertTrue(self.storage.path(qr_code_public_id(url, "svg")).exists())
+            self.assertEqual(result[url], f"/storage/{qr_code_public_id(url, 'svg')}")
+
+    async def test_upload_qr_code_expired(self):
+        # a qr code deleted by the storage GC of another process is uploaded again
+        url = "http://example.com/1.jpg"
+        public_id = qr_code_public_id(url, "svg")
+        await upload_qr_code(url, self.storage, "svg")
+        await self.storage.delete(public_id)
+        self.assertIsNotNone(qr_code_cache.get(public_id))
+        with patch("src.utils.cache.time.monotonic", return_value=float("inf")):
+            await upload_qr_code(url, self.storage, "svg")
+        self.assertTrue(self.storage.path(public_id).exists())
@@ -0,0 +1,162 @@
+"""
+Benchmark of the authentication overhead per request: get_current_user resolving
+access tokens with the user cached by the blocking redis client as a pickled
+User (the behaviour before redis.asyncio), against the current JSON snapshots.
+
+Tokens of existing users are cache hits after the first request; tokens of
+unknown emails (deleted users) query the database on every request unless they
+are cached as negative entries. For every variant the report has the throughput,
+the latencies, the database queries per request and how late a probe sleeping
+10 ms in a loop wakes up, i.e. how long the event loop is blocked.
+
+Needs a Redis server (--redis-url). --fake runs against fakeredis: no network
+round trips, only the serialization and the database are measured. Run from
+the goit_python_web_hw14 directory:
+
+    python -m benchmarks.auth --redis-url redis://localhost:6379/1 --requests 5000 --concurrency 20
+"""
+import argparse
+import asyncio
+import pickle
+import random
+import time
+
+import redis
+import redis.asyncio
+from fastapi import HTTPException
+from jose import jwt
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.orm import Session, sessionmaker
+
+from benchmarks.utils import percentile, print_report, run_load
+from src.database.models import Base, User
+from src.repository.users import get_user_by_email
+from src.services.auth import auth_service
+from src.services.user_cache import user_cache
+
+
+def seed(session: Session, users: int) -> None:
+    Base.metadata.drop_all(bind=session.get_bind())
+    Base.metadata.create_all(bind=session.get_bind())
+    session.execute(insert(User), [
+        {"username": f"user{i}", "email": f"user{i}@example.com", "password": "secret", "confirmed": True}
+        for i in range(users)
+    ])
+    session.commit()
+
+
+async def legacy_get_current_user(client: redis.Redis, token: str, db: Session) -> User:
+    """
+    The legacy_get_current_user function resolves a token the pre-asyncio way: blocking
+    GET, and on a miss SET then EXPIRE of the pickled user.
+
+    :param client: redis.Redis: Blocking Redis client
+    :param token: str: Access token
+    :param db: Session: Pass the database session to the function
+    :return: The user
+    """
+    payload = jwt.decode(token, auth_service.SECRET_KEY, algorithms=[auth_service.ALGORITHM])
+    email = payload["sub"]
+    user = client.get(f"user:{email}")
+    if user is None:
+        user = await get_user_by_email(email, db)
+        if user is None:
+            raise HTTPException(status_code=401)
+        client.set(f"user:{email}", pickle.dumps(user))
+        client.expire(f"user:{email}", 900)
+    else:
+        user = pickle.loads(user)
+    return user
+
+
+async def bench(resolve, tokens: list, session_factory: sessionmaker, queries: list,
+                requests: int, concurrency: int) -> dict:
+    rng = random.Random(0)
+
+    async def call():
+        with session_factory() as db:
+            try:
+                await resolve(rng.choice(tokens), db)
+            except HTTPException:
+                pass
+
+    async def probe(done: asyncio.Event, lags: list):
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lags.append(time.perf_counter() - start - 0.01)
+
+    queries[0] = 0
+    done = asyncio.Event()
+    lags = []
+    prober = asyncio.create_task(probe(done, lags))
+    report = await run_load(call, requests, concurrency)
+    done.set()
+    await prober
+    report["queries_per_request"] = round(queries[0] / requests, 3)
+    report["loop_lag_p99_ms"] = round(percentile(lags, 99) * 1000, 3)
+    report["loop_lag_max_ms"] = round(max(lags, default=0) * 1000, 3)
+    return report
+
+
+async def main(args: argparse.Namespace) -> None:
+    engine = create_engine(args.database_url, connect_args={"check_same_thread": False})
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with session_factory() as session:
+        seed(session, args.users)
+    queries = [0]
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def count(*_):
+        queries[0] += 1
+
+    if args.fake:
+        import fakeredis
+
+        server = fakeredis.FakeServer()
+        sync_client = fakeredis.FakeRedis(server=server)
+        user_cache.redis = fakeredis.aioredis.FakeRedis(server=server)
+    else:
+        sync_client = redis.Redis.from_url(args.redis_url)
+        user_cache.redis = redis.asyncio.Redis.from_url(args.redis_url)
+
+    known = [await auth_service.create_access_token(data={"sub": f"user{i}@example.com"})
+             for i in range(args.users)]
+    unknown = [await auth_service.create_access_token(data={"sub": f"deleted{i}@example.com"})
+               for i in range(args.users)]
+
+    async def legacy(token, db):
+        return await legacy_get_current_user(sync_client, token, db)
+
+    async def current(token, db):
+        return await auth_service.get_current_user(token=token, db=db)
+
+    reports = {}
+    for name, tokens in (("known users", known), ("unknown emails", unknown)):
+        sync_client.flushdb()
+        reports[f"{name}: sync redis, pickle"] = await bench(
+            legacy, tokens, session_factory, queries, args.requests, args.concurrency
+        )
+        sync_client.flushdb()
+        reports[f"{name}: redis.asyncio, JSON"] = await bench(
+            current, tokens, session_factory, queries, args.requests, args.concurrency
+        )
+    sync_client.flushdb()
+    await user_cache.redis.aclose()
+    engine.dispose()
+    print_report(
+        f"get_current_user, {args.users} users, concurrency {args.concurrency}, "
+        f"{'fakeredis' if args.fake else args.redis_url}",
+        reports
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default="sqlite:///./benchmark.db")
+    parser.add_argument("--redis-url", default="redis://localhost:6379/1")
+    parser.add_argument("--fake", action="store_true", help="use fakeredis instead of a Redis server")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    asyncio.run(main(parser.parse_args()))
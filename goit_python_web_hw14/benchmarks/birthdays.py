@@ -0,0 +1,117 @@
+"""
+Benchmark of /contacts/birthdays: the former query (extract(year from age(...))
+computed twice per row, Postgres only) against the range scan of the
+(user_id, birthday_doy) index, against the daily cache of upcoming birthdays.
+
+The contacts table is recreated with --contacts contacts spread over --users
+users. Every request asks for the birthdays of the next --days days of a random
+user. The cache is filled for every user before it is measured, as it is after
+the first request of the day. It uses a Redis server with --redis-url, fakeredis
+otherwise. Run from the goit_python_web_hw14 directory:
+
+    python -m benchmarks.birthdays --database-url postgresql+psycopg2://... \\
+        --contacts 1000000 --users 1000 --requests 500
+"""
+import argparse
+import asyncio
+import datetime
+import random
+from datetime import timedelta
+
+import redis.asyncio
+from sqlalchemy import Interval, create_engine, extract, func, insert
+from sqlalchemy.orm import Session, sessionmaker
+
+from benchmarks.utils import print_report, run_load
+from src.database.models import Base, Contact, User, birthday_doy
+from src.repository.contacts import get_upcoming_birthdays
+from src.services.birthday_cache import birthday_cache, upcoming_birthdays
+
+CHUNK = 50000
+
+
+def seed(session: Session, contacts: int, users: int) -> None:
+    rng = random.Random(0)
+    Base.metadata.drop_all(bind=session.get_bind())
+    Base.metadata.create_all(bind=session.get_bind())
+    session.execute(insert(User), [
+        {"username": f"user{i}", "email": f"user{i}@example.com", "password": "secret"}
+        for i in range(users)
+    ])
+    for start in range(0, contacts, CHUNK):
+        rows = []
+        for i in range(start, min(start + CHUNK, contacts)):
+            birthday = datetime.date(1950, 1, 1) + timedelta(days=rng.randint(0, 50 * 365))
+            rows.append({
+                "name": f"name{i}",
+                "surname": f"surname{i}",
+                "email": f"contact{i}@example.com",
+                "phone": "0123456789",
+                "birthday": birthday,
+                "birthday_doy": birthday_doy(birthday),
+                "user_id": rng.randint(1, users),
+            })
+        session.execute(insert(Contact), rows)
+    session.commit()
+
+
+def legacy_birthdays(db: Session, user_id: int, days: int) -> list:
+    age = extract("year", func.age(Contact.birthday))
+    age_days = extract("year", func.age(Contact.birthday - func.cast(timedelta(days), Interval)))
+    return db.query(Contact).filter(age_days > age, Contact.user_id == user_id).all()
+
+
+async def main(args: argparse.Namespace) -> None:
+    engine = create_engine(args.database_url)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with session_factory() as session:
+        seed(session, args.contacts, args.users)
+    if args.redis_url:
+        birthday_cache.redis = redis.asyncio.Redis.from_url(args.redis_url)
+    else:
+        import fakeredis
+
+        birthday_cache.redis = fakeredis.aioredis.FakeRedis()
+    await birthday_cache.redis.flushdb()
+    rng = random.Random(1)
+
+    async def legacy():
+        with session_factory() as db:
+            legacy_birthdays(db, rng.randint(1, args.users), args.days)
+
+    async def doy_range():
+        with session_factory() as db:
+            await get_upcoming_birthdays(rng.randint(1, args.users), args.days, db)
+
+    async def cached():
+        with session_factory() as db:
+            await upcoming_birthdays(rng.randint(1, args.users), args.days, db)
+
+    reports = {}
+    if engine.dialect.name == "postgresql":
+        reports["age() on every row"] = await run_load(legacy, args.requests, args.concurrency)
+    reports["birthday_doy range"] = await run_load(doy_range, args.requests, args.concurrency)
+    # a user misses the cache once a day, the first request of the day fills it
+    with session_factory() as db:
+        for user_id in range(1, args.users + 1):
+            await upcoming_birthdays(user_id, args.days, db)
+    reports["daily cache"] = await run_load(cached, args.requests, args.concurrency)
+    await birthday_cache.redis.aclose()
+    engine.dispose()
+    print_report(
+        f"birthdays in the next {args.days} days, {args.contacts} contacts, {args.users} users, "
+        f"{engine.dialect.name}",
+        reports
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default="sqlite:///./benchmark.db")
+    parser.add_argument("--redis-url", help="Redis of the daily cache, fakeredis by default")
+    parser.add_argument("--contacts", type=int, default=200000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,118 @@
+"""
+Benchmark of the contact search: the former read_contacts query (three LIKE
+'%...%' predicates, every match returned) against repository.contacts, with the
+search column, its trigram index and a page of ranked results.
+
+The contacts table is recreated with --contacts contacts spread over --users
+users. Every request searches the contacts of a random user for a random
+fragment of a name. The trigram index only exists on Postgres, with the pg_trgm
+and btree_gin extensions available. Run from the goit_python_web_hw14 directory:
+
+    python -m benchmarks.contacts_search --database-url postgresql+psycopg2://... \\
+        --contacts 1000000 --users 1000 --requests 500 --explain
+"""
+import argparse
+import asyncio
+import datetime
+import random
+
+from sqlalchemy import create_engine, insert, select, text
+from sqlalchemy.orm import Session, sessionmaker
+
+from benchmarks.utils import print_report, run_load
+from src.database.models import Base, Contact, User, birthday_doy
+from src.repository.contacts import search_contacts
+
+NAMES = ["anna", "john", "maria", "oleksandr", "iryna", "petro", "olga", "andrii", "sofia", "taras",
+         "kateryna", "mykola", "natalia", "serhii", "yulia", "dmytro", "oksana", "viktor", "alina", "roman"]
+CHUNK = 50000
+
+
+def seed(session: Session, contacts: int, users: int) -> None:
+    rng = random.Random(0)
+    Base.metadata.drop_all(bind=session.get_bind())
+    Base.metadata.create_all(bind=session.get_bind())
+    session.execute(insert(User), [
+        {"username": f"user{i}", "email": f"user{i}@example.com", "password": "secret"}
+        for i in range(users)
+    ])
+    for start in range(0, contacts, CHUNK):
+        rows = []
+        for i in range(start, min(start + CHUNK, contacts)):
+            name = rng.choice(NAMES).title()
+            surname = f"{rng.choice(NAMES).title()}enko{i}"
+            rows.append({
+                "name": name,
+                "surname": surname,
+                "email": f"{name.lower()}.{surname.lower()}@example.com",
+                "phone": "0123456789",
+                "birthday": datetime.date(1990, 1, 1),
+                "birthday_doy": birthday_doy(datetime.date(1990, 1, 1)),
+                "user_id": rng.randint(1, users),
+            })
+        session.execute(insert(Contact), rows)
+    session.commit()
+    if session.get_bind().dialect.name == "postgresql":
+        session.execute(text("ANALYZE contacts"))
+        session.commit()
+
+
+def legacy_read_contacts(db: Session, user_id: int, q: str) -> list:
+    return db.query(Contact).filter(
+        Contact.name.like(f"%{q}%"),
+        Contact.surname.like("%%"),
+        Contact.email.like("%%"),
+        Contact.user_id == user_id
+    ).all()
+
+
+async def main(args: argparse.Namespace) -> None:
+    engine = create_engine(args.database_url)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with session_factory() as session:
+        seed(session, args.contacts, args.users)
+    rng = random.Random(1)
+
+    def fragment() -> str:
+        name = rng.choice(NAMES)
+        start = rng.randint(0, len(name) - 3)
+        return name[start:start + 3]
+
+    async def legacy():
+        with session_factory() as db:
+            legacy_read_contacts(db, rng.randint(1, args.users), fragment().title())
+
+    async def search():
+        with session_factory() as db:
+            await search_contacts(rng.randint(1, args.users), db, q=fragment(), limit=args.limit)
+
+    reports = {
+        "LIKE on 3 columns": await run_load(legacy, args.requests, args.concurrency),
+        "search column, page": await run_load(search, args.requests, args.concurrency),
+    }
+    if args.explain and engine.dialect.name == "postgresql":
+        with session_factory() as db:
+            query = (
+                select(Contact)
+                .where(Contact.user_id == 1, Contact.search.contains("ann", autoescape=True))
+                .limit(args.limit)
+            )
+            plan = db.execute(text(f"EXPLAIN ANALYZE {query.compile(engine, compile_kwargs={'literal_binds': True})}"))
+            print("\n".join(row[0] for row in plan))
+    engine.dispose()
+    print_report(
+        f"contact search, {args.contacts} contacts, {args.users} users, {engine.dialect.name}",
+        reports
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default="sqlite:///./benchmark.db")
+    parser.add_argument("--contacts", type=int, default=200000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--explain", action="store_true", help="print the plan of a search on Postgres")
+    asyncio.run(main(parser.parse_args()))
@@ -1,13 +1,14 @@
-import uvicorn
 import redis.asyncio
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
 from contextlib import asynccontextmanager
 from fastapi_limiter import FastAPILimiter
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from src.routes.contacts import router as contacts_router
 from src.routes.auth import router as auth_router
 from src.routes.users import router as users_router
 from src.conf.config import settings
+from src.database.db import engine
 
 
 @asynccontextmanager
@@ -15,7 +16,8 @@ async def lifespan(app: FastAPI):
     """
     The lifespan function is a coroutine that runs before and after the server starts.
     It's used to initialize any resources that need to be available for the entire lifetime of the application.
-    In this case, we're using it to initialize our Redis connection pool.
+    In this case, we're using it to initialize our Redis connection pool and to start
+    the worker sending the queued emails, stopped on shutdown.
     
     :param app: FastAPI: Pass the fastapi instance to the lifespan function
     :return: A context manager, which is used to manage the lifetime of a resource
@@ -29,7 +31,16 @@ async def lifespan(app: FastAPI):
         decode_responses=True
     )
     await FastAPILimiter.init(r)
-    yield
+    if not settings.email_worker_enabled:
+        yield
+        return
+    from src.services.outbox import outbox_worker
+
+    outbox_worker.start()
+    try:
+        yield
+    finally:
+        await outbox_worker.stop()
 
 app = FastAPI(lifespan=lifespan)
 
@@ -49,5 +60,25 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if settings.metrics_enabled:
+    from src.services.metrics import MetricsMiddleware, instrument_engine, metrics, metrics_access
+
+    instrument_engine(engine)
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+    def get_metrics(_: None = Depends(metrics_access)):
+        """
+        The get_metrics function exports request latencies, query statistics and the
+        connection pool state in the Prometheus text format to the scraper holding settings.metrics_token.
+        
+        :param _: None: Reject the requests without the metrics token
+        :return: The metrics of this worker process
+        :doc-author: Trelent
+        """
+        return metrics.render()
+
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
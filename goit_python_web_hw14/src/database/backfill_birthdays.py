@@ -0,0 +1,51 @@
+"""
+Add the birthday_doy column and its (user_id, birthday_doy) index to a database
+created before they existed, and fill the column from the birthdays. New contacts
+get it from the ORM (Contact.validate_birthday).
+
+Run from the goit_python_web_hw14 directory:
+
+    python -m src.database.backfill_birthdays
+"""
+from sqlalchemy import bindparam, inspect, select, text, update
+
+from src.database.db import engine
+from src.database.models import Contact, birthday_doy
+
+CHUNK = 10000
+
+
+def main() -> None:
+    with engine.begin() as connection:
+        columns = {column["name"] for column in inspect(connection).get_columns("contacts")}
+        if "birthday_doy" not in columns:
+            connection.execute(text("ALTER TABLE contacts ADD COLUMN birthday_doy integer"))
+
+    table = Contact.__table__
+    filled = 0
+    with engine.connect() as connection:
+        while True:
+            rows = connection.execute(
+                select(table.c.id, table.c.birthday).where(table.c.birthday_doy.is_(None)).limit(CHUNK)
+            ).all()
+            if not rows:
+                break
+            connection.execute(
+                update(table).where(table.c.id == bindparam("b_id")).values(birthday_doy=bindparam("b_doy")),
+                [{"b_id": row.id, "b_doy": birthday_doy(row.birthday)} for row in rows]
+            )
+            connection.commit()
+            filled += len(rows)
+
+    with engine.begin() as connection:
+        if connection.dialect.name == "postgresql":
+            connection.execute(text("ALTER TABLE contacts ALTER COLUMN birthday_doy SET NOT NULL"))
+        connection.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_contacts_user_id_birthday_doy ON contacts (user_id, birthday_doy)"
+        ))
+    engine.dispose()
+    print(f"birthday_doy filled for {filled} contacts")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+"""
+Create the contact search column and indexes (trigram GIN index on Postgres) on a
+database created before they existed. New databases get them with the tables.
+
+Run from the goit_python_web_hw14 directory:
+
+    python -m src.database.create_search_index
+"""
+from src.database.db import engine
+from src.database.models import create_search_objects
+
+
+def main() -> None:
+    with engine.begin() as connection:
+        create_search_objects(connection)
+    engine.dispose()
+    print("Search index created")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,25 @@
 import datetime
-from sqlalchemy import String, func, Boolean
-from sqlalchemy.orm import declarative_base, Mapped, mapped_column
+import enum
+from sqlalchemy import String, func, Boolean, Computed, Enum, Index, event, text
+from sqlalchemy.orm import declarative_base, Mapped, mapped_column, validates
 from sqlalchemy.sql.schema import ForeignKey
 
 
 Base = declarative_base()
 
 
+def birthday_doy(birthday: datetime.date) -> int:
+    """
+    The birthday_doy function returns the day of the year of a birthday in a leap year:
+    February 29 is day 60 and the later dates have the same number in every year.
+
+    :param birthday: datetime.date: Birthday
+    :return: The day of the year, 1 to 366
+    :doc-author: Trelent
+    """
+    return datetime.date(2000, birthday.month, birthday.day).timetuple().tm_yday
+
+
 class Contact(Base):
     __tablename__ = 'contacts'
     id: Mapped[int] = mapped_column(primary_key=True)
@@ -20,6 +33,59 @@ class Contact(Base):
         ForeignKey('users.id', ondelete='CASCADE'),
         default=None
     )
+    # set from birthday, see birthday_doy and repository.contacts.get_upcoming_birthdays
+    birthday_doy: Mapped[int] = mapped_column(nullable=False)
+    # lowercased name, surname and email matched by the contact search
+    search: Mapped[str] = mapped_column(
+        String,
+        Computed("lower(name || ' ' || surname || ' ' || email)", persisted=True)
+    )
+
+    __table_args__ = (
+        # listing and paging the contacts of a user, see repository.contacts
+        Index("ix_contacts_user_id_surname_name", "user_id", "surname", "name", "id"),
+        # upcoming birthdays of a user, a range of birthday_doy
+        Index("ix_contacts_user_id_birthday_doy", "user_id", "birthday_doy"),
+    )
+
+    @validates("birthday")
+    def validate_birthday(self, key, birthday):
+        self.birthday_doy = birthday_doy(birthday)
+        return birthday
+
+
+# substring search of repository.contacts: a trigram GIN index on Postgres, with
+# user_id in the same index (btree_gin) so a search only reads the rows of the user.
+# It has no portable ORM form and is created with the table.
+SEARCH_DDL = {
+    "postgresql": [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        "CREATE EXTENSION IF NOT EXISTS btree_gin",
+        "ALTER TABLE contacts ADD COLUMN IF NOT EXISTS search varchar "
+        "GENERATED ALWAYS AS (lower(name || ' ' || surname || ' ' || email)) STORED",
+        "CREATE INDEX IF NOT EXISTS ix_contacts_user_id_surname_name ON contacts (user_id, surname, name, id)",
+        "CREATE INDEX IF NOT EXISTS ix_contacts_user_id_search_trgm ON contacts "
+        "USING gin (user_id, search gin_trgm_ops)",
+    ],
+}
+
+
+def create_search_objects(connection) -> None:
+    """
+    The create_search_objects function creates the search column and indexes of the
+    contacts for the dialect of the connection. Statements are idempotent.
+
+    :param connection: Connection: Sync connection
+    :return: None
+    :doc-author: Trelent
+    """
+    for statement in SEARCH_DDL.get(connection.dialect.name, []):
+        connection.execute(text(statement))
+
+
+@event.listens_for(Contact.__table__, "after_create")
+def create_contacts_search(target, connection, **kw):
+    create_search_objects(connection)
 
 
 class User(Base):
@@ -35,3 +101,38 @@ class User(Base):
     refresh_token: Mapped[str] = mapped_column(String, nullable=True)
     confirmed: Mapped[bool] = mapped_column(Boolean, default=False)
     avatar: Mapped[str] = mapped_column(String, nullable=True, default=None)
+
+
+class EmailStatus(str, enum.Enum):
+    pending = "pending"
+    sending = "sending"
+    sent = "sent"
+    failed = "failed"
+
+
+# emails waiting to be sent, see services.outbox: requests only insert a row, a worker
+# sends them in batches over one SMTP session each and retries the failures
+class OutboxEmail(Base):
+    __tablename__ = 'email_outbox'
+    id: Mapped[int] = mapped_column(primary_key=True)
+    recipient: Mapped[str] = mapped_column(String(250), nullable=False)
+    subject: Mapped[str] = mapped_column(String(255), nullable=False)
+    template: Mapped[str] = mapped_column(String(100), nullable=False)
+    # JSON of the template variables
+    body: Mapped[str] = mapped_column(String, nullable=False)
+    status: Mapped[EmailStatus] = mapped_column(
+        Enum(EmailStatus),
+        nullable=False,
+        default=EmailStatus.pending
+    )
+    attempts: Mapped[int] = mapped_column(nullable=False, default=0, server_default="0")
+    # when a pending email is due, or when the claim of a sending one expires
+    next_attempt_at: Mapped[datetime.datetime] = mapped_column(nullable=False)
+    last_error: Mapped[str] = mapped_column(String, nullable=True)
+    created_at: Mapped[datetime.datetime] = mapped_column(
+        default=func.now(),
+        nullable=False
+    )
+    sent_at: Mapped[datetime.datetime] = mapped_column(nullable=True)
+
+    __table_args__ = (Index("ix_email_outbox_due", "status", "next_attempt_at"),)
@@ -0,0 +1,171 @@
+import datetime
+from typing import List, Tuple
+
+from sqlalchemy import case, func, or_, select
+from sqlalchemy.orm import Session
+
+from src.conf.config import settings
+from src.database.models import Contact, birthday_doy
+
+
+def search_filters(user_id: int, q: str = "", name_contains: str = "",
+                   surname_contains: str = "", email_contains: str = "") -> list:
+    """
+    The search_filters function builds the WHERE clauses of a contact search. q is
+    matched anywhere in the name, surname or email, case-insensitively, through the
+    search column and its trigram index. The *_contains filters match one column.
+
+    :param user_id: int: Owner of the contacts
+    :param q: str: Searched text
+    :param name_contains: str: Filter contacts by name
+    :param surname_contains: str: Filter contacts by surname
+    :param email_contains: str: Filter contacts by email
+    :return: A list of clauses
+    :doc-author: Trelent
+    """
+    filters = [Contact.user_id == user_id]
+    if q:
+        filters.append(Contact.search.contains(q.lower(), autoescape=True))
+    for column, value in ((Contact.name, name_contains), (Contact.surname, surname_contains),
+                          (Contact.email, email_contains)):
+        if value:
+            filters.append(column.contains(value, autoescape=True))
+    return filters
+
+
+def search_order(q: str, dialect: str) -> list:
+    """
+    The search_order function ranks the matches of q: contacts whose name, surname or
+    email starts with q first, then by trigram similarity on Postgres, then by surname
+    and name as the contacts are listed without q.
+
+    :param q: str: Searched text
+    :param dialect: str: Name of the database dialect
+    :return: A list of ORDER BY clauses
+    :doc-author: Trelent
+    """
+    order = []
+    if q:
+        q = q.lower()
+        prefix = or_(
+            func.lower(Contact.name).startswith(q, autoescape=True),
+            func.lower(Contact.surname).startswith(q, autoescape=True),
+            func.lower(Contact.email).startswith(q, autoescape=True)
+        )
+        order.append(case((prefix, 0), else_=1))
+        if dialect == "postgresql":
+            order.append(func.similarity(Contact.search, q).desc())
+    return order + [Contact.surname, Contact.name, Contact.id]
+
+
+async def search_contacts(
+    user_id: int,
+    db: Session,
+    q: str = "",
+    name_contains: str = "",
+    surname_contains: str = "",
+    email_contains: str = "",
+    limit: int = settings.contacts_page_size,
+    offset: int = 0
+) -> Tuple[List[Contact], int, bool]:
+    """
+    The search_contacts function returns a page of the contacts of a user matching
+    the search, ranked, with the number of matches. Ranking q needs every match, so
+    they are counted in the same query. Without q the page is read in the order of
+    the (user_id, surname, name) index and the contacts are counted up to
+    settings.contacts_count_limit, a user with many contacts isn't counted in full.
+
+    :param user_id: int: Owner of the contacts
+    :param db: Session: Pass the database session to the function
+    :param q: str: Searched text
+    :param name_contains: str: Filter contacts by name
+    :param surname_contains: str: Filter contacts by surname
+    :param email_contains: str: Filter contacts by email
+    :param limit: int: Page size
+    :param offset: int: Number of skipped contacts
+    :return: The contacts, the number of matches and whether it reached the count limit
+    :doc-author: Trelent
+    """
+    filters = search_filters(user_id, q, name_contains, surname_contains, email_contains)
+    query = (
+        select(Contact)
+        .where(*filters)
+        .order_by(*search_order(q, db.get_bind().dialect.name))
+        .limit(limit)
+        .offset(offset)
+    )
+    if q:
+        rows = db.execute(query.add_columns(func.count().over())).all()
+        contacts = [contact for contact, _ in rows]
+        if rows:
+            return contacts, rows[0][1], False
+    else:
+        contacts = db.execute(query).scalars().all()
+    if offset == 0 and len(contacts) < limit:
+        # the whole result fits in the first page
+        return contacts, len(contacts), False
+    matches = select(Contact.id).where(*filters).limit(settings.contacts_count_limit + 1).subquery()
+    total = db.execute(select(func.count()).select_from(matches)).scalar_one()
+    return contacts, min(total, settings.contacts_count_limit), total > settings.contacts_count_limit
+
+
+def birthday_window(today: datetime.date, days: int) -> Tuple[int, int] | None:
+    """
+    The birthday_window function returns the range of birthday_doy of the birthdays in
+    the next `days` days, today excluded. The range wraps around the end of the year
+    when end < start. In a common year the window starting on March 1 starts at
+    February 29 (day 60), those birthdays are celebrated on March 1.
+
+    :param today: datetime.date: First day of the window, excluded
+    :param days: int: Length of the window in days
+    :return: The first and last birthday_doy, None for an empty window
+    :doc-author: Trelent
+    """
+    if days <= 0:
+        return None
+    if days >= 366:
+        return 1, 366
+    start = birthday_doy(today) % 366 + 1
+    end = birthday_doy(today + datetime.timedelta(days=days))
+    return start, end
+
+
+def doy_in_window(doy: int, window: Tuple[int, int] | None) -> bool:
+    if window is None:
+        return False
+    start, end = window
+    return start <= doy <= end if start <= end else doy >= start or doy <= end
+
+
+async def get_upcoming_birthdays(user_id: int, days: int, db: Session,
+                                 today: datetime.date | None = None) -> List[Contact]:
+    """
+    The get_upcoming_birthdays function returns the contacts of a user with a birthday
+    in the next `days` days, soonest first. The window is one or, around new year, two
+    range scans of the (user_id, birthday_doy) index.
+
+    :param user_id: int: Owner of the contacts
+    :param days: int: Length of the window in days
+    :param db: Session: Pass the database session to the function
+    :param today: datetime.date: First day of the window, excluded; today by default
+    :return: A list of contacts
+    :doc-author: Trelent
+    """
+    window = birthday_window(today or datetime.date.today(), days)
+    if window is None:
+        return []
+    start, end = window
+    if start <= end:
+        in_window = Contact.birthday_doy.between(start, end)
+    else:
+        in_window = or_(Contact.birthday_doy >= start, Contact.birthday_doy <= end)
+    return db.execute(
+        select(Contact)
+        .where(Contact.user_id == user_id, in_window)
+        .order_by(
+            case((Contact.birthday_doy >= start, Contact.birthday_doy), else_=Contact.birthday_doy + 366),
+            Contact.surname,
+            Contact.name,
+            Contact.id
+        )
+    ).scalars().all()
@@ -2,6 +2,7 @@ from sqlalchemy.orm import Session
 
 from src.database.models import User
 from src.schemas import UserModel
+from src.services.user_cache import user_cache
 
 
 async def get_user_by_email(email: str, db: Session) -> User:
@@ -31,6 +32,8 @@ async def create_user(body: UserModel, db: Session) -> User:
     db.add(new_user)
     db.commit()
     db.refresh(new_user)
+    # drop a negative entry cached while the email was unknown
+    await user_cache.invalidate(new_user.email)
     return new_user
 
 
@@ -61,6 +64,7 @@ async def confirmed_email(email: str, db: Session) -> None:
     user = await get_user_by_email(email, db)
     user.confirmed = True
     db.commit()
+    await user_cache.invalidate(email)
 
 
 async def new_password(user: User, password: str, db: Session) -> None:
@@ -76,6 +80,7 @@ async def new_password(user: User, password: str, db: Session) -> None:
     """
     user.password = password
     db.commit()
+    await user_cache.invalidate(user.email)
 
 
 async def update_avatar(email, url: str, db: Session) -> User:
@@ -93,4 +98,5 @@ async def update_avatar(email, url: str, db: Session) -> User:
     user = await get_user_by_email(email, db)
     user.avatar = url
     db.commit()
+    await user_cache.invalidate(email)
     return user
@@ -1,6 +1,6 @@
 from typing import List
 
-from fastapi import APIRouter, HTTPException, Depends, status, Security, BackgroundTasks, Request
+from fastapi import APIRouter, HTTPException, Depends, status, Security, Request
 from fastapi.security import OAuth2PasswordRequestForm, \
     HTTPAuthorizationCredentials, HTTPBearer
 from sqlalchemy.orm import Session
@@ -22,7 +22,6 @@ security = HTTPBearer()
 )
 async def signup(
     body: UserModel,
-    background_tasks: BackgroundTasks,
     request: Request,
     db: Session = Depends(get_db)
 ):
@@ -30,9 +29,9 @@ async def signup(
     The signup function creates a new user in the database.
     It takes a UserModel object as input, and returns a dictionary with the created user and an informative message.
     If there is already an account associated with that email address, it raises an HTTPException.
+    The confirmation email is queued in the transaction creating the user.
     
     :param body: UserModel: Get the user's email and password
-    :param background_tasks: BackgroundTasks: Add a task to the background tasks queue
     :param request: Request: Get the base_url of the application
     :param db: Session: Get the database session
     :return: A dictionary with two keys: user and detail
@@ -45,8 +44,8 @@ async def signup(
             detail="Account already exists"
         )
     body.password = auth_service.get_password_hash(body.password)
+    await send_email(db, body.email, body.username, request.base_url)
     new_user = await repository_users.create_user(body, db)
-    background_tasks.add_task(send_email, new_user.email, new_user.username, request.base_url)
     return {"user": new_user, "detail": "User successfully created. Check your email for confirmation."}
 
 
@@ -161,7 +160,6 @@ async def confirmed_email(token: str, db: Session = Depends(get_db)):
 @router.post('/request_email')
 async def request_email(
     body: RequestEmail,
-    background_tasks: BackgroundTasks,
     request: Request,
     db: Session = Depends(get_db)
 ):
@@ -171,7 +169,6 @@ async def request_email(
     The function returns a message indicating whether or not the user has already confirmed their account.
     
     :param body: RequestEmail: Get the email from the request body
-    :param background_tasks: BackgroundTasks: Add a task to the background tasks queue
     :param request: Request: Get the base_url of the application
     :param db: Session: Access the database
     :return: A message to the user
@@ -186,14 +183,14 @@ async def request_email(
     if user.confirmed:
         return {"message": "Your email is already confirmed"}
     if user:
-        background_tasks.add_task(send_email, user.email, user.username, request.base_url)
+        await send_email(db, user.email, user.username, request.base_url)
+        db.commit()
     return {"message": "Check your email for confirmation."}
 
 
 @router.post('/forgot_password')
 async def forgot_password(
     body: RequestEmail,
-    background_tasks: BackgroundTasks,
     request: Request,
     db: Session = Depends(get_db)
 ):
@@ -203,7 +200,6 @@ async def forgot_password(
     an email containing a link that will allow them to reset their password.
     
     :param body: RequestEmail: Get the email from the request body
-    :param background_tasks: BackgroundTasks: Add a task to the background tasks
     :param request: Request: Get the base url of the application
     :param db: Session: Get the database session
     :return: A message to the user
@@ -215,7 +211,8 @@ async def forgot_password(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid email"
         )
-    background_tasks.add_task(send_reset_password_email, user.email, user.username, request.base_url)
+    await send_reset_password_email(db, user.email, user.username, request.base_url)
+    db.commit()
     return {"message": "Check your email for reset password."}
 
 
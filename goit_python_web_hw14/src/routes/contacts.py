@@ -1,14 +1,15 @@
-from datetime import datetime, timedelta
 from typing import List
-from fastapi import APIRouter, HTTPException, Depends, status
-from sqlalchemy import func, extract, Interval
-from sqlalchemy.orm import Session, Mapped
+from fastapi import APIRouter, HTTPException, Depends, Query, Response, status
+from sqlalchemy.orm import Session
 from fastapi_limiter.depends import RateLimiter
+from src.conf.config import settings
 from src.database.db import get_db
 from src.schemas import GetContactResponce, PostContactRequest, \
     PatchContactRequest
 from src.database.models import Contact, User
+from src.repository.contacts import search_contacts
 from src.services.auth import auth_service
+from src.services.birthday_cache import birthday_cache, upcoming_birthdays
 
 router = APIRouter(prefix='/contacts', tags=["contacts"])
 
@@ -20,59 +21,59 @@ router = APIRouter(prefix='/contacts', tags=["contacts"])
     dependencies=[Depends(RateLimiter(times=10, seconds=60))]
 )
 async def read_contacts(
-    name_contains="",
-    surname_contains="",
-    email_contains="",
+    response: Response,
+    q: str = "",
+    name_contains: str = "",
+    surname_contains: str = "",
+    email_contains: str = "",
+    limit: int = Query(settings.contacts_page_size, ge=1, le=settings.contacts_page_max),
+    offset: int = Query(0, ge=0),
     db: Session = Depends(get_db),
     current_user: User = Depends(auth_service.get_current_user)
 ):
     """
-    The read_contacts function returns a list of contacts that match the search criteria.
+    The read_contacts function returns a page of the contacts that match the search criteria.
+    Contacts matching q in their name, surname or email are ranked, the ones starting with q first.
+    The number of matches, counted up to settings.contacts_count_limit, is sent in the
+    X-Total-Count header; X-Total-Count-Capped is true when there are more.
     
+    :param response: Response: Set the count headers
+    :param q: str: Search contacts by name, surname or email
     :param name_contains: Filter contacts by name
     :param surname_contains: Filter the contacts by surname
     :param email_contains: Filter the contacts by email
+    :param limit: int: Page size
+    :param offset: int: Number of skipped contacts
     :param db: Session: Pass the database session to the function
     :param current_user: User: Get the current user from the database
     :return: A list of contacts
     :doc-author: Trelent
     """
-    contacts = db.query(Contact).filter(
-        Contact.name.like(f"%{name_contains}%"),
-        Contact.surname.like(f"%{surname_contains}%"),
-        Contact.email.like(f"%{email_contains}%"),
-        Contact.user_id == current_user.id
-    ).all()
+    contacts, total, capped = await search_contacts(
+        current_user.id,
+        db,
+        q=q,
+        name_contains=name_contains,
+        surname_contains=surname_contains,
+        email_contains=email_contains,
+        limit=limit,
+        offset=offset
+    )
+    response.headers["X-Total-Count"] = str(total)
+    response.headers["X-Total-Count-Capped"] = str(capped).lower()
     return contacts
 
 
-def birthdy_next_days(birthday: Mapped[datetime.date], days: int = 0):
-    """
-    The birthdy_next_days function returns True if the birthday is within
-    the next `days` days, otherwise False.
-    
-    
-    :param birthday: Mapped[datetime.date]: Map the birthday column to a datetime
-    :param days: int: Specify the number of days to check for
-    :return: A boolean value that indicates if the birthday is in the next days
-    :doc-author: Trelent
-    """
-    if days == 0:
-        return False
-    age = extract("year", func.age(birthday))
-    birthday_days = birthday - func.cast(timedelta(days), Interval)
-    age_days = extract("year", func.age(birthday_days))
-    return age_days > age
-
-
 @router.get("/birthdays", response_model=List[GetContactResponce])
 async def get_birthdays(
-    next_days: int = 7,
+    next_days: int = Query(7, ge=0),
     db: Session = Depends(get_db),
     current_user: User = Depends(auth_service.get_current_user)
 ):
     """
-    The get_birthdays function returns a list of contacts with birthdays in the next 7 days.
+    The get_birthdays function returns a list of contacts with birthdays in the next 7 days,
+    today excluded, soonest first. Windows up to settings.birthdays_cache_days days are
+    served from a cache computed once a day per user.
     
     :param next_days: int: Specify the number of days to look ahead for birthdays
     :param db: Session: Inject the database session
@@ -80,10 +81,7 @@ async def get_birthdays(
     :return: A list of contacts
     :doc-author: Trelent
     """
-    return db.query(Contact).filter(
-        birthdy_next_days(Contact.birthday, next_days),
-        Contact.user_id == current_user.id
-    )
+    return await upcoming_birthdays(current_user.id, next_days, db)
 
 
 @router.get("/{contact_id}", response_model=GetContactResponce)
@@ -144,6 +142,7 @@ async def create_contact(
     )
     db.add(contact)
     db.commit()
+    await birthday_cache.invalidate(current_user.id)
     return contact
 
 
@@ -176,6 +175,7 @@ async def update_contact(
     for key, val in body.model_dump().items():
         setattr(contact, key, val)
     db.commit()
+    await birthday_cache.invalidate(current_user.id)
     return contact
 
 
@@ -209,6 +209,7 @@ async def patch_contact(
             continue
         setattr(contact, key, val)
     db.commit()
+    await birthday_cache.invalidate(current_user.id)
     return contact
 
 
@@ -240,4 +241,5 @@ async def remove_contact(
         )
     db.delete(contact)
     db.commit()
+    await birthday_cache.invalidate(current_user.id)
     return contact
@@ -1,7 +1,5 @@
 from fastapi import APIRouter, Depends, status, UploadFile, File
 from sqlalchemy.orm import Session
-import cloudinary
-import cloudinary.uploader
 
 from src.database.db import get_db
 from src.database.models import User
@@ -44,6 +42,10 @@ async def update_avatar_user(
     :return: A user object
     :doc-author: Trelent
     """
+    # imported on first use, most workers never upload an avatar
+    import cloudinary
+    import cloudinary.uploader
+
     cloudinary.config(
         cloud_name=settings.cloudinary_name,
         api_key=settings.cloudinary_api_key,
@@ -1,5 +1,3 @@
-import pickle
-import redis
 import datetime
 from typing import Optional
 
@@ -12,6 +10,7 @@ from sqlalchemy.orm import Session
 from src.database.db import get_db
 from src.repository.users import get_user_by_email
 from src.conf.config import settings
+from src.services.user_cache import UNKNOWN, user_cache, user_from_snapshot
 
 
 class Auth:
@@ -19,7 +18,6 @@ class Auth:
     SECRET_KEY = settings.secret_key
     ALGORITHM = settings.algorithm
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
-    r = redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0)
 
     def verify_password(self, plain_password, hashed_password):
         """
@@ -179,15 +177,15 @@ class Auth:
         except JWTError:
             raise credentials_exception
 
-        user = self.r.get(f"user:{email}")
+        snapshot = await user_cache.get(email)
+        if snapshot == UNKNOWN:
+            raise credentials_exception
+        if snapshot is not None:
+            return user_from_snapshot(snapshot)
+        user = await get_user_by_email(email, db)
+        await user_cache.set(email, user)
         if user is None:
-            user = await get_user_by_email(email, db)
-            if user is None:
-                raise credentials_exception
-            self.r.set(f"user:{email}", pickle.dumps(user))
-            self.r.expire(f"user:{email}", 900)
-        else:
-            user = pickle.loads(user)
+            raise credentials_exception
         return user
     
     def create_email_token(self, data: dict):
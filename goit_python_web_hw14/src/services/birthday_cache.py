@@ -0,0 +1,121 @@
+import json
+import logging
+import datetime
+from typing import List
+
+import redis.asyncio
+from sqlalchemy.orm import Session
+
+from src.conf.config import settings
+from src.repository.contacts import birthday_window, doy_in_window, get_upcoming_birthdays
+from src.schemas import GetContactResponce
+from src.services.user_cache import user_cache
+
+
+logger = logging.getLogger(__name__)
+
+
+class BirthdayCache:
+    """
+    Redis cache of the contacts of a user with a birthday in the next `days` days,
+    computed once a day: an entry is only valid for the date it was computed on and
+    expires at midnight. Shorter windows are filtered from the cached one. Redis
+    errors are logged and the caller falls back to the database.
+    """
+
+    def __init__(self, client: redis.asyncio.Redis, days: int):
+        self.redis = client
+        self.days = days
+
+    @staticmethod
+    def key(user_id: int) -> str:
+        return f"birthdays:{user_id}"
+
+    async def get(self, user_id: int, today: datetime.date) -> List[dict] | None:
+        """
+        The get function returns the cached contacts of a user, computed today.
+
+        :param user_id: int: Owner of the contacts
+        :param today: datetime.date: Current date
+        :return: The contacts with their birthday_doy, or None on a miss
+        :doc-author: Trelent
+        """
+        try:
+            raw = await self.redis.get(self.key(user_id))
+        except redis.RedisError as err:
+            logger.warning("birthday cache: redis get failed: %s", err)
+            return None
+        if raw is None:
+            return None
+        entry = json.loads(raw)
+        if entry["date"] != today.isoformat():
+            return None
+        return entry["contacts"]
+
+    async def set(self, user_id: int, today: datetime.date, contacts: List[dict]) -> None:
+        """
+        The set function stores the contacts of a user until midnight.
+
+        :param user_id: int: Owner of the contacts
+        :param today: datetime.date: Date the contacts were computed on
+        :param contacts: List[dict]: The contacts with their birthday_doy
+        :return: None
+        :doc-author: Trelent
+        """
+        midnight = datetime.datetime.combine(today + datetime.timedelta(days=1), datetime.time())
+        ttl = max(1, int((midnight - datetime.datetime.now()).total_seconds()))
+        try:
+            await self.redis.set(
+                self.key(user_id),
+                json.dumps({"date": today.isoformat(), "contacts": contacts}),
+                ex=ttl
+            )
+        except redis.RedisError as err:
+            logger.warning("birthday cache: redis set failed: %s", err)
+
+    async def invalidate(self, user_id: int) -> None:
+        """
+        The invalidate function drops the entry of a user. It must be called whenever
+        a contact of the user is created, changed or deleted.
+
+        :param user_id: int: Owner of the contacts
+        :return: None
+        :doc-author: Trelent
+        """
+        try:
+            await self.redis.delete(self.key(user_id))
+        except redis.RedisError as err:
+            logger.warning("birthday cache: redis delete failed: %s", err)
+
+
+async def upcoming_birthdays(user_id: int, days: int, db: Session) -> list:
+    """
+    The upcoming_birthdays function returns the contacts of a user with a birthday in
+    the next `days` days, from the daily cache when the window is not longer than
+    settings.birthdays_cache_days.
+
+    :param user_id: int: Owner of the contacts
+    :param days: int: Length of the window in days
+    :param db: Session: Pass the database session to the function
+    :return: The contacts or their cached dictionaries, soonest birthday first
+    :doc-author: Trelent
+    """
+    today = datetime.date.today()
+    if days > birthday_cache.days:
+        return await get_upcoming_birthdays(user_id, days, db, today)
+    contacts = await birthday_cache.get(user_id, today)
+    if contacts is None:
+        contacts = [
+            {
+                **GetContactResponce.model_validate(contact, from_attributes=True).model_dump(mode="json"),
+                "birthday_doy": contact.birthday_doy,
+            }
+            for contact in await get_upcoming_birthdays(user_id, birthday_cache.days, db, today)
+        ]
+        await birthday_cache.set(user_id, today, contacts)
+    window = birthday_window(today, days)
+    return [contact for contact in contacts if doy_in_window(contact["birthday_doy"], window)]
+
+
+# same Redis connection settings as the user cache
+birthday_cache = BirthdayCache(user_cache.redis, settings.birthdays_cache_days)
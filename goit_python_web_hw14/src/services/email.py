@@ -1,76 +1,73 @@
-from pathlib import Path
-
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi_mail.errors import ConnectionErrors
 from pydantic import EmailStr
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 
+from src.repository.outbox import queue_email
 from src.services.auth import auth_service
-from src.conf.config import settings
+from src.services.outbox import outbox_worker
 
-conf = ConnectionConfig(
-    MAIL_USERNAME=settings.mail_username,
-    MAIL_PASSWORD=settings.mail_password,
-    MAIL_FROM=settings.mail_from,
-    MAIL_PORT=settings.mail_port,
-    MAIL_SERVER=settings.mail_server,
-    MAIL_FROM_NAME="REST API app",
-    MAIL_STARTTLS=False,
-    MAIL_SSL_TLS=True,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
-)
 
+def enqueue(db: Session, email: EmailStr, subject: str, template: str, body: dict) -> None:
+    """
+    The enqueue function adds an email to the outbox in the transaction of the request,
+    the outbox worker is woken up once the caller commits it.
 
-async def send_email(email: EmailStr, username: str, host: str):
+    :param db: Session: Session of the request, committed by the caller
+    :param email: EmailStr: Specify the email address of the recipient
+    :param subject: str: Subject of the email
+    :param template: str: Name of the template in services/templates
+    :param body: dict: Template variables
+    :return: None
+    :doc-author: Trelent
+    """
+    queue_email(db, email, subject, template, body)
+    event.listen(db, "after_commit", lambda session: outbox_worker.notify(), once=True)
+
+
+async def send_email(db: Session, email: EmailStr, username: str, host: str):
     """
     The send_email function sends an email to the user with a link to confirm their email address.
-        The function takes in three arguments:
-            1) An EmailStr object containing the user's email address.
-            2) A string containing the username of the user who is registering for an account.  This will be used in a template message that is sent to them via FastMail API.
-            3) A string containing hostname of where this application is hosted (e.g., &quot;localhost&quot; or &quot;127.0.0.&quot;).  This will be used in a template message that is sent to them via FastMail API
+        The function takes in four arguments:
+            1) The database session of the request.
+            2) An EmailStr object containing the user's email address.
+            3) A string containing the username of the user who is registering for an account.  This will be used in the email template.
+            4) A string containing hostname of where this application is hosted (e.g., &quot;localhost&quot; or &quot;127.0.0.&quot;).  This will be used in the email template.
+        The email is queued in the outbox with the session of the request, the caller commits it.
     
+    :param db: Session: Session of the request, committed by the caller
     :param email: EmailStr: Specify the email address of the recipient
     :param username: str: Pass the username to the email template
     :param host: str: Pass the host url to the email template
-    :return: A coroutine object
+    :return: None
     :doc-author: Trelent
     """
-    try:
-        token_verification = auth_service.create_email_token({"sub": email})
-        message = MessageSchema(
-            subject="Confirm your email ",
-            recipients=[email],
-            template_body={"host": host, "username": username, "token": token_verification},
-            subtype=MessageType.html
-        )
+    token_verification = auth_service.create_email_token({"sub": email})
+    enqueue(
+        db,
+        email,
+        "Confirm your email ",
+        "email_template.html",
+        {"host": str(host), "username": username, "token": token_verification}
+    )
 
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="email_template.html")
-    except ConnectionErrors as err:
-        print(err)
 
-
-async def send_reset_password_email(email: EmailStr, username: str, host: str):
+async def send_reset_password_email(db: Session, email: EmailStr, username: str, host: str):
     """
     The send_reset_password_email function sends an email to the user with a link to reset their password.
+    The email is queued in the outbox with the session of the request, the caller commits it.
     
+    :param db: Session: Session of the request, committed by the caller
     :param email: EmailStr: Specify the email address of the user who requested a password reset
     :param username: str: Pass the username of the user to the template
     :param host: str: Pass the hostname of the website to be used in the email
-    :return: A coroutine object
+    :return: None
     :doc-author: Trelent
     """
-    try:
-        token_reset = await auth_service.create_password_reset_token({"sub": email})
-        message = MessageSchema(
-            subject="Paasword reset request",
-            recipients=[email],
-            template_body={"host": host, "username": username, "token": token_reset},
-            subtype=MessageType.html
-        )
-
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="reset_password_email_template.html")
-    except ConnectionErrors as err:
-        print(err)
+    token_reset = await auth_service.create_password_reset_token({"sub": email})
+    enqueue(
+        db,
+        email,
+        "Paasword reset request",
+        "reset_password_email_template.html",
+        {"host": str(host), "username": username, "token": token_reset}
+    )
@@ -0,0 +1,210 @@
+import logging
+import secrets
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from fastapi import HTTPException, Security, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from src.conf.config import settings
+
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# every metric is exported, even before its first observation
+HISTOGRAMS = {
+    "http_request_duration_seconds": LATENCY_BUCKETS,
+    "http_request_queries": QUERY_BUCKETS,
+    "http_request_query_duration_seconds": LATENCY_BUCKETS,
+    "db_pool_checkout_wait_seconds": LATENCY_BUCKETS,
+}
+COUNTERS = ("db_slow_queries_total", "db_n_plus_one_total")
+
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+class Metrics:
+    """
+    In-process metrics of one worker: histograms, counters and the state of the
+    connection pool, exported in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (name, labels) -> [count per bucket..., +Inf count, sum]
+        self.histograms: Dict[Key, List[float]] = {}
+        self.counters: Dict[Key, float] = {}
+        self.engine: Engine | None = None
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        buckets = HISTOGRAMS[name]
+        with self.lock:
+            values = self.histograms.setdefault(key, [0] * (len(buckets) + 2))
+            values[bisect_left(buckets, value)] += 1
+            values[-1] += value
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def render(self) -> str:
+        """
+        The render function exports the metrics in the Prometheus text format.
+
+        :return: The text of the /metrics response
+        :doc-author: Trelent
+        """
+        lines = []
+        with self.lock:
+            for name, buckets in HISTOGRAMS.items():
+                lines.append(f"# TYPE {name} histogram")
+                for labels, values in sorted(
+                        (labels, values) for (key, labels), values in self.histograms.items() if key == name):
+                    total = 0
+                    for bound, count in zip([*map(str, buckets), "+Inf"], values):
+                        total += count
+                        lines.append(f"{name}_bucket{format_labels(labels + (('le', bound),))} {total}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {values[-1]}")
+                    lines.append(f"{name}_count{format_labels(labels)} {total}")
+            for name in COUNTERS:
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in sorted(
+                        (labels, value) for (key, labels), value in self.counters.items() if key == name):
+                    lines.append(f"{name}{format_labels(labels)} {value}")
+        checkedout = getattr(self.engine.pool, "checkedout", None) if self.engine is not None else None
+        if callable(checkedout):
+            lines += ["# TYPE db_pool_checked_out gauge", f"db_pool_checked_out {checkedout()}"]
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+
+metrics = Metrics()
+
+
+@dataclass
+class RequestStats:
+    queries: int = 0
+    query_duration: float = 0.0
+    statements: Counter = field(default_factory=Counter)
+
+
+# statistics of the request being handled, None outside of requests
+current_request: ContextVar[RequestStats | None] = ContextVar("current_request", default=None)
+
+
+def instrument_engine(engine: Engine) -> None:
+    """
+    The instrument_engine function times every query and every checkout of a pool
+    connection of the engine, logs the slow queries and counts the statements of the
+    current request.
+
+    :param engine: Engine: Engine of the application
+    :return: None
+    :doc-author: Trelent
+    """
+    metrics.engine = engine
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context.metrics_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context.metrics_start
+        stats = current_request.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.query_duration += elapsed
+            stats.statements[statement] += 1
+        if elapsed * 1000 >= settings.slow_query_ms:
+            metrics.inc("db_slow_queries_total")
+            logger.warning("slow query: %.1f ms: %s", elapsed * 1000, statement)
+
+    raw_connection = engine.raw_connection
+
+    def timed_raw_connection():
+        start = time.perf_counter()
+        try:
+            return raw_connection()
+        finally:
+            metrics.observe("db_pool_checkout_wait_seconds", time.perf_counter() - start)
+
+    engine.raw_connection = timed_raw_connection
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording the latency, number of queries and query time of every
+    request by route and flagging the requests repeating one statement
+    settings.n_plus_one_threshold times or more (N+1).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats()
+        token = current_request.set(stats)
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_request.reset(token)
+            record_request(scope, status_code, time.perf_counter() - start, stats)
+
+
+def record_request(scope, status_code: int, elapsed: float, stats: RequestStats) -> None:
+    # the router sets the matched route on the scope, raw paths are unbounded and
+    # requests not matched by a route share one label
+    route = getattr(scope.get("route"), "path", None) or "unmatched"
+    metrics.observe("http_request_duration_seconds", elapsed,
+                    method=scope["method"], route=route, status=str(status_code))
+    metrics.observe("http_request_queries", stats.queries, route=route)
+    metrics.observe("http_request_query_duration_seconds", stats.query_duration, route=route)
+    if stats.statements:
+        statement, count = stats.statements.most_common(1)[0]
+        if count >= settings.n_plus_one_threshold:
+            metrics.inc("db_n_plus_one_total", route=route)
+            logger.warning("possible N+1 in %s: %d executions of %s", route, count, statement)
+
+
+def metrics_access(credentials: HTTPAuthorizationCredentials = Security(HTTPBearer())) -> None:
+    """
+    The metrics_access function is the dependency of /metrics: the scraper sends
+    settings.metrics_token as bearer token. Without a configured token nobody can read the metrics.
+
+    :param credentials: HTTPAuthorizationCredentials: Get the token from the request header
+    :return: None
+    :doc-author: Trelent
+    """
+    if not settings.metrics_token or not secrets.compare_digest(credentials.credentials, settings.metrics_token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not enough permissions")
@@ -0,0 +1,260 @@
+import asyncio
+import json
+import logging
+import time
+from email.message import EmailMessage
+from email.utils import formataddr
+from functools import lru_cache
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import Row
+from sqlalchemy.orm import sessionmaker
+
+from src.conf.config import settings
+from src.database.db import SessionLocal
+from src.repository.outbox import claim_emails, record_deliveries
+
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_FOLDER = Path(__file__).parent / "templates"
+
+
+@lru_cache
+def template_environment():
+    """
+    The template_environment function returns the Jinja2 environment of the email templates,
+    created on first use. It keeps every template compiled once loaded.
+
+    :return: The Jinja2 environment
+    :doc-author: Trelent
+    """
+    from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+    return Environment(
+        loader=FileSystemLoader(TEMPLATE_FOLDER),
+        autoescape=select_autoescape(["html"]),
+        auto_reload=False
+    )
+
+
+def build_message(email: Row) -> EmailMessage:
+    """
+    The build_message function renders an email of the outbox with its template.
+
+    :param email: Row: Email returned by claim_emails
+    :return: The message
+    :doc-author: Trelent
+    """
+    message = EmailMessage()
+    message["From"] = formataddr((settings.mail_from_name, settings.mail_from))
+    message["To"] = email.recipient
+    message["Subject"] = email.subject
+    body = template_environment().get_template(email.template).render(**json.loads(email.body))
+    message.set_content(body, subtype="html")
+    return message
+
+
+async def connect_smtp():
+    """
+    The connect_smtp function opens an SMTP session with the server from settings,
+    TLS and login included.
+
+    :return: A connected aiosmtplib.SMTP client
+    :doc-author: Trelent
+    """
+    from aiosmtplib import SMTP
+
+    smtp = SMTP(
+        hostname=settings.mail_server,
+        port=settings.mail_port,
+        use_tls=settings.mail_ssl_tls,
+        start_tls=settings.mail_starttls,
+        timeout=settings.email_smtp_timeout
+    )
+    await smtp.connect()
+    if settings.mail_use_credentials:
+        await smtp.login(settings.mail_username, settings.mail_password)
+    return smtp
+
+
+class SMTPPool:
+    """
+    Pool of long-lived SMTP sessions: a batch of emails is sent over `size` open
+    connections instead of one TLS handshake and login per email. Connections idle
+    for more than `idle_timeout` seconds are reopened rather than trusted, servers
+    close them on their side, and a connection is dropped after a network error.
+    """
+
+    def __init__(self, size: int, idle_timeout: float, connect: Callable[[], Awaitable] = connect_smtp):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.connect = connect
+        self.idle: List[Tuple[object, float]] = []
+        self.semaphore = asyncio.Semaphore(size)
+        self.connections_opened = 0
+
+    async def checkout(self):
+        while self.idle:
+            smtp, last_used = self.idle.pop()
+            if time.monotonic() - last_used < self.idle_timeout and smtp.is_connected:
+                return smtp
+            await self.discard(smtp)
+        self.connections_opened += 1
+        return await self.connect()
+
+    async def discard(self, smtp) -> None:
+        try:
+            await smtp.quit()
+        except Exception:
+            smtp.close()
+
+    async def send(self, message: EmailMessage) -> None:
+        """
+        The send function sends a message over a pooled connection, at most `size`
+        messages are being sent at the same time.
+
+        :param message: EmailMessage: Message to send
+        :return: None
+        :doc-author: Trelent
+        """
+        from aiosmtplib import SMTPResponseException
+
+        async with self.semaphore:
+            smtp = await self.checkout()
+            try:
+                await smtp.send_message(message)
+            except SMTPResponseException:
+                # the server refused the message, the session is still usable
+                self.idle.append((smtp, time.monotonic()))
+                raise
+            except asyncio.CancelledError:
+                smtp.close()
+                raise
+            except Exception:
+                await self.discard(smtp)
+                raise
+            self.idle.append((smtp, time.monotonic()))
+
+    async def close(self) -> None:
+        while self.idle:
+            await self.discard(self.idle.pop()[0])
+
+
+def is_permanent(error: Exception) -> bool:
+    """
+    The is_permanent function tells errors worth no retry: 5xx SMTP replies (unknown
+    recipient, rejected message) and missing or broken templates.
+
+    :param error: Exception: Error raised while building or sending an email
+    :return: True if the email must not be retried
+    :doc-author: Trelent
+    """
+    from aiosmtplib import SMTPResponseException
+    from jinja2 import TemplateError
+
+    if isinstance(error, SMTPResponseException):
+        return error.code >= 500
+    return isinstance(error, (TemplateError, KeyError, ValueError))
+
+
+class OutboxWorker:
+    """
+    Long-lived task sending the emails of the outbox. It wakes up when an email is
+    committed by this process (notify) or every settings.email_poll_interval seconds
+    and sends batches of settings.email_batch_size emails over the SMTP pool until
+    none is due. The database calls are blocking and run in the thread pool, the
+    event loop keeps serving requests meanwhile.
+    """
+
+    def __init__(self, session_factory: sessionmaker = SessionLocal, pool: SMTPPool | None = None):
+        self.session_factory = session_factory
+        self.pool = pool
+        self.wakeup = asyncio.Event()
+        self.task: asyncio.Task | None = None
+        self.stats = {"batches": 0, "sent": 0, "retried": 0, "failed": 0}
+
+    def notify(self) -> None:
+        self.wakeup.set()
+
+    def claim(self) -> List[Row]:
+        with self.session_factory() as db:
+            return claim_emails(db, settings.email_batch_size)
+
+    def record(self, emails: List[Row], errors: List[Tuple[str, bool] | None]) -> Dict[str, int]:
+        with self.session_factory() as db:
+            return record_deliveries(db, emails, errors)
+
+    async def deliver(self, email: Row) -> Tuple[str, bool] | None:
+        try:
+            await self.pool.send(build_message(email))
+        except Exception as err:
+            logger.warning("email %s to %s failed: %r", email.id, email.recipient, err)
+            return repr(err), is_permanent(err)
+        return None
+
+    async def send_batch(self) -> int:
+        """
+        The send_batch function claims a batch of due emails, sends them concurrently
+        over the SMTP pool and records the outcome of every email.
+
+        :return: The number of claimed emails
+        :doc-author: Trelent
+        """
+        if self.pool is None:
+            self.pool = SMTPPool(settings.email_smtp_pool_size, settings.email_smtp_idle_timeout)
+        emails = await run_in_threadpool(self.claim)
+        if not emails:
+            return 0
+        errors = await asyncio.gather(*(self.deliver(email) for email in emails))
+        counts = await run_in_threadpool(self.record, emails, errors)
+        self.stats["batches"] += 1
+        for key, value in counts.items():
+            self.stats[key] += value
+        return len(emails)
+
+    async def drain(self) -> int:
+        """
+        The drain function sends batches until no email is due.
+
+        :return: The number of claimed emails
+        :doc-author: Trelent
+        """
+        total = 0
+        while True:
+            claimed = await self.send_batch()
+            total += claimed
+            if claimed < settings.email_batch_size:
+                return total
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.drain()
+            except Exception:
+                logger.exception("email outbox batch failed")
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), settings.email_poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+
+    def start(self) -> None:
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        if self.pool is not None:
+            await self.pool.close()
+
+
+outbox_worker = OutboxWorker()
@@ -0,0 +1,132 @@
+import json
+import logging
+import datetime
+
+import redis.asyncio
+from redis.asyncio.retry import Retry
+from redis.backoff import NoBackoff
+
+from src.conf.config import settings
+from src.database.models import User
+
+
+logger = logging.getLogger(__name__)
+
+# columns kept in a snapshot; password and refresh token never leave the database
+SNAPSHOT_FIELDS = ("id", "username", "email", "avatar", "confirmed", "created_at")
+
+# cached for emails without user, a token of a deleted user is refused without a query
+UNKNOWN = "null"
+
+
+def user_to_snapshot(user: User) -> dict:
+    """
+    The user_to_snapshot function turns a user into a small JSON-serializable dictionary.
+
+    :param user: User: User loaded from the database
+    :return: A dictionary with the SNAPSHOT_FIELDS of the user
+    :doc-author: Trelent
+    """
+    snapshot = {field: getattr(user, field) for field in SNAPSHOT_FIELDS}
+    snapshot["created_at"] = snapshot["created_at"].isoformat() if snapshot["created_at"] else None
+    return snapshot
+
+
+def user_from_snapshot(snapshot: dict) -> User:
+    """
+    The user_from_snapshot function builds a User from a snapshot. The user is not
+    attached to any session, it is only meant to be read by the request handlers.
+
+    :param snapshot: dict: Snapshot made by user_to_snapshot
+    :return: A transient user object
+    :doc-author: Trelent
+    """
+    data = dict(snapshot)
+    data["created_at"] = datetime.datetime.fromisoformat(data["created_at"]) if data["created_at"] else None
+    return User(**data)
+
+
+class UserCache:
+    """
+    Redis cache of the users resolved from access tokens, keyed by email (the token
+    subject). Every operation is one round trip of the asyncio client, Redis errors
+    are logged and the caller falls back to the database.
+    """
+
+    def __init__(self, client: redis.asyncio.Redis, ttl: int, negative_ttl: int):
+        self.redis = client
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+    @staticmethod
+    def key(email: str) -> str:
+        return f"user:{email}"
+
+    async def get(self, email: str) -> dict | str | None:
+        """
+        The get function returns the cached snapshot of a user.
+
+        :param email: str: Email of the user
+        :return: The snapshot, UNKNOWN for an email without user or None on a miss
+        :doc-author: Trelent
+        """
+        try:
+            raw = await self.redis.get(self.key(email))
+        except redis.RedisError as err:
+            logger.warning("user cache: redis get failed: %s", err)
+            return None
+        if raw is None:
+            return None
+        if isinstance(raw, bytes):
+            raw = raw.decode()
+        return UNKNOWN if raw == UNKNOWN else json.loads(raw)
+
+    async def set(self, email: str, user: User | None) -> None:
+        """
+        The set function stores the snapshot of a user with SET ... EX, the value and
+        its expiration in one command. An email without user is stored as UNKNOWN
+        for the shorter negative_ttl.
+
+        :param email: str: Email of the user
+        :param user: User | None: User loaded from the database, None if there is none
+        :return: None
+        :doc-author: Trelent
+        """
+        if user is None:
+            value, ttl = UNKNOWN, self.negative_ttl
+        else:
+            value, ttl = json.dumps(user_to_snapshot(user)), self.ttl
+        try:
+            await self.redis.set(self.key(email), value, ex=ttl)
+        except redis.RedisError as err:
+            logger.warning("user cache: redis set failed: %s", err)
+
+    async def invalidate(self, email: str) -> None:
+        """
+        The invalidate function drops a user from the cache. It must be called whenever
+        a column of the snapshot changes, and when a user is created (a negative entry
+        may exist for the email).
+
+        :param email: str: Email of the user
+        :return: None
+        :doc-author: Trelent
+        """
+        try:
+            await self.redis.delete(self.key(email))
+        except redis.RedisError as err:
+            logger.warning("user cache: redis delete failed: %s", err)
+
+
+# a cache must not slow requests down when Redis is unreachable: no retries, short timeouts
+user_cache = UserCache(
+    redis.asyncio.Redis(
+        host=settings.redis_host,
+        port=settings.redis_port,
+        db=0,
+        socket_connect_timeout=settings.user_cache_timeout,
+        socket_timeout=settings.user_cache_timeout,
+        retry=Retry(NoBackoff(), 0)
+    ),
+    settings.user_cache_ttl,
+    settings.user_cache_negative_ttl
+)
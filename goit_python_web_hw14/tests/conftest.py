@@ -1,3 +1,4 @@
+import fakeredis
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
@@ -6,6 +7,8 @@ from sqlalchemy.orm import sessionmaker
 from main import app
 from src.database.models import Base
 from src.database.db import get_db
+from src.services.birthday_cache import birthday_cache
+from src.services.user_cache import user_cache
 
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
@@ -20,6 +23,12 @@ TestingSessionLocal = sessionmaker(
 )
 
 
+@pytest.fixture(autouse=True)
+def fake_user_cache():
+    # no Redis server in tests, and no user cached by a previous test
+    user_cache.redis = birthday_cache.redis = fakeredis.aioredis.FakeRedis()
+
+
 @pytest.fixture(scope="module")
 def session():
     # Create the database
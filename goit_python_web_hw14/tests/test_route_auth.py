@@ -1,13 +1,10 @@
-from unittest.mock import MagicMock
 import pytest
 
-from src.database.models import User
+from src.database.models import OutboxEmail, User
 from src.services.auth import auth_service
 
 
-def test_create_user(client, user, monkeypatch):
-    mock_send_email = MagicMock()
-    monkeypatch.setattr("src.routes.auth.send_email", mock_send_email)
+def test_create_user(client, user, session):
     response = client.post(
         "/api/auth/signup",
         json=user,
@@ -16,6 +13,8 @@ def test_create_user(client, user, monkeypatch):
     data = response.json()
     assert data["user"]["email"] == user.get("email")
     assert "id" in data["user"]
+    # the confirmation email is committed with the user
+    assert [email.recipient for email in session.query(OutboxEmail)] == [user["email"]]
 
 
 def test_repeat_create_user(client, user):
@@ -153,9 +152,8 @@ def test_already_confirmed_email_request(client, user):
     assert data["message"] == "Your email is already confirmed"
 
 
-def test_email_request(client, user, monkeypatch, session):
-    mock_send_email = MagicMock()
-    monkeypatch.setattr("src.routes.auth.send_email", mock_send_email)
+def test_email_request(client, user, session):
+    session.query(OutboxEmail).delete()
     current_user: User = session.query(User).filter(User.email == user.get('email')).first()
     current_user.confirmed = False
     session.commit()
@@ -166,6 +164,7 @@ def test_email_request(client, user, monkeypatch, session):
     assert response.status_code == 200, response.text
     data = response.json()
     assert data["message"] == "Check your email for confirmation."
+    assert [email.template for email in session.query(OutboxEmail)] == ["email_template.html"]
 
 
 def test_invalid_email_request(client):
@@ -178,12 +177,9 @@ def test_invalid_email_request(client):
     assert data["detail"] == "Invalid email"
 
 
-def test_forgot_password(client, user, monkeypatch):
-    mock_send_email = MagicMock()
-    monkeypatch.setattr(
-        "src.routes.auth.send_reset_password_email",
-        mock_send_email
-    )
+def test_forgot_password(client, user, session):
+    session.query(OutboxEmail).delete()
+    session.commit()
     response = client.post(
         "/api/auth/forgot_password",
         json={"email": user.get('email')}
@@ -191,6 +187,7 @@ def test_forgot_password(client, user, monkeypatch):
     assert response.status_code == 200, response.text
     data = response.json()
     assert data["message"] == "Check your email for reset password."
+    assert [email.template for email in session.query(OutboxEmail)] == ["reset_password_email_template.html"]
 
 
 def test_forgot_password_invalid_email(client):
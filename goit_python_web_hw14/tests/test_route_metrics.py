@@ -0,0 +1,45 @@
+from unittest.mock import patch
+
+from src.conf.config import settings
+from src.services.metrics import instrument_engine
+
+
+def test_metrics(client):
+    response = client.get("/api/contacts/birthdays")
+    assert response.status_code == 401
+
+    with patch.object(settings, "metrics_token", "scrape"):
+        response = client.get("/metrics", headers={"Authorization": "Bearer scrape"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE http_request_duration_seconds histogram" in response.text
+    assert 'http_request_duration_seconds_count{method="GET",route="/api/contacts/birthdays",status="401"}' in response.text
+    assert "# TYPE db_pool_checkout_wait_seconds histogram" in response.text
+    assert "sqlite" not in response.text
+
+
+def test_metrics_token(client):
+    response = client.get("/metrics")
+    assert response.status_code == 403
+
+    # without a configured token the metrics are closed
+    response = client.get("/metrics", headers={"Authorization": "Bearer scrape"})
+    assert response.status_code == 403
+
+    with patch.object(settings, "metrics_token", "scrape"):
+        response = client.get("/metrics", headers={"Authorization": "Bearer wrong"})
+    assert response.status_code == 403
+
+
+def test_metrics_query_route(client, session, user):
+    # the test client runs on the engine of the test session, not on the one of main
+    instrument_engine(session.get_bind())
+    response = client.post("/api/auth/signup", json=user)
+    assert response.status_code == 201, response.text
+
+    with patch.object(settings, "metrics_token", "scrape"):
+        response = client.get("/metrics", headers={"Authorization": "Bearer scrape"})
+    samples = dict(line.rsplit(" ", 1) for line in response.text.splitlines() if not line.startswith("#"))
+    assert float(samples['http_request_queries_sum{route="/api/auth/signup"}']) >= 1
+    assert float(samples['http_request_query_duration_seconds_sum{route="/api/auth/signup"}']) > 0
+    assert 'http_request_queries_count{route="unmatched"}' not in samples
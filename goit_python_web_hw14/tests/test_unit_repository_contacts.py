@@ -0,0 +1,108 @@
+import datetime
+import unittest
+from unittest.mock import patch
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from src.conf.config import settings
+from src.database.models import Base, Contact, User
+from src.repository.contacts import birthday_window, doy_in_window, get_upcoming_birthdays, search_contacts
+
+
+class TestContacts(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        engine = create_engine(
+            "sqlite://",
+            connect_args={"check_same_thread": False},
+            poolclass=StaticPool
+        )
+        Base.metadata.create_all(bind=engine)
+        self.session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+        self.user = User(username="user", email="user@example.com", password="secret")
+        other = User(username="other", email="other@example.com", password="secret")
+        self.session.add_all([self.user, other])
+        self.session.commit()
+        people = [
+            ("Anna", "Smith", "anna@example.com"),
+            ("John", "Annanov", "john@example.com"),
+            ("Bob", "Marley", "bob.hannah@example.com"),
+            ("Carl", "Johnson", "carl@example.com"),
+            ("Dora", "50%_off", "dora@example.com"),
+        ]
+        for name, surname, email in people:
+            self.session.add(self.contact(name, surname, email, self.user.id))
+        self.session.add(self.contact("Anna", "Other", "anna@other.com", other.id))
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+
+    @staticmethod
+    def contact(name, surname, email, user_id):
+        return Contact(name=name, surname=surname, email=email, phone="0123456789",
+                       birthday=datetime.date(1990, 1, 1), user_id=user_id)
+
+    async def search(self, **kwargs):
+        contacts, total, capped = await search_contacts(self.user.id, self.session, **kwargs)
+        return [contact.name for contact in contacts], total, capped
+
+    async def test_search_contacts(self):
+        self.assertEqual(
+            await self.search(q="ANN"),
+            (["John", "Anna", "Bob"], 3, False)
+        )
+        self.assertEqual(await self.search(q="%_"), (["Dora"], 1, False))
+        self.assertEqual(await self.search(q="nobody"), ([], 0, False))
+        self.assertEqual(await self.search(q="example", limit=2), (["Dora", "John"], 5, False))
+        self.assertEqual(await self.search(q="ann", offset=10), ([], 3, False))
+
+    async def test_search_contacts_list(self):
+        self.assertEqual(
+            await self.search(),
+            (["Dora", "John", "Carl", "Bob", "Anna"], 5, False)
+        )
+        self.assertEqual(await self.search(limit=2, offset=2), (["Carl", "Bob"], 5, False))
+        with patch.object(settings, "contacts_count_limit", 3):
+            self.assertEqual(await self.search(limit=2), (["Dora", "John"], 3, True))
+
+    async def test_search_contacts_filters(self):
+        self.assertEqual(await self.search(name_contains="o"), (["Dora", "John", "Bob"], 3, False))
+        self.assertEqual(await self.search(q="john", email_contains="carl"), (["Carl"], 1, False))
+
+    async def test_search_column_follows_updates(self):
+        contact = self.session.query(Contact).filter(Contact.name == "Carl").first()
+        contact.surname = "Zed"
+        self.session.commit()
+        self.assertEqual(await self.search(q="zed"), (["Carl"], 1, False))
+        self.assertEqual(await self.search(q="johnson"), ([], 0, False))
+
+    async def test_get_upcoming_birthdays(self):
+        birthdays = {"Anna": (1992, 12, 30), "John": (1985, 1, 2), "Bob": (1992, 2, 29),
+                     "Carl": (1990, 3, 1), "Dora": (1990, 12, 28)}
+        for contact in self.session.query(Contact).filter(Contact.user_id == self.user.id):
+            contact.birthday = datetime.date(*birthdays[contact.name])
+        self.session.commit()
+
+        async def upcoming(today, days):
+            return [contact.name for contact in await get_upcoming_birthdays(self.user.id, days, self.session, today)]
+
+        self.assertEqual(await upcoming(datetime.date(2024, 12, 28), 7), ["Anna", "John"])
+        self.assertEqual(await upcoming(datetime.date(2024, 12, 27), 1), ["Dora"])
+        self.assertEqual(await upcoming(datetime.date(2023, 2, 27), 2), ["Bob", "Carl"])
+        self.assertEqual(await upcoming(datetime.date(2024, 2, 27), 2), ["Bob"])
+        self.assertEqual(await upcoming(datetime.date(2024, 2, 27), 0), [])
+        self.assertEqual(len(await upcoming(datetime.date(2024, 2, 27), 400)), 5)
+
+    def test_birthday_window(self):
+        self.assertEqual(birthday_window(datetime.date(2024, 1, 1), 7), (2, 8))
+        self.assertEqual(birthday_window(datetime.date(2023, 12, 30), 5), (366, 4))
+        # February 29 birthdays are in the window starting on March 1 of a common year
+        self.assertEqual(birthday_window(datetime.date(2023, 2, 28), 1), (60, 61))
+        self.assertEqual(birthday_window(datetime.date(2024, 2, 28), 1), (60, 60))
+        self.assertIsNone(birthday_window(datetime.date(2024, 2, 28), 0))
+        self.assertTrue(doy_in_window(366, (365, 4)))
+        self.assertTrue(doy_in_window(1, (365, 4)))
+        self.assertFalse(doy_in_window(5, (365, 4)))
+        self.assertFalse(doy_in_window(1, None))
@@ -4,6 +4,7 @@ from sqlalchemy.orm import Session
 
 from src.database.models import User
 from src.schemas import UserModel
+from src.services.user_cache import user_cache
 
 from src.repository.users import (
     get_user_by_email,
@@ -76,8 +77,10 @@ class TestUsers(unittest.IsolatedAsyncioTestCase):
     async def test_update_avatar(self):
         email = "example@mail.com"
         url = "url_str"
+        await user_cache.redis.set(user_cache.key(email), "{}")
         result = await update_avatar(email=email, url=url, db=self.session)
         self.assertEqual(result.avatar, url)
+        self.assertIsNone(await user_cache.redis.get(user_cache.key(email)))
 
 
 if __name__ == '__main__':
@@ -1,5 +1,5 @@
 import datetime
-import pickle
+import json
 import unittest
 import fakeredis
 from unittest.mock import MagicMock
@@ -10,6 +10,7 @@ from jose import jwt
 from fastapi import HTTPException, status
 
 from src.services.auth import auth_service
+from src.services.user_cache import user_cache, user_to_snapshot
 from src.database.models import User
 
 
@@ -21,7 +22,7 @@ class TestUsers(unittest.IsolatedAsyncioTestCase):
         self.pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
         auth_service.SECRET_KEY = self.SECRET_KEY
         auth_service.ALGORITHM = self.ALGORITHM
-        auth_service.r = fakeredis.FakeStrictRedis()
+        user_cache.redis = fakeredis.aioredis.FakeRedis()
         self.session = MagicMock(spec=Session)
 
     def test_get_password_hash(self):
@@ -168,26 +169,35 @@ class TestUsers(unittest.IsolatedAsyncioTestCase):
             algorithm=self.ALGORITHM
         )
 
-        user = User
+        user = User(
+            id=1,
+            username="user",
+            email=email,
+            password="hash",
+            confirmed=True,
+            created_at=datetime.datetime(2024, 5, 1, 12, 0)
+        )
         self.session.query().filter().first.return_value = user
         result = await auth_service.get_current_user(
             token=token,
             db=self.session
         )
         self.assertEqual(result, user)
+        cached = json.loads(await user_cache.redis.get(f"user:{email}"))
+        self.assertEqual(cached, user_to_snapshot(user))
+        self.assertNotIn("password", cached)
+        self.assertLessEqual(await user_cache.redis.ttl(f"user:{email}"), user_cache.ttl)
 
-        auth_service.r.flushall()
-        auth_service.r.set(f"user:{email}", pickle.dumps(user))
-
+        self.session.query().filter().first.return_value = None
         result = await auth_service.get_current_user(
             token=token,
             db=self.session
         )
-        self.assertEqual(result, user)
+        self.assertIsInstance(result, User)
+        self.assertEqual(user_to_snapshot(result), user_to_snapshot(user))
 
-        auth_service.r.flushall()
+        await user_cache.invalidate(email)
 
-        self.session.query().filter().first.return_value = None
         try:
             result = await auth_service.get_current_user(
                 token=token,
@@ -200,6 +210,16 @@ class TestUsers(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(result.detail, "Could not validate credentials")
         self.assertEqual(result.headers, {"WWW-Authenticate": "Bearer"})
 
+        # the unknown email is cached, the next request is refused without a query
+        self.session.reset_mock()
+        with self.assertRaises(HTTPException):
+            await auth_service.get_current_user(
+                token=token,
+                db=self.session
+            )
+        self.session.query.assert_not_called()
+        self.assertLessEqual(await user_cache.redis.ttl(f"user:{email}"), user_cache.negative_ttl)
+
         invalid_token = "invalid_token"
         try:
             result = await auth_service.get_current_user(
@@ -0,0 +1,65 @@
+import datetime
+import json
+import unittest
+
+import fakeredis
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from src.database.models import Base, Contact, User
+from src.services.birthday_cache import birthday_cache, upcoming_birthdays
+
+
+class TestBirthdayCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        engine = create_engine(
+            "sqlite://",
+            connect_args={"check_same_thread": False},
+            poolclass=StaticPool
+        )
+        Base.metadata.create_all(bind=engine)
+        self.session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+        birthday_cache.redis = fakeredis.aioredis.FakeRedis()
+        self.user = User(username="user", email="user@example.com", password="secret")
+        self.session.add(self.user)
+        self.session.commit()
+        today = datetime.date.today()
+        for name, days in (("Anna", 2), ("John", 10), ("Bob", 40)):
+            # 1992 is a leap year, any anniversary is a valid date
+            birthday = (today + datetime.timedelta(days=days)).replace(year=1992)
+            self.session.add(Contact(name=name, surname="Smith", email=f"{name}@example.com", phone="0123456789",
+                                     birthday=birthday, user_id=self.user.id))
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+
+    async def names(self, days):
+        return [contact["name"] for contact in await upcoming_birthdays(self.user.id, days, self.session)]
+
+    async def test_upcoming_birthdays(self):
+        self.assertEqual(await self.names(7), ["Anna"])
+        entry = json.loads(await birthday_cache.redis.get(birthday_cache.key(self.user.id)))
+        self.assertEqual(entry["date"], datetime.date.today().isoformat())
+        self.assertEqual([contact["name"] for contact in entry["contacts"]], ["Anna", "John"])
+        self.assertLessEqual(await birthday_cache.redis.ttl(birthday_cache.key(self.user.id)), 24 * 3600)
+
+        # served from the cache: the change is only seen once the entry is dropped
+        john = self.session.query(Contact).filter(Contact.name == "John").first()
+        john.birthday = john.birthday - datetime.timedelta(days=5)
+        self.session.commit()
+        self.assertEqual(await self.names(7), ["Anna"])
+        self.assertEqual(await self.names(14), ["Anna", "John"])
+        await birthday_cache.invalidate(self.user.id)
+        self.assertEqual(await self.names(7), ["Anna", "John"])
+
+        # longer windows than the cached one are queried
+        names = [contact.name for contact in await upcoming_birthdays(self.user.id, 60, self.session)]
+        self.assertEqual(names, ["Anna", "John", "Bob"])
+
+    async def test_upcoming_birthdays_stale_entry(self):
+        yesterday = datetime.date.today() - datetime.timedelta(days=1)
+        await birthday_cache.set(self.user.id, yesterday, [])
+        self.assertIsNone(await birthday_cache.get(self.user.id, datetime.date.today()))
+        self.assertEqual(await self.names(7), ["Anna"])
@@ -0,0 +1,173 @@
+import threading
+import unittest
+from datetime import timedelta
+from unittest.mock import patch
+
+from aiosmtplib import SMTPResponseException
+from sqlalchemy import create_engine, select, update
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from src.conf.config import settings
+from src.database.models import Base, EmailStatus, OutboxEmail
+from src.repository.outbox import queue_email, utcnow
+from src.services.email import send_reset_password_email
+from src.services.outbox import OutboxWorker, SMTPPool, outbox_worker
+
+
+class FakeSMTP:
+    def __init__(self, server):
+        self.server = server
+        self.is_connected = True
+
+    async def send_message(self, message):
+        code = self.server.refuse.get(message["To"])
+        if code:
+            raise SMTPResponseException(code, "refused")
+        self.server.messages.append(message)
+
+    async def quit(self):
+        self.is_connected = False
+
+    def close(self):
+        self.is_connected = False
+
+
+class FakeServer:
+    def __init__(self):
+        self.messages = []
+        self.refuse = {}
+        self.connections = 0
+
+    async def connect(self):
+        self.connections += 1
+        return FakeSMTP(self)
+
+
+class TestOutbox(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        engine = create_engine(
+            "sqlite://",
+            connect_args={"check_same_thread": False},
+            poolclass=StaticPool
+        )
+        Base.metadata.create_all(bind=engine)
+        self.session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        self.session = self.session_factory()
+        self.server = FakeServer()
+        self.pool = SMTPPool(2, 60, self.server.connect)
+        self.worker = OutboxWorker(self.session_factory, self.pool)
+
+    def tearDown(self):
+        self.session.close()
+
+    async def queue(self, recipient):
+        email = queue_email(
+            self.session, recipient, "Confirm your email ", "email_template.html",
+            {"host": "http://testserver/", "username": "user", "token": "token"}
+        )
+        self.session.commit()
+        return email
+
+    async def test_send_batch(self):
+        for number in range(5):
+            await self.queue(f"user{number}@example.com")
+        self.assertEqual(await self.worker.send_batch(), 5)
+        self.assertEqual(await self.worker.send_batch(), 0)
+        self.assertEqual(
+            sorted(message["To"] for message in self.server.messages),
+            [f"user{number}@example.com" for number in range(5)]
+        )
+        self.assertIn("http://testserver/api/auth/confirmed_email/token", self.server.messages[0].get_content())
+        # the batch shares the pooled connections
+        opened = self.server.connections
+        self.assertLessEqual(opened, 2)
+        statuses = self.session.execute(select(OutboxEmail.status)).scalars().all()
+        self.assertEqual(statuses, [EmailStatus.sent] * 5)
+
+        # and the next batches reuse them
+        await self.queue("late@example.com")
+        self.assertEqual(await self.worker.drain(), 1)
+        self.assertEqual(self.server.connections, opened)
+
+        await self.worker.stop()
+        self.assertEqual(self.pool.idle, [])
+
+    async def test_send_batch_failures(self):
+        busy = await self.queue("busy@example.com")
+        unknown = await self.queue("unknown@example.com")
+        self.server.refuse = {"busy@example.com": 451, "unknown@example.com": 550}
+        with patch.multiple(settings, email_retry_base=30, email_max_attempts=2):
+            self.assertEqual(await self.worker.send_batch(), 2)
+            self.session.refresh(busy)
+            self.session.refresh(unknown)
+            self.assertEqual((busy.status, busy.attempts), (EmailStatus.pending, 1))
+            self.assertGreater(busy.next_attempt_at, utcnow() + timedelta(seconds=20))
+            self.assertEqual((unknown.status, unknown.attempts), (EmailStatus.failed, 1))
+
+            busy.next_attempt_at = utcnow()
+            self.session.commit()
+            self.assertEqual(await self.worker.send_batch(), 1)
+            self.session.refresh(busy)
+            self.assertEqual((busy.status, busy.attempts), (EmailStatus.failed, 2))
+        self.assertEqual(self.worker.stats, {"batches": 2, "sent": 0, "retried": 1, "failed": 2})
+
+    async def test_send_batch_off_the_event_loop(self):
+        await self.queue("user@example.com")
+        threads = []
+        claim, record = self.worker.claim, self.worker.record
+        with patch.object(self.worker, "claim", lambda: threads.append(threading.current_thread()) or claim()), \
+                patch.object(self.worker, "record", lambda *args: threads.append(threading.current_thread()) or record(*args)):
+            self.assertEqual(await self.worker.send_batch(), 1)
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(threading.current_thread(), threads)
+
+    async def test_send_batch_connection_lost(self):
+        for number in range(3):
+            await self.queue(f"user{number}@example.com")
+        lost = []
+
+        async def connect():
+            smtp = await self.server.connect()
+            send_message = smtp.send_message
+
+            async def flaky_send_message(message):
+                if message["To"] == "user1@example.com" and not lost:
+                    lost.append(smtp)
+                    raise ConnectionResetError("lost")
+                await send_message(message)
+
+            smtp.send_message = flaky_send_message
+            return smtp
+
+        self.pool.connect = connect
+        self.assertEqual(await self.worker.send_batch(), 3)
+        self.assertEqual(len(self.server.messages), 2)
+        self.assertEqual(self.worker.stats, {"batches": 1, "sent": 2, "retried": 1, "failed": 0})
+        # the broken connection is dropped, the retry opens a new one
+        self.assertNotIn(lost[0], [smtp for smtp, _ in self.pool.idle])
+        with self.session_factory() as db:
+            db.execute(update(OutboxEmail).values(next_attempt_at=utcnow()))
+            db.commit()
+        self.assertEqual(await self.worker.send_batch(), 1)
+        self.assertEqual(len(self.server.messages), 3)
+
+    async def test_pool_reopens_idle_connections(self):
+        await self.queue("user@example.com")
+        self.assertEqual(await self.worker.send_batch(), 1)
+        with patch.object(self.pool, "idle_timeout", 0):
+            await self.queue("late@example.com")
+            self.assertEqual(await self.worker.send_batch(), 1)
+        self.assertEqual(self.server.connections, 2)
+
+    async def test_send_reset_password_email_queues(self):
+        outbox_worker.wakeup.clear()
+        with patch("src.services.auth.auth_service.create_password_reset_token", return_value="token"):
+            await send_reset_password_email(self.session, "reset@example.com", "user", "http://testserver/")
+        # queued in the transaction of the caller, the worker is woken up by its commit
+        self.assertFalse(outbox_worker.wakeup.is_set())
+        self.session.commit()
+        self.assertTrue(outbox_worker.wakeup.is_set())
+        email = self.session.execute(select(OutboxEmail)).scalar_one()
+        self.assertEqual(email.template, "reset_password_email_template.html")
+        self.assertEqual(email.status, EmailStatus.pending)